@@ -1,4 +1,4 @@
-from algorithms.clustering import find_hotspots
+from algorithms.clustering import find_hotspots, find_density_hotspots
 from algorithms.matching import find_similar_photos
 
-__all__ = ['find_hotspots', 'find_similar_photos']
+__all__ = ['find_hotspots', 'find_density_hotspots', 'find_similar_photos']
@@ -1,7 +1,10 @@
 from models import db, Disparu
 import math
+import numpy as np
 from collections import defaultdict
-from sqlalchemy import or_
+from utils.spatial import filter_bbox
+
+EARTH_RADIUS_KM = 6371
 
 
 def haversine_distance(lat1, lon1, lat2, lon2):
@@ -18,98 +21,181 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     return R * c
 
 
-def find_hotspots(min_cases=3, radius_km=50):
-    disparus = Disparu.query.filter(
+def haversine_distances(lat, lon, lats, lons):
+    """Distances in km from (lat, lon) to every point of the lats/lons arrays, in one NumPy pass"""
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    return _haversine_radians(math.radians(lat), math.radians(lon), lats, np.cos(lats), lons)
+
+
+def _haversine_radians(lat, lon, lats, cos_lats, lons):
+    # Inputs already in radians, cos(lats) precomputed by callers looping over many centers
+    a = np.sin((lats - lat) / 2) ** 2 + math.cos(lat) * cos_lats * np.sin((lons - lon) / 2) ** 2
+
+    # arcsin(sqrt(a)) == atan2(sqrt(a), sqrt(1-a)); clip guards rounding above 1
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+# Spatial hashing / Grid-based clustering optimization
+GRID_SIZE = 0.5  # degrees, approx 55km at equator
+MAX_LON_IDX = int(360 / GRID_SIZE)
+
+
+def grid_cell(lat, lon):
+    """Grid cell (lat_idx, lon_idx) of a point, longitude normalized to 0..360"""
+    return int(lat / GRID_SIZE), int((lon % 360) / GRID_SIZE)
+
+
+def grid_steps(lat, radius_km):
+    """Number of cells to scan on each side, (lat_steps, lon_steps), to cover radius_km around lat"""
+    lat_steps = math.ceil(radius_km / 111.0 / GRID_SIZE)
+
+    cos_lat = math.cos(math.radians(lat))
+    if abs(cos_lat) < 0.0001:
+        return lat_steps, MAX_LON_IDX // 2  # Search everything
+    return lat_steps, min(math.ceil(radius_km / (111.0 * abs(cos_lat)) / GRID_SIZE), MAX_LON_IDX // 2)
+
+
+def cluster_points(lats, lons, min_cases=3, radius_km=50):
+    """
+    Greedy clustering: each point not yet clustered, in input order, gathers
+    the unclustered points within radius_km. Returns the member index arrays
+    (seed first, then input order) of the clusters reaching min_cases, in
+    seed order.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    if len(lats) < min_cases:
+        return []
+
+    # One integer key per cell
+    lat_idx = np.trunc(lats / GRID_SIZE).astype(np.int64)
+    lon_idx = (np.mod(lons, 360) / GRID_SIZE).astype(np.int64)
+    keys = lat_idx * MAX_LON_IDX + lon_idx
+
+    # Point indices of each cell, in input order
+    order = np.argsort(keys, kind='stable')
+    cell_keys, starts = np.unique(keys[order], return_index=True)
+    grid = dict(zip(cell_keys.tolist(), np.split(order, starts[1:])))
+
+    # Occupied longitude cells of each latitude row, so wide windows near the
+    # poles only visit cells that hold points
+    occupied = defaultdict(list)
+    for key in cell_keys.tolist():
+        cell_lat, cell_lon = divmod(key, MAX_LON_IDX)
+        occupied[cell_lat].append(cell_lon)
+
+    def neighbour_candidates(cell_lat, cell_lon, lat_steps, lon_steps):
+        # Concatenate neighbor cells so a single kernel call covers them all
+        first_lon = (cell_lon - lon_steps) % MAX_LON_IDX
+        width = min(2 * lon_steps + 1, MAX_LON_IDX)
+
+        cells = []
+        for curr_lat in range(cell_lat - lat_steps, cell_lat + lat_steps + 1):
+            row = occupied.get(curr_lat)
+            if not row:
+                continue
+            if width <= len(row):
+                lons_in_window = ((first_lon + d_lon) % MAX_LON_IDX for d_lon in range(width))
+            else:
+                lons_in_window = sorted(
+                    (lon for lon in row if (lon - first_lon) % MAX_LON_IDX < width),
+                    key=lambda lon: (lon - first_lon) % MAX_LON_IDX
+                )
+            for curr_lon in lons_in_window:
+                cell = grid.get(curr_lat * MAX_LON_IDX + curr_lon)
+                if cell is not None:
+                    cells.append(cell)
+
+        return np.concatenate(cells)
+
+    lat_rad = np.radians(lats)
+    lon_rad = np.radians(lons)
+    cos_lat_rad = np.cos(lat_rad)
+
+    # Neighbourhoods are shared by every point of a cell with the same lon_steps
+    neighbourhoods = {}
+
+    clusters = []
+    processed = np.zeros(len(lats), dtype=bool)
+
+    for i in range(len(lats)):
+        if processed[i]:
+            continue
+
+        lat_steps, lon_steps = grid_steps(lats[i], radius_km)
+        candidates = neighbourhoods.get((keys[i], lon_steps))
+        if candidates is None:
+            candidates = neighbour_candidates(int(lat_idx[i]), int(lon_idx[i]), lat_steps, lon_steps)
+            neighbourhoods[(keys[i], lon_steps)] = candidates
+
+        candidates = candidates[~processed[candidates] & (candidates != i)]
+        if len(candidates) + 1 < min_cases:
+            continue
+
+        distances = _haversine_radians(
+            lat_rad[i], lon_rad[i],
+            lat_rad[candidates], cos_lat_rad[candidates], lon_rad[candidates]
+        )
+        members = np.concatenate(([i], np.sort(candidates[distances <= radius_km])))
+
+        if len(members) >= min_cases:
+            clusters.append(members)
+            processed[members] = True
+
+    return clusters
+
+
+def hotspot_summary(public_ids, lats, lons, radius_km):
+    """Hotspot dict returned by find_hotspots for one cluster"""
+    return {
+        'latitude': sum(lats) / len(lats),
+        'longitude': sum(lons) / len(lons),
+        'count': len(public_ids),
+        'disparus': list(public_ids),
+        'radius_km': radius_km,
+    }
+
+
+def compute_hotspots(min_cases=3, radius_km=50):
+    """Clusters every missing, geolocated case from scratch (O(all cases))"""
+    rows = db.session.query(
+        Disparu.public_id,
+        Disparu.latitude,
+        Disparu.longitude
+    ).filter(
         Disparu.latitude.isnot(None),
         Disparu.longitude.isnot(None),
         Disparu.status == 'missing'
-    ).all()
-    
-    if len(disparus) < min_cases:
-        return []
-    
-    # Spatial hashing / Grid-based clustering optimization
-    GRID_SIZE = 0.5  # degrees, approx 55km at equator
-    grid = defaultdict(list)
-    max_lon_idx = int(360 / GRID_SIZE)
-
-    for idx, d in enumerate(disparus):
-        lat_idx = int(d.latitude / GRID_SIZE)
-        # Normalize longitude to 0..360
-        norm_lon = d.longitude % 360
-        lon_idx = int(norm_lon / GRID_SIZE)
-        grid[(lat_idx, lon_idx)].append((idx, d))
+    ).order_by(Disparu.id).all()
+
+    lats = [r.latitude for r in rows]
+    lons = [r.longitude for r in rows]
 
     hotspots = []
-    processed = set()
-    
-    for i, d1 in enumerate(disparus):
-        if i in processed:
-            continue
-        
-        cluster = [d1]
-        cluster_ids = {i}
-        
-        lat_idx = int(d1.latitude / GRID_SIZE)
-        norm_lon = d1.longitude % 360
-        lon_idx = int(norm_lon / GRID_SIZE)
-
-        # Calculate search radius in grid units
-        lat_steps = math.ceil(radius_km / 111.0 / GRID_SIZE)
-
-        cos_lat = math.cos(math.radians(d1.latitude))
-        if abs(cos_lat) < 0.0001:
-            lon_steps = max_lon_idx // 2  # Search everything
-        else:
-            lon_steps = math.ceil(radius_km / (111.0 * abs(cos_lat)) / GRID_SIZE)
-            if lon_steps > max_lon_idx // 2:
-                lon_steps = max_lon_idx // 2
-
-        # Check neighbor cells
-        checked_cells = set()
-        for d_lat in range(-lat_steps, lat_steps + 1):
-            curr_lat = lat_idx + d_lat
-            for d_lon in range(-lon_steps, lon_steps + 1):
-                curr_lon = (lon_idx + d_lon) % max_lon_idx
-
-                if (curr_lat, curr_lon) in checked_cells:
-                    continue
-                checked_cells.add((curr_lat, curr_lon))
-
-                cell_points = grid.get((curr_lat, curr_lon))
-                if not cell_points:
-                    continue
-
-                for j, d2 in cell_points:
-                    if j in processed or j == i:
-                        continue
-
-                    distance = haversine_distance(
-                        d1.latitude, d1.longitude,
-                        d2.latitude, d2.longitude
-                    )
-
-                    if distance <= radius_km:
-                        cluster.append(d2)
-                        cluster_ids.add(j)
-        
-        if len(cluster) >= min_cases:
-            center_lat = sum(d.latitude for d in cluster) / len(cluster)
-            center_lng = sum(d.longitude for d in cluster) / len(cluster)
-            
-            hotspots.append({
-                'latitude': center_lat,
-                'longitude': center_lng,
-                'count': len(cluster),
-                'disparus': [d.public_id for d in cluster],
-                'radius_km': radius_km,
-            })
-            
-            processed.update(cluster_ids)
-    
+    for members in cluster_points(lats, lons, min_cases, radius_km):
+        members = members.tolist()
+        hotspots.append(hotspot_summary(
+            [rows[j].public_id for j in members],
+            [lats[j] for j in members],
+            [lons[j] for j in members],
+            radius_km
+        ))
+
     return sorted(hotspots, key=lambda x: x['count'], reverse=True)
 
 
+def find_hotspots(min_cases=3, radius_km=50):
+    """
+    Current hotspots, read from the incrementally maintained hotspot index.
+    Stays greedy: the index follows each write by replaying the seeds near
+    it, where find_density_hotspots() reclusters every case per call.
+    """
+    from algorithms.hotspot_index import get_hotspot_index
+
+    return get_hotspot_index(min_cases, radius_km).hotspots()
+
+
 def get_nearby_cases(latitude, longitude, radius_km=100):
     # Calculate bounding box
     # 1 degree of latitude ~= 111 km
@@ -129,41 +215,244 @@ def get_nearby_cases(latitude, longitude, radius_km=100):
     min_lon = longitude - lon_delta
     max_lon = longitude + lon_delta
 
-    query = Disparu.query.filter(
-        Disparu.latitude.isnot(None),
-        Disparu.longitude.isnot(None),
-        Disparu.latitude >= min_lat,
-        Disparu.latitude <= max_lat
-    )
-
     if lon_delta >= 180:
         # Cover all longitudes
-        pass
+        min_lon, max_lon = -180, 180
     elif min_lon < -180:
-        query = query.filter(or_(
-            Disparu.longitude >= min_lon + 360,
-            Disparu.longitude <= max_lon
-        ))
+        # Crosses the antimeridian (min > max)
+        min_lon += 360
     elif max_lon > 180:
-        query = query.filter(or_(
-            Disparu.longitude >= min_lon,
-            Disparu.longitude <= max_lon - 360
-        ))
-    else:
-        query = query.filter(
-            Disparu.longitude >= min_lon,
-            Disparu.longitude <= max_lon
-        )
+        max_lon -= 360
+
+    query = Disparu.query.filter(
+        Disparu.latitude.isnot(None),
+        Disparu.longitude.isnot(None)
+    )
+    query = filter_bbox(query, min_lat, max_lat, min_lon, max_lon)
 
     disparus = query.all()
-    
-    nearby = []
-    for d in disparus:
-        distance = haversine_distance(latitude, longitude, d.latitude, d.longitude)
-        if distance <= radius_km:
-            nearby.append({
-                'disparu': d.to_dict(),
-                'distance_km': round(distance, 2)
-            })
-    
-    return sorted(nearby, key=lambda x: x['distance_km'])
+    if not disparus:
+        return []
+
+    distances = haversine_distances(
+        latitude, longitude,
+        [d.latitude for d in disparus],
+        [d.longitude for d in disparus]
+    )
+
+    # Exact filter and sort on the whole candidate set at once
+    inside = np.flatnonzero(distances <= radius_km)
+    inside = inside[np.argsort(distances[inside], kind='stable')]
+
+    return [{
+        'disparu': disparus[j].to_dict(),
+        'distance_km': round(float(distances[j]), 2)
+    } for j in inside]
+
+
+# Density-based clustering (DBSCAN) on the unit sphere
+MIN_EPS_KM = 0.01
+# Candidate pairs materialized at once by the neighbour search
+PAIR_CHUNK = 1 << 21
+
+
+def unit_vectors(lats, lons):
+    """(n, 3) array of unit-sphere vectors, free of antimeridian and pole special cases"""
+    lat_rad = np.radians(np.asarray(lats, dtype=np.float64))
+    lon_rad = np.radians(np.asarray(lons, dtype=np.float64))
+    cos_lat = np.cos(lat_rad)
+    return np.column_stack((cos_lat * np.cos(lon_rad), cos_lat * np.sin(lon_rad), np.sin(lat_rad)))
+
+
+def spherical_centroid(lats, lons):
+    """Centre of mass of the points projected back on the sphere, as (lat, lon)"""
+    x, y, z = unit_vectors(lats, lons).sum(axis=0)
+    return math.degrees(math.atan2(z, math.hypot(x, y))), math.degrees(math.atan2(y, x))
+
+
+def _neighbour_pairs(xyz, eps_chord):
+    """
+    Yields chunks (firsts, seconds, chords) of the pairs (i, j), i < j,
+    closer than eps_chord, with their squared chord. Points are hashed in a
+    3-d grid of side eps_chord: sorting the cell keys costs O(n log n) and
+    each point only scans the 27 cells around its own. A chunk holds about
+    PAIR_CHUNK candidates, so memory does not grow with the pair count.
+    """
+    dim = int(2 / eps_chord) + 4
+    cells = np.floor(xyz / eps_chord).astype(np.int64) + dim // 2
+    keys = (cells[:, 0] * dim + cells[:, 1]) * dim + cells[:, 2]
+
+    # Work on points sorted by cell: each cell is a contiguous run
+    order = np.argsort(keys, kind='stable')
+    xyz = xyz[order]
+    cell_keys, cell_starts, point_cell, cell_sizes = np.unique(
+        keys[order], return_index=True, return_inverse=True, return_counts=True
+    )
+    eps_sq = eps_chord * eps_chord
+
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            for dz in (-1, 0, 1):
+                # Shifted keys stay sorted, so this lookup is a merge
+                neighbour_keys = cell_keys + (dx * dim + dy) * dim + dz
+                found = np.minimum(np.searchsorted(cell_keys, neighbour_keys), len(cell_keys) - 1)
+                exists = cell_keys[found] == neighbour_keys
+
+                lo = cell_starts[found][point_cell]
+                counts = np.where(exists, cell_sizes[found], 0)[point_cell]
+
+                # Expand (point, candidate) pairs in bounded chunks
+                cumulative = np.cumsum(counts)
+                start = 0
+                while start < len(keys):
+                    done = int(cumulative[start - 1]) if start else 0
+                    stop = max(int(np.searchsorted(cumulative, done + PAIR_CHUNK, side='right')), start + 1)
+                    chunk_counts = counts[start:stop]
+                    total = int(cumulative[stop - 1]) - done
+                    if total:
+                        i = np.repeat(np.arange(start, stop), chunk_counts)
+                        offsets = np.arange(total) - np.repeat(np.cumsum(chunk_counts) - chunk_counts, chunk_counts)
+                        j = np.repeat(lo[start:stop], chunk_counts) + offsets
+
+                        keep = order[i] < order[j]
+                        i, j = i[keep], j[keep]
+                        d2 = ((xyz[i] - xyz[j]) ** 2).sum(axis=1)
+                        close = d2 <= eps_sq
+                        if close.any():
+                            yield order[i[close]], order[j[close]], d2[close]
+                    start = stop
+
+
+def _connect(labels, firsts, seconds):
+    """Merges the components of labels joined by the edges (hooking + pointer jumping)"""
+    while len(firsts):
+        root_a, root_b = labels[firsts], labels[seconds]
+        if (root_a == root_b).all():
+            break
+        lowest = np.minimum(root_a, root_b)
+        np.minimum.at(labels, root_a, lowest)
+        np.minimum.at(labels, root_b, lowest)
+        while True:
+            jumped = labels[labels]
+            if (jumped == labels).all():
+                break
+            labels = jumped
+    return labels
+
+
+def dbscan(lats, lons, eps_km=5, min_samples=5, ids=None):
+    """
+    DBSCAN over geographic points. A point with at least min_samples points
+    (itself included) within eps_km is a core point; core points chained by
+    eps_km steps form a cluster, and other points join the cluster of their
+    nearest core point within eps_km, or stay noise.
+
+    Returns one label per point: -1 for noise, otherwise the smallest id
+    (ids, or the input index) among the cluster's core points, so labels do
+    not depend on input order and survive the insertion of newer records.
+
+    Pairs are never all held at once: a first pass over the chunks counts
+    neighbours, a second one merges core components and keeps each border
+    point's nearest core neighbour.
+    """
+    n = len(lats)
+    if n == 0:
+        return np.empty(0, np.int64)
+    ids = np.arange(n) if ids is None else np.asarray(ids, dtype=np.int64)
+
+    eps_chord = 2 * math.sin(min(max(eps_km, MIN_EPS_KM) / (2 * EARTH_RADIUS_KM), math.pi / 2))
+    xyz = unit_vectors(lats, lons)
+
+    degree = np.ones(n, dtype=np.int64)
+    for firsts, seconds, _ in _neighbour_pairs(xyz, eps_chord):
+        degree += np.bincount(firsts, minlength=n) + np.bincount(seconds, minlength=n)
+    core = degree >= min_samples
+
+    labels = np.full(n, -1, dtype=np.int64)
+    core_idx = np.flatnonzero(core)
+    if not len(core_idx):
+        return labels
+
+    # Clusters: components of the core-core graph. Border points: nearest
+    # core neighbour, ties broken by its smaller id
+    components = np.arange(n)
+    best_dist = np.full(n, np.inf)
+    best_anchor = np.full(n, -1, dtype=np.int64)
+    for firsts, seconds, chords in _neighbour_pairs(xyz, eps_chord):
+        both_core = core[firsts] & core[seconds]
+        components = _connect(components, firsts[both_core], seconds[both_core])
+
+        border = np.concatenate((firsts, seconds))
+        anchor = np.concatenate((seconds, firsts))
+        dist = np.concatenate((chords, chords))
+        mask = ~core[border] & core[anchor]
+        border, anchor, dist = border[mask], anchor[mask], dist[mask]
+        if not len(border):
+            continue
+        ranking = np.lexsort((ids[anchor], dist, border))
+        border, anchor, dist = border[ranking], anchor[ranking], dist[ranking]
+        first = np.r_[True, border[1:] != border[:-1]]
+        border, anchor, dist = border[first], anchor[first], dist[first]
+        known = best_anchor[border]
+        better = (dist < best_dist[border]) | (
+            (dist == best_dist[border]) & ((known < 0) | (ids[anchor] < ids[np.maximum(known, 0)]))
+        )
+        best_dist[border[better]] = dist[better]
+        best_anchor[border[better]] = anchor[better]
+
+    cluster_ids = np.full(n, np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(cluster_ids, components[core_idx], ids[core_idx])
+    labels[core_idx] = cluster_ids[components[core_idx]]
+
+    anchored = np.flatnonzero(best_anchor >= 0)
+    labels[anchored] = labels[best_anchor[anchored]]
+    return labels
+
+
+def find_density_hotspots(eps_km=5, min_samples=5):
+    """
+    Hotspots of missing cases found by DBSCAN, largest first. Each has a
+    stable cluster_id, a spherical centroid and the great-circle radius
+    enclosing its members.
+
+    Not a drop-in for find_hotspots(): DBSCAN chains dense neighbourhoods
+    into one cluster where the greedy pass splits them by radius_km, and it
+    has no incremental update, so it is offered alongside for callers that
+    want order-independent clusters.
+    """
+    rows = db.session.query(
+        Disparu.id,
+        Disparu.public_id,
+        Disparu.latitude,
+        Disparu.longitude
+    ).filter(
+        Disparu.latitude.isnot(None),
+        Disparu.longitude.isnot(None),
+        Disparu.status == 'missing'
+    ).all()
+
+    if not rows:
+        return []
+
+    lats = np.fromiter((r.latitude for r in rows), dtype=np.float64, count=len(rows))
+    lons = np.fromiter((r.longitude for r in rows), dtype=np.float64, count=len(rows))
+    labels = dbscan(lats, lons, eps_km, min_samples, ids=[r.id for r in rows])
+
+    clusters = defaultdict(list)
+    for j in np.flatnonzero(labels >= 0).tolist():
+        clusters[int(labels[j])].append(j)
+
+    hotspots = []
+    for cluster_id, members in clusters.items():
+        center_lat, center_lng = spherical_centroid(lats[members], lons[members])
+        radius = haversine_distances(center_lat, center_lng, lats[members], lons[members]).max()
+        hotspots.append({
+            'cluster_id': cluster_id,
+            'latitude': center_lat,
+            'longitude': center_lng,
+            'count': len(members),
+            'disparus': [rows[j].public_id for j in members],
+            'radius_km': round(float(radius), 2),
+        })
+
+    return sorted(hotspots, key=lambda x: (-x['count'], x['cluster_id']))
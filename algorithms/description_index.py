@@ -0,0 +1,150 @@
+import numpy as np
+
+from models import db, Disparu
+from algorithms.index_reload import DEFAULT_TTL, IndexRegistry, ReloadableIndex
+from algorithms.minhash import BANDS, NUM_PERM, band_keys, signature_array
+
+# Estimated Jaccard index a candidate must reach
+DEFAULT_THRESHOLD = 0.3
+# Pending writes tolerated before the band tables are rebuilt
+MIN_REBUILD_THRESHOLD = 1024
+
+
+class DescriptionIndex(ReloadableIndex):
+    """
+    LSH banding index over the stored MinHash signatures of descriptions and
+    clothing. Each band is a sorted array of packed band values: records
+    sharing a band with the query are found by binary search, then
+    verified on their full signature. No pairwise comparison with the rest
+    of the dataset is made.
+
+    Writes go to a small buffer scanned linearly until the tables are
+    rebuilt.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        super().__init__(ttl)
+        self.ids = np.empty(0, dtype=np.int64)      # sorted
+        self.signatures = np.empty((0, NUM_PERM), dtype=np.uint32)
+        self.band_order = []
+        self.band_sorted = []
+        self.pending = {}        # id -> signature array, written since last rebuild
+        self.tombstones = set()  # ids whose table entry is outdated
+
+    def load(self, rows):
+        """Replaces the whole index with rows of (id, description_minhash)."""
+        with self.lock:
+            pairs = sorted((disparu_id, signature) for disparu_id, signature in rows if signature)
+            signatures = np.empty((len(pairs), NUM_PERM), dtype=np.uint32)
+            for row, (_, signature) in enumerate(pairs):
+                signatures[row] = signature_array(signature)
+            self._build(np.fromiter((p[0] for p in pairs), dtype=np.int64, count=len(pairs)), signatures)
+            self._built()
+
+    def _build(self, ids, signatures):
+        self.ids = ids
+        self.signatures = signatures
+        keys = band_keys(signatures)
+        self.band_order = []
+        self.band_sorted = []
+        for band in range(BANDS):
+            order = np.argsort(keys[:, band], kind='stable')
+            self.band_order.append(order)
+            self.band_sorted.append(keys[order, band])
+        self.pending = {}
+        self.tombstones = set()
+
+    def upsert(self, disparu_id, signature):
+        with self.lock:
+            if not signature:
+                self.remove(disparu_id)
+                return
+            if self._in_tables(disparu_id):
+                self.tombstones.add(disparu_id)
+            self.pending[disparu_id] = signature_array(signature).copy()
+            self._maybe_rebuild()
+
+    def remove(self, disparu_id):
+        with self.lock:
+            self.pending.pop(disparu_id, None)
+            if self._in_tables(disparu_id):
+                self.tombstones.add(disparu_id)
+                self._maybe_rebuild()
+
+    def __len__(self):
+        return len(self.ids) - len(self.tombstones) + len(self.pending)
+
+    def _in_tables(self, disparu_id):
+        i = np.searchsorted(self.ids, disparu_id)
+        return i < len(self.ids) and self.ids[i] == disparu_id
+
+    def _maybe_rebuild(self):
+        if len(self.pending) + len(self.tombstones) <= max(MIN_REBUILD_THRESHOLD, len(self.ids) // 16):
+            return
+        keep = ~np.isin(self.ids, np.fromiter(self.tombstones, dtype=np.int64, count=len(self.tombstones)))
+        pending = sorted(self.pending.items())
+        ids = np.concatenate([self.ids[keep], np.array([p[0] for p in pending], dtype=np.int64)])
+        signatures = np.concatenate([self.signatures[keep], np.array([p[1] for p in pending], dtype=np.uint32).reshape(-1, NUM_PERM)])
+        order = np.argsort(ids, kind='stable')
+        self._build(ids[order], signatures[order])
+
+    def search(self, signature, threshold=DEFAULT_THRESHOLD, limit=100, exclude=()):
+        """(similarity, id) pairs of the records likely above threshold, most similar first."""
+        if not signature:
+            return []
+        query = signature_array(signature)
+        query_keys = band_keys(query[None, :])[0]
+
+        with self.lock:
+            results = []
+            if len(self.ids):
+                found = []
+                for band in range(BANDS):
+                    keys = self.band_sorted[band]
+                    lo = np.searchsorted(keys, query_keys[band], side='left')
+                    hi = np.searchsorted(keys, query_keys[band], side='right')
+                    if hi > lo:
+                        found.append(self.band_order[band][lo:hi])
+                if found:
+                    marked = np.zeros(len(self.ids), dtype=bool)
+                    for rows in found:
+                        marked[rows] = True
+                    rows = np.flatnonzero(marked)
+                    similarities = (self.signatures[rows] == query).mean(axis=1)
+                    close = np.flatnonzero(similarities >= threshold)
+                    # Most similar first; only the head is ever read
+                    wanted = min(len(close), limit + len(exclude) + len(self.tombstones))
+                    if wanted < len(close):
+                        close = close[np.argpartition(-similarities[close], wanted - 1)[:wanted]]
+                    close = close[np.lexsort((self.ids[rows[close]], -similarities[close]))]
+                    for disparu_id, similarity in zip(self.ids[rows[close]].tolist(), similarities[close].tolist()):
+                        if disparu_id not in self.tombstones and disparu_id not in exclude:
+                            results.append((similarity, disparu_id))
+
+            for disparu_id, other in self.pending.items():
+                similarity = float(np.mean(other == query))
+                if similarity >= threshold and disparu_id not in exclude:
+                    results.append((similarity, disparu_id))
+
+        results.sort(key=lambda pair: (-pair[0], pair[1]))
+        return results[:limit]
+
+
+_INDEXES = IndexRegistry()
+
+
+def _fetch_rows(session, ids=None):
+    query = session.query(Disparu.id, Disparu.description_minhash)
+    if ids is None:
+        return query.filter(Disparu.description_minhash.isnot(None)).yield_per(10000)
+    return query.filter(Disparu.id.in_(ids)).all()
+
+
+def get_description_index(session=None):
+    """Returns the up-to-date description LSH index for the session's database."""
+    return _INDEXES.get(session or db.session, DescriptionIndex, _fetch_rows)
+
+
+def invalidate_description_index(engine=None):
+    """Forces a rebuild on next use, for bulk writes that bypass the ORM."""
+    _INDEXES.invalidate(engine)
@@ -0,0 +1,139 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAXSIZE = 4096
+
+
+class ImageHashCache:
+    """
+    Bounded LRU of image hashes keyed by (path, mtime_ns, size), so that a
+    photo overwritten under the same name is hashed again instead of being
+    served its old hash.
+
+    With a path, entries are also written through to a small SQLite file
+    that every worker process opens: a hash computed by one worker is a
+    disk hit for the others. The store is best effort, any error on it
+    degrades to the in-memory cache alone.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def configure(self, maxsize=DEFAULT_MAXSIZE, path=None):
+        with self._lock:
+            self.maxsize = maxsize
+            if path != self.path:
+                self.path = path
+                self._local = threading.local()
+            self._evict()
+
+    @staticmethod
+    def key_for(path):
+        """Cache key of a file, None if it does not exist."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (path, st.st_mtime_ns, st.st_size)
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        value = self._load(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self.hits += 1
+            self._remember(key, value)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._remember(key, value)
+        self._store(key, value)
+
+    def clear(self):
+        """Empties the in-memory entries and counters, the shared store is kept."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'shared': self.path is not None,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def _remember(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        self._evict()
+
+    def _evict(self):
+        while len(self._entries) > max(self.maxsize, 0):
+            self._entries.popitem(last=False)
+
+    # Shared store: one row per path, valid only for the recorded mtime and size
+
+    def _connection(self):
+        if self.path is None:
+            return None
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS image_hashes ('
+                'path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, hash TEXT NOT NULL)'
+            )
+            self._local.conn = conn
+        return conn
+
+    def _load(self, key):
+        try:
+            conn = self._connection()
+            if conn is None:
+                return None
+            row = conn.execute(
+                'SELECT hash FROM image_hashes WHERE path = ? AND mtime_ns = ? AND size = ?', key
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        return row[0] if row else None
+
+    def _store(self, key, value):
+        try:
+            conn = self._connection()
+            if conn is not None:
+                conn.execute('INSERT OR REPLACE INTO image_hashes VALUES (?, ?, ?, ?)', key + (value,))
+        except sqlite3.Error:
+            pass
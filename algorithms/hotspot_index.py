@@ -0,0 +1,223 @@
+import heapq
+
+from models import db, Disparu
+from algorithms.index_reload import DEFAULT_TTL, IndexRegistry, ReloadableIndex
+from algorithms.clustering import (
+    MAX_LON_IDX, cluster_points, grid_cell, grid_steps, haversine_distances, hotspot_summary
+)
+
+
+
+class HotspotIndex(ReloadableIndex):
+    """
+    Per-worker hotspot state for one (min_cases, radius_km): grid cells of the
+    missing, geolocated cases plus the cluster owning each of them.
+
+    find_hotspots clusters greedily in id order: a case not yet clustered
+    claims every unclustered case within radius_km. A seed's outcome only
+    depends on its neighbours, so after a write the greedy pass is replayed
+    in id order over the seeds near a case whose owner changed, instead of
+    over every case. Reads return the cached list, O(number of hotspots).
+    """
+
+    def __init__(self, min_cases=3, radius_km=50, ttl=DEFAULT_TTL):
+        super().__init__(ttl)
+        self.min_cases = min_cases
+        self.radius_km = radius_km
+        self.points = {}    # id -> (public_id, latitude, longitude)
+        self.cells = {}     # (lat_idx, lon_idx) -> set of ids
+        self.owner = {}     # id -> seed id of the cluster holding it
+        self.members = {}   # seed id -> member ids, seed first
+        self.summaries = {} # seed id -> hotspot dict
+        self._sorted = None
+
+    def load(self, rows):
+        """Replaces the whole state with rows of (id, public_id, latitude, longitude, status)."""
+        with self.lock:
+            self.points = {}
+            self.cells = {}
+            self.owner = {}
+            self.members = {}
+            self.summaries = {}
+            self._sorted = None
+            for point_id, public_id, lat, lng, status in rows:
+                if self._tracked(lat, lng, status):
+                    self._add(point_id, public_id, lat, lng)
+
+            ids = sorted(self.points)
+            lats = [self.points[point_id][1] for point_id in ids]
+            lons = [self.points[point_id][2] for point_id in ids]
+            for members in cluster_points(lats, lons, self.min_cases, self.radius_km):
+                self._set_cluster(ids[members[0]], [ids[j] for j in members.tolist()])
+
+            self._built()
+
+    def apply(self, rows, removed_ids=()):
+        """
+        Applies fresh rows of (id, public_id, latitude, longitude, status) and
+        deletions, then replays the greedy pass over the seeds they can affect.
+        """
+        with self.lock:
+            changed = {row[0]: row for row in rows}
+            changed.update((point_id, None) for point_id in removed_ids)
+
+            seeds = set()
+            for point_id, row in changed.items():
+                if point_id in self.points:
+                    # Neighbours at the old position, and the cluster it leaves
+                    seeds |= self._within(point_id)
+                    seeds.add(self.owner.pop(point_id, point_id))
+                    for member_id in self._set_cluster(point_id, None):
+                        seeds |= self._within(member_id)
+                        seeds.add(member_id)
+                    self._remove(point_id)
+                if row is not None and self._tracked(row[2], row[3], row[4]):
+                    self._add(point_id, row[1], row[2], row[3])
+
+            for point_id in changed:
+                if point_id in self.points:
+                    seeds |= self._within(point_id)
+                    seeds.add(point_id)
+
+            self._replay(seeds)
+
+    def refresh(self, rows, ids):
+        found = {row[0] for row in rows}
+        self.apply(rows, removed_ids=[point_id for point_id in ids if point_id not in found])
+
+    def hotspots(self):
+        """Hotspots sorted by decreasing count, as find_hotspots returns them."""
+        with self.lock:
+            if self._sorted is None:
+                self._sorted = [
+                    self.summaries[seed]
+                    for seed in sorted(self.summaries, key=lambda seed: (-self.summaries[seed]['count'], seed))
+                ]
+            return list(self._sorted)
+
+    def __len__(self):
+        return len(self.points)
+
+    def _tracked(self, lat, lng, status):
+        return status == 'missing' and lat is not None and lng is not None
+
+    def _add(self, point_id, public_id, lat, lng):
+        self.points[point_id] = (public_id, lat, lng)
+        self.cells.setdefault(grid_cell(lat, lng), set()).add(point_id)
+
+    def _remove(self, point_id):
+        point = self.points.pop(point_id, None)
+        if point is None:
+            return
+        cell = grid_cell(point[1], point[2])
+        self.cells[cell].discard(point_id)
+        if not self.cells[cell]:
+            del self.cells[cell]
+
+    def _within(self, point_id):
+        """Ids at most radius_km away from point_id, itself excluded."""
+        _, lat, lng = self.points[point_id]
+        lat_idx, lon_idx = grid_cell(lat, lng)
+        lat_steps, lon_steps = grid_steps(lat, self.radius_km)
+        width = min(2 * lon_steps + 1, MAX_LON_IDX)
+
+        candidates = []
+        for curr_lat in range(lat_idx - lat_steps, lat_idx + lat_steps + 1):
+            for d_lon in range(width):
+                cell = self.cells.get((curr_lat, (lon_idx - lon_steps + d_lon) % MAX_LON_IDX))
+                if cell:
+                    candidates.extend(cell)
+        if len(candidates) <= 1:
+            return set()
+
+        distances = haversine_distances(
+            lat, lng,
+            [self.points[other_id][1] for other_id in candidates],
+            [self.points[other_id][2] for other_id in candidates]
+        )
+        return {
+            other_id for other_id, distance in zip(candidates, distances.tolist())
+            if distance <= self.radius_km and other_id != point_id
+        }
+
+    def _set_cluster(self, seed, member_ids):
+        """
+        Makes member_ids (or nothing) the cluster of seed. Returns the ids
+        whose owner changed.
+        """
+        changed = []
+        new_members = set(member_ids or ())
+        for point_id in self.members.pop(seed, ()):
+            if point_id not in new_members and self.owner.get(point_id) == seed:
+                del self.owner[point_id]
+                changed.append(point_id)
+        if self.summaries.pop(seed, None) is not None:
+            self._sorted = None
+
+        if member_ids:
+            for point_id in member_ids:
+                if self.owner.get(point_id) != seed:
+                    self.owner[point_id] = seed
+                    changed.append(point_id)
+            self.members[seed] = member_ids
+            self.summaries[seed] = hotspot_summary(
+                [self.points[point_id][0] for point_id in member_ids],
+                [self.points[point_id][1] for point_id in member_ids],
+                [self.points[point_id][2] for point_id in member_ids],
+                self.radius_km
+            )
+            self._sorted = None
+        return changed
+
+    def _replay(self, seeds):
+        # Seeds are re-evaluated in id order; owners below the current seed are
+        # final, so a point counts as clustered iff its owner comes first
+        queue = [seed for seed in seeds if seed in self.points]
+        heapq.heapify(queue)
+        queued = set(queue)
+
+        while queue:
+            seed = heapq.heappop(queue)
+            owner = self.owner.get(seed)
+            if owner is not None and owner < seed:
+                member_ids = None
+            else:
+                free = sorted(
+                    point_id for point_id in self._within(seed)
+                    if self.owner.get(point_id) is None or self.owner[point_id] >= seed
+                )
+                member_ids = [seed] + free if len(free) + 1 >= self.min_cases else None
+
+            for point_id in self._set_cluster(seed, member_ids):
+                # Later seeds near a point whose owner changed may decide differently
+                for other_id in self._within(point_id) | {point_id}:
+                    if other_id > seed and other_id not in queued:
+                        heapq.heappush(queue, other_id)
+                        queued.add(other_id)
+
+
+# Keyed by (min_cases, radius_km)
+_INDEXES = IndexRegistry()
+
+def _fetch_rows(session, ids=None):
+    query = session.query(Disparu.id, Disparu.public_id, Disparu.latitude, Disparu.longitude, Disparu.status)
+    if ids is None:
+        query = query.filter(
+            Disparu.latitude.isnot(None),
+            Disparu.longitude.isnot(None),
+            Disparu.status == 'missing'
+        )
+        return query.order_by(Disparu.id).yield_per(5000)
+    return query.filter(Disparu.id.in_(ids)).all()
+
+
+
+def get_hotspot_index(min_cases=3, radius_km=50, session=None):
+    """Returns the up-to-date hotspot index for the session's database."""
+    return _INDEXES.get(session or db.session, lambda: HotspotIndex(min_cases, radius_km), _fetch_rows,
+                        key=(min_cases, radius_km))
+
+
+def invalidate_hotspot_index(engine=None):
+    """Forces a rebuild on next use, for bulk writes that bypass the ORM."""
+    _INDEXES.invalidate(engine)
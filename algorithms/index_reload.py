@@ -0,0 +1,163 @@
+import logging
+import threading
+import time
+import weakref
+
+from sqlalchemy.orm import Session
+
+from models import on_disparu_change
+
+logger = logging.getLogger(__name__)
+
+# Full resync with the database, picks up writes made by other workers
+DEFAULT_TTL = 300
+
+
+class ReloadableIndex:
+    """
+    Per-worker index of the disparus table, kept in step by an
+    IndexRegistry: ids written through the ORM are marked dirty and
+    refreshed on next use, and the whole index is reloaded in the
+    background once older than ttl. Subclasses load(rows) the full table,
+    calling _built() once done, and upsert(id, *values) / remove(id).
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self.dirty_ids = set()
+        self.reloading = None  # ids written during a background reload
+        self.built_at = None
+        self.lock = threading.RLock()
+
+    def _built(self):
+        self.dirty_ids = set()
+        self.built_at = time.time()
+
+    def mark_dirty(self, ids):
+        with self.lock:
+            ids = set(ids)
+            self.dirty_ids.update(ids)
+            if self.reloading is not None:
+                self.reloading.update(ids)
+
+    def is_stale(self):
+        return self.built_at is None or (time.time() - self.built_at) > self.ttl
+
+    def refresh(self, rows, ids):
+        """Applies the rows read back for the written ids; ids without one were deleted."""
+        found = set()
+        for row in rows:
+            self.upsert(*row)
+            found.add(row[0])
+        for disparu_id in ids:
+            if disparu_id not in found:
+                self.remove(disparu_id)
+
+
+def reload_in_background(index, engine, build, registry, key, registry_lock):
+    """
+    Replaces a stale per-worker index without holding up requests.
+
+    build(session) returns a loaded replacement, made on a daemon thread
+    with its own session while index keeps answering; the replacement is
+    then swapped in for index in registry[key]. Writes noted on index in
+    the meantime (index.reloading) are replayed on the replacement, which
+    is dropped if index was reloaded or reset before it was ready.
+    Returns the thread, or None when a reload is already under way.
+    """
+    with index.lock:
+        if index.reloading is not None:
+            return None
+        index.reloading = set()
+        built_at = index.built_at
+
+    def run():
+        fresh = None
+        try:
+            with Session(bind=engine) as session:
+                fresh = build(session)
+        except Exception as e:
+            logger.warning(f"Background reload of {type(index).__name__} failed: {e}")
+
+        with index.lock:
+            written, index.reloading = index.reloading, None
+            if index.built_at != built_at:
+                return
+            if fresh is None:
+                # Keeps serving what it has, and tries again after another ttl
+                index.built_at = time.time()
+                return
+            fresh.dirty_ids.update(written)
+            with registry_lock:
+                if registry.get(key) is index:
+                    registry[key] = fresh
+
+    thread = threading.Thread(target=run, name=f'reload-{type(index).__name__}', daemon=True)
+    thread.start()
+    return thread
+
+
+class IndexRegistry:
+    """
+    The ReloadableIndex instances of one kind, per engine so that separate
+    apps (and test databases) never share state, then per key for indexes
+    built with parameters. Follows the change feed of the disparus table.
+    """
+
+    def __init__(self):
+        self.indexes = weakref.WeakKeyDictionary()  # engine -> {key: index}
+        self.lock = threading.Lock()
+        on_disparu_change(self._on_disparu_change)
+
+    def get(self, session, factory, fetch_rows, key=None):
+        """
+        Returns the up-to-date index of the session's database for key,
+        made by factory() on first use. fetch_rows(session, ids=None) reads
+        the rows of the given ids, or those of the whole index.
+        """
+        engine = session.get_bind()
+        with self.lock:
+            indexes = self.indexes.get(engine)
+            if indexes is None:
+                indexes = self.indexes[engine] = {}
+            index = indexes.get(key)
+            if index is None:
+                index = indexes[key] = factory()
+
+        with index.lock:
+            if index.built_at is None:
+                # Never built, or reset by a bulk write: nothing right to serve yet
+                index.load(fetch_rows(session))
+            elif index.is_stale():
+                reload_in_background(index, engine, lambda s: _loaded(factory(), index.ttl, fetch_rows, s),
+                                     indexes, key, self.lock)
+            if index.dirty_ids:
+                ids = list(index.dirty_ids)
+                index.dirty_ids.clear()
+                index.refresh(fetch_rows(session, ids), ids)
+
+        return index
+
+    def invalidate(self, engine=None):
+        """Forces a rebuild on next use, for bulk writes that bypass the ORM."""
+        with self.lock:
+            if engine is None:
+                self.indexes.clear()
+            else:
+                self.indexes.pop(engine, None)
+
+    def _on_disparu_change(self, engine, changes):
+        with self.lock:
+            indexes = list(self.indexes.get(engine, {}).values())
+        reset = any(action == 'reset' for action, _ in changes)
+        for index in indexes:
+            if reset:
+                index.built_at = None
+            else:
+                index.mark_dirty(disparu_id for _, disparu_id in changes)
+
+
+def _loaded(index, ttl, fetch_rows, session):
+    index.ttl = ttl
+    index.load(fetch_rows(session))
+    return index
@@ -0,0 +1,275 @@
+import math
+import threading
+import time
+import weakref
+
+import numpy as np
+
+from models import db, Disparu, on_disparu_change
+from utils.geo import COUNTRIES_CITIES
+
+# Highest zoom with aggregated clusters; above it the map gets single cases
+MAX_ZOOM = 16
+# Cluster radius in screen pixels, on 256 px Web Mercator tiles
+RADIUS_PX = 60
+TILE_SIZE = 256
+MAX_MERCATOR_LAT = 85.05112878
+# Beyond this many grid rows a viewport query scans the whole level
+MAX_SCANNED_ROWS = 256
+# Full resync with the database, picks up writes made by other workers
+DEFAULT_TTL = 300
+# Type filters the maps offer; with the countries of COUNTRIES_CITIES, the
+# only filter sets given a hierarchy of their own
+PERSON_TYPES = ('all', 'person', 'child', 'adult', 'elderly', 'animal')
+
+
+def mercator(lats, lons):
+    """Web Mercator coordinates in [0, 1] (x eastward, y southward)"""
+    lats = np.clip(np.asarray(lats, dtype=np.float64), -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT)
+    lons = np.asarray(lons, dtype=np.float64)
+    x = (lons + 180) / 360
+    y = 0.5 - np.log(np.tan(np.pi / 4 + np.radians(lats) / 2)) / (2 * np.pi)
+    return np.clip(x, 0, 1 - 1e-12), np.clip(y, 0, 1 - 1e-12)
+
+
+def inverse_mercator(x, y):
+    lons = np.asarray(x) * 360 - 180
+    lats = np.degrees(2 * np.arctan(np.exp((0.5 - np.asarray(y)) * 2 * np.pi)) - np.pi / 2)
+    return lats, lons
+
+
+def _grid_columns(zoom):
+    return math.ceil(TILE_SIZE * 2 ** zoom / RADIUS_PX)
+
+
+def _cell_keys(x, y, columns):
+    return (y * columns).astype(np.int64) * columns + (x * columns).astype(np.int64)
+
+
+class _Level:
+    """Clusters of one zoom level, sorted row-major by grid cell for viewport queries."""
+
+    def __init__(self, zoom, keys, x, y, counts, point_ids):
+        self.zoom = zoom
+        self.keys = keys
+        self.x = x
+        self.y = y
+        self.counts = counts
+        self.point_ids = point_ids  # disparu id of single-case clusters, -1 otherwise
+        self.expansion_zoom = None
+
+    def aggregate(self, zoom):
+        """Merges this level into the coarser one, one cluster per grid cell."""
+        keys = _cell_keys(self.x, self.y, _grid_columns(zoom))
+        cell_keys, first, parents = np.unique(keys, return_index=True, return_inverse=True)
+
+        counts = np.bincount(parents, weights=self.counts)
+        x = np.bincount(parents, weights=self.x * self.counts) / counts
+        y = np.bincount(parents, weights=self.y * self.counts) / counts
+        children = np.bincount(parents)
+        point_ids = np.where(counts == 1, self.point_ids[first], -1)
+
+        level = _Level(zoom, cell_keys, x, y, counts.astype(np.int64), point_ids)
+        # Cluster splitting right below, or keeping a single child further down
+        level.expansion_zoom = np.where(children > 1, zoom + 1, self.expansion_zoom[first])
+        return level
+
+    def query(self, x_ranges, min_y, max_y):
+        """Indices of the clusters inside the Mercator box, one x range per side of the antimeridian."""
+        columns = _grid_columns(self.zoom)
+        first_row, last_row = int(min_y * columns), int(max_y * columns)
+
+        if last_row - first_row > MAX_SCANNED_ROWS:
+            # Box far larger than a screen at this zoom: plain scan
+            idx = np.arange(len(self.keys))
+        else:
+            found = []
+            for row in range(first_row, last_row + 1):
+                for min_x, max_x in x_ranges:
+                    lo = np.searchsorted(self.keys, row * columns + int(min_x * columns), side='left')
+                    hi = np.searchsorted(self.keys, row * columns + int(max_x * columns), side='right')
+                    if hi > lo:
+                        found.append(np.arange(lo, hi))
+            if not found:
+                return np.empty(0, np.int64)
+            idx = np.concatenate(found)
+
+        inside = (self.y[idx] >= min_y) & (self.y[idx] <= max_y)
+        inside &= np.logical_or.reduce([(self.x[idx] >= min_x) & (self.x[idx] <= max_x) for min_x, max_x in x_ranges])
+        return idx[inside]
+
+
+class ClusterHierarchy:
+    """
+    Precomputed point clusters for every zoom level (supercluster-style):
+    each level merges the clusters of the next zoom falling in the same
+    RADIUS_PX grid cell, weighted by count. A viewport query only walks the
+    grid rows it covers, so the response size follows the viewport.
+    """
+
+    def __init__(self, rows):
+        # rows: iterable of (id, latitude, longitude)
+        rows = list(rows)
+        ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        lats = np.fromiter((r[1] for r in rows), dtype=np.float64, count=len(rows))
+        lons = np.fromiter((r[2] for r in rows), dtype=np.float64, count=len(rows))
+        x, y = mercator(lats, lons)
+
+        keys = _cell_keys(x, y, _grid_columns(MAX_ZOOM + 1))
+        order = np.argsort(keys, kind='stable')
+        points = _Level(MAX_ZOOM + 1, keys[order], x[order], y[order], np.ones(len(rows), dtype=np.int64), ids[order])
+        points.expansion_zoom = np.full(len(rows), MAX_ZOOM + 1)
+
+        self.ids = np.sort(ids)
+        self.levels = {MAX_ZOOM + 1: points}
+        for zoom in range(MAX_ZOOM, -1, -1):
+            self.levels[zoom] = self.levels[zoom + 1].aggregate(zoom)
+        self.total = len(rows)
+
+    def holds(self, ids):
+        """Whether any of ids is one of the clustered cases."""
+        pos = np.minimum(np.searchsorted(self.ids, ids), max(len(self.ids) - 1, 0))
+        return bool(len(self.ids)) and bool((self.ids[pos] == ids).any())
+
+    def get_clusters(self, min_lat, max_lat, min_lng, max_lng, zoom, max_clusters=None):
+        """
+        Clusters in the box at zoom, as dicts with latitude, longitude, count,
+        expansion_zoom and the disparu id of single cases (None otherwise).
+        min_lng > max_lng means the box crosses the antimeridian. Past
+        max_clusters, the box is clustered at the next coarser zoom instead,
+        down to one that holds at most that many.
+        """
+        zoom = max(0, min(int(zoom), MAX_ZOOM + 1))
+        if not len(self.levels[zoom].keys):
+            return []
+
+        (west, east), (north, south) = mercator([max_lat, min_lat], [min_lng, max_lng])
+        if min_lng > max_lng:
+            x_ranges = [(west, 1), (0, east)]
+        else:
+            x_ranges = [(west, east)]
+
+        level = self.levels[zoom]
+        idx = level.query(x_ranges, north, south)
+        while max_clusters is not None and len(idx) > max_clusters and level.zoom > 0:
+            level = self.levels[level.zoom - 1]
+            idx = level.query(x_ranges, north, south)
+        lats, lons = inverse_mercator(level.x[idx], level.y[idx])
+        return [{
+            'id': int(i) * 32 + level.zoom,
+            'latitude': float(lat),
+            'longitude': float(lng),
+            'count': int(level.counts[i]),
+            'expansion_zoom': int(level.expansion_zoom[i]),
+            'disparu_id': int(level.point_ids[i]) if level.point_ids[i] >= 0 else None,
+        } for i, lat, lng in zip(idx.tolist(), lats.tolist(), lons.tolist())]
+
+
+# Per engine, then per filter set, so test databases never share state
+_HIERARCHIES = weakref.WeakKeyDictionary()
+# Per engine, cases written since the filter sets were last checked
+_DIRTY_IDS = weakref.WeakKeyDictionary()
+_HIERARCHIES_LOCK = threading.Lock()
+
+
+def _filtered_rows(session, person_type=None, country=None):
+    query = session.query(Disparu.id, Disparu.latitude, Disparu.longitude).filter(
+        Disparu.latitude.isnot(None),
+        Disparu.longitude.isnot(None)
+    )
+    if country:
+        query = query.filter(Disparu.country == country)
+    if person_type and person_type != 'all':
+        if person_type == 'person':
+            query = query.filter(Disparu.person_type.in_(['child', 'adult', 'elderly']))
+        else:
+            query = query.filter(Disparu.person_type == person_type)
+    return query.yield_per(5000)
+
+
+def _matches(key, person_type, country):
+    key_type, key_country = key
+    if key_country is not None and country != key_country:
+        return False
+    if key_type == 'person':
+        return person_type in ('child', 'adult', 'elderly')
+    return key_type in ('all', person_type)
+
+
+def _drop_affected(cache, session, ids):
+    """
+    Drops the hierarchies a write to ids can change: those holding one of
+    the cases (moved, refiltered or deleted) and those whose filters one
+    of them now matches. The other filter sets stay cached.
+    """
+    rows = session.query(Disparu.person_type, Disparu.country).filter(
+        Disparu.id.in_(ids),
+        Disparu.latitude.isnot(None),
+        Disparu.longitude.isnot(None)
+    ).all()
+    ids = np.fromiter(ids, dtype=np.int64, count=len(ids))
+    with _HIERARCHIES_LOCK:
+        for key, (_, hierarchy) in list(cache.items()):
+            if hierarchy.holds(ids) or any(_matches(key, person_type, country) for person_type, country in rows):
+                del cache[key]
+
+
+def map_filter_key(person_type=None, country=None):
+    """(person_type, country) cache key of map filters, None for filters the maps do not offer."""
+    person_type = person_type or 'all'
+    if person_type not in PERSON_TYPES or (country and country not in COUNTRIES_CITIES):
+        return None
+    return person_type, country or None
+
+
+def get_cluster_hierarchy(person_type=None, country=None, session=None):
+    """
+    Returns the cluster hierarchy of the geolocated cases matching the map
+    filters. Raises ValueError for filters map_filter_key() rejects, which
+    would otherwise each get a hierarchy of their own.
+    """
+    session = session or db.session
+    engine = session.get_bind()
+    key = map_filter_key(person_type, country)
+    if key is None:
+        raise ValueError(f"Unknown map filter: type={person_type!r} country={country!r}")
+
+    with _HIERARCHIES_LOCK:
+        cache = _HIERARCHIES.get(engine)
+        if cache is None:
+            cache = _HIERARCHIES[engine] = {}
+        dirty_ids = _DIRTY_IDS.pop(engine, None)
+    if dirty_ids:
+        _drop_affected(cache, session, dirty_ids)
+    with _HIERARCHIES_LOCK:
+        entry = cache.get(key)
+
+    if entry is None or (time.time() - entry[0]) > DEFAULT_TTL:
+        built_at = time.time()
+        hierarchy = ClusterHierarchy(_filtered_rows(session, person_type, country))
+        with _HIERARCHIES_LOCK:
+            cache[key] = (built_at, hierarchy)
+        return hierarchy
+    return entry[1]
+
+
+def invalidate_cluster_hierarchies(engine=None):
+    """Forces a rebuild on next use, for bulk writes that bypass the ORM."""
+    with _HIERARCHIES_LOCK:
+        if engine is None:
+            _HIERARCHIES.clear()
+            _DIRTY_IDS.clear()
+        else:
+            _HIERARCHIES.pop(engine, None)
+            _DIRTY_IDS.pop(engine, None)
+
+
+@on_disparu_change
+def _on_disparu_change(engine, changes):
+    if any(action == 'reset' for action, _ in changes):
+        invalidate_cluster_hierarchies(engine)
+        return
+    # Resolved against the filter sets on next use, once the write is readable
+    with _HIERARCHIES_LOCK:
+        if engine in _HIERARCHIES:
+            _DIRTY_IDS.setdefault(engine, set()).update(disparu_id for _, disparu_id in changes)
@@ -0,0 +1,183 @@
+import threading
+import time
+import weakref
+from collections import OrderedDict, namedtuple
+
+from models import db, Disparu, on_disparu_change
+from algorithms.phonetics import name_keys
+from algorithms.minhash import minhash_similarity
+from algorithms.name_index import MIN_OVERLAP, get_name_index
+from algorithms.description_index import DEFAULT_THRESHOLD as DESCRIPTION_THRESHOLD
+
+HASH_MASK = (1 << 64) - 1
+
+# Match lists kept per database, and how long one may be served
+DEFAULT_MAXSIZE = 1024
+DEFAULT_TTL = 300
+
+# What a cached list was computed from: the case's version, its candidates,
+# and the blocking keys any new candidate would have to share
+CacheEntry = namedtuple('CacheEntry', [
+    'updated_at', 'version', 'created', 'matches', 'candidate_ids',
+    'person_type', 'name_keys', 'photo_hash', 'photo_distance', 'description_minhash',
+])
+
+
+def _copy(matches):
+    # Callers get their own lists: the cached ones are shared
+    return [dict(match, disparu=dict(match['disparu']), match_reasons=list(match['match_reasons']))
+            for match in matches]
+
+
+class MatchCache:
+    """
+    Bounded LRU of find_potential_matches() results keyed by case id, valid
+    while the case keeps its updated_at and the cache its version.
+
+    A write to a case drops the lists it could change: the case's own, the
+    lists it is a candidate in, and the lists of the cases it now blocks
+    with (name keys, photo hash or description signature close enough to
+    make it a candidate). Bulk writes that bypass the ORM bump the version,
+    which drops everything.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = 0
+        self.entries = OrderedDict()
+        self.dirty_ids = set()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+
+    def get(self, disparu):
+        with self.lock:
+            entry = self.entries.get(disparu.id)
+            if entry is None or entry.updated_at != disparu.updated_at or entry.version != self.version \
+                    or time.time() - entry.created > self.ttl:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(disparu.id)
+            self.hits += 1
+            return _copy(entry.matches)
+
+    def put(self, disparu, matches, candidate_ids, version, photo_distance):
+        """Stores the matches computed at cache version `version`, unless it moved on since."""
+        photo_hash = disparu.photo_hash if disparu.photo_url else None
+        entry = CacheEntry(
+            disparu.updated_at, version, time.time(), _copy(matches), frozenset(candidate_ids),
+            disparu.person_type, frozenset(name_keys(disparu.first_name, disparu.last_name)),
+            photo_hash, photo_distance, disparu.description_minhash,
+        )
+        with self.lock:
+            if version != self.version:
+                return
+            self.entries[disparu.id] = entry
+            self.entries.move_to_end(disparu.id)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def mark_dirty(self, ids):
+        with self.lock:
+            self.dirty_ids.update(ids)
+
+    def clear(self):
+        with self.lock:
+            self.version += 1
+            self.entries.clear()
+            self.dirty_ids.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def evict(self, ids, rows, name_index):
+        """
+        Drops the lists the written cases could change. rows are the current
+        values of those still in the database.
+        """
+        changed = set(ids)
+        rows = [(row, frozenset(name_keys(row.first_name, row.last_name))) for row in rows]
+        with self.lock:
+            for disparu_id, entry in list(self.entries.items()):
+                if disparu_id in changed or not changed.isdisjoint(entry.candidate_ids) \
+                        or any(self._blocks_with(entry, row, keys, name_index) for row, keys in rows):
+                    del self.entries[disparu_id]
+
+    @staticmethod
+    def _blocks_with(entry, row, keys, name_index):
+        if entry.person_type and row.person_type != entry.person_type:
+            return False
+        if not entry.name_keys.isdisjoint(keys) and name_index.overlap(entry.name_keys, keys) >= MIN_OVERLAP:
+            return True
+        if entry.photo_hash is not None and row.photo_url and row.photo_hash is not None \
+                and ((entry.photo_hash ^ row.photo_hash) & HASH_MASK).bit_count() <= entry.photo_distance:
+            return True
+        return minhash_similarity(entry.description_minhash, row.description_minhash) >= DESCRIPTION_THRESHOLD
+
+
+# One cache per engine so that separate apps (and test databases) never share state
+_CACHES = weakref.WeakKeyDictionary()
+_CACHES_LOCK = threading.Lock()
+_settings = {'maxsize': DEFAULT_MAXSIZE, 'ttl': DEFAULT_TTL}
+
+
+def configure_match_cache(maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL):
+    """Sets the size and TTL of the match caches, existing ones included."""
+    with _CACHES_LOCK:
+        _settings.update(maxsize=maxsize, ttl=ttl)
+        for cache in _CACHES.values():
+            with cache.lock:
+                cache.maxsize, cache.ttl = maxsize, ttl
+                while len(cache.entries) > maxsize:
+                    cache.entries.popitem(last=False)
+
+
+def _fetch_rows(session, ids):
+    return session.query(
+        Disparu.id, Disparu.person_type, Disparu.first_name, Disparu.last_name,
+        Disparu.photo_url, Disparu.photo_hash, Disparu.description_minhash
+    ).filter(Disparu.id.in_(ids)).all()
+
+
+def get_match_cache(session=None):
+    """Returns the match cache of the session's database, purged of the lists writes made stale."""
+    session = session or db.session
+    engine = session.get_bind()
+
+    with _CACHES_LOCK:
+        cache = _CACHES.get(engine)
+        if cache is None:
+            cache = _CACHES[engine] = MatchCache(**_settings)
+
+    with cache.lock:
+        if cache.dirty_ids:
+            ids = list(cache.dirty_ids)
+            cache.dirty_ids.clear()
+            if len(ids) > cache.maxsize:
+                # Cheaper to start over than to check every list
+                cache.clear()
+            elif cache.entries:
+                cache.evict(ids, _fetch_rows(session, ids), get_name_index(session))
+
+    return cache
+
+
+def invalidate_match_cache(engine=None):
+    """Drops every cached list, for bulk writes that bypass the ORM."""
+    with _CACHES_LOCK:
+        caches = list(_CACHES.values()) if engine is None else [_CACHES.get(engine)]
+    for cache in caches:
+        if cache is not None:
+            cache.clear()
+
+
+@on_disparu_change
+def _on_disparu_change(engine, changes):
+    cache = _CACHES.get(engine)
+    if cache is None:
+        return
+    if any(action == 'reset' for action, _ in changes):
+        cache.clear()
+    else:
+        cache.mark_dirty(disparu_id for _, disparu_id in changes)
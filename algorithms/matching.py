@@ -1,34 +1,45 @@
 import os
 import difflib
-import re
+import numpy as np
 from PIL import Image
-from sqlalchemy import or_
 from models import Disparu
 from flask import current_app
-
-STOP_WORDS = {
-    'le', 'la', 'les', 'l', 'un', 'une', 'des', 'du', 'de', 'd',
-    'et', 'ou', 'a', 'au', 'aux', 'ce', 'cet', 'cette', 'ces',
-    'est', 'sont', 'il', 'elle', 'ils', 'elles', 'je', 'tu', 'nous', 'vous',
-    'mon', 'ton', 'son', 'ma', 'ta', 'sa', 'mes', 'tes', 'ses',
-    'qui', 'que', 'quoi', 'dont', 'ou', 'quand', 'comment', 'pour',
-    'avec', 'sans', 'dans', 'sur', 'sous', 'par', 'en', 'vers', 'chez'
-}
-
-_HASH_CACHE = {}
-
-def compute_image_hash(image_path):
+from sqlalchemy import inspect
+from algorithms.photo_index import get_photo_index, hamming_distances, max_distance_for
+from algorithms.hash_cache import ImageHashCache
+from algorithms.name_index import get_name_index
+from algorithms.phonetics import fold_name, jaro_winkler, jaro_winkler_many, name_similarity
+from algorithms.description_index import get_description_index
+from algorithms.minhash import NUM_PERM, description_tokens, minhash_similarity, signature_array
+from algorithms.match_cache import get_match_cache
+
+# Sized and optionally shared across workers by configure_hash_cache()
+_HASH_CACHE = ImageHashCache()
+
+HASH_MASK = (1 << 64) - 1
+
+# Candidate budget of find_potential_matches, per source
+NAME_CANDIDATES = 200
+PHOTO_CANDIDATES = 50
+DESCRIPTION_CANDIDATES = 100
+# Lowest photo similarity that still scores points
+PHOTO_CANDIDATE_SIMILARITY = 0.6
+# Lowest score reported as a potential match
+MIN_MATCH_SCORE = 30
+# Matches returned by find_potential_matches, best first
+MAX_MATCHES = 10
+# Distinct names from which one batched Jaro-Winkler beats the cached one per name
+BATCH_SIMILARITY_MIN = 64
+
+def compute_image_hash(image_path, use_cache=True):
     """
     Computes dHash (difference hash) for an image.
     Returns a hexadecimal string representing the hash.
+    use_cache=False for throwaway files, which would only leave dead entries.
     """
     if not image_path:
         return None
 
-    # Check cache first
-    if image_path in _HASH_CACHE:
-        return _HASH_CACHE[image_path]
-
     try:
         # Resolve full path if relative
         if not os.path.isabs(image_path):
@@ -46,8 +57,15 @@ def compute_image_hash(image_path):
         else:
             full_path = image_path
 
-        if not os.path.exists(full_path):
-            return None
+        cache_key = None
+        if use_cache:
+            # Keyed by mtime and size: a photo replaced under the same name is rehashed
+            cache_key = _HASH_CACHE.key_for(full_path)
+            if cache_key is None:
+                return None
+            cached = _HASH_CACHE.get(cache_key)
+            if cached is not None:
+                return cached
 
         with Image.open(full_path) as img:
             # 1. Resize to 9x8 (width=9, height=8) for dHash
@@ -77,13 +95,45 @@ def compute_image_hash(image_path):
                     decimal_value = 0
 
             img_hash = "".join(hex_string)
-            _HASH_CACHE[image_path] = img_hash
+            if cache_key is not None:
+                _HASH_CACHE.put(cache_key, img_hash)
             return img_hash
 
     except Exception as e:
         # print(f"Error hashing image {image_path}: {e}")
         return None
 
+def configure_hash_cache(maxsize, path=None):
+    """Bounds the image hash cache and sets its shared on-disk store (None for memory only)."""
+    _HASH_CACHE.configure(maxsize, path)
+
+def hash_cache_stats():
+    return _HASH_CACHE.stats()
+
+def hash_to_int(img_hash):
+    """
+    Converts a hex dHash to the signed 64-bit integer stored in
+    Disparu.photo_hash / Contribution.proof_hash (BIGINT is signed).
+    """
+    if not img_hash:
+        return None
+    value = int(img_hash, 16)
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+def compute_photo_hash(image_path, use_cache=True):
+    """dHash of an image file as a stored integer, None if it cannot be read."""
+    return hash_to_int(compute_image_hash(image_path, use_cache))
+
+def hamming_similarity(hash1, hash2):
+    """
+    Compares two stored 64-bit hashes.
+    Returns a similarity score between 0.0 and 1.0.
+    """
+    if hash1 is None or hash2 is None:
+        return 0.0
+    distance = ((hash1 ^ hash2) & HASH_MASK).bit_count()
+    return 1.0 - distance / 64
+
 def compare_hashes(hash1, hash2):
     """
     Compares two image hashes (hex strings).
@@ -132,13 +182,8 @@ def description_similarity(desc1, desc2):
     if not desc1 or not desc2:
         return 0.0
 
-    def tokenize(text):
-        # Simple tokenization: remove punctuation, split by space
-        words = re.findall(r'\w+', text.lower())
-        return set(w for w in words if w not in STOP_WORDS and len(w) > 2)
-
-    set1 = tokenize(desc1)
-    set2 = tokenize(desc2)
+    set1 = description_tokens(desc1)
+    set2 = description_tokens(desc2)
 
     if not set1 or not set2:
         return 0.0
@@ -149,6 +194,191 @@ def description_similarity(desc1, desc2):
     # Jaccard index
     return intersection / union if union > 0 else 0.0
 
+def blocked_candidate_ids(disparu, name_index, photo_index, description_index,
+                          name_candidates=NAME_CANDIDATES, photo_candidates=PHOTO_CANDIDATES,
+                          description_candidates=DESCRIPTION_CANDIDATES):
+    """
+    Ids worth scoring against disparu: ranked name lookalikes from the
+    blocking index, wherever they live, plus photo and description
+    lookalikes.
+    """
+    ids = [point_id for _, point_id in name_index.search(
+        disparu.first_name, disparu.last_name, name_candidates, exclude={disparu.id}
+    )]
+    if disparu.photo_url and disparu.photo_hash is not None:
+        hits = photo_index.search(disparu.photo_hash, max_distance_for(PHOTO_CANDIDATE_SIMILARITY), exclude={disparu.id})
+        ids.extend(point_id for _, point_id in hits[:photo_candidates])
+    if disparu.description_minhash:
+        hits = description_index.search(disparu.description_minhash, limit=description_candidates, exclude={disparu.id})
+        ids.extend(point_id for _, point_id in hits)
+    return ids
+
+def _blocked_candidate_ids(disparu):
+    """blocked_candidate_ids() over the shared, up-to-date indexes."""
+    return blocked_candidate_ids(disparu, get_name_index(), get_photo_index(), get_description_index())
+
+def score_pair(disparu, other):
+    """
+    Scores how likely two records describe the same person.
+    Returns (score, reasons); MIN_MATCH_SCORE and above is a potential match.
+    Photo hashes are stored at upload: no image file is read here.
+    """
+    score = 0
+    reasons = []
+    
+    # 1. Location (Country & City) - Weight: High
+    # Country
+    if disparu.country and other.country:
+        if disparu.country.lower() == other.country.lower():
+            score += 15
+            reasons.append("Pays identique")
+    
+    # City
+    city_sim = jaro_winkler(fold_name(disparu.city), fold_name(other.city))
+    if city_sim > 0.9:
+        score += 15
+        reasons.append(f"Ville similaire ({int(city_sim*100)}%)")
+
+    # 2. Names (First & Last) - Weight: High
+    # Jaro-Winkler, straight and swapped (first-first vs first-last)
+    name_sim = name_similarity(disparu.first_name, disparu.last_name, other.first_name, other.last_name)
+    if name_sim > 0.92:
+        score += 30
+        reasons.append(f"Nom très similaire ({int(name_sim*100)}%)")
+    elif name_sim > 0.85:
+        score += 15
+        reasons.append(f"Nom similaire ({int(name_sim*100)}%)")
+
+    # 3. Age - Weight: Medium/High
+    if disparu.age and other.age and disparu.age > 0 and other.age > 0:
+        age_diff = abs(disparu.age - other.age)
+        if age_diff <= 2:
+            score += 15
+            reasons.append("Age proche (<= 2 ans)")
+        elif age_diff <= 5:
+            score += 10
+            reasons.append("Age proche (<= 5 ans)")
+    
+    # 4. Sex - Weight: Medium (Filter?)
+    if disparu.sex and other.sex and disparu.sex == other.sex:
+        score += 10
+    
+    # 5. Physical Description - Weight: Medium
+    # Estimated from the stored signatures (description and clothing)
+    if disparu.description_minhash and other.description_minhash:
+        desc_sim = minhash_similarity(disparu.description_minhash, other.description_minhash)
+    else:
+        desc_sim = description_similarity(disparu.physical_description, other.physical_description)
+    if desc_sim > 0.3:
+        points = int(desc_sim * 20) # Max 20 points
+        score += points
+        reasons.append(f"Description similaire ({int(desc_sim*100)}%)")
+
+    # 6. Image - Weight: Very High
+    if disparu.photo_url and other.photo_url:
+        other_hash = other.photo_hash
+        if disparu.photo_hash is not None and other_hash is not None:
+            img_sim = hamming_similarity(disparu.photo_hash, other_hash)
+            if img_sim > 0.8: # Threshold for high similarity
+                score += 40
+                reasons.append(f"Photo très similaire ({int(img_sim*100)}%)")
+            elif img_sim > 0.6:
+                score += 20
+                reasons.append(f"Photo similaire ({int(img_sim*100)}%)")
+
+    return score, reasons
+
+def _similarity_column(query_values, values):
+    """
+    Jaro-Winkler of each query value against each of values, as a
+    (len(query_values), len(values)) matrix computed once per distinct value.
+    Also returns whether each value is non-empty.
+    """
+    distinct = {}
+    codes = np.fromiter((distinct.setdefault(value, len(distinct)) for value in values), dtype=np.intp, count=len(values))
+    distinct = list(distinct)
+    if len(distinct) >= BATCH_SIMILARITY_MIN:
+        matrix = np.array([jaro_winkler_many(query, distinct) for query in query_values])
+    else:
+        matrix = np.array([[jaro_winkler(query, value) for value in distinct] for query in query_values])
+    known = np.fromiter((bool(value) for value in distinct), dtype=bool, count=len(distinct))
+    return matrix.reshape(len(query_values), len(distinct))[:, codes], known[codes]
+
+def score_candidates(disparu, others):
+    """
+    score_pair() scores of disparu against each of others, as an int array,
+    without the reasons. Each criterion is evaluated over columns of the
+    candidates at once; names are scored from a matrix of the query's name
+    parts against the distinct names among the candidates.
+    """
+    count = len(others)
+    scores = np.zeros(count, dtype=np.int64)
+    if not count:
+        return scores
+
+    # Location
+    if disparu.country:
+        country = disparu.country.lower()
+        scores += 15 * np.fromiter((bool(o.country) and o.country.lower() == country for o in others), dtype=bool, count=count)
+    city_sim, _ = _similarity_column([fold_name(disparu.city)], [fold_name(o.city) for o in others])
+    scores += np.where(city_sim[0] > 0.9, 15, 0)
+
+    # Names, straight and swapped, as name_similarity()
+    first, last = fold_name(disparu.first_name or ''), fold_name(disparu.last_name or '')
+    parts = [fold_name(o.first_name or '') for o in others] + [fold_name(o.last_name or '') for o in others]
+    sims, known = _similarity_column([first, last], parts)
+    straight = sims[0, :count] + sims[1, count:]
+    swapped = sims[0, count:] + sims[1, :count]
+    known = np.maximum(bool(first) + bool(last), known[:count].astype(np.int64) + known[count:])
+    name_sim = np.maximum(straight, swapped) / np.maximum(known, 1)
+    scores += np.where(name_sim > 0.92, 30, np.where(name_sim > 0.85, 15, 0))
+
+    # Age and sex
+    if disparu.age and disparu.age > 0:
+        ages = np.fromiter((o.age or 0 for o in others), dtype=np.int64, count=count)
+        age_diff = np.abs(ages - disparu.age)
+        scores += np.where(ages > 0, np.where(age_diff <= 2, 15, np.where(age_diff <= 5, 10, 0)), 0)
+    if disparu.sex:
+        scores += 10 * np.fromiter((o.sex == disparu.sex for o in others), dtype=bool, count=count)
+
+    # Description: signatures compared in one pass, text for rows without one
+    desc_sim = np.zeros(count)
+    signed = [i for i, o in enumerate(others) if o.description_minhash] if disparu.description_minhash else []
+    if signed:
+        signatures = np.frombuffer(b''.join(others[i].description_minhash for i in signed), dtype='<u4')
+        equal = signatures.reshape(-1, NUM_PERM) == signature_array(disparu.description_minhash)
+        desc_sim[signed] = np.count_nonzero(equal, axis=1) / NUM_PERM
+    signed = set(signed)
+    for i, o in enumerate(others):
+        if i not in signed:
+            desc_sim[i] = description_similarity(disparu.physical_description, o.physical_description)
+    scores += np.where(desc_sim > 0.3, (desc_sim * 20).astype(np.int64), 0)
+
+    # Photo: popcount of the XOR of the packed hashes
+    if disparu.photo_url and disparu.photo_hash is not None:
+        hashed = np.fromiter((bool(o.photo_url) and o.photo_hash is not None for o in others), dtype=bool, count=count)
+        hashes = np.fromiter((o.photo_hash if h else 0 for o, h in zip(others, hashed)), dtype=np.int64, count=count)
+        distance = hamming_distances(hashes.view(np.uint64), np.uint64(disparu.photo_hash & HASH_MASK))
+        img_sim = 1.0 - distance / 64
+        scores += np.where(hashed, np.where(img_sim > 0.8, 40, np.where(img_sim > 0.6, 20, 0)), 0)
+
+    return scores
+
+def best_candidates(disparu, others, limit=MAX_MATCHES):
+    """
+    (other, score, reasons) of the limit best of others scoring
+    MIN_MATCH_SCORE or more, best first; reasons are only worded for those.
+    """
+    scores = score_candidates(disparu, others)
+    kept = np.flatnonzero(scores >= MIN_MATCH_SCORE)
+    kept = kept[np.argsort(-scores[kept], kind='stable')][:limit]
+    return [(others[i], int(scores[i]), score_pair(disparu, others[i])[1]) for i in kept.tolist()]
+
+def _cacheable(disparu):
+    """Saved cases without pending changes: their updated_at is their version."""
+    state = inspect(disparu, raiseerr=False)
+    return state is not None and state.persistent and not state.modified
+
 def find_potential_matches(disparu):
     """
     Finds potential matches for a given Disparu object.
@@ -164,115 +394,63 @@ def find_potential_matches(disparu):
     # Check if we are in an application context to access DB
     # If not, return empty list (fail safe)
     try:
+        # Unchanged case, unchanged candidates: served from the cache
+        cache = get_match_cache() if _cacheable(disparu) else None
+        if cache is not None:
+            cached = cache.get(disparu)
+            if cached is not None:
+                return cached
+            version = cache.version
+
         query = Disparu.query.filter(Disparu.id != disparu.id)
 
         # Performance optimization: pre-filter potential matches in database
         if hasattr(disparu, 'person_type') and disparu.person_type:
             query = query.filter(Disparu.person_type == disparu.person_type)
 
-        or_conditions = []
-
-        if disparu.country:
-            or_conditions.append(Disparu.country == disparu.country)
-        if disparu.city:
-            or_conditions.append(Disparu.city == disparu.city)
-        if disparu.first_name:
-            or_conditions.append(Disparu.first_name == disparu.first_name)
-        if disparu.last_name:
-            or_conditions.append(Disparu.last_name == disparu.last_name)
-        if disparu.age and disparu.age > 0:
-            or_conditions.append(Disparu.age.between(max(0, disparu.age - 5), disparu.age + 5))
+        # Only name, photo or description lookalikes are scored, wherever they live
+        blocked_ids = _blocked_candidate_ids(disparu)
+        all_disparus = query.filter(Disparu.id.in_(blocked_ids)).all() if blocked_ids else []
+    except Exception:
+        return []
 
-        if or_conditions:
-            query = query.filter(or_(*or_conditions))
+    # Scored as arrays; only the best are worded and serialized
+    for other, score, reasons in best_candidates(disparu, all_disparus):
+        matches.append({
+            'disparu': other.to_dict(),
+            'score': score,
+            'match_reasons': reasons
+        })
+    if cache is not None:
+        cache.put(disparu, matches, blocked_ids, version, max_distance_for(PHOTO_CANDIDATE_SIMILARITY))
+    return matches
+
+def find_similar_hashes(photo_hash, threshold=0.8, exclude_id=None, limit=50):
+    """
+    Cases whose stored photo hash is at least `threshold` similar to
+    photo_hash, closest first, looked up in the multi-index hash table.
+    Returns a list of dictionaries with 'disparu' (dict), 'distance' (bits)
+    and 'similarity'.
+    """
+    if photo_hash is None:
+        return []
 
-        # Limiting to last 500
-        all_disparus = query.limit(500).all()
-    except Exception:
+    index = get_photo_index()
+    exclude = {exclude_id} if exclude_id is not None else ()
+    hits = index.search(photo_hash, max_distance_for(threshold), exclude=exclude)[:limit]
+    if not hits:
         return []
 
-    # Calculate scores
-    disparu_hash = None
-    if disparu.photo_url:
-        disparu_hash = compute_image_hash(disparu.photo_url)
-
-    for other in all_disparus:
-        score = 0
-        reasons = []
-        
-        # 1. Location (Country & City) - Weight: High
-        # Country
-        if disparu.country and other.country:
-            if disparu.country.lower() == other.country.lower():
-                score += 15
-                reasons.append("Pays identique")
-        
-        # City
-        city_sim = text_similarity(disparu.city, other.city)
-        if city_sim > 0.8:
-            score += 15
-            reasons.append(f"Ville similaire ({int(city_sim*100)}%)")
-
-        # 2. Names (First & Last) - Weight: High
-        # Check cross match (first-first vs first-last in case of swap)
-        name1 = f"{disparu.first_name} {disparu.last_name}"
-        name2 = f"{other.first_name} {other.last_name}"
-        name3 = f"{other.last_name} {other.first_name}" # Swapped
-        
-        name_sim = max(text_similarity(name1, name2), text_similarity(name1, name3))
-        if name_sim > 0.85:
-            score += 30
-            reasons.append(f"Nom très similaire ({int(name_sim*100)}%)")
-        elif name_sim > 0.6:
-            score += 15
-            reasons.append(f"Nom similaire ({int(name_sim*100)}%)")
-
-        # 3. Age - Weight: Medium/High
-        if disparu.age and other.age and disparu.age > 0 and other.age > 0:
-            age_diff = abs(disparu.age - other.age)
-            if age_diff <= 2:
-                score += 15
-                reasons.append("Age proche (<= 2 ans)")
-            elif age_diff <= 5:
-                score += 10
-                reasons.append("Age proche (<= 5 ans)")
-        
-        # 4. Sex - Weight: Medium (Filter?)
-        if disparu.sex and other.sex and disparu.sex == other.sex:
-            score += 10
-        
-        # 5. Physical Description - Weight: Medium
-        desc_sim = description_similarity(disparu.physical_description, other.physical_description)
-        if desc_sim > 0.3:
-            points = int(desc_sim * 20) # Max 20 points
-            score += points
-            reasons.append(f"Description similaire ({int(desc_sim*100)}%)")
-
-        # 6. Image - Weight: Very High
-        if disparu_hash and other.photo_url:
-            other_hash = compute_image_hash(other.photo_url)
-            if other_hash:
-                img_sim = compare_hashes(disparu_hash, other_hash)
-                if img_sim > 0.8: # Threshold for high similarity
-                    score += 40
-                    reasons.append(f"Photo très similaire ({int(img_sim*100)}%)")
-                elif img_sim > 0.6:
-                    score += 20
-                    reasons.append(f"Photo similaire ({int(img_sim*100)}%)")
-
-        if score >= 30: # Threshold to be considered a match
-            matches.append({
-                'disparu': other.to_dict(),
-                'score': score,
-                'match_reasons': reasons
-            })
-    
-    # Sort by score desc
-    matches.sort(key=lambda x: x['score'], reverse=True)
-    return matches[:10]
+    records = {d.id: d for d in Disparu.query.filter(Disparu.id.in_([point_id for _, point_id in hits])).all()}
+    return [{
+        'disparu': records[point_id].to_dict(),
+        'distance': distance,
+        'similarity': 1.0 - distance / 64
+    } for distance, point_id in hits if point_id in records]
 
-def find_similar_photos(photo_path, threshold=0.8):
-    return []
+def find_similar_photos(photo_path, threshold=0.8, limit=50, use_cache=True):
+    """Cases whose photo looks like the image at photo_path (duplicates, reposts)."""
+    return find_similar_hashes(compute_photo_hash(photo_path, use_cache), threshold, limit=limit)
 
 def compare_photos(photo1_path, photo2_path):
     h1 = compute_image_hash(photo1_path)
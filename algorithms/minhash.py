@@ -0,0 +1,68 @@
+import re
+import zlib
+
+import numpy as np
+
+STOP_WORDS = {
+    'le', 'la', 'les', 'l', 'un', 'une', 'des', 'du', 'de', 'd',
+    'et', 'ou', 'a', 'au', 'aux', 'ce', 'cet', 'cette', 'ces',
+    'est', 'sont', 'il', 'elle', 'ils', 'elles', 'je', 'tu', 'nous', 'vous',
+    'mon', 'ton', 'son', 'ma', 'ta', 'sa', 'mes', 'tes', 'ses',
+    'qui', 'que', 'quoi', 'dont', 'ou', 'quand', 'comment', 'pour',
+    'avec', 'sans', 'dans', 'sur', 'sous', 'par', 'en', 'vers', 'chez'
+}
+
+# 64 hash functions in 32 LSH bands of 2 rows: a pair with Jaccard J shares
+# a band with probability 1 - (1 - J^2)^32, 95% at J = 0.3
+NUM_PERM = 64
+BAND_ROWS = 2
+BANDS = NUM_PERM // BAND_ROWS
+SIGNATURE_BYTES = NUM_PERM * 4
+
+# Fixed seed: signatures are stored, they must not change between processes
+_rng = np.random.default_rng(0x6D696E68)
+_PERM_A = _rng.integers(1, 2 ** 63, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_PERM_B = _rng.integers(0, 2 ** 63, size=NUM_PERM, dtype=np.uint64)
+
+
+def description_tokens(text):
+    """Lowercase words of more than 2 letters, French stop words removed."""
+    if not text:
+        return set()
+    words = re.findall(r'\w+', text.lower())
+    return set(w for w in words if w not in STOP_WORDS and len(w) > 2)
+
+
+def minhash_signature(*texts):
+    """
+    MinHash of the words of the given texts as SIGNATURE_BYTES bytes
+    (little-endian uint32), None when they have no word to hash.
+    """
+    tokens = set()
+    for text in texts:
+        tokens |= description_tokens(text)
+    if not tokens:
+        return None
+
+    # crc32 rather than hash(): str hashes are salted per process
+    values = np.fromiter((zlib.crc32(token.encode('utf-8')) for token in tokens), dtype=np.uint64, count=len(tokens))
+    # Multiply-shift hashing, one (a, b) pair per permutation; uint64 wraps
+    hashed = (values[:, None] * _PERM_A + _PERM_B) >> np.uint64(32)
+    return hashed.min(axis=0).astype('<u4').tobytes()
+
+
+def signature_array(signature):
+    return np.frombuffer(signature, dtype='<u4')
+
+
+def minhash_similarity(signature1, signature2):
+    """Estimated Jaccard index of two signatures, 0.0 when either is missing."""
+    if not signature1 or not signature2:
+        return 0.0
+    return np.count_nonzero(signature_array(signature1) == signature_array(signature2)) / NUM_PERM
+
+
+def band_keys(signatures):
+    """(n, BANDS) uint64 keys: the BAND_ROWS values of each band packed together."""
+    rows = signatures.reshape(-1, BANDS, BAND_ROWS).astype(np.uint64)
+    return (rows[:, :, 0] << np.uint64(32)) | rows[:, :, 1]
@@ -0,0 +1,168 @@
+import math
+
+import numpy as np
+
+from models import db, Disparu
+from algorithms.index_reload import DEFAULT_TTL, IndexRegistry, ReloadableIndex
+from algorithms.phonetics import name_keys
+
+# A shared phonetic key says more than a shared trigram
+PHONETIC_WEIGHT = 2.0
+# Share of the query's own key weight a candidate must reach
+MIN_OVERLAP = 0.3
+# Pending writes tolerated before the postings are rebuilt
+MIN_REBUILD_THRESHOLD = 512
+
+
+class NameIndex(ReloadableIndex):
+    """
+    Blocking index over case names: inverted lists from name trigrams and
+    phonetic keys to rows. A query scores every row by the IDF weight of the
+    keys it shares with the query name, so misspellings, transcription
+    variants and swapped first/last names rank high whatever their city.
+
+    Postings are frozen numpy arrays scored with one bincount; writes go to
+    a small buffer scanned linearly until the postings are rebuilt.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        super().__init__(ttl)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.postings = {}
+        self.weights = {}
+        self.keys_by_id = {}     # id -> keys, the source of every rebuild
+        self.pending = {}        # id -> keys, written since last rebuild
+        self.tombstones = set()  # ids whose posted keys are outdated
+        self.row_of = {}
+
+    def load(self, rows):
+        """Replaces the whole index with rows of (id, first_name, last_name)."""
+        with self.lock:
+            self.keys_by_id = {}
+            for disparu_id, first_name, last_name in rows:
+                keys = name_keys(first_name, last_name)
+                if keys:
+                    self.keys_by_id[disparu_id] = keys
+            self._build()
+            self._built()
+
+    def _build(self):
+        items = sorted(self.keys_by_id.items())
+        self.ids = np.fromiter((disparu_id for disparu_id, _ in items), dtype=np.int64, count=len(items))
+        self.row_of = {disparu_id: row for row, (disparu_id, _) in enumerate(items)}
+
+        lists = {}
+        for row, (_, keys) in enumerate(items):
+            for key in keys:
+                lists.setdefault(key, []).append(row)
+        total = max(len(items), 1)
+        self.postings = {key: np.array(rows, dtype=np.int32) for key, rows in lists.items()}
+        self.weights = {key: self._weight(key, len(rows), total) for key, rows in lists.items()}
+        self.pending = {}
+        self.tombstones = set()
+
+    @staticmethod
+    def _weight(key, document_frequency, total):
+        idf = math.log(1.0 + total / document_frequency)
+        return idf * PHONETIC_WEIGHT if key[0] == 'p' else idf
+
+    def _key_weight(self, key):
+        weight = self.weights.get(key)
+        if weight is None:
+            # Unseen in the postings: as rare as a key can be
+            weight = self._weight(key, 1, max(len(self.ids), 1))
+        return weight
+
+    def upsert(self, disparu_id, first_name, last_name):
+        with self.lock:
+            keys = name_keys(first_name, last_name)
+            if not keys:
+                self.remove(disparu_id)
+                return
+            self.keys_by_id[disparu_id] = keys
+            if disparu_id in self.row_of:
+                self.tombstones.add(disparu_id)
+            self.pending[disparu_id] = keys
+            self._maybe_rebuild()
+
+    def remove(self, disparu_id):
+        with self.lock:
+            self.keys_by_id.pop(disparu_id, None)
+            self.pending.pop(disparu_id, None)
+            if disparu_id in self.row_of:
+                self.tombstones.add(disparu_id)
+                self._maybe_rebuild()
+
+    def __len__(self):
+        return len(self.keys_by_id)
+
+    def _maybe_rebuild(self):
+        if len(self.pending) + len(self.tombstones) > max(MIN_REBUILD_THRESHOLD, len(self.ids) // 16):
+            self._build()
+
+    def overlap(self, query_keys, keys):
+        """Score search() gives a row with keys when querying query_keys."""
+        with self.lock:
+            weights = {key: self._key_weight(key) for key in query_keys}
+        total = sum(weights.values())
+        return sum(weights[key] for key in query_keys & keys) / total if total else 0.0
+
+    def search(self, first_name, last_name, limit=200, exclude=()):
+        """
+        (score, id) pairs of the best candidates for a name, best first.
+        Scores are between 0 and 1: the share of the query's key weight
+        that the candidate shares.
+        """
+        query_keys = name_keys(first_name, last_name)
+        if not query_keys:
+            return []
+
+        with self.lock:
+            weights = {key: self._key_weight(key) for key in query_keys}
+            total = sum(weights.values())
+            results = []
+
+            found = [(self.postings[key], weights[key]) for key in query_keys if key in self.postings]
+            if found:
+                rows = np.concatenate([posting for posting, _ in found])
+                row_weights = np.repeat([w for _, w in found], [len(posting) for posting, _ in found])
+                scores = np.bincount(rows, weights=row_weights, minlength=len(self.ids)) / total
+                close = np.flatnonzero(scores >= MIN_OVERLAP)
+                for row in close[np.argsort(-scores[close], kind='stable')].tolist():
+                    disparu_id = int(self.ids[row])
+                    if disparu_id in self.tombstones or disparu_id in exclude:
+                        continue
+                    results.append((float(scores[row]), disparu_id))
+                    # Pending rows can only push these out of the top
+                    if len(results) >= limit + len(self.pending):
+                        break
+
+            for disparu_id, keys in self.pending.items():
+                if disparu_id in exclude:
+                    continue
+                score = sum(weights[key] for key in query_keys & keys) / total
+                if score >= MIN_OVERLAP:
+                    results.append((score, disparu_id))
+
+        results.sort(key=lambda pair: (-pair[0], pair[1]))
+        return results[:limit]
+
+
+_INDEXES = IndexRegistry()
+
+
+def _fetch_rows(session, ids=None):
+    query = session.query(Disparu.id, Disparu.first_name, Disparu.last_name)
+    if ids is None:
+        return query.yield_per(10000)
+    return query.filter(Disparu.id.in_(ids)).all()
+
+
+def get_name_index(session=None):
+    """Returns the up-to-date name blocking index for the session's database."""
+    return _INDEXES.get(session or db.session, NameIndex, _fetch_rows)
+
+
+def invalidate_name_index(engine=None):
+    """Forces a rebuild on next use, for bulk writes that bypass the ORM."""
+    _INDEXES.invalidate(engine)
@@ -0,0 +1,271 @@
+import re
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+
+VOWELS = set('aeiou')
+
+# Rewrites applied in order to an accent-free lowercase word. They merge the
+# spellings a name gets from French, English and Portuguese transcription
+# (Ousmane/Usman, Tshisekedi/Chisekedi, Kouassi/Kwasi, Djibril/Jibril).
+_PHONETIC_RULES = [
+    (re.compile(r'(?<=[aeiouyn])[tdsx]$'), ''),   # silent final consonant (Dupont/Dupon)
+    (re.compile(r'(?<=...)e$'), ''),               # silent final e (Ousmane/Ousman)
+    (re.compile(r'([a-z])\1+'), r'\1'),
+    (re.compile(r'sch|tch|tsh|ch|sh'), 's'),
+    (re.compile(r'ph'), 'f'),
+    (re.compile(r'th'), 't'),
+    (re.compile(r'kh'), 'k'),
+    (re.compile(r'gh'), 'g'),
+    (re.compile(r'dj'), 'j'),
+    (re.compile(r'dz'), 'z'),
+    (re.compile(r'gn'), 'n'),
+    (re.compile(r'ck|qu|q'), 'k'),
+    (re.compile(r'c(?=[eiy])'), 's'),
+    (re.compile(r'c'), 'k'),
+    (re.compile(r'gu(?=[ei])'), 'g'),
+    (re.compile(r'x'), 'ks'),
+    (re.compile(r'z'), 's'),
+    (re.compile(r'ou|oo|w'), 'u'),
+    (re.compile(r'y'), 'i'),
+    (re.compile(r'h'), ''),
+]
+
+
+@lru_cache(maxsize=65536)
+def fold_name(text):
+    """Lowercase, accent-free, letters only, single spaces."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return ' '.join(re.sub(r'[^a-z]+', ' ', text).split())
+
+
+def phonetic_key(word):
+    """
+    Metaphone-style key of a single name: consonant skeleton after the
+    rewrites above, with any leading vowel written 'A'. Empty for words
+    without letters.
+    """
+    word = fold_name((word or '').lower().replace('ç', 's')).replace(' ', '')
+    if not word:
+        return ''
+    for pattern, replacement in _PHONETIC_RULES:
+        word = pattern.sub(replacement, word)
+    if not word:
+        return ''
+
+    key = ['A' if word[0] in VOWELS else word[0].upper()]
+    for previous, ch in zip(word, word[1:]):
+        # Rewrites can put two identical letters side by side again
+        if ch not in VOWELS and ch != previous:
+            key.append(ch.upper())
+    return ''.join(key)
+
+
+def trigrams(word):
+    """Character trigrams of a word padded like pg_trgm ('  ab', ' abc', 'bc ')."""
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(s1, s2, limit):
+    """
+    Edits (insertion, deletion, substitution, swap of neighbours) between
+    two strings, or limit + 1 as soon as more than limit are needed.
+    """
+    if abs(len(s1) - len(s2)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(s2) + 1))
+    for i in range(1, len(s1) + 1):
+        current = [i] + [0] * len(s2)
+        for j in range(1, len(s2) + 1):
+            cost = s1[i - 1] != s2[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous2 is not None and j > 1 and s1[i - 1] == s2[j - 2] and s1[i - 2] == s2[j - 1]):
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+def name_keys(*names):
+    """Blocking keys of a full name: trigrams ('t') and phonetic key ('p') of every word."""
+    keys = set()
+    for name in names:
+        for raw in (name or '').split():
+            word = fold_name(raw).replace(' ', '')
+            if not word:
+                continue
+            keys.update('t' + gram for gram in trigrams(word))
+            code = phonetic_key(raw)
+            if code:
+                keys.add('p' + code)
+    return keys
+
+
+# First names and cities repeat across records: most pairs were seen before
+@lru_cache(maxsize=65536)
+def jaro_winkler(s1, s2, prefix_scale=0.1):
+    """Jaro-Winkler similarity between 0.0 and 1.0, 0.0 when either string is empty."""
+    if not s1 or not s2:
+        return 0.0
+    if s1 == s2:
+        return 1.0
+
+    len1, len2 = len(s1), len(s2)
+    window = max(0, max(len1, len2) // 2 - 1)
+    taken = [False] * len2
+    matched1 = []
+    for i, ch in enumerate(s1):
+        for j in range(max(0, i - window), min(i + window + 1, len2)):
+            if not taken[j] and s2[j] == ch:
+                taken[j] = True
+                matched1.append(ch)
+                break
+
+    m = len(matched1)
+    if not m:
+        return 0.0
+    matched2 = [s2[j] for j in range(len2) if taken[j]]
+    transpositions = sum(a != b for a, b in zip(matched1, matched2)) / 2
+    jaro = (m / len1 + m / len2 + (m - transpositions) / m) / 3
+
+    prefix = 0
+    for a, b in zip(s1[:4], s2[:4]):
+        if a != b:
+            break
+        prefix += 1
+    return jaro + prefix * prefix_scale * (1 - jaro)
+
+
+def _encode(strings, width):
+    codes = np.zeros((len(strings), width), dtype=np.int32)
+    for row, text in enumerate(strings):
+        codes[row, :len(text)] = [ord(ch) for ch in text]
+    return codes
+
+
+def jaro_winkler_many(s1, strings, prefix_scale=0.1):
+    """
+    jaro_winkler(s1, s) for each of strings, as a float array: the same
+    greedy matching, run for all the strings at once, one character of s1
+    and one window offset at a time.
+    """
+    count = len(strings)
+    result = np.zeros(count)
+    if not s1 or not count:
+        return result
+
+    len1 = len(s1)
+    len2 = np.fromiter((len(s) for s in strings), dtype=np.int64, count=count)
+    width = max(int(len2.max()), len1, 1)
+    chars1 = np.array([ord(ch) for ch in s1], dtype=np.int32)
+    chars2 = _encode(strings, width)
+    window = np.maximum(0, np.maximum(len1, len2) // 2 - 1)
+    rows = np.arange(count)
+
+    taken = np.zeros((count, width), dtype=bool)
+    matched1 = np.zeros((count, len1), dtype=bool)
+    max_window = int(window.max())
+    for i in range(len1):
+        found = np.zeros(count, dtype=bool)
+        for j in range(max(0, i - max_window), min(i + max_window + 1, width)):
+            hit = ~found & ~taken[:, j] & (chars2[:, j] == chars1[i]) & (abs(i - j) <= window) & (j < len2)
+            taken[:, j] |= hit
+            found |= hit
+        matched1[:, i] = found
+
+    m = matched1.sum(axis=1)
+    # Matched characters of each side in order: matched positions first
+    order1 = np.argsort(~matched1, axis=1, kind='stable')
+    order2 = np.argsort(~taken, axis=1, kind='stable')[:, :len1]
+    in_order1 = chars1[order1]
+    in_order2 = np.take_along_axis(chars2, order2, axis=1)
+    counted = np.arange(len1) < m[:, None]
+    transpositions = np.count_nonzero((in_order1 != in_order2) & counted, axis=1) / 2
+
+    safe_m = np.maximum(m, 1)
+    jaro = (m / len1 + m / np.maximum(len2, 1) + (m - transpositions) / safe_m) / 3
+    prefix = np.zeros(count, dtype=np.int64)
+    same = np.ones(count, dtype=bool)
+    for k in range(min(4, len1)):
+        same &= (chars2[:, k] == chars1[k]) & (k < len2)
+        prefix += same
+    result = jaro + prefix * prefix_scale * (1 - jaro)
+
+    result[m == 0] = 0.0
+    result[len2 == 0] = 0.0
+    result[np.fromiter((s == s1 for s in strings), dtype=bool, count=count)] = 1.0
+    return result
+
+
+def edit_distance_codes(s1, codes, lengths, limit):
+    """
+    edit_distance(s1, s, limit) for each string s encoded as a row of codes
+    (ord of each character, zero padded) of the given lengths, as an int
+    array: the dynamic programming table is filled one character of s1 at a
+    time for all the strings at once, insertions by a running minimum.
+    A string is dropped as soon as no cell of its last two rows, plus the
+    length difference left to cover, stays within limit.
+    """
+    result = np.full(len(codes), limit + 1, dtype=np.int64)
+    alive = np.arange(len(codes))
+    width = codes.shape[1]
+    columns = np.arange(width + 1, dtype=np.int16)
+    # Insertions or deletions left from each cell to the end of each string
+    remaining = lengths.astype(np.int16)[:, None] - columns - len(s1)
+    previous2 = None
+    previous = np.broadcast_to(columns, (len(codes), width + 1)).copy()
+    previous_bound = np.zeros(len(codes), dtype=np.int16)
+    for i in range(1, len(s1) + 1):
+        char = ord(s1[i - 1])
+        current = np.empty_like(previous)
+        current[:, 0] = i
+        np.minimum(previous[:, 1:] + 1, previous[:, :-1] + (codes != char), out=current[:, 1:])
+        if previous2 is not None and width > 1:
+            swapped = (codes[:, :-1] == char) & (codes[:, 1:] == ord(s1[i - 2]))
+            current[:, 2:] = np.where(swapped, np.minimum(current[:, 2:], previous2[:, :-2] + 1), current[:, 2:])
+        current = np.minimum.accumulate(current - columns, axis=1) + columns
+
+        # A swap reads two rows back: the previous row's bound counts too
+        bound = (current + np.abs(remaining + i)).min(axis=1)
+        keep = np.minimum(bound, previous_bound) <= limit
+        if not keep.all():
+            alive, codes, remaining = alive[keep], codes[keep], remaining[keep]
+            lengths, current, previous, bound = lengths[keep], current[keep], previous[keep], bound[keep]
+            if not len(alive):
+                return result
+        previous2, previous, previous_bound = previous, current, bound
+    result[alive] = np.minimum(previous[np.arange(len(alive)), lengths], limit + 1)
+    return result
+
+
+def edit_distance_many(s1, strings, limit):
+    """edit_distance(s1, s, limit) for each of strings, as an int array."""
+    lengths = np.fromiter((len(s) for s in strings), dtype=np.int64, count=len(strings))
+    width = max(int(lengths.max()) if len(strings) else 0, 1)
+    return edit_distance_codes(s1, _encode(strings, width), lengths, limit)
+
+
+def _paired_similarity(parts1, parts2):
+    pairs = [(a, b) for a, b in zip(parts1, parts2) if a and b]
+    if not pairs:
+        return 0.0
+    # A part known on one side only counts as a mismatch
+    known = max(sum(1 for part in parts1 if part), sum(1 for part in parts2 if part))
+    return sum(jaro_winkler(a, b) for a, b in pairs) / known
+
+
+def name_similarity(first1, last1, first2, last2):
+    """
+    Jaro-Winkler of the first names and of the last names, averaged, the
+    best of the straight and the swapped (last name first) pairing. Parts
+    are compared separately so that a shared first name cannot carry the
+    whole score.
+    """
+    parts1 = (fold_name(first1 or ''), fold_name(last1 or ''))
+    parts2 = (fold_name(first2 or ''), fold_name(last2 or ''))
+    return max(_paired_similarity(parts1, parts2), _paired_similarity(parts1, parts2[::-1]))
@@ -0,0 +1,188 @@
+import itertools
+
+import numpy as np
+
+from models import db, Disparu
+from algorithms.index_reload import DEFAULT_TTL, IndexRegistry, ReloadableIndex
+
+HASH_BITS = 64
+BANDS = 4
+BAND_BITS = HASH_BITS // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+# Pending writes tolerated before the band tables are rebuilt
+MIN_REBUILD_THRESHOLD = 1024
+
+_FLIP_MASKS = {}
+
+
+def _flip_masks(radius):
+    """All BAND_BITS-bit masks with at most `radius` bits set."""
+    masks = _FLIP_MASKS.get(radius)
+    if masks is None:
+        values = [0]
+        for bits in range(1, radius + 1):
+            for positions in itertools.combinations(range(BAND_BITS), bits):
+                values.append(sum(1 << p for p in positions))
+        masks = _FLIP_MASKS[radius] = np.array(values, dtype=np.int64)
+    return masks
+
+
+def _unsigned(hashes):
+    """Stored signed hashes as uint64, bit for bit."""
+    return np.asarray(hashes, dtype=np.int64).view(np.uint64)
+
+
+def hamming_distances(hashes, query):
+    """Differing bits between uint64 hashes and query (np.bitwise_count needs NumPy 2.0)."""
+    return np.bitwise_count(hashes ^ query)
+
+
+def max_distance_for(threshold):
+    """Largest Hamming distance whose similarity (1 - d / 64) reaches threshold."""
+    return max(0, min(HASH_BITS, int((1.0 - threshold) * HASH_BITS + 1e-9)))
+
+
+class PhotoHashIndex(ReloadableIndex):
+    """
+    Multi-index hashing over the stored 64-bit photo dHashes, split in 4
+    bands of 16 bits. Two hashes at Hamming distance <= k agree within
+    k // 4 bits on at least one band (pigeonhole), so a query only probes,
+    in each band, the buckets within that radius of its own band value and
+    verifies the candidates with a full popcount.
+
+    Each band is a bucket table in CSR form: rows sorted by band value plus
+    the offset of every one of the 65536 values. Writes go to a small
+    buffer scanned linearly until the tables are rebuilt.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        super().__init__(ttl)
+        self.ids = np.empty(0, dtype=np.int64)      # sorted
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.band_rows = []
+        self.band_starts = []
+        self.pending = {}        # id -> hash, written since last rebuild
+        self.tombstones = set()  # ids whose table entry is outdated
+
+    def load(self, rows):
+        """Replaces the whole index with rows of (id, photo_hash)."""
+        with self.lock:
+            pairs = sorted((disparu_id, photo_hash) for disparu_id, photo_hash in rows if photo_hash is not None)
+            self._build(
+                np.fromiter((p[0] for p in pairs), dtype=np.int64, count=len(pairs)),
+                _unsigned([p[1] for p in pairs]) if pairs else np.empty(0, dtype=np.uint64)
+            )
+            self._built()
+
+    def _build(self, ids, hashes):
+        self.ids = ids
+        self.hashes = hashes
+        self.band_rows = []
+        self.band_starts = []
+        for band in range(BANDS):
+            values = ((hashes >> np.uint64(band * BAND_BITS)) & np.uint64(BAND_MASK)).astype(np.int64)
+            order = np.argsort(values, kind='stable')
+            self.band_rows.append(order)
+            self.band_starts.append(np.searchsorted(values[order], np.arange(BAND_MASK + 2)))
+        self.pending = {}
+        self.tombstones = set()
+
+    def upsert(self, disparu_id, photo_hash):
+        with self.lock:
+            if photo_hash is None:
+                self.remove(disparu_id)
+                return
+            if self._in_tables(disparu_id):
+                self.tombstones.add(disparu_id)
+            self.pending[disparu_id] = photo_hash
+            self._maybe_rebuild()
+
+    def remove(self, disparu_id):
+        with self.lock:
+            self.pending.pop(disparu_id, None)
+            if self._in_tables(disparu_id):
+                self.tombstones.add(disparu_id)
+                self._maybe_rebuild()
+
+    def __len__(self):
+        return len(self.ids) - len(self.tombstones) + len(self.pending)
+
+    def _in_tables(self, disparu_id):
+        i = np.searchsorted(self.ids, disparu_id)
+        return i < len(self.ids) and self.ids[i] == disparu_id
+
+    def _maybe_rebuild(self):
+        if len(self.pending) + len(self.tombstones) <= max(MIN_REBUILD_THRESHOLD, len(self.ids) // 16):
+            return
+        keep = ~np.isin(self.ids, np.fromiter(self.tombstones, dtype=np.int64, count=len(self.tombstones)))
+        pending = sorted(self.pending.items())
+        ids = np.concatenate([self.ids[keep], np.array([p[0] for p in pending], dtype=np.int64)])
+        hashes = np.concatenate([self.hashes[keep], _unsigned([p[1] for p in pending])])
+        order = np.argsort(ids, kind='stable')
+        self._build(ids[order], hashes[order])
+
+    def _candidate_rows(self, query, max_distance):
+        radius = max_distance // BANDS
+        masks = _flip_masks(radius)
+        if len(masks) * BANDS * 8 > len(self.ids):
+            # Probing would touch most buckets: a straight scan is cheaper
+            return np.arange(len(self.ids))
+
+        found = []
+        for band in range(BANDS):
+            value = int(query >> np.uint64(band * BAND_BITS)) & BAND_MASK
+            probes = value ^ masks
+            starts = self.band_starts[band]
+            lo, hi = starts[probes], starts[probes + 1]
+            lengths = hi - lo
+            total = int(lengths.sum())
+            if not total:
+                continue
+            # Concatenated [lo, hi) ranges without a Python loop
+            offsets = np.repeat(lo - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+            found.append(self.band_rows[band][offsets])
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+    def search(self, photo_hash, max_distance, exclude=()):
+        """(distance, id) pairs of the hashes within max_distance bits, closest first."""
+        with self.lock:
+            query = _unsigned([photo_hash])[0]
+            results = []
+
+            if len(self.ids):
+                rows = self._candidate_rows(query, max_distance)
+                distances = hamming_distances(self.hashes[rows], query)
+                close = distances <= max_distance
+                for disparu_id, distance in zip(self.ids[rows[close]].tolist(), distances[close].tolist()):
+                    if disparu_id not in self.tombstones and disparu_id not in exclude:
+                        results.append((distance, disparu_id))
+
+            for disparu_id, other in self.pending.items():
+                distance = ((photo_hash ^ other) & ((1 << HASH_BITS) - 1)).bit_count()
+                if distance <= max_distance and disparu_id not in exclude:
+                    results.append((distance, disparu_id))
+
+        results.sort()
+        return results
+
+
+_INDEXES = IndexRegistry()
+
+
+def _fetch_rows(session, ids=None):
+    query = session.query(Disparu.id, Disparu.photo_hash)
+    if ids is None:
+        return query.filter(Disparu.photo_hash.isnot(None)).yield_per(10000)
+    return query.filter(Disparu.id.in_(ids)).all()
+
+
+def get_photo_index(session=None):
+    """Returns the up-to-date photo hash index for the session's database."""
+    return _INDEXES.get(session or db.session, PhotoHashIndex, _fetch_rows)
+
+
+def invalidate_photo_index(engine=None):
+    """Forces a rebuild on next use, for bulk writes that bypass the ORM."""
+    _INDEXES.invalidate(engine)
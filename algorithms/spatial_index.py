@@ -0,0 +1,246 @@
+import heapq
+import math
+
+from models import db, Disparu
+from algorithms.index_reload import DEFAULT_TTL, IndexRegistry, ReloadableIndex
+
+EARTH_RADIUS_KM = 6371
+LEAF_SIZE = 16
+# Pending inserts/deletes tolerated before a partition's tree is rebuilt
+MIN_REBUILD_THRESHOLD = 64
+
+
+def to_unit_vector(lat, lng):
+    """Projects a coordinate on the unit sphere (antimeridian and poles need no special case)."""
+    lat_rad = math.radians(lat)
+    lng_rad = math.radians(lng)
+    cos_lat = math.cos(lat_rad)
+    return (cos_lat * math.cos(lng_rad), cos_lat * math.sin(lng_rad), math.sin(lat_rad))
+
+
+def chord_to_km(chord_sq):
+    """Converts a squared chord length on the unit sphere to a great-circle distance in km."""
+    half = min(1.0, math.sqrt(chord_sq) / 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(half)
+
+
+class KDTree:
+    """
+    Static 3-d tree over unit-sphere vectors, stored implicitly in flat lists:
+    the node covering [lo, hi) splits on the element at (lo + hi) // 2.
+    """
+
+    def __init__(self, points):
+        # points: iterable of (id, (x, y, z))
+        items = list(points)
+        self.size = len(items)
+        self.ids = [0] * self.size
+        self.coords = ([0.0] * self.size, [0.0] * self.size, [0.0] * self.size)
+        self.axes = [0] * self.size
+        self._build(items)
+
+    def _build(self, items):
+        xs, ys, zs = self.coords
+        stack = [(0, len(items), items)]
+        while stack:
+            lo, hi, chunk = stack.pop()
+            if hi - lo <= LEAF_SIZE:
+                for offset, (point_id, vec) in enumerate(chunk):
+                    self.ids[lo + offset] = point_id
+                    xs[lo + offset], ys[lo + offset], zs[lo + offset] = vec
+                continue
+
+            # Split on the axis with the widest spread
+            spreads = []
+            for axis in range(3):
+                values = [vec[axis] for _, vec in chunk]
+                spreads.append(max(values) - min(values))
+            axis = spreads.index(max(spreads))
+
+            chunk.sort(key=lambda item: item[1][axis])
+            mid = (lo + hi) >> 1
+            split = mid - lo
+            point_id, vec = chunk[split]
+            self.ids[mid] = point_id
+            xs[mid], ys[mid], zs[mid] = vec
+            self.axes[mid] = axis
+
+            stack.append((lo, mid, chunk[:split]))
+            stack.append((mid + 1, hi, chunk[split + 1:]))
+
+    def search(self, query, k, heap, skip):
+        """
+        Pushes the k closest live points into heap, a max-heap of
+        (-chord_sq, id) shared across trees so results can be merged.
+        """
+        if not self.size:
+            return
+        xs, ys, zs = self.coords
+        qx, qy, qz = query
+        ids = self.ids
+        axes = self.axes
+
+        def consider(i):
+            point_id = ids[i]
+            if point_id in skip:
+                return
+            dx = xs[i] - qx
+            dy = ys[i] - qy
+            dz = zs[i] - qz
+            d2 = dx * dx + dy * dy + dz * dz
+            if len(heap) < k:
+                heapq.heappush(heap, (-d2, point_id))
+            elif d2 < -heap[0][0]:
+                heapq.heapreplace(heap, (-d2, point_id))
+
+        def visit(lo, hi):
+            if hi - lo <= LEAF_SIZE:
+                for i in range(lo, hi):
+                    consider(i)
+                return
+            mid = (lo + hi) >> 1
+            axis = axes[mid]
+            diff = query[axis] - self.coords[axis][mid]
+            if diff < 0:
+                near, far = (lo, mid), (mid + 1, hi)
+            else:
+                near, far = (mid + 1, hi), (lo, mid)
+            visit(*near)
+            consider(mid)
+            if len(heap) < k or diff * diff < -heap[0][0]:
+                visit(*far)
+
+        visit(0, self.size)
+
+
+class _Partition:
+    """All geolocated cases sharing one status: a KD-tree plus a small write buffer."""
+
+    def __init__(self, points=None):
+        self.tree = KDTree(points or [])
+        self.tree_ids = set(self.tree.ids)
+        self.pending = {}       # id -> vector, inserted since last rebuild
+        self.tombstones = set()  # ids deleted from the tree since last rebuild
+
+    def __len__(self):
+        return self.tree.size - len(self.tombstones) + len(self.pending)
+
+    def add(self, point_id, vec):
+        if point_id in self.tree_ids:
+            # Moved point: hide the stale tree entry, serve it from the buffer
+            self.tombstones.add(point_id)
+        self.pending[point_id] = vec
+        self._maybe_rebuild()
+
+    def remove(self, point_id):
+        self.pending.pop(point_id, None)
+        if point_id in self.tree_ids:
+            self.tombstones.add(point_id)
+        self._maybe_rebuild()
+
+    def _maybe_rebuild(self):
+        threshold = max(MIN_REBUILD_THRESHOLD, int(math.sqrt(self.tree.size)))
+        if len(self.pending) + len(self.tombstones) <= threshold:
+            return
+        live = [
+            (point_id, (self.tree.coords[0][i], self.tree.coords[1][i], self.tree.coords[2][i]))
+            for i, point_id in enumerate(self.tree.ids)
+            if point_id not in self.tombstones
+        ]
+        live.extend(self.pending.items())
+        self.__init__(live)
+
+    def search(self, query, k, heap):
+        self.tree.search(query, k, heap, self.tombstones)
+        qx, qy, qz = query
+        for point_id, (x, y, z) in self.pending.items():
+            d2 = (x - qx) ** 2 + (y - qy) ** 2 + (z - qz) ** 2
+            if len(heap) < k:
+                heapq.heappush(heap, (-d2, point_id))
+            elif d2 < -heap[0][0]:
+                heapq.heapreplace(heap, (-d2, point_id))
+
+
+class SpatialIndex(ReloadableIndex):
+    """
+    Per-worker k-nearest-neighbour index over geolocated cases, partitioned
+    by status. Queries cost O(log n); writes are buffered and folded into the
+    trees once the buffer outgrows sqrt(n).
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        super().__init__(ttl)
+        self.partitions = {}
+        self.locations = {}  # id -> status, for relocation and removal
+
+    def load(self, rows):
+        """Replaces the whole index with rows of (id, latitude, longitude, status)."""
+        grouped = {}
+        locations = {}
+        for point_id, lat, lng, status in rows:
+            if lat is None or lng is None:
+                continue
+            grouped.setdefault(status, []).append((point_id, to_unit_vector(lat, lng)))
+            locations[point_id] = status
+
+        with self.lock:
+            self.partitions = {status: _Partition(points) for status, points in grouped.items()}
+            self.locations = locations
+            self._built()
+
+    def upsert(self, point_id, lat, lng, status):
+        with self.lock:
+            self.remove(point_id)
+            if lat is None or lng is None:
+                return
+            partition = self.partitions.get(status)
+            if partition is None:
+                partition = self.partitions[status] = _Partition()
+            partition.add(point_id, to_unit_vector(lat, lng))
+            self.locations[point_id] = status
+
+    def remove(self, point_id):
+        with self.lock:
+            if point_id not in self.locations:
+                return
+            status = self.locations.pop(point_id)
+            self.partitions[status].remove(point_id)
+
+    def nearest(self, lat, lng, k, status=None):
+        """Returns up to k (distance_km, id) tuples sorted by distance."""
+        if k <= 0:
+            return []
+        query = to_unit_vector(lat, lng)
+        heap = []
+        with self.lock:
+            if status:
+                partitions = [self.partitions[status]] if status in self.partitions else []
+            else:
+                partitions = list(self.partitions.values())
+            for partition in partitions:
+                partition.search(query, k, heap)
+        return sorted((chord_to_km(-neg_d2), point_id) for neg_d2, point_id in heap)
+
+    def __len__(self):
+        return len(self.locations)
+
+
+_INDEXES = IndexRegistry()
+
+
+def _fetch_rows(session, ids=None):
+    query = session.query(Disparu.id, Disparu.latitude, Disparu.longitude, Disparu.status)
+    if ids is None:
+        query = query.filter(Disparu.latitude.isnot(None), Disparu.longitude.isnot(None))
+        return query.yield_per(5000)
+    return query.filter(Disparu.id.in_(ids)).all()
+
+
+def get_spatial_index(session=None):
+    """Returns the up-to-date spatial index for the session's database."""
+    return _INDEXES.get(session or db.session, SpatialIndex, _fetch_rows)
+
+
+def invalidate_spatial_index(engine=None):
+    """Forces a rebuild on next use, for bulk writes that bypass the ORM."""
+    _INDEXES.invalidate(engine)
@@ -14,6 +14,10 @@ from flask_migrate import Migrate
 
 from models import db
 from routes import register_blueprints
+from commands import register_commands
+from algorithms.matching import configure_hash_cache
+from algorithms.match_cache import configure_match_cache
+from services.job_queue import init_job_queue
 from config import config
 import math
 from sqlalchemy import event
@@ -64,6 +68,10 @@ def create_app(config_name=None):
     db.init_app(app)
     csrf.init_app(app)
     Migrate(app, db)
+
+    configure_hash_cache(app.config['IMAGE_HASH_CACHE_SIZE'], app.config.get('IMAGE_HASH_CACHE_PATH'))
+    configure_match_cache(app.config['MATCH_CACHE_SIZE'], app.config['MATCH_CACHE_TTL'])
+    init_job_queue(app)
     
     babel = Babel(app, locale_selector=get_locale)
     
@@ -103,6 +111,8 @@ def create_app(config_name=None):
     
     register_utility_routes(app)
 
+    register_commands(app)
+
     @app.errorhandler(400)
     def bad_request(e):
         if request.path.startswith('/api/') or request.headers.get('Accept') == 'application/json':
@@ -0,0 +1,83 @@
+"""
+ * Nom de l'application : DISPARUS.ORG
+ * Description : Commandes de maintenance (flask <commande>)
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from services.geocoding import backfill_contribution_coordinates, backfill_disparu_coordinates
+from services.image_hashes import backfill_photo_hashes, backfill_proof_hashes
+from services.description_signatures import backfill_description_signatures
+from services.dedupe import run_dedupe
+from algorithms.matching import hash_cache_stats
+
+
+@click.command('geocode-backfill')
+@click.option('--batch-size', default=500, show_default=True, help='Rows committed per batch.')
+@with_appcontext
+def geocode_backfill_command(batch_size):
+    """Geocode cases and contributions without coordinates, offline."""
+    geocoded, unresolved = backfill_disparu_coordinates(batch_size)
+    click.echo(f"Disparus: {geocoded} geocoded, {unresolved} unresolved")
+    geocoded, unresolved = backfill_contribution_coordinates(batch_size)
+    click.echo(f"Contributions: {geocoded} geocoded, {unresolved} unresolved")
+
+
+@click.command('hash-backfill')
+@click.option('--batch-size', default=200, show_default=True, help='Rows committed per batch.')
+@with_appcontext
+def hash_backfill_command(batch_size):
+    """Store the perceptual hash of photos and proofs uploaded before hashing existed."""
+    hashed, unreadable = backfill_photo_hashes(batch_size)
+    click.echo(f"Photos: {hashed} hashed, {unreadable} unreadable")
+    hashed, unreadable = backfill_proof_hashes(batch_size)
+    click.echo(f"Proofs: {hashed} hashed, {unreadable} unreadable")
+    stats = hash_cache_stats()
+    click.echo(f"Hash cache: {stats['hits']} hits ({stats['disk_hits']} shared), {stats['misses']} misses")
+
+
+@click.command('minhash-backfill')
+@click.option('--batch-size', default=500, show_default=True, help='Rows committed per batch.')
+@with_appcontext
+def minhash_backfill_command(batch_size):
+    """Store the MinHash signature of descriptions saved before signatures existed."""
+    signed, empty = backfill_description_signatures(batch_size)
+    click.echo(f"Descriptions: {signed} signed, {empty} without words")
+
+
+@click.command('dedupe')
+@click.option('--full', is_flag=True, help='Rescore every case, not only those changed since the last run.')
+@click.option('--workers', type=int, default=None, help='Worker processes (default: DEDUPE_WORKERS, or one per CPU).')
+@click.option('--block-size', default=500, show_default=True, help='Cases scored per worker task.')
+@with_appcontext
+def dedupe_command(full, workers, block_size):
+    """Find potential duplicates across all cases and store them in match_candidates."""
+    start_time = time.perf_counter()
+    run = run_dedupe(full=full, workers=workers or current_app.config.get('DEDUPE_WORKERS') or None, block_size=block_size)
+    click.echo(f"Dedupe ({run.mode}): {run.records_scanned} cases scanned, {run.pairs_found} pairs "
+               f"in {time.perf_counter() - start_time:.1f}s")
+
+
+@click.command('jobs-run')
+@with_appcontext
+def jobs_run_command():
+    """Run the queued background jobs, for deployments with JOB_WORKERS=0."""
+    queue = current_app.extensions['job_queue']
+    queue.requeue_stale()
+    ran = queue.run_pending()
+    failed = queue.stats().get('failed', 0)
+    click.echo(f"Jobs: {ran} run, {failed} failed")
+
+
+def register_commands(app):
+    app.cli.add_command(geocode_backfill_command)
+    app.cli.add_command(hash_backfill_command)
+    app.cli.add_command(minhash_backfill_command)
+    app.cli.add_command(dedupe_command)
+    app.cli.add_command(jobs_run_command)
@@ -16,6 +16,23 @@ class Config:
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads')
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
+    # Image hash cache: LRU entries per worker, plus an optional SQLite file
+    # shared by all workers (e.g. /tmp/disparus_hashes.db)
+    IMAGE_HASH_CACHE_SIZE = int(os.environ.get('IMAGE_HASH_CACHE_SIZE', 4096))
+    IMAGE_HASH_CACHE_PATH = os.environ.get('IMAGE_HASH_CACHE_PATH')
+
+    # Potential match lists cached per worker, and for how many seconds
+    MATCH_CACHE_SIZE = int(os.environ.get('MATCH_CACHE_SIZE', 1024))
+    MATCH_CACHE_TTL = int(os.environ.get('MATCH_CACHE_TTL', 300))
+
+    # Background jobs (matches of new and edited reports): SQLite file shared
+    # by the worker processes (default instance/jobs.db), threads per process
+    JOB_QUEUE_PATH = os.environ.get('JOB_QUEUE_PATH')
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 1))
+
+    # Processes used by the duplicate detection job (0: one per CPU)
+    DEDUPE_WORKERS = int(os.environ.get('DEDUPE_WORKERS', 0))
+
     WHATSAPP_NUMBER = os.environ.get('WHATSAPP_NUMBER', '243860493345')
     TIDYCAL_URL = os.environ.get('TIDYCAL_URL', 'https://tidycal.com/moamyoneart/consultation-gratuite-15-min')
 
@@ -72,6 +89,9 @@ class TestingConfig(Config):
     DEBUG = True
     SECRET_KEY = 'test-secret-key'
     WTF_CSRF_ENABLED = False
+    # Jobs stay queued until a test runs them
+    JOB_QUEUE_PATH = ':memory:'
+    JOB_WORKERS = 0
 
 
 config = {
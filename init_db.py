@@ -22,6 +22,9 @@ from models import db, User, Role, Disparu, Contribution, ModerationReport, Acti
 from werkzeug.security import generate_password_hash
 from sqlalchemy import text, inspect, Integer, Boolean, String, Text, Float, DateTime, JSON
 from sqlalchemy.exc import ProgrammingError, OperationalError
+from utils.spatial import reset_spatial_capabilities
+from utils.geohash import encode_geohash
+from utils.search import build_search_index
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -313,7 +316,8 @@ def sync_indexes():
         required_indexes = [
             ('first_name', ['first_name']),
             ('last_name', ['last_name']),
-            ('city', ['city'])
+            ('city', ['city']),
+            ('created_at_id', ['created_at', 'id']),
         ]
 
         for field, cols in required_indexes:
@@ -328,17 +332,75 @@ def sync_indexes():
                 logger.info(f"  Creating missing index for {field}...")
                 idx_name = f"ix_disparus_flask_{field}"
                 try:
-                    db.session.execute(text(f"CREATE INDEX IF NOT EXISTS {idx_name} ON disparus_flask({field})"))
+                    db.session.execute(text(f"CREATE INDEX IF NOT EXISTS {idx_name} ON disparus_flask({', '.join(cols)})"))
                     db.session.commit()
                     logger.info(f"  + Created index {idx_name}")
                 except Exception as e:
                     logger.error(f"  Failed to create index {idx_name}: {e}")
                     db.session.rollback()
 
+        for table_name in ('disparus_flask', 'contributions_flask'):
+            backfill_geohash(table_name)
+            create_geohash_index(table_name)
+        reset_spatial_capabilities()
+
     except Exception as e:
         logger.error(f"  Error syncing indexes: {e}")
 
 
+def backfill_geohash(table_name, batch_size=1000):
+    """Fills the geohash of rows written before the column existed or by raw SQL"""
+    total = 0
+    last_id = 0
+    try:
+        while True:
+            rows = db.session.execute(text(
+                f"SELECT id, latitude, longitude FROM {table_name} "
+                "WHERE geohash IS NULL AND latitude IS NOT NULL AND longitude IS NOT NULL AND id > :last_id "
+                "ORDER BY id LIMIT :limit"
+            ), {'last_id': last_id, 'limit': batch_size}).fetchall()
+            if not rows:
+                break
+
+            db.session.execute(
+                text(f"UPDATE {table_name} SET geohash = :geohash WHERE id = :id"),
+                [{'id': row.id, 'geohash': encode_geohash(row.latitude, row.longitude)} for row in rows]
+            )
+            db.session.commit()
+            total += len(rows)
+            last_id = rows[-1].id
+
+        if total:
+            logger.info(f"  + Backfilled geohash of {total} rows in {table_name}")
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"  Failed to backfill geohash of {table_name}: {e}")
+
+
+def create_geohash_index(table_name):
+    """
+    Index serving LIKE 'prefix%' on geohash: SQLite only uses an index for
+    LIKE under NOCASE collation, PostgreSQL needs the pattern operator class
+    outside the C locale.
+    """
+    idx_name = f"ix_{table_name}_geohash"
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        column = 'geohash COLLATE NOCASE'
+    elif dialect == 'postgresql':
+        column = 'geohash varchar_pattern_ops'
+    else:
+        column = 'geohash'
+
+    try:
+        db.session.execute(text(f"CREATE INDEX IF NOT EXISTS {idx_name} ON {table_name}({column})"))
+        db.session.commit()
+        logger.info(f"  + Verified/Created index {idx_name}")
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"  Failed to create index {idx_name}: {e}")
+
+
 def run_migrations():
     """Run database specific optimizations and migrations"""
     logger.info("Running specific migrations/optimizations...")
@@ -347,7 +409,10 @@ def run_migrations():
     sync_schema_columns()
     sync_indexes()
     
-    # Postgres-specific optimizations (Indexes)
+    # Search index: FTS5 on SQLite, tsvector/trigram indexes on Postgres
+    backend = build_search_index()
+    logger.info(f"  + Search backend: {backend}")
+
     try:
         # Check dialect again just to be safe
         dialect_name = db.session.get_bind().dialect.name
@@ -355,114 +420,147 @@ def run_migrations():
         dialect_name = 'unknown'
 
     if dialect_name == 'postgresql':
-        try:
-            # Enable pg_trgm extension for substring search optimizations
-            db.session.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
-            db.session.commit()
-            logger.info("  + Enabled pg_trgm extension")
+        setup_postgres_geo()
 
-            # Create GIN indexes with gin_trgm_ops for efficient leading wildcard search
-            trgm_indexes = [
-                ('first_name', 'ix_disparus_flask_first_name_trgm'),
-                ('last_name', 'ix_disparus_flask_last_name_trgm'),
-                ('public_id', 'ix_disparus_flask_public_id_trgm'),
-                ('city', 'ix_disparus_flask_city_trgm')
-            ]
+    elif dialect_name == 'sqlite':
+        setup_sqlite_rtree()
 
-            for col, idx_name in trgm_indexes:
-                db.session.execute(text(f"CREATE INDEX IF NOT EXISTS {idx_name} ON disparus_flask USING gin ({col} gin_trgm_ops)"))
-                logger.info(f"  + Verified/Created Postgres GIN index {idx_name}")
 
-            db.session.commit()
-        except Exception as e:
-            db.session.rollback()
-            logger.warning(f"  - Postgres pg_trgm optimization skipped/failed: {e}")
+def setup_sqlite_rtree():
+    """
+    Creates the disparus_rtree R*Tree over latitude/longitude, kept in sync
+    by triggers the same way disparus_fts is.
+    """
+    try:
+        inspector = inspect(db.engine)
+        tables = inspector.get_table_names()
+
+        if 'disparus_rtree' in tables:
+            logger.info("  SQLite R*Tree already setup.")
+            return
+
+        logger.info("  Setting up SQLite R*Tree...")
+
+        # 1. Create Virtual Table (one degenerate box per geolocated case)
+        db.session.execute(text("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS disparus_rtree USING rtree(
+                id,
+                min_lat, max_lat,
+                min_lng, max_lng
+            );
+        """))
+
+        # 2. Create Triggers to keep index in sync
+        # Insert Trigger
+        db.session.execute(text("""
+            CREATE TRIGGER IF NOT EXISTS disparus_rtree_ai AFTER INSERT ON disparus_flask
+            WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN
+                INSERT INTO disparus_rtree(id, min_lat, max_lat, min_lng, max_lng)
+                VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+            END;
+        """))
+
+        # Delete Trigger
+        db.session.execute(text("""
+            CREATE TRIGGER IF NOT EXISTS disparus_rtree_ad AFTER DELETE ON disparus_flask BEGIN
+                DELETE FROM disparus_rtree WHERE id = old.id;
+            END;
+        """))
+
+        # Update Trigger (only when coordinates change)
+        db.session.execute(text("""
+            CREATE TRIGGER IF NOT EXISTS disparus_rtree_au AFTER UPDATE OF latitude, longitude ON disparus_flask BEGIN
+                DELETE FROM disparus_rtree WHERE id = old.id;
+                INSERT INTO disparus_rtree(id, min_lat, max_lat, min_lng, max_lng)
+                SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude
+                WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+            END;
+        """))
+
+        # 3. Populate initially from existing data
+        db.session.execute(text("""
+            INSERT INTO disparus_rtree(id, min_lat, max_lat, min_lng, max_lng)
+            SELECT id, latitude, latitude, longitude, longitude FROM disparus_flask
+            WHERE latitude IS NOT NULL AND longitude IS NOT NULL;
+        """))
+
+        db.session.commit()
+        reset_spatial_capabilities()
+        logger.info("  + SQLite R*Tree setup complete.")
+
+    except Exception as e:
+        db.session.rollback()
+        # SQLite builds without the rtree module end up here
+        logger.warning(f"  - SQLite R*Tree setup skipped/failed: {e}")
+
+
+def setup_postgres_geo():
+    """
+    Adds a geography column with GiST indexes (PostGIS), maintained from
+    latitude/longitude by a trigger, so nearby / sort-by-distance queries can
+    use the <-> KNN operator. Falls back to a GiST index on ll_to_earth()
+    (cube + earthdistance) when PostGIS is not installable.
+    """
+    try:
+        db.session.execute(text("CREATE EXTENSION IF NOT EXISTS postgis"))
+        db.session.commit()
+        logger.info("  + Enabled postgis extension")
+        has_postgis = True
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"  - PostGIS not available, trying earthdistance: {e}")
+        has_postgis = False
 
+    if has_postgis:
         try:
-            # Create GIN index for Full Text Search
-            # Using DO block for robustness if possible, but standard IF NOT EXISTS is good
-            sql = """
-            CREATE INDEX IF NOT EXISTS idx_disparu_fulltext
-            ON disparus_flask
-            USING gin(to_tsvector('french',
-                coalesce(first_name,'') || ' ' ||
-                coalesce(last_name,'') || ' ' ||
-                coalesce(public_id,'') || ' ' ||
-                coalesce(city,'')
-            ));
-            """
-            db.session.execute(text(sql))
+            db.session.execute(text("ALTER TABLE disparus_flask ADD COLUMN IF NOT EXISTS geog geography(Point, 4326)"))
+
+            # Trigger keeps geog in sync with latitude/longitude
+            db.session.execute(text("""
+                CREATE OR REPLACE FUNCTION disparus_geog_sync() RETURNS trigger AS $$
+                BEGIN
+                    IF NEW.latitude IS NULL OR NEW.longitude IS NULL THEN
+                        NEW.geog := NULL;
+                    ELSE
+                        NEW.geog := ST_SetSRID(ST_MakePoint(NEW.longitude, NEW.latitude), 4326)::geography;
+                    END IF;
+                    RETURN NEW;
+                END;
+                $$ LANGUAGE plpgsql;
+            """))
+            db.session.execute(text("DROP TRIGGER IF EXISTS disparus_geog_biu ON disparus_flask"))
+            db.session.execute(text("""
+                CREATE TRIGGER disparus_geog_biu BEFORE INSERT OR UPDATE OF latitude, longitude ON disparus_flask
+                FOR EACH ROW EXECUTE PROCEDURE disparus_geog_sync();
+            """))
+
+            # Backfill existing rows
+            db.session.execute(text("""
+                UPDATE disparus_flask
+                SET geog = ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography
+                WHERE latitude IS NOT NULL AND longitude IS NOT NULL AND geog IS NULL
+            """))
+
+            # Spherical KNN (<->) and planar bbox (&&) indexes
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_disparus_flask_geog ON disparus_flask USING gist (geog)"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_disparus_flask_geom ON disparus_flask USING gist ((geog::geometry))"))
             db.session.commit()
-            logger.info("  + Verified/Created Postgres GIN index for full text search")
+            logger.info("  + Verified/Created PostGIS geography column and GiST indexes")
         except Exception as e:
             db.session.rollback()
-            logger.warning(f"  - Postgres optimization skipped/failed: {e}")
-
-    elif dialect_name == 'sqlite':
+            logger.warning(f"  - PostGIS setup skipped/failed: {e}")
+    else:
         try:
-            # Check if FTS table exists
-            # We use inspect to check regular tables, but virtual tables show up there too usually.
-            inspector = inspect(db.engine)
-            tables = inspector.get_table_names()
-
-            if 'disparus_fts' not in tables:
-                logger.info("  Setting up SQLite FTS...")
-
-                # 1. Create Virtual Table (External Content)
-                # This indexes content from disparus_flask without duplicating storage
-                db.session.execute(text("""
-                    CREATE VIRTUAL TABLE IF NOT EXISTS disparus_fts USING fts5(
-                        first_name,
-                        last_name,
-                        public_id,
-                        city,
-                        content='disparus_flask',
-                        content_rowid='id'
-                    );
-                """))
-
-                # 2. Create Triggers to keep index in sync
-                # Insert Trigger
-                db.session.execute(text("""
-                    CREATE TRIGGER IF NOT EXISTS disparus_ai AFTER INSERT ON disparus_flask BEGIN
-                        INSERT INTO disparus_fts(rowid, first_name, last_name, public_id, city)
-                        VALUES (new.id, new.first_name, new.last_name, new.public_id, new.city);
-                    END;
-                """))
-
-                # Delete Trigger
-                db.session.execute(text("""
-                    CREATE TRIGGER IF NOT EXISTS disparus_ad AFTER DELETE ON disparus_flask BEGIN
-                        INSERT INTO disparus_fts(disparus_fts, rowid, first_name, last_name, public_id, city)
-                        VALUES('delete', old.id, old.first_name, old.last_name, old.public_id, old.city);
-                    END;
-                """))
-
-                # Update Trigger
-                db.session.execute(text("""
-                    CREATE TRIGGER IF NOT EXISTS disparus_au AFTER UPDATE ON disparus_flask BEGIN
-                        INSERT INTO disparus_fts(disparus_fts, rowid, first_name, last_name, public_id, city)
-                        VALUES('delete', old.id, old.first_name, old.last_name, old.public_id, old.city);
-                        INSERT INTO disparus_fts(rowid, first_name, last_name, public_id, city)
-                        VALUES (new.id, new.first_name, new.last_name, new.public_id, new.city);
-                    END;
-                """))
-
-                # 3. Populate initially from existing data
-                db.session.execute(text("""
-                    INSERT INTO disparus_fts(rowid, first_name, last_name, public_id, city)
-                    SELECT id, first_name, last_name, public_id, city FROM disparus_flask;
-                """))
-
-                db.session.commit()
-                logger.info("  + SQLite FTS setup complete.")
-            else:
-                 logger.info("  SQLite FTS already setup.")
-
+            db.session.execute(text("CREATE EXTENSION IF NOT EXISTS cube"))
+            db.session.execute(text("CREATE EXTENSION IF NOT EXISTS earthdistance"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_disparus_flask_earth ON disparus_flask USING gist (ll_to_earth(latitude, longitude))"))
+            db.session.commit()
+            logger.info("  + Verified/Created earthdistance GiST index")
         except Exception as e:
             db.session.rollback()
-            # If fts5 is not available, this will fail. We should log it but not crash.
-            logger.warning(f"  - SQLite optimization skipped/failed: {e}")
+            logger.warning(f"  - earthdistance setup skipped/failed: {e}")
+
+    reset_spatial_capabilities()
 
 
 def generate_demo_images():
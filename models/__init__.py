@@ -16,6 +16,8 @@ from models.activity_log import ActivityLog, log_activity
 from models.download import Download
 from models.settings import SiteSetting, init_default_settings, init_default_roles
 from models.moderation_log import ContentModerationLog
+from models.events import on_disparu_change
+from models.match_candidate import MatchCandidate, DedupeRun
 
 __all__ = [
     'db', 
@@ -31,4 +33,7 @@ __all__ = [
     'init_default_settings',
     'init_default_roles',
     'ContentModerationLog',
+    'on_disparu_change',
+    'MatchCandidate',
+    'DedupeRun',
 ]
@@ -6,6 +6,8 @@
  * Auditer par : La CyberConfiance, www.cyberconfiance.com
 """
 from models import db
+from models.disparu import _geohash
+from sqlalchemy.orm import validates
 
 
 class Contribution(db.Model):
@@ -19,10 +21,12 @@ class Contribution(db.Model):
     
     latitude = db.Column(db.Float)
     longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(9))
     location_name = db.Column(db.String(200))
     
     observation_date = db.Column(db.DateTime)
     proof_url = db.Column(db.String(500))
+    proof_hash = db.Column(db.BigInteger)
     
     person_state = db.Column(db.String(50))
     return_circumstances = db.Column(db.Text)
@@ -44,7 +48,17 @@ class Contribution(db.Model):
     location = db.Column(db.String(200))
     
     created_at = db.Column(db.DateTime, default=db.func.now())
-    
+
+    @validates('latitude')
+    def validate_latitude(self, key, latitude):
+        self.geohash = _geohash(latitude, self.longitude)
+        return latitude
+
+    @validates('longitude')
+    def validate_longitude(self, key, longitude):
+        self.geohash = _geohash(self.latitude, longitude)
+        return longitude
+
     def to_dict(self):
         return {
             'id': self.id,
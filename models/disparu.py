@@ -9,8 +9,26 @@ from models import db
 from sqlalchemy.orm import validates
 
 
+def _geohash(latitude, longitude):
+    # Imported late: the utils package imports the models
+    from utils.geohash import encode_geohash
+    return encode_geohash(latitude, longitude)
+
+
+def _description_minhash(physical_description, clothing):
+    from algorithms.minhash import minhash_signature
+    return minhash_signature(physical_description, clothing)
+
+
+def _search_words(text):
+    from utils.search import search_words
+    return search_words(text)
+
+
 class Disparu(db.Model):
     __tablename__ = 'disparus_flask'
+    # Newest first listings, paged by (created_at, id) cursors
+    __table_args__ = (db.Index('ix_disparus_flask_created_at_id', 'created_at', 'id'),)
     
     id = db.Column(db.Integer, primary_key=True)
     public_id = db.Column(db.String(6), unique=True, nullable=False, index=True)
@@ -25,15 +43,30 @@ class Disparu(db.Model):
     
     country = db.Column(db.String(100), nullable=False)
     city = db.Column(db.String(100), nullable=False, index=True)
+    # Accent, case and punctuation folded copies of the columns above
+    # (utils.search.search_words), kept in step by the validators below and
+    # indexed by utils.search.build_search_index
+    first_name_search = db.Column(db.String(255))
+    last_name_search = db.Column(db.String(255))
+    city_search = db.Column(db.String(255))
+    country_search = db.Column(db.String(255))
     
     physical_description = db.Column(db.Text, nullable=False)
+    # MinHash of the description and clothing words, kept in step by the
+    # validators below (algorithms.minhash)
+    description_minhash = db.Column(db.LargeBinary)
     photo_url = db.Column(db.String(500))
+    # 64-bit dHash of the photo, signed to fit BIGINT (algorithms.matching.hash_to_int)
+    photo_hash = db.Column(db.BigInteger)
     
     disappearance_date = db.Column(db.DateTime, nullable=False)
     circumstances = db.Column(db.Text, nullable=False)
     
     latitude = db.Column(db.Float)
     longitude = db.Column(db.Float)
+    # Kept in step with the coordinates by the validators below; its prefix
+    # index is created by init_db.sync_indexes (per-dialect operator class)
+    geohash = db.Column(db.String(9))
     
     clothing = db.Column(db.Text)
     objects = db.Column(db.Text)
@@ -58,6 +91,7 @@ class Disparu(db.Model):
                  raise ValueError("Latitude must be a number")
              if not (-90 <= val <= 90):
                  raise ValueError("Latitude must be between -90 and 90")
+        self.geohash = _geohash(latitude, self.longitude)
         return latitude
 
     @validates('longitude')
@@ -69,8 +103,24 @@ class Disparu(db.Model):
                  raise ValueError("Longitude must be a number")
              if not (-180 <= val <= 180):
                  raise ValueError("Longitude must be between -180 and 180")
+        self.geohash = _geohash(self.latitude, longitude)
         return longitude
 
+    @validates('physical_description')
+    def validate_physical_description(self, key, physical_description):
+        self.description_minhash = _description_minhash(physical_description, self.clothing)
+        return physical_description
+
+    @validates('clothing')
+    def validate_clothing(self, key, clothing):
+        self.description_minhash = _description_minhash(self.physical_description, clothing)
+        return clothing
+
+    @validates('first_name', 'last_name', 'city', 'country')
+    def validate_searched(self, key, value):
+        setattr(self, f'{key}_search', _search_words(value))
+        return value
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -0,0 +1,87 @@
+"""
+ * Nom de l'application : DISPARUS.ORG
+ * Description : Notifications de modification des fiches disparus
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+import logging
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from models.disparu import Disparu
+
+_PENDING_KEY = 'disparu_changes'
+_listeners = []
+
+
+def on_disparu_change(listener):
+    """
+    Registers listener(engine, changes) to be called after each commit that
+    touched disparus. changes is a list of (action, disparu_id) tuples where
+    action is 'insert', 'update', 'delete', or 'reset' (with a None id) after
+    a bulk statement.
+    """
+    if listener not in _listeners:
+        _listeners.append(listener)
+    return listener
+
+
+def _record(connection, target, action):
+    session = object_session(target)
+    if session is None or target.id is None:
+        return
+    session.info.setdefault(_PENDING_KEY, []).append((connection.engine, action, target.id))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _bulk_statement(orm_execute_state):
+    # query.delete() / query.update() bypass the mapper hooks: listeners get a
+    # 'reset' with no id and must drop whatever they derived from the table
+    if not (orm_execute_state.is_delete or orm_execute_state.is_update):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ is not Disparu:
+        return
+    session = orm_execute_state.session
+    engine = session.get_bind(mapper=mapper)
+    session.info.setdefault(_PENDING_KEY, []).append((engine, 'reset', None))
+
+
+@event.listens_for(Disparu, 'after_insert')
+def _disparu_inserted(mapper, connection, target):
+    _record(connection, target, 'insert')
+
+
+@event.listens_for(Disparu, 'after_update')
+def _disparu_updated(mapper, connection, target):
+    _record(connection, target, 'update')
+
+
+@event.listens_for(Disparu, 'after_delete')
+def _disparu_deleted(mapper, connection, target):
+    _record(connection, target, 'delete')
+
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch_changes(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+
+    by_engine = {}
+    for engine, action, disparu_id in pending:
+        by_engine.setdefault(engine, []).append((action, disparu_id))
+
+    for engine, changes in by_engine.items():
+        for listener in list(_listeners):
+            try:
+                listener(engine, changes)
+            except Exception as e:
+                # A failing cache must never break the write path
+                logging.warning(f"Disparu change listener failed: {e}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop(_PENDING_KEY, None)
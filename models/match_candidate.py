@@ -0,0 +1,68 @@
+"""
+ * Nom de l'application : DISPARUS.ORG
+ * Description : Modeles des doublons potentiels et des passes de dedoublonnage
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+from models import db
+
+
+class MatchCandidate(db.Model):
+    __tablename__ = 'match_candidates'
+    # One row per pair, smallest id in disparu_id
+    __table_args__ = (db.UniqueConstraint('disparu_id', 'candidate_id', name='uq_match_candidates_pair'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    disparu_id = db.Column(db.Integer, db.ForeignKey('disparus_flask.id', ondelete='CASCADE'), nullable=False, index=True)
+    candidate_id = db.Column(db.Integer, db.ForeignKey('disparus_flask.id', ondelete='CASCADE'), nullable=False, index=True)
+
+    score = db.Column(db.Integer, nullable=False, index=True)
+    reasons = db.Column(db.JSON, default=list)
+    computed_at = db.Column(db.DateTime, default=db.func.now())
+
+    # No backref: deleting a case must not try to null these rows
+    disparu = db.relationship('Disparu', foreign_keys=[disparu_id], lazy='select')
+    candidate = db.relationship('Disparu', foreign_keys=[candidate_id], lazy='select')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'disparu_id': self.disparu_id,
+            'candidate_id': self.candidate_id,
+            'score': self.score,
+            'reasons': self.reasons or [],
+            'computed_at': self.computed_at.isoformat() if self.computed_at else None,
+        }
+
+
+class DedupeRun(db.Model):
+    __tablename__ = 'dedupe_runs'
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    mode = db.Column(db.String(20), nullable=False, default='full')
+    status = db.Column(db.String(20), nullable=False, default='running')
+
+    records_scanned = db.Column(db.Integer, default=0)
+    pairs_found = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text)
+
+    started_at = db.Column(db.DateTime, default=db.func.now())
+    finished_at = db.Column(db.DateTime)
+
+    MODES = ['full', 'incremental']
+    STATUSES = ['running', 'finished', 'failed']
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'mode': self.mode,
+            'status': self.status,
+            'records_scanned': self.records_scanned,
+            'pairs_found': self.pairs_found,
+            'error': self.error,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
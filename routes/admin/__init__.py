@@ -36,4 +36,4 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-from . import dashboard, management, moderation, export
+from . import dashboard, management, moderation, export, duplicates
@@ -86,7 +86,7 @@ def map_view():
 
     data = stats_service.get_map_data()
 
-    return render_template('admin_map.html', disparus=data['results'], disparus_list=data['disparus_list'])
+    return render_template('admin_map.html', countries=data['countries'], total=data['total'])
 
 
 @admin_bp.route('/settings', methods=['GET', 'POST'])
@@ -0,0 +1,42 @@
+from flask import render_template, request, redirect, url_for, flash, current_app
+from sqlalchemy.orm import aliased
+from models import db, Disparu, MatchCandidate
+from services.dedupe import last_dedupe_run, start_dedupe_job
+from . import admin_bp, admin_required, log_activity
+
+
+@admin_bp.route('/duplicates')
+@admin_required
+def duplicates():
+    log_activity('Consultation doublons potentiels', action_type='view', target_type='duplicates')
+    page = request.args.get('page', 1, type=int)
+    per_page = 50
+    min_score = request.args.get('min_score', 0, type=int)
+
+    # Inner joins skip pairs whose case was deleted since the last run
+    first, second = aliased(Disparu), aliased(Disparu)
+    query = db.session.query(MatchCandidate, first, second) \
+        .join(first, MatchCandidate.disparu_id == first.id) \
+        .join(second, MatchCandidate.candidate_id == second.id)
+    if min_score:
+        query = query.filter(MatchCandidate.score >= min_score)
+
+    candidates = query.order_by(MatchCandidate.score.desc(), MatchCandidate.id) \
+        .paginate(page=page, per_page=per_page, error_out=False)
+
+    return render_template('admin_duplicates.html',
+                         candidates=candidates,
+                         min_score=min_score,
+                         last_run=last_dedupe_run())
+
+
+@admin_bp.route('/duplicates/run', methods=['POST'])
+@admin_required
+def run_duplicates():
+    full = request.form.get('full') == '1'
+    if start_dedupe_job(current_app._get_current_object(), full=full) is None:
+        flash('Une detection des doublons est deja en cours', 'error')
+    else:
+        log_activity('Lancement detection des doublons', action_type='update', target_type='duplicates')
+        flash('Detection des doublons lancee', 'success')
+    return redirect(url_for('admin.duplicates'))
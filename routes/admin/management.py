@@ -1,10 +1,13 @@
 import os
+import tempfile
 from datetime import datetime
-from flask import render_template, request, redirect, url_for, session, flash, current_app
+from flask import render_template, request, redirect, url_for, session, flash, current_app, jsonify
 from werkzeug.utils import secure_filename
 from models import db, User, Role, Disparu, Contribution
 from sqlalchemy.orm import joinedload
 from utils.geo import get_countries
+from algorithms.matching import compute_photo_hash, find_similar_hashes, find_similar_photos
+from services.dedupe import possible_duplicates
 from . import admin_bp, admin_required, log_activity
 
 @admin_bp.route('/users')
@@ -210,6 +213,7 @@ def edit_disparu(disparu_id):
                     file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
                     file.save(file_path)
                     disparu.photo_url = filename
+                    disparu.photo_hash = compute_photo_hash(file_path)
 
             if request.form.get('latitude') and request.form.get('latitude').strip():
                 try:
@@ -263,7 +267,8 @@ def edit_disparu(disparu_id):
             flash(f'Erreur lors de la modification: {str(e)}', 'error')
 
     from utils.geo import COUNTRIES_CITIES
-    return render_template('admin_disparu_form.html', person=disparu, countries=get_countries(), countries_cities=COUNTRIES_CITIES)
+    return render_template('admin_disparu_form.html', person=disparu, countries=get_countries(), countries_cities=COUNTRIES_CITIES,
+                           duplicates=possible_duplicates(disparu.id, limit=10))
 
 
 @admin_bp.route('/disparu/<int:disparu_id>/status', methods=['POST'])
@@ -294,6 +299,32 @@ def update_status(disparu_id):
     return redirect(request.referrer or url_for('admin.dashboard'))
 
 
+@admin_bp.route('/disparu/<int:disparu_id>/similar-photos')
+@admin_required
+def similar_photos(disparu_id):
+    """Cases whose photo duplicates or closely resembles this case's photo"""
+    disparu = Disparu.query.get_or_404(disparu_id)
+    threshold = min(1.0, max(0.5, request.args.get('threshold', 0.8, type=float)))
+    matches = find_similar_hashes(disparu.photo_hash, threshold, exclude_id=disparu.id)
+    return jsonify({'disparu_id': disparu.id, 'threshold': threshold, 'matches': matches})
+
+
+@admin_bp.route('/similar-photos', methods=['POST'])
+@admin_required
+def similar_photos_upload():
+    """Cases whose photo resembles an uploaded image, before it is published"""
+    file = request.files.get('photo')
+    if not file or not file.filename:
+        return jsonify({'error': 'photo required'}), 400
+    threshold = min(1.0, max(0.5, request.form.get('threshold', 0.8, type=float)))
+
+    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(secure_filename(file.filename))[1]) as tmp:
+        file.save(tmp.name)
+        # Not cached: the temporary path is gone once answered
+        matches = find_similar_photos(tmp.name, threshold, use_cache=False)
+    return jsonify({'threshold': threshold, 'matches': matches})
+
+
 @admin_bp.route('/disparu/<int:disparu_id>/delete', methods=['POST'])
 @admin_required
 def delete_disparu(disparu_id):
@@ -5,14 +5,25 @@
  * Fait par : Aisance KALONJI, www.aisancekalonji.com
  * Auditer par : La CyberConfiance, www.cyberconfiance.com
 """
-from flask import Blueprint, jsonify, request
-from math import radians, sin, cos, sqrt, atan2
+from flask import Blueprint, Response, jsonify, request
+import gzip
+import hashlib
+from datetime import datetime
+from math import radians, sin, cos, sqrt, atan2, isfinite, floor
 import time
 
 from models import db, Disparu, Contribution
 from utils.geo import get_countries, get_cities
+from utils.spatial import filter_bbox, knn_distance
+from utils.search import ranked_search
+from utils.suggest import KINDS as SUGGESTION_TYPES, get_suggest_index
+from utils.pagination import (MAX_PAGE_SIZE, InvalidCursor, decode_cursor, keyset_condition, page_size, paginate,
+                              with_next_cursor)
 from security.rate_limit import rate_limit
 from services.moderation import get_geo_info
+from algorithms.spatial_index import get_spatial_index
+from algorithms.map_clusters import get_cluster_hierarchy, map_filter_key
+from utils.tiles import MAX_TILE_ZOOM, TILE_MIMETYPE, encode_tile, tile_bounds
 
 api_bp = Blueprint('api', __name__)
 
@@ -35,7 +46,8 @@ def haversine_distance(lat1, lon1, lat2, lon2):
 def get_disparus():
     status = request.args.get('status')
     country = request.args.get('country')
-    limit = request.args.get('limit', 100, type=int)
+    size = page_size(request.args.get('limit', type=int), default=MAX_PAGE_SIZE)
+    cursor = request.args.get('cursor')
     user_lat = request.args.get('lat', type=float)
     user_lng = request.args.get('lng', type=float)
     
@@ -47,48 +59,88 @@ def get_disparus():
         q = q.filter_by(country=country)
     
     if user_lat and user_lng:
-        # Calculate distance in SQL for efficiency and pagination
-        # Use Haversine formula
-        R = 6371  # Earth radius in km
+        knn = knn_distance(user_lat, user_lng)
+        if knn is not None:
+            # PostGIS / earthdistance: index-assisted KNN ordering (<->)
+            order_by, distance_expr = knn
+        else:
+            # Calculate distance in SQL for efficiency and pagination
+            # Use Haversine formula
+            R = 6371  # Earth radius in km
 
-        lat1 = db.func.radians(user_lat)
-        lon1 = db.func.radians(user_lng)
-        lat2 = db.func.radians(Disparu.latitude)
-        lon2 = db.func.radians(Disparu.longitude)
+            lat1 = db.func.radians(user_lat)
+            lon1 = db.func.radians(user_lng)
+            lat2 = db.func.radians(Disparu.latitude)
+            lon2 = db.func.radians(Disparu.longitude)
 
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
+            dlat = lat2 - lat1
+            dlon = lon2 - lon1
 
-        a = db.func.sin(dlat / 2) * db.func.sin(dlat / 2) + \
-            db.func.cos(lat1) * db.func.cos(lat2) * \
-            db.func.sin(dlon / 2) * db.func.sin(dlon / 2)
+            a = db.func.sin(dlat / 2) * db.func.sin(dlat / 2) + \
+                db.func.cos(lat1) * db.func.cos(lat2) * \
+                db.func.sin(dlon / 2) * db.func.sin(dlon / 2)
 
-        c = 2 * db.func.atan2(db.func.sqrt(a), db.func.sqrt(1 - a))
+            c = 2 * db.func.atan2(db.func.sqrt(a), db.func.sqrt(1 - a))
 
-        distance_expr = R * c
+            distance_expr = R * c
+            order_by = distance_expr
 
         # Filter out records without location
         q = q.filter(Disparu.latitude.isnot(None), Disparu.longitude.isnot(None))
 
+        # Pages follow each other on (ordering distance, id)
+        columns = [Disparu, distance_expr.label('distance')]
+        sort_key = columns[1]
+        if order_by is not distance_expr:
+            sort_key = order_by.label('sort_key')
+            columns.append(sort_key)
+        if cursor:
+            try:
+                q = q.filter(keyset_condition([order_by, Disparu.id], decode_cursor(cursor, float, int),
+                                              descending=False))
+            except InvalidCursor:
+                return jsonify({'error': 'invalid cursor'}), 400
+
         # Select Disparu and distance
         # Order by distance
-        results = q.with_entities(Disparu, distance_expr.label('distance')) \
-                   .order_by('distance') \
-                   .limit(limit) \
+        results = q.with_entities(*columns) \
+                   .order_by(sort_key, Disparu.id) \
+                   .limit(size + 1) \
                    .all()
+        results, next_cursor = paginate(results, size, key=lambda row: (row[-1], row[0].id))
 
         final_result = []
-        for d, dist in results:
+        for d, dist, *_ in results:
             d_dict = d.to_dict()
             d_dict['distance'] = dist
             final_result.append(d_dict)
 
-        return jsonify(final_result)
+        return with_next_cursor(jsonify(final_result), next_cursor)
 
     else:
-        disparus = q.order_by(Disparu.created_at.desc()).limit(limit).all()
+        # Newest first, paged on (created_at, id): ix_disparus_flask_created_at_id
+        if cursor:
+            try:
+                q = q.filter(keyset_condition([Disparu.created_at, Disparu.id], decode_cursor(cursor, datetime, int)))
+            except InvalidCursor:
+                return jsonify({'error': 'invalid cursor'}), 400
+        disparus = q.order_by(Disparu.created_at.desc(), Disparu.id.desc()).limit(size + 1).all()
+        disparus, next_cursor = paginate(disparus, size, key=lambda d: (d.created_at, d.id))
         result = [d.to_dict() for d in disparus]
-        return jsonify(result)
+        return with_next_cursor(jsonify(result), next_cursor)
+
+
+def _filter_map_query(query, person_type=None, country=None):
+    """Applies the map's type and country filters"""
+    if country:
+        query = query.filter(Disparu.country == country)
+
+    if person_type and person_type != 'all':
+        if person_type == 'person':
+            query = query.filter(Disparu.person_type.in_(['child', 'adult', 'elderly']))
+        else:
+            query = query.filter(Disparu.person_type == person_type)
+    return query
 
 
 @api_bp.route('/map-data')
@@ -119,26 +171,10 @@ def get_map_data():
     ).filter(Disparu.latitude.isnot(None), Disparu.longitude.isnot(None))
 
     if min_lat is not None and max_lat is not None and min_lng is not None and max_lng is not None:
-        # Handle date line crossing if needed (min_lng > max_lng)
-        if min_lng > max_lng:
-             query = query.filter(
-                Disparu.latitude.between(min_lat, max_lat),
-                db.or_(Disparu.longitude >= min_lng, Disparu.longitude <= max_lng)
-            )
-        else:
-            query = query.filter(
-                Disparu.latitude.between(min_lat, max_lat),
-                Disparu.longitude.between(min_lng, max_lng)
-            )
-
-    if country:
-        query = query.filter(Disparu.country == country)
+        # Date line crossing is expressed as min_lng > max_lng
+        query = filter_bbox(query, min_lat, max_lat, min_lng, max_lng)
 
-    if person_type and person_type != 'all':
-        if person_type == 'person':
-            query = query.filter(Disparu.person_type.in_(['child', 'adult', 'elderly']))
-        else:
-            query = query.filter(Disparu.person_type == person_type)
+    query = _filter_map_query(query, person_type, country)
 
     # Limit to prevent overload if bbox is too large
     results = query.limit(500).all()
@@ -160,6 +196,176 @@ def get_map_data():
     return jsonify(data)
 
 
+# Single cases returned at most per viewport (stacked cases at high zoom)
+MAX_MAP_POINTS = 500
+# Features returned at most per viewport: wider boxes are clustered at a coarser zoom
+MAX_MAP_FEATURES = 2000
+
+
+@api_bp.route('/map-clusters')
+@rate_limit()
+def get_map_clusters():
+    try:
+        min_lng, min_lat, max_lng, max_lat = [float(v) for v in request.args.get('bbox', '').split(',')]
+        if not all(isfinite(v) for v in (min_lng, min_lat, max_lng, max_lat)):
+            raise ValueError('non-finite bbox')
+    except ValueError:
+        return jsonify({'error': 'bbox=min_lng,min_lat,max_lng,max_lat required'}), 400
+    try:
+        # Fractional zooms (pinch, animated zoom) use the level below
+        zoom = float(request.args.get('zoom', 0))
+        if not isfinite(zoom):
+            raise ValueError('non-finite zoom')
+    except ValueError:
+        return jsonify({'error': 'zoom must be a number'}), 400
+    zoom = floor(zoom)
+
+    person_type = request.args.get('type')
+    country = request.args.get('country')
+    if map_filter_key(person_type, country) is None:
+        return jsonify({'error': 'Unknown type or country'}), 400
+
+    # Maps panned past the date line send longitudes beyond +/-180: wrap
+    # them, a crossing being expressed as min_lng > max_lng
+    width = max_lng - min_lng
+    if width >= 360:
+        min_lng, max_lng = -180, 180
+    else:
+        min_lng = (min_lng + 180) % 360 - 180
+        max_lng = min_lng + width
+        if max_lng > 180:
+            max_lng -= 360
+
+    hierarchy = get_cluster_hierarchy(person_type, country)
+    clusters = hierarchy.get_clusters(min_lat, max_lat, min_lng, max_lng, zoom, max_clusters=MAX_MAP_FEATURES)
+
+    # Single cases past MAX_MAP_POINTS are sent as one-case clusters, without their details
+    point_ids = [c['disparu_id'] for c in clusters if c['disparu_id'] is not None][:MAX_MAP_POINTS]
+    points = {}
+    if point_ids:
+        rows = db.session.query(
+            Disparu.id,
+            Disparu.public_id,
+            Disparu.first_name,
+            Disparu.last_name,
+            Disparu.photo_url,
+            Disparu.latitude,
+            Disparu.longitude,
+            Disparu.city,
+            Disparu.country,
+            Disparu.status,
+            Disparu.person_type,
+            Disparu.is_flagged
+        ).filter(Disparu.id.in_(point_ids)).all()
+        points = {d.id: d for d in rows}
+
+    detailed = set(point_ids)
+    features = []
+    for c in clusters:
+        if c['disparu_id'] not in detailed:
+            features.append({
+                'type': 'cluster',
+                'id': c['id'],
+                'latitude': c['latitude'],
+                'longitude': c['longitude'],
+                'count': c['count'],
+                'expansion_zoom': c['expansion_zoom'],
+            })
+            continue
+
+        d = points.get(c['disparu_id'])
+        if d is None:
+            # Deleted since the hierarchy was built
+            continue
+        features.append({
+            'type': 'point',
+            'id': d.id,
+            'public_id': d.public_id,
+            'full_name': f"{d.first_name} {d.last_name}" if d.person_type != 'animal' else d.first_name,
+            'photo_url': d.photo_url,
+            'latitude': d.latitude,
+            'longitude': d.longitude,
+            'city': d.city,
+            'country': d.country,
+            'status': d.status,
+            'person_type': d.person_type,
+            'is_flagged': d.is_flagged,
+            'count': 1,
+        })
+
+    return jsonify({
+        'zoom': zoom,
+        'total': sum(f['count'] for f in features),
+        'features': features,
+    })
+
+
+# Browsers and CDNs reuse a tile for this long, then revalidate with the ETag
+TILE_MAX_AGE = 300
+
+
+@api_bp.route('/tiles/<int:z>/<int:x>/<int:y>')
+@rate_limit()
+def get_map_tile(z, x, y):
+    """
+    Map tile in the compact columnar format of utils.tiles: quantized
+    coordinates and dictionary-encoded attributes, clusters below the
+    points zoom. Names and photos are left to /api/disparus/<public_id>.
+    """
+    if z > MAX_TILE_ZOOM or x >= 2 ** z or y >= 2 ** z:
+        return jsonify({'error': 'Tile out of range'}), 404
+
+    person_type = request.args.get('type')
+    country = request.args.get('country')
+    if map_filter_key(person_type, country) is None:
+        return jsonify({'error': 'Unknown type or country'}), 400
+
+    min_lat, max_lat, min_lng, max_lng = tile_bounds(z, x, y)
+    clusters = get_cluster_hierarchy(person_type, country).get_clusters(min_lat, max_lat, min_lng, max_lng, z)
+
+    point_ids = [c['disparu_id'] for c in clusters if c['disparu_id'] is not None]
+    points = {}
+    if point_ids:
+        rows = db.session.query(
+            Disparu.id,
+            Disparu.public_id,
+            Disparu.status,
+            Disparu.person_type,
+            Disparu.country
+        ).filter(Disparu.id.in_(point_ids)).all()
+        points = {d.id: d for d in rows}
+
+    features = []
+    for c in clusters:
+        d = points.get(c['disparu_id'])
+        if d is not None:
+            c.update(public_id=d.public_id, status=d.status, person_type=d.person_type, country=d.country)
+        elif c['disparu_id'] is not None:
+            # Deleted since the hierarchy was built
+            continue
+        features.append(c)
+
+    # Versioned by the bytes themselves: the clusters come from this worker's
+    # hierarchy, which can lag the database, so a 304 only ever confirms
+    # the tile this worker would send. The gzip body gets its own tag, and
+    # either tag of the same tile revalidates.
+    body = encode_tile(z, x, y, features)
+    etag = hashlib.sha1(body).hexdigest()[:20]
+    compressed = 'gzip' in request.accept_encodings
+    if request.if_none_match.contains(etag) or request.if_none_match.contains(etag + '-gz'):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype=TILE_MIMETYPE)
+        if compressed:
+            response.set_data(gzip.compress(body, compresslevel=6))
+            response.headers['Content-Encoding'] = 'gzip'
+
+    response.set_etag(etag + '-gz' if compressed else etag)
+    response.headers['Cache-Control'] = f'public, max-age={TILE_MAX_AGE}, stale-while-revalidate={TILE_MAX_AGE * 12}'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
 @api_bp.route('/disparus/nearby')
 @rate_limit()
 def get_nearby_disparus():
@@ -171,56 +377,26 @@ def get_nearby_disparus():
     if not user_lat or not user_lng:
         return jsonify({'error': 'lat and lng required'}), 400
     
-    # Helper to construct the query with optional bounding box
-    def get_query(bbox=None):
-        if bbox:
-            min_lat, max_lat, min_lng, max_lng = bbox
-            q = Disparu.query.filter(
-                Disparu.latitude.between(min_lat, max_lat),
-                Disparu.longitude.between(min_lng, max_lng)
-            )
-        else:
-            q = Disparu.query.filter(Disparu.latitude.isnot(None), Disparu.longitude.isnot(None))
-
+    knn = knn_distance(user_lat, user_lng)
+    if knn is not None:
+        # PostgreSQL geo backend: shared, always fresh, index-assisted KNN
+        order_by, distance_expr = knn
+        q = Disparu.query.filter(Disparu.latitude.isnot(None), Disparu.longitude.isnot(None))
         if status:
             q = q.filter_by(status=status)
-        return q
-
-    # SQL Haversine calculation to find nearest neighbors
-    R = 6371  # Earth radius in km
-
-    lat1 = db.func.radians(user_lat)
-    lon1 = db.func.radians(user_lng)
-    lat2 = db.func.radians(Disparu.latitude)
-    lon2 = db.func.radians(Disparu.longitude)
-
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-
-    a = db.func.sin(dlat / 2) * db.func.sin(dlat / 2) + \
-        db.func.cos(lat1) * db.func.cos(lat2) * \
-        db.func.sin(dlon / 2) * db.func.sin(dlon / 2)
-
-    c = 2 * db.func.atan2(db.func.sqrt(a), db.func.sqrt(1 - a))
-    distance_expr = R * c
-
-    # Optimization: Use bounding box to limit search space (approx 550km box)
-    BOX_SIZE = 5.0
-    bbox = (user_lat - BOX_SIZE, user_lat + BOX_SIZE, user_lng - BOX_SIZE, user_lng + BOX_SIZE)
-    
-    # Try with bounding box first to limit rows before sorting
-    q_bbox = get_query(bbox)
-    disparus_with_dist = q_bbox.with_entities(Disparu, distance_expr.label('distance')).order_by('distance').limit(limit).all()
+        neighbours = q.with_entities(Disparu, distance_expr.label('distance')).order_by(order_by).limit(limit).all()
+    else:
+        # k-nearest-neighbour lookup in the per-worker spatial index: O(log n)
+        # whatever the density around the user, instead of a SQL sort
+        index = get_spatial_index()
+        nearest = index.nearest(user_lat, user_lng, limit, status=status or None)
 
-    # Fallback: if not enough results, search everything (preserves behavior for distant matches)
-    if len(disparus_with_dist) < limit:
-        # Avoids loading all candidates into Python memory
-        q_all = get_query(None)
-        # Order by distance and limit
-        disparus_with_dist = q_all.with_entities(Disparu, distance_expr.label('distance')).order_by('distance').limit(limit).all()
+        ids = [disparu_id for _, disparu_id in nearest]
+        disparus = {d.id: d for d in Disparu.query.filter(Disparu.id.in_(ids)).all()} if ids else {}
+        neighbours = [(disparus[disparu_id], dist) for dist, disparu_id in nearest if disparu_id in disparus]
 
     results = []
-    for d, dist in disparus_with_dist:
+    for d, dist in neighbours:
         data = d.to_dict()
         data['distance'] = round(dist, 1)
         results.append(data)
@@ -305,17 +481,33 @@ def search_api():
     if not query or len(query) < 2:
         return jsonify([])
     
-    search_term = f"%{query}%"
-    results = Disparu.query.filter(
-        db.or_(
-            Disparu.first_name.ilike(search_term),
-            Disparu.last_name.ilike(search_term),
-            Disparu.public_id.ilike(search_term),
-            Disparu.city.ilike(search_term),
-        )
-    ).limit(20).all()
+    fuzzy = request.args.get('fuzzy', '1') != '0'
+    size = page_size(request.args.get('limit', type=int))
+    cursor = request.args.get('cursor')
+    try:
+        after = decode_cursor(cursor, float, int) if cursor else None
+    except InvalidCursor:
+        return jsonify({'error': 'invalid cursor'}), 400
+    # Pages follow each other on (score, id), the ranking order
+    results = ranked_search(query, limit=size + 1, fuzzy=fuzzy, after=after)
+    results, next_cursor = paginate(results, size, key=lambda item: (item[1], item[0].id))
     
-    return jsonify([d.to_dict() for d in results])
+    return with_next_cursor(jsonify([dict(d.to_dict(), score=round(score, 4)) for d, score in results]), next_cursor)
+
+
+# Completions returned at most per keystroke
+MAX_SUGGESTIONS = 20
+
+
+@api_bp.route('/suggest')
+@rate_limit()
+def suggest_api():
+    """Typeahead: names, public ids and cities starting with q, most viewed first"""
+    query = request.args.get('q', '')
+    k = max(1, min(request.args.get('limit', 8, type=int), MAX_SUGGESTIONS))
+    types = [kind for kind in request.args.get('types', '').split(',') if kind in SUGGESTION_TYPES]
+
+    return jsonify(get_suggest_index().suggest(query, k, types or SUGGESTION_TYPES))
 
 
 @api_bp.route('/geo/ip')
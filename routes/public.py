@@ -8,14 +8,18 @@
 import os
 import random
 from datetime import datetime
-from flask import Blueprint, render_template, request, redirect, url_for, current_app, flash
+from flask import Blueprint, render_template, request, redirect, url_for, current_app, flash, session
 from werkzeug.utils import secure_filename
 
 from models import db, Disparu, Contribution, ModerationReport, ActivityLog, SiteSetting
-from utils.geo import get_countries, get_cities, COUNTRIES_CITIES, get_total_cities
+from utils.geo import get_countries, get_cities, COUNTRIES_CITIES, get_total_cities, get_coordinates_from_city
+from utils.search import ranked_search, search_disparus
+from utils.pagination import MAX_PAGE_SIZE, InvalidCursor, decode_cursor, keyset_condition, page_size, paginate
 from services.signalement import create_signalement, generate_public_id
+from services.dedupe import possible_duplicates
 from security.rate_limit import rate_limit
 from services.moderation import check_image_content
+from algorithms.matching import compute_photo_hash
 from asgiref.sync import sync_to_async
 
 public_bp = Blueprint('public', __name__)
@@ -24,49 +28,6 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 ALLOWED_MIMETYPES = {'image/png', 'image/jpeg', 'image/gif', 'image/webp'}
 
 
-# Cache for SQLite FTS availability
-_sqlite_fts_status = {}
-_postgres_trgm_status = {}
-
-def is_sqlite_fts_available(session):
-    """Check if SQLite FTS table exists, with caching"""
-    try:
-        bind = session.get_bind()
-        if bind.dialect.name != 'sqlite':
-            return False
-
-        # Use database URL as cache key
-        db_key = str(bind.url)
-        if db_key in _sqlite_fts_status:
-            return _sqlite_fts_status[db_key]
-
-        result = session.execute(db.text("SELECT name FROM sqlite_master WHERE type='table' AND name='disparus_fts'")).scalar()
-        available = (result is not None)
-        _sqlite_fts_status[db_key] = available
-        return available
-    except Exception:
-        return False
-
-
-def is_postgres_trgm_available(session):
-    """Check if Postgres pg_trgm extension is installed, with caching"""
-    try:
-        bind = session.get_bind()
-        if bind.dialect.name != 'postgresql':
-            return False
-
-        db_key = str(bind.url)
-        if db_key in _postgres_trgm_status:
-            return _postgres_trgm_status[db_key]
-
-        result = session.execute(db.text("SELECT count(*) FROM pg_extension WHERE extname = 'pg_trgm'")).scalar()
-        available = (result > 0)
-        _postgres_trgm_status[db_key] = available
-        return available
-    except Exception:
-        return False
-
-
 def allowed_file(filename, file_obj=None):
     """Validate file extension and optionally MIME type"""
     if '.' not in filename:
@@ -173,101 +134,38 @@ def search():
     country = request.args.get('country', '')
     has_photo = request.args.get('photo', '') == 'on'
     
-    q = Disparu.query
-    
-    if query:
-        # Optimized search for Postgres (uses Full Text Search or pg_trgm)
-        if db.session.get_bind().dialect.name == 'postgresql':
-            if is_postgres_trgm_available(db.session):
-                # Use pg_trgm for efficient substring search (Leading Wildcard Search)
-                # This fixes the inefficient fallback logic by enabling index usage for ILIKE
-                search_term = f"%{query}%"
-                q = q.filter(
-                    db.or_(
-                        Disparu.first_name.ilike(search_term),
-                        Disparu.last_name.ilike(search_term),
-                        Disparu.public_id.ilike(search_term),
-                        Disparu.city.ilike(search_term),
-                    )
-                )
-            else:
-                # Fallback to Full Text Search if pg_trgm is not available
-                # Note: This performs word-based matching rather than substring matching
-                sql_search = db.text("""
-                    to_tsvector('french',
-                        coalesce(first_name,'') || ' ' ||
-                        coalesce(last_name,'') || ' ' ||
-                        coalesce(public_id,'') || ' ' ||
-                        coalesce(city,'')
-                    ) @@ plainto_tsquery('french', :query)
-                """)
-                q = q.filter(sql_search).params(query=query)
-        elif db.session.get_bind().dialect.name == 'sqlite':
-            # Optimized Search for SQLite using FTS5 if available
-            if is_sqlite_fts_available(db.session):
-                # Sanitize and prepare query for FTS5 (Prefix search)
-                # We remove special characters that could break FTS syntax
-                safe_query = "".join([c for c in query if c.isalnum() or c.isspace() or c == '-'])
-
-                if safe_query.strip():
-                    # Append * to each term for prefix matching
-                    fts_query = " ".join([f'"{term}"*' for term in safe_query.split()])
-
-                    # Search in FTS table and filter main query by ID
-                    q = q.filter(db.text("id IN (SELECT rowid FROM disparus_fts WHERE disparus_fts MATCH :fts_q)").params(fts_q=fts_query))
-                else:
-                     # Fallback if query becomes empty after sanitization
-                     search_term = f"%{query}%"
-                     q = q.filter(
-                        db.or_(
-                            Disparu.first_name.ilike(search_term),
-                            Disparu.last_name.ilike(search_term),
-                            Disparu.public_id.ilike(search_term),
-                            Disparu.city.ilike(search_term),
-                        )
-                    )
-            else:
-                # Fallback if FTS table not present
-                search_term = f"%{query}%"
-                q = q.filter(
-                    db.or_(
-                        Disparu.first_name.ilike(search_term),
-                        Disparu.last_name.ilike(search_term),
-                        Disparu.public_id.ilike(search_term),
-                        Disparu.city.ilike(search_term),
-                    )
-                )
-        else:
-            # Fallback for Other (Leading wildcard scan)
-            search_term = f"%{query}%"
-            q = q.filter(
-                db.or_(
-                    Disparu.first_name.ilike(search_term),
-                    Disparu.last_name.ilike(search_term),
-                    Disparu.public_id.ilike(search_term),
-                    Disparu.city.ilike(search_term),
-                )
-            )
-    
-    if status_filter and status_filter != 'all':
-        q = q.filter_by(status=status_filter)
+    filters = {
+        'status': status_filter if status_filter != 'all' else None,
+        'person_type': person_type if person_type != 'all' else None,
+        'country': country,
+        'has_photo': has_photo,
+    }
     
-    if person_type and person_type != 'all':
-        if person_type == 'person':
-            q = q.filter(Disparu.person_type.in_(['child', 'adult', 'elderly']))
+    size = page_size(request.args.get('limit', type=int), default=MAX_PAGE_SIZE)
+    cursor = request.args.get('cursor')
+    try:
+        if query:
+            # Most relevant first, typos tolerated; pages follow on (score, id)
+            after = decode_cursor(cursor, float, int) if cursor else None
+            results = ranked_search(query, filters, limit=size + 1, after=after)
+            results, next_cursor = paginate(results, size, key=lambda item: (item[1], item[0].id))
+            results = [d for d, _ in results]
         else:
-            q = q.filter_by(person_type=person_type)
-    
-    if country:
-        q = q.filter_by(country=country)
-    
-    if has_photo:
-        q = q.filter(Disparu.photo_url.isnot(None))
-    
-    results = q.order_by(Disparu.created_at.desc()).limit(100).all()
+            q = search_disparus(query, filters)
+            if cursor:
+                q = q.filter(keyset_condition([Disparu.created_at, Disparu.id], decode_cursor(cursor, datetime, int)))
+            results, next_cursor = paginate(q.limit(size + 1).all(), size, key=lambda d: (d.created_at, d.id))
+    except InvalidCursor:
+        # Stale or edited link: back to the first page
+        return redirect(url_for('public.search', **{k: v for k, v in request.args.items() if k != 'cursor'}))
+
+    next_url = None
+    if next_cursor:
+        next_url = url_for('public.search', **dict(request.args.items(), cursor=next_cursor))
     
     return render_template('search.html', 
                          results=results, 
+                         next_url=next_url,
                          query=query,
                          status_filter=status_filter,
                          person_type=person_type,
@@ -360,7 +258,9 @@ def detail(public_id):
             db.session.rollback()
 
     contributions = Contribution.query.filter_by(disparu_id=disparu.id).order_by(Contribution.created_at.desc()).all()
-    return render_template('detail.html', person=disparu, contributions=contributions)
+    # Stored by the background match job: shown to moderators only
+    duplicates = possible_duplicates(disparu.id) if session.get('admin_logged_in') else []
+    return render_template('detail.html', person=disparu, contributions=contributions, duplicates=duplicates)
 
 
 @public_bp.route('/disparu/<public_id>/contribute', methods=['POST'])
@@ -491,12 +391,14 @@ def _handle_report_submission_sync(form_data, photo_file, upload_folder):
     """Sync helper for creating a new report with photo and DB commit"""
     try:
         photo_url = None
+        photo_hash = None
         if photo_file and photo_file.filename:
             filename = secure_filename(photo_file.filename)
             unique_name = f"{generate_public_id()}_{filename}"
             filepath = os.path.join(upload_folder, unique_name)
             photo_file.save(filepath)
             photo_url = f"/static/uploads/{unique_name}"
+            photo_hash = compute_photo_hash(filepath)
 
         person_type = form_data.get('person_type')
         animal_type = None
@@ -525,6 +427,12 @@ def _handle_report_submission_sync(form_data, photo_file, upload_folder):
                     'relation': form_data.get(f'contact_relation_{i}', '')
                 })
 
+        latitude = float(form_data.get('latitude')) if form_data.get('latitude') else None
+        longitude = float(form_data.get('longitude')) if form_data.get('longitude') else None
+        if latitude is None or longitude is None:
+            # No map pin: place the report at its city, from the offline gazetteer
+            latitude, longitude = get_coordinates_from_city(form_data.get('city'), form_data.get('country')) or (None, None)
+
         disparu = Disparu(
             public_id=generate_public_id(),
             person_type=person_type,
@@ -538,10 +446,11 @@ def _handle_report_submission_sync(form_data, photo_file, upload_folder):
             city=form_data.get('city'),
             physical_description=form_data.get('physical_description'),
             photo_url=photo_url,
+            photo_hash=photo_hash,
             disappearance_date=datetime.fromisoformat(form_data.get('disappearance_date')),
             circumstances=circumstances,
-            latitude=float(form_data.get('latitude')) if form_data.get('latitude') else None,
-            longitude=float(form_data.get('longitude')) if form_data.get('longitude') else None,
+            latitude=latitude,
+            longitude=longitude,
             clothing=form_data.get('clothing', ''),
             objects=objects,
             contacts=contacts,
@@ -559,16 +468,22 @@ def _handle_contribution_submission_sync(disparu_id, form_data, proof_file, uplo
     """Sync helper for creating a new contribution with proof and DB commit"""
     try:
         proof_url = None
+        proof_hash = None
         if proof_file and proof_file.filename:
             filename = secure_filename(proof_file.filename)
             unique_name = f"proof_{generate_public_id()}_{filename}"
             filepath = os.path.join(upload_folder, unique_name)
             proof_file.save(filepath)
             proof_url = f"/static/uploads/{unique_name}"
+            proof_hash = compute_photo_hash(filepath)
 
         lat = form_data.get('latitude')
         lng = form_data.get('longitude')
         obs_date = form_data.get('observation_date')
+        if not (lat and lng) and form_data.get('location_name'):
+            # Place named without a map pin: geocode it in the case's country
+            disparu = db.session.get(Disparu, disparu_id)
+            lat, lng = get_coordinates_from_city(form_data.get('location_name'), disparu.country if disparu else None) or (None, None)
 
         proposed_status = None
         if form_data.get('contribution_type') == 'found':
@@ -587,6 +502,7 @@ def _handle_contribution_submission_sync(disparu_id, form_data, proof_file, uplo
             location_name=form_data.get('location_name', ''),
             observation_date=datetime.fromisoformat(obs_date) if obs_date else None,
             proof_url=proof_url,
+            proof_hash=proof_hash,
             proof_source=form_data.get('proof_source'),
             person_state=form_data.get('person_state'),
             proposed_status=proposed_status,
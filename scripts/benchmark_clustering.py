@@ -15,7 +15,11 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from app import create_app
 from models import db, Disparu
-from algorithms.clustering import find_hotspots
+from algorithms.clustering import compute_hotspots, find_hotspots, haversine_distance, haversine_distances
+from algorithms.hotspot_index import invalidate_hotspot_index
+
+# Record counts benchmarked when none are given on the command line
+DEFAULT_SIZES = [10000, 100000, 1000000]
 
 def generate_random_string(length=10):
     return ''.join(random.choices(string.ascii_letters, k=length))
@@ -28,7 +32,7 @@ def setup_database(app, count=1000):
         disparus = []
         print(f"Generating {count} records...")
         for i in range(count):
-            d = Disparu(
+            d = dict(
                 public_id=f"DEMO{i}",
                 person_type='adult',
                 first_name=generate_random_string(),
@@ -46,8 +50,17 @@ def setup_database(app, count=1000):
             )
             disparus.append(d)
 
-        db.session.bulk_save_objects(disparus)
+            # Core bulk INSERT in batches keeps seeding 1M rows tractable
+            if len(disparus) == 50000:
+                db.session.execute(db.insert(Disparu), disparus)
+                disparus = []
+
+        if disparus:
+            db.session.execute(db.insert(Disparu), disparus)
         db.session.commit()
+
+        # Core inserts and drop_all bypass the change events
+        invalidate_hotspot_index()
         print(f"Database populated with {count} records.")
 
 def run_benchmark(app):
@@ -55,22 +68,65 @@ def run_benchmark(app):
         print("Warming up DB connection...")
         Disparu.query.first()
 
-        print("Running find_hotspots...")
+        print("Running find_hotspots (index build)...")
         start_time = time.time()
         hotspots = find_hotspots(min_cases=3, radius_km=50)
         end_time = time.time()
 
         duration = end_time - start_time
         print(f"Found {len(hotspots)} hotspots.")
+
+        start_time = time.time()
+        compute_hotspots(min_cases=3, radius_km=50)
+        print(f"compute_hotspots (from scratch): {time.time() - start_time:.4f}s")
+
+        start_time = time.time()
+        find_hotspots(min_cases=3, radius_km=50)
+        print(f"find_hotspots (cached read): {time.time() - start_time:.6f}s")
+
+        # One new report next to an existing case, then read again
+        anchor = Disparu.query.first()
+        db.session.add(Disparu(
+            public_id="BENCHNEW", person_type='adult', first_name='New', last_name='Case',
+            age=30, sex='male', country='Country', city='City', physical_description='Desc',
+            disappearance_date=datetime.now(), circumstances='Circumstances',
+            latitude=anchor.latitude + 0.01, longitude=anchor.longitude, status='missing'
+        ))
+        db.session.commit()
+        start_time = time.time()
+        find_hotspots(min_cases=3, radius_km=50)
+        print(f"find_hotspots (after one insert): {time.time() - start_time:.6f}s")
+
         return duration
 
+def run_kernel_benchmark(count):
+    """Scalar haversine loop vs one batched NumPy call over the same points"""
+    lats = [random.uniform(-90, 90) for _ in range(count)]
+    lngs = [random.uniform(-180, 180) for _ in range(count)]
+
+    start_time = time.time()
+    scalar = [haversine_distance(48.8566, 2.3522, lat, lng) for lat, lng in zip(lats, lngs)]
+    scalar_duration = time.time() - start_time
+
+    start_time = time.time()
+    batched = haversine_distances(48.8566, 2.3522, lats, lngs)
+    batched_duration = time.time() - start_time
+
+    assert max(abs(a - b) for a, b in zip(scalar, batched)) < 1e-6
+    return scalar_duration, batched_duration
+
 if __name__ == "__main__":
     app = create_app()
 
-    # Use enough records to make O(N^2) painful.
-    record_count = 2000
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+
+    for record_count in sizes:
+        print(f"\n=== {record_count} records ===")
+        scalar_duration, batched_duration = run_kernel_benchmark(record_count)
+        print(f"Distance kernel: scalar {scalar_duration:.4f}s, numpy {batched_duration:.4f}s "
+              f"(x{scalar_duration / max(batched_duration, 1e-9):.1f})")
 
-    setup_database(app, count=record_count)
+        setup_database(app, count=record_count)
 
-    duration = run_benchmark(app)
-    print(f"\nExecution time for {record_count} records: {duration:.4f} seconds")
+        duration = run_benchmark(app)
+        print(f"Execution time for {record_count} records: {duration:.4f} seconds")
@@ -0,0 +1,62 @@
+import os
+import sys
+
+# Set environment variables BEFORE importing app or config
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+os.environ['SESSION_SECRET'] = 'test'
+
+import time
+import random
+
+# Add root directory to path so we can import app
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+from algorithms.clustering import cluster_points, dbscan
+
+# Point counts benchmarked when none are given on the command line
+DEFAULT_SIZES = [10000, 100000]
+
+
+def generate_points(count, cluster_count=80):
+    """City-like gaussian blobs over Africa plus uniform background noise"""
+    per_cluster = count // (2 * cluster_count)
+    lats, lons = [], []
+    for _ in range(cluster_count):
+        center_lat, center_lng = random.uniform(-30, 30), random.uniform(-15, 45)
+        lats.append(np.random.normal(center_lat, 0.2, per_cluster))
+        lons.append(np.random.normal(center_lng, 0.2, per_cluster))
+    noise = count - per_cluster * cluster_count
+    lats.append(np.random.uniform(-35, 37, noise))
+    lons.append(np.random.uniform(-20, 52, noise))
+    return np.concatenate(lats), np.concatenate(lons)
+
+
+def run_benchmark(count, eps_km=5, min_samples=5):
+    lats, lons = generate_points(count)
+
+    start_time = time.time()
+    labels = dbscan(lats, lons, eps_km=eps_km, min_samples=min_samples)
+    dbscan_duration = time.time() - start_time
+
+    start_time = time.time()
+    greedy = cluster_points(lats, lons, min_cases=min_samples, radius_km=eps_km)
+    greedy_duration = time.time() - start_time
+
+    cluster_count = len(set(labels.tolist()) - {-1})
+    noise = int((labels == -1).sum())
+    print(f"DBSCAN (eps={eps_km}km, min_samples={min_samples}): {dbscan_duration:.4f}s, "
+          f"{cluster_count} clusters, {noise} noise points")
+    print(f"Greedy grid clustering: {greedy_duration:.4f}s, {len(greedy)} clusters")
+
+
+if __name__ == "__main__":
+    random.seed(42)
+    np.random.seed(42)
+
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+
+    for point_count in sizes:
+        print(f"\n=== {point_count} points ===")
+        run_benchmark(point_count)
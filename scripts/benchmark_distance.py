@@ -16,6 +16,10 @@ os.environ['DATABASE_URL'] = 'sqlite:///benchmark.db'
 
 from app import create_app
 from models import db, Disparu
+from algorithms.clustering import haversine_distance, haversine_distances
+
+# Point counts for the kernel benchmark, e.g. BENCHMARK_SIZES=10000,100000
+KERNEL_SIZES = [int(n) for n in os.environ.get('BENCHMARK_SIZES', '10000,100000,1000000').split(',')]
 
 class BenchmarkDistance(unittest.TestCase):
     def setUp(self):
@@ -75,18 +79,25 @@ class BenchmarkDistance(unittest.TestCase):
     def test_benchmark(self):
         client = self.app.test_client()
 
-        print("\nRunning benchmark (limit=2000)...")
+        print("\nRunning benchmark (2000 nearest, in pages)...")
         start_time = time.time()
 
-        # Request with non-zero lat/lng to trigger distance calculation
-        resp = client.get('/api/disparus?lat=48.8566&lng=2.3522&limit=2000')
+        # Request with non-zero lat/lng to trigger distance calculation,
+        # following the cursor from page to page
+        data, cursor = [], None
+        while len(data) < 2000:
+            url = '/api/disparus?lat=48.8566&lng=2.3522&limit=100' + (f'&cursor={cursor}' if cursor else '')
+            resp = client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            data.extend(resp.get_json())
+            cursor = resp.headers.get('X-Next-Cursor')
+            if cursor is None:
+                break
 
         end_time = time.time()
         duration = end_time - start_time
 
-        print(f"Request took: {duration:.4f} seconds")
-        self.assertEqual(resp.status_code, 200)
-        data = resp.get_json()
+        print(f"Requests took: {duration:.4f} seconds")
         self.assertEqual(len(data), 2000)
 
         if data:
@@ -96,5 +107,28 @@ class BenchmarkDistance(unittest.TestCase):
             else:
                 print("Distance key missing!")
 
+class BenchmarkDistanceKernel(unittest.TestCase):
+    """Radius filtering as get_nearby_cases does it: scalar loop vs NumPy kernel"""
+
+    def test_kernel_speedup(self):
+        radius_km = 500
+        for count in KERNEL_SIZES:
+            lats = [random.uniform(-90, 90) for _ in range(count)]
+            lngs = [random.uniform(-180, 180) for _ in range(count)]
+
+            start_time = time.time()
+            scalar = [i for i, (lat, lng) in enumerate(zip(lats, lngs))
+                      if haversine_distance(48.8566, 2.3522, lat, lng) <= radius_km]
+            scalar_duration = time.time() - start_time
+
+            start_time = time.time()
+            distances = haversine_distances(48.8566, 2.3522, lats, lngs)
+            batched = (distances <= radius_km).nonzero()[0].tolist()
+            batched_duration = time.time() - start_time
+
+            print(f"\n{count} points: scalar {scalar_duration:.4f}s, numpy {batched_duration:.4f}s "
+                  f"(x{scalar_duration / max(batched_duration, 1e-9):.1f})")
+            self.assertEqual(scalar, batched)
+
 if __name__ == '__main__':
     unittest.main()
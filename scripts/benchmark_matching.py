@@ -0,0 +1,158 @@
+import os
+import sys
+
+# Set environment variables BEFORE importing app or config
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+os.environ['SESSION_SECRET'] = 'test'
+
+import argparse
+import json
+import subprocess
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+# Add root directory to path so we can import app
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from app import create_app
+from models import db
+from algorithms.match_cache import invalidate_match_cache
+from algorithms.matching import find_potential_matches
+from matching_dataset import PERTURBATIONS, CaseGenerator
+
+# Record counts benchmarked when none are given on the command line
+DEFAULT_SIZES = [1000, 10000, 100000]
+QUERY_COUNT = 200
+# Metrics compared by --compare, and whether higher is better
+COMPARED = {'precision': True, 'recall': True, 'top1_accuracy': True, 'p50_ms': False, 'p95_ms': False}
+
+
+def run_benchmark(count, queries=QUERY_COUNT, seed=42):
+    """Seeds count synthetic cases and measures find_potential_matches on the duplicated ones."""
+    with tempfile.TemporaryDirectory() as photo_dir:
+        start_time = time.perf_counter()
+        cases, groups = CaseGenerator(photo_dir, seed).generate(count)
+        db.session.add_all(cases)
+        db.session.commit()
+        seed_seconds = time.perf_counter() - start_time
+
+        # Warm the indexes so that their build is not timed
+        start_time = time.perf_counter()
+        find_potential_matches(cases[-1])
+        warmup_ms = (time.perf_counter() - start_time) * 1000
+        invalidate_match_cache()
+
+        groups = groups[:queries]
+        returned = true_positives = expected = found = top1 = 0
+        found_by_noise, expected_by_noise = Counter(), Counter()
+        durations = []
+        for group in groups:
+            start_time = time.perf_counter()
+            matches = find_potential_matches(group.original)
+            durations.append(time.perf_counter() - start_time)
+
+            match_ids = [match['disparu']['id'] for match in matches]
+            duplicate_ids = {duplicate.id for duplicate in group.duplicates}
+            returned += len(match_ids)
+            true_positives += len(duplicate_ids.intersection(match_ids))
+            expected += len(duplicate_ids)
+            top1 += bool(match_ids) and match_ids[0] in duplicate_ids
+            for duplicate, noise in zip(group.duplicates, group.perturbations):
+                hit = duplicate.id in match_ids
+                found += hit
+                for name in noise:
+                    expected_by_noise[name] += 1
+                    found_by_noise[name] += hit
+
+    return {
+        'records': len(cases),
+        'queries': len(groups),
+        'duplicates': expected,
+        'precision': round(true_positives / returned, 4) if returned else None,
+        'recall': round(found / expected, 4) if expected else None,
+        'top1_accuracy': round(top1 / len(groups), 4) if groups else None,
+        'recall_by_perturbation': {
+            name: round(found_by_noise[name] / expected_by_noise[name], 4)
+            for name in PERTURBATIONS if expected_by_noise[name]
+        },
+        'matches_per_query': round(returned / len(groups), 2) if groups else None,
+        'p50_ms': round(float(np.percentile(durations, 50)) * 1000, 3) if durations else None,
+        'p95_ms': round(float(np.percentile(durations, 95)) * 1000, 3) if durations else None,
+        'warmup_ms': round(warmup_ms, 1),
+        'seed_seconds': round(seed_seconds, 1),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(previous, current):
+    """Lines telling how each metric moved since a previous report."""
+    before = {result['records']: result for result in previous['results']}
+    lines = []
+    for result in current['results']:
+        old = before.get(result['records'])
+        if old is None:
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            if old.get(metric) is None or result.get(metric) is None:
+                continue
+            delta = result[metric] - old[metric]
+            better = delta > 0 if higher_is_better else delta < 0
+            verdict = 'better' if better else ('same' if delta == 0 else 'worse')
+            lines.append(f"{result['records']} records, {metric}: {old[metric]} -> {result[metric]} ({verdict})")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Precision, recall and latency of find_potential_matches')
+    parser.add_argument('sizes', nargs='*', type=int, default=DEFAULT_SIZES, help='record counts')
+    parser.add_argument('--queries', type=int, default=QUERY_COUNT, help='duplicated people queried per size')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='JSON report path (default: stdout)')
+    parser.add_argument('--compare', help='previous JSON report to compare with')
+    args = parser.parse_args(argv)
+
+    report = {
+        'benchmark': 'matching',
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'seed': args.seed,
+        'results': [],
+    }
+    app = create_app('testing')
+    for record_count in args.sizes:
+        with app.app_context():
+            db.create_all()
+            result = run_benchmark(record_count, args.queries, args.seed)
+            db.session.remove()
+            db.drop_all()
+        print(f"{result['records']} records: precision {result['precision']}, recall {result['recall']}, "
+              f"p50 {result['p50_ms']}ms, p95 {result['p95_ms']}ms", file=sys.stderr)
+        report['results'].append(result)
+
+    if args.compare:
+        with open(args.compare) as f:
+            for line in compare(json.load(f), report):
+                print(line, file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import os
+import sys
+
+# Set environment variables BEFORE importing app or config
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+os.environ['SESSION_SECRET'] = 'test'
+
+import time
+import random
+from datetime import datetime
+
+# Add root directory to path so we can import app
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from sqlalchemy import or_
+
+from app import create_app
+from models import db, Disparu
+from algorithms.matching import _blocked_candidate_ids, find_potential_matches, text_similarity
+
+# Record counts benchmarked when none are given on the command line
+DEFAULT_SIZES = [2000, 20000]
+QUERY_COUNT = 100
+
+FIRST_NAMES = ['Jean', 'Marie', 'Mamadou', 'Ousmane', 'Fatou', 'Aminata', 'Moussa', 'Ibrahima', 'Awa',
+               'Kouassi', 'Mohamed', 'Philippe', 'Djibril', 'Aissatou', 'Cheikh', 'Grace', 'Patrick',
+               'Christelle', 'Emmanuel', 'Josephine', 'Abdoulaye', 'Mariam', 'Yao', 'Adjoa', 'Koffi']
+SYLLABLES = ['ka', 'bi', 'lo', 'mu', 'ndi', 'tou', 'sa', 'ko', 'ba', 'ma', 'ye', 'ri', 'zo', 'fa', 'ngo',
+             'kwe', 'di', 'la', 'mbe', 'shi', 'ta', 'ne', 'wa', 'gu']
+LAST_NAMES = ['Dupont', 'Diallo', 'Traore', 'Kabila', 'Kabongo', 'Ouattara', 'Ndiaye', 'Tshisekedi',
+              'Mbappe', 'Nkurunziza', 'Kone', 'Camara', 'Sow', 'Ba', 'Mukendi', 'Ilunga', 'Kalonji',
+              'Nzuzi', 'Mutombo', 'Lumumba', 'Diop', 'Faye', 'Coulibaly', 'Bamba', 'Toure']
+DESCRIPTION_WORDS = ['grand', 'petit', 'mince', 'corpulent', 'cicatrice', 'lunettes', 'barbe', 'tresses',
+                     'chemise', 'rouge', 'bleu', 'noir', 'jaune', 'pantalon', 'robe', 'sandales', 'casquette',
+                     'vert', 'blanc', 'pagne', 'boubou', 'short', 'baskets', 'cheveux', 'courts', 'crane',
+                     'rase', 'tatouage', 'bras', 'front', 'boite', 'sourire', 'timide', 'bracelet', 'collier']
+PLACES = [('Congo', 'Kinshasa'), ('Congo', 'Lubumbashi'), ('Congo', 'Goma'), ('Senegal', 'Dakar'),
+          ('Senegal', 'Thies'), ('Mali', 'Bamako'), ('Cote d\'Ivoire', 'Abidjan'), ('Cameroun', 'Douala')]
+
+# Spelling variants a report can carry (French vs English transcription)
+VARIANTS = [('ou', 'u'), ('ph', 'f'), ('tsh', 'ch'), ('dj', 'j'), ('ll', 'l'), ('e', 'é'), ('w', 'ou'),
+            ('mm', 'm'), ('c', 'k'), ('ss', 's'), ('t', 'd')]
+
+
+def random_last_name():
+    """Surnames from random syllables, so that homonyms stay rare"""
+    return ''.join(random.choice(SYLLABLES) for _ in range(random.randint(2, 4))).capitalize()
+
+
+def misspell(name):
+    for old, new in random.sample(VARIANTS, len(VARIANTS)):
+        if old in name.lower():
+            return name.replace(old, new).replace(old.capitalize(), new.capitalize())
+    # Typo: one letter doubled
+    i = random.randrange(1, len(name))
+    return name[:i] + name[i - 1] + name[i:]
+
+
+def make_disparu(public_id, first_name, last_name, place, age):
+    return Disparu(
+        public_id=public_id, person_type='adult', first_name=first_name, last_name=last_name,
+        age=age, sex=random.choice('MF'), country=place[0], city=place[1],
+        physical_description=' '.join(random.sample(DESCRIPTION_WORDS, 4)), disappearance_date=datetime.now(), circumstances='.'
+    )
+
+
+def legacy_candidates(disparu):
+    """Candidate query before the blocking index: exact equalities, first 500 rows"""
+    conditions = [Disparu.country == disparu.country, Disparu.city == disparu.city,
+                  Disparu.first_name == disparu.first_name, Disparu.last_name == disparu.last_name,
+                  Disparu.age.between(max(0, disparu.age - 5), disparu.age + 5)]
+    candidates = Disparu.query.filter(Disparu.id != disparu.id, or_(*conditions)).limit(500).all()
+    # Name scoring as it was: SequenceMatcher, straight and swapped
+    for other in candidates:
+        name = f"{disparu.first_name} {disparu.last_name}"
+        max(text_similarity(name, f"{other.first_name} {other.last_name}"),
+            text_similarity(name, f"{other.last_name} {other.first_name}"))
+    return candidates
+
+
+def seed(count):
+    records = [
+        make_disparu(f'B{i:06d}', random.choice(FIRST_NAMES),
+                     random.choice(LAST_NAMES) if random.random() < 0.2 else random_last_name(),
+                     random.choice(PLACES), random.randint(5, 80))
+        for i in range(count)
+    ]
+    # Query/duplicate pairs: the test_matching fixture first, then random names
+    pairs = []
+    for i in range(QUERY_COUNT):
+        first, last = ('Jean', 'Dupont') if i == 0 else (random.choice(FIRST_NAMES), random_last_name())
+        age = random.randint(5, 80)
+        query = make_disparu(f'Q{i:05d}', first, last, ('Congo', 'Kinshasa') if i == 0 else random.choice(PLACES), age)
+        if random.random() < 0.3:
+            first, last = last, first
+        duplicate = make_disparu(f'D{i:05d}', misspell(first), misspell(last), random.choice(PLACES), age + random.randint(-1, 1))
+        # Same person: the second report describes them in other words
+        words = query.physical_description.split()
+        duplicate.physical_description = ' '.join(random.sample(words, 3) + random.sample(DESCRIPTION_WORDS, 1))
+        pairs.append((query, duplicate))
+        records.extend([query, duplicate])
+
+    db.session.add_all(records)
+    db.session.commit()
+    return pairs
+
+
+def run_benchmark(count):
+    pairs = seed(count)
+
+    def measure(fn):
+        found, durations = 0, []
+        for query, duplicate in pairs:
+            start_time = time.perf_counter()
+            ids = fn(query)
+            durations.append(time.perf_counter() - start_time)
+            found += duplicate.id in ids
+        return found / len(pairs), np.percentile(durations, 50) * 1000, np.percentile(durations, 95) * 1000
+
+    # Warm the indexes so that their build is not timed
+    find_potential_matches(pairs[0][0])
+
+    recall, p50, p95 = measure(lambda d: {other.id for other in legacy_candidates(d)})
+    print(f"Legacy candidate query: recall {recall:.0%}, p50 {p50:.1f}ms, p95 {p95:.1f}ms")
+    recall, p50, p95 = measure(lambda d: set(_blocked_candidate_ids(d)))
+    print(f"Name, photo and description blocking: recall {recall:.0%}, p50 {p50:.1f}ms, p95 {p95:.1f}ms")
+    recall, p50, p95 = measure(lambda d: {m['disparu']['id'] for m in find_potential_matches(d)})
+    print(f"Blocking index + Jaro-Winkler (top 10 matches): recall {recall:.0%}, p50 {p50:.1f}ms, p95 {p95:.1f}ms")
+
+
+if __name__ == "__main__":
+    random.seed(42)
+
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+
+    app = create_app('testing')
+    for record_count in sizes:
+        print(f"\n=== {record_count} records ===")
+        with app.app_context():
+            db.create_all()
+            run_benchmark(record_count)
+            db.session.remove()
+            db.drop_all()
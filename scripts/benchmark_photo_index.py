@@ -0,0 +1,68 @@
+import os
+import sys
+
+# Set environment variables BEFORE importing app or config
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+os.environ['SESSION_SECRET'] = 'test'
+
+import time
+import random
+
+# Add root directory to path so we can import app
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+from algorithms.photo_index import PhotoHashIndex, max_distance_for
+
+# Hash counts benchmarked when none are given on the command line
+DEFAULT_SIZES = [100000, 1000000]
+QUERY_COUNT = 200
+
+
+def generate_hashes(count):
+    """Random signed 64-bit hashes, the way photo_hash is stored"""
+    return np.random.randint(-2 ** 63, 2 ** 63 - 1, size=count, dtype=np.int64)
+
+
+def run_benchmark(count, threshold=0.9):
+    hashes = generate_hashes(count)
+
+    start_time = time.time()
+    index = PhotoHashIndex()
+    index.load(zip(range(1, count + 1), hashes.tolist()))
+    build_duration = time.time() - start_time
+
+    max_distance = max_distance_for(threshold)
+    # Near duplicates of stored hashes: a few random bits flipped
+    queries = []
+    for _ in range(QUERY_COUNT):
+        value = int(hashes[random.randrange(count)]) & (2 ** 64 - 1)
+        for bit in random.sample(range(64), random.randint(0, max_distance)):
+            value ^= 1 << bit
+        queries.append(value - (1 << 64) if value >= 1 << 63 else value)
+
+    start_time = time.time()
+    found = sum(len(index.search(q, max_distance)) for q in queries)
+    index_duration = (time.time() - start_time) / QUERY_COUNT
+
+    start_time = time.time()
+    for q in queries[:20]:
+        np.nonzero(np.bitwise_count(hashes.view(np.uint64) ^ np.uint64(q & (2 ** 64 - 1))) <= max_distance)
+    scan_duration = (time.time() - start_time) / 20
+
+    print(f"Index build: {build_duration:.2f}s")
+    print(f"Multi-index search (threshold={threshold}, <= {max_distance} bits): "
+          f"{index_duration * 1000:.3f}ms/query, {found} matches")
+    print(f"Linear popcount scan: {scan_duration * 1000:.3f}ms/query")
+
+
+if __name__ == "__main__":
+    random.seed(42)
+    np.random.seed(42)
+
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+
+    for hash_count in sizes:
+        print(f"\n=== {hash_count} hashes ===")
+        run_benchmark(hash_count)
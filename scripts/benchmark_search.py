@@ -0,0 +1,121 @@
+import os
+import sys
+
+# Set environment variables BEFORE importing app or config
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+os.environ['SESSION_SECRET'] = 'test'
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+# Add root directory to path so we can import app
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from app import create_app
+from models import db, Disparu
+from utils.search import FOLDED_FIELDS, build_search_index, get_search_backend, ranked_search, search_words
+from matching_dataset import FIRST_NAMES, PLACES, misspell, public_id, random_last_name
+
+# Record counts benchmarked when none are given on the command line
+DEFAULT_SIZES = [10000, 100000, 500000]
+QUERY_COUNT = 200
+INSERT_BATCH = 10000
+
+
+def seed(count, rng):
+    """count cases inserted in bulk, folded columns included; returns their (first_name, last_name, city)."""
+    today = datetime(2026, 1, 1)
+    cases = []
+    for start in range(0, count, INSERT_BATCH):
+        rows = []
+        for n in range(start, min(start + INSERT_BATCH, count)):
+            country, city = rng.choice(PLACES)
+            row = {
+                'public_id': public_id('B', n), 'person_type': 'adult', 'first_name': rng.choice(FIRST_NAMES),
+                'last_name': random_last_name(rng), 'age': rng.randint(5, 80), 'sex': rng.choice('MF'),
+                'country': country, 'city': city, 'physical_description': '.', 'circumstances': '.',
+                'disappearance_date': today - timedelta(days=rng.randrange(365)), 'status': 'missing',
+                'created_at': today + timedelta(minutes=n),
+            }
+            for field in FOLDED_FIELDS:
+                row[f'{field}_search'] = search_words(row[field])
+            rows.append(row)
+        db.session.execute(Disparu.__table__.insert(), rows)
+        cases.extend((row['first_name'], row['last_name'], row['city']) for row in rows)
+    db.session.commit()
+    return cases
+
+
+def queries(cases, count, rng):
+    """
+    (kind, text, expected) searches for random cases, as users type them;
+    expected are the column values a result must have to be the case
+    searched (homonyms count: a name can be more common than one page).
+    """
+    out = []
+    for first_name, last_name, city in rng.sample(cases, count):
+        person = {'first_name': first_name, 'last_name': last_name}
+        out.append(('exact', f'{first_name} {last_name}', person))
+        out.append(('typo', f'{first_name} {misspell(rng, last_name)}', person))
+        out.append(('prefix', last_name[:4], None))
+        out.append(('name_city', f'{last_name} {city}', {'last_name': last_name, 'city': city}))
+    return out
+
+
+def run_benchmark(count, backend, query_count=QUERY_COUNT, seed_value=42):
+    rng = random.Random(seed_value)
+    start_time = time.perf_counter()
+    cases = seed(count, rng)
+    seed_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    if backend == 'fts5':
+        build_search_index()
+    # Warms the in-memory index or the FTS5 vocabulary
+    ranked_search('warmup')
+    build_seconds = time.perf_counter() - start_time
+
+    durations, found, expected = {}, {}, {}
+    for kind, text, values in queries(cases, query_count, rng):
+        start_time = time.perf_counter()
+        results = ranked_search(text, limit=20)
+        durations.setdefault(kind, []).append(time.perf_counter() - start_time)
+        if values is not None:
+            expected[kind] = expected.get(kind, 0) + 1
+            found[kind] = found.get(kind, 0) + any(
+                all(getattr(d, field) == value for field, value in values.items()) for d, _ in results)
+
+    print(f"{count} records ({get_search_backend()}): seeded in {seed_seconds:.1f}s, "
+          f"index ready in {build_seconds:.1f}s", file=sys.stderr)
+    for kind, values in durations.items():
+        recall = f", found {found[kind] / expected[kind]:.0%}" if kind in expected else ''
+        print(f"  {kind:>9}: p50 {np.percentile(values, 50) * 1000:.1f}ms, "
+              f"p95 {np.percentile(values, 95) * 1000:.1f}ms{recall}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Latency and typo recall of ranked_search')
+    parser.add_argument('sizes', nargs='*', type=int, default=DEFAULT_SIZES, help='record counts')
+    parser.add_argument('--backend', choices=['fts5', 'memory'], default='fts5')
+    parser.add_argument('--queries', type=int, default=QUERY_COUNT, help='cases searched per size')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    app = create_app('testing')
+    for record_count in args.sizes:
+        with app.app_context():
+            db.create_all()
+            run_benchmark(record_count, args.backend, args.queries, args.seed)
+            db.session.remove()
+            db.session.execute(db.text("DROP TABLE IF EXISTS disparus_fts_vocab"))
+            db.session.execute(db.text("DROP TABLE IF EXISTS disparus_fts"))
+            db.drop_all()
+
+
+if __name__ == "__main__":
+    main()
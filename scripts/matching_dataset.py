@@ -0,0 +1,216 @@
+"""
+Synthetic case reports with known duplicates, for measuring matching quality.
+
+Every person of the ground truth is reported once, and some of them again
+(1 or 2 more reports) with the kinds of noise a second reporter introduces:
+typos and transcription variants, first/last names swapped, an age off by a
+year to three, the photo re-encoded at another size and quality, the
+description reworded. Relatives (same surname and town, another person)
+are mixed in as hard negatives.
+"""
+import os
+import random
+import string
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from PIL import Image, ImageEnhance
+
+from models import Disparu
+from algorithms.matching import compute_photo_hash
+
+FIRST_NAMES = ['Jean', 'Marie', 'Mamadou', 'Ousmane', 'Fatou', 'Aminata', 'Moussa', 'Ibrahima', 'Awa',
+               'Kouassi', 'Mohamed', 'Philippe', 'Djibril', 'Aissatou', 'Cheikh', 'Grace', 'Patrick',
+               'Christelle', 'Emmanuel', 'Josephine', 'Abdoulaye', 'Mariam', 'Yao', 'Adjoa', 'Koffi',
+               'Christophe', 'Nathalie', 'Serge', 'Rachel', 'Didier', 'Esther', 'Joseph', 'Mireille']
+SYLLABLES = ['ka', 'bi', 'lo', 'mu', 'ndi', 'tou', 'sa', 'ko', 'ba', 'ma', 'ye', 'ri', 'zo', 'fa', 'ngo',
+             'kwe', 'di', 'la', 'mbe', 'shi', 'ta', 'ne', 'wa', 'gu', 'tshi', 'phi', 'dja', 'lou']
+LAST_NAMES = ['Dupont', 'Diallo', 'Traore', 'Kabila', 'Kabongo', 'Ouattara', 'Ndiaye', 'Tshisekedi',
+              'Mbappe', 'Nkurunziza', 'Kone', 'Camara', 'Sow', 'Ba', 'Mukendi', 'Ilunga', 'Kalonji',
+              'Nzuzi', 'Mutombo', 'Lumumba', 'Diop', 'Faye', 'Coulibaly', 'Bamba', 'Toure']
+DESCRIPTION_WORDS = ['grand', 'petit', 'mince', 'corpulent', 'cicatrice', 'lunettes', 'barbe', 'tresses',
+                     'chemise', 'rouge', 'bleu', 'noir', 'jaune', 'pantalon', 'robe', 'sandales', 'casquette',
+                     'vert', 'blanc', 'pagne', 'boubou', 'short', 'baskets', 'cheveux', 'courts', 'crane',
+                     'rase', 'tatouage', 'bras', 'front', 'boite', 'sourire', 'timide', 'bracelet', 'collier',
+                     'maillot', 'veste', 'gris', 'sac', 'dos', 'oreille', 'grain', 'beaute', 'dent', 'manquante']
+# How a second reporter says the same thing
+SYNONYMS = {'grand': 'elance', 'petit': 'menu', 'mince': 'fin', 'corpulent': 'fort', 'baskets': 'tennis',
+            'casquette': 'bonnet', 'rouge': 'bordeaux', 'pantalon': 'jean', 'sourire': 'souriant',
+            'cicatrice': 'balafre', 'lunettes': 'verres', 'chemise': 'tshirt'}
+PLACES = [('Congo', 'Kinshasa'), ('Congo', 'Lubumbashi'), ('Congo', 'Goma'), ('Senegal', 'Dakar'),
+          ('Senegal', 'Thies'), ('Mali', 'Bamako'), ('Cote d\'Ivoire', 'Abidjan'), ('Cameroun', 'Douala')]
+
+# Spelling variants a report can carry (French vs English transcription)
+VARIANTS = [('ou', 'u'), ('ph', 'f'), ('tsh', 'ch'), ('dj', 'j'), ('ll', 'l'), ('e', 'é'), ('w', 'ou'),
+            ('mm', 'm'), ('c', 'k'), ('ss', 's'), ('t', 'd')]
+
+# Noise a duplicate report may carry, and how often
+PERTURBATIONS = {'typo': 0.6, 'swapped': 0.25, 'age_drift': 0.5, 'photo': 0.5, 'description': 0.7}
+# Share of the people reported more than once, with a photo, with a relative
+DUPLICATED_SHARE = 0.1
+PHOTO_SHARE = 0.4
+RELATIVE_SHARE = 0.1
+
+DuplicateGroup = namedtuple('DuplicateGroup', ['original', 'duplicates', 'perturbations'])
+
+
+def public_id(prefix, number):
+    """6 characters, as the column allows: a prefix and the number in base 36."""
+    digits = string.digits + string.ascii_uppercase
+    out = ''
+    for _ in range(5):
+        number, rest = divmod(number, 36)
+        out = digits[rest] + out
+    return prefix + out
+
+
+def random_last_name(rng):
+    """Surnames from random syllables, so that homonyms stay rare"""
+    if rng.random() < 0.2:
+        return rng.choice(LAST_NAMES)
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+
+
+def misspell(rng, name):
+    """A transcription variant when one applies, else a keyboard typo."""
+    if rng.random() < 0.5:
+        for old, new in rng.sample(VARIANTS, len(VARIANTS)):
+            if old in name.lower():
+                return name.replace(old, new).replace(old.capitalize(), new.capitalize())
+    if len(name) < 3:
+        return name + name[-1]
+    i = rng.randrange(1, len(name) - 1)
+    edit = rng.choice(['double', 'drop', 'swap', 'replace'])
+    if edit == 'double':
+        return name[:i] + name[i] + name[i:]
+    if edit == 'drop':
+        return name[:i] + name[i + 1:]
+    if edit == 'swap':
+        return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+    return name[:i] + rng.choice('aeiouy') + name[i + 1:]
+
+
+def reword(rng, description):
+    """The same description in other words: synonyms, reordered, one word dropped, one added."""
+    words = [SYNONYMS.get(word, word) if rng.random() < 0.4 else word for word in description.split()]
+    rng.shuffle(words)
+    if len(words) > 3:
+        words.pop(rng.randrange(len(words)))
+    words.insert(rng.randrange(len(words) + 1), rng.choice(DESCRIPTION_WORDS))
+    return ' '.join(words)
+
+
+def make_photo(rng, path):
+    """A smooth random portrait-sized picture, saved as a JPEG."""
+    small = Image.new('RGB', (6, 8))
+    small.putdata([tuple(rng.randrange(256) for _ in range(3)) for _ in range(48)])
+    small.resize((60, 80), Image.Resampling.BICUBIC).save(path, 'JPEG', quality=90)
+
+
+def reencode_photo(rng, source, path):
+    """The same picture as another upload would store it: resized, recompressed, relit."""
+    with Image.open(source) as img:
+        scale = rng.uniform(0.5, 1.5)
+        img = img.resize((int(img.width * scale), int(img.height * scale)), Image.Resampling.BILINEAR)
+        img = ImageEnhance.Brightness(img).enhance(rng.uniform(0.85, 1.15))
+        img.save(path, 'JPEG', quality=rng.randint(30, 80))
+
+
+class CaseGenerator:
+    """
+    Builds unsaved Disparu rows. Photos are written under photo_dir and
+    hashed the way uploads are (compute_photo_hash).
+    """
+
+    def __init__(self, photo_dir, seed=42):
+        self.rng = random.Random(seed)
+        self.photo_dir = photo_dir
+        self.count = 0
+        self.today = datetime(2026, 1, 1)
+
+    def _photo(self, source=None):
+        path = os.path.join(self.photo_dir, f'{self.count + 1}.jpg')
+        if source is None:
+            make_photo(self.rng, path)
+        else:
+            reencode_photo(self.rng, source, path)
+        return path, compute_photo_hash(path)
+
+    def _case(self, first_name, last_name, place, age, sex, description, photo=None):
+        self.count += 1
+        disparu = Disparu(
+            public_id=public_id('S', self.count), person_type='adult', first_name=first_name,
+            last_name=last_name, age=age, sex=sex, country=place[0], city=place[1],
+            physical_description=description, circumstances='.',
+            disappearance_date=self.today - timedelta(days=self.rng.randrange(365)),
+        )
+        if photo is not None:
+            disparu.photo_url, disparu.photo_hash = photo
+        return disparu
+
+    def person(self):
+        rng = self.rng
+        photo = self._photo() if rng.random() < PHOTO_SHARE else None
+        return self._case(rng.choice(FIRST_NAMES), random_last_name(rng), rng.choice(PLACES),
+                          rng.randint(5, 80), rng.choice('MF'), ' '.join(rng.sample(DESCRIPTION_WORDS, 5)), photo)
+
+    def relative(self, of):
+        """Another member of the family: same surname and town, not the same person."""
+        rng = self.rng
+        first_name = rng.choice([name for name in FIRST_NAMES if name != of.first_name])
+        return self._case(first_name, of.last_name, (of.country, of.city), rng.randint(5, 80),
+                          rng.choice('MF'), ' '.join(rng.sample(DESCRIPTION_WORDS, 5)))
+
+    def duplicate(self, of):
+        """Another report of the same person, and the noise it carries."""
+        rng = self.rng
+        applicable = [name for name in PERTURBATIONS if name != 'photo' or of.photo_url]
+        perturbations = [name for name in applicable if rng.random() < PERTURBATIONS[name]]
+        if not perturbations:
+            perturbations = [rng.choice(applicable)]
+
+        first_name, last_name = of.first_name, of.last_name
+        if 'typo' in perturbations:
+            # One of the names, sometimes both
+            which = rng.choice(['first', 'last', 'both'])
+            if which != 'last':
+                first_name = misspell(rng, first_name)
+            if which != 'first':
+                last_name = misspell(rng, last_name)
+        if 'swapped' in perturbations:
+            first_name, last_name = last_name, first_name
+        age = of.age
+        if 'age_drift' in perturbations:
+            age = max(1, age + rng.choice([-3, -2, -1, 1, 2, 3]))
+        description = of.physical_description
+        if 'description' in perturbations:
+            description = reword(rng, description)
+        photo = None
+        if 'photo' in perturbations:
+            photo = self._photo(source=of.photo_url)
+        # Reported where the person was last seen, or where the family lives
+        place = (of.country, of.city) if rng.random() < 0.7 else rng.choice(PLACES)
+
+        return self._case(first_name, last_name, place, age, of.sex, description, photo), perturbations
+
+    def generate(self, count):
+        """
+        (cases, groups) with about count cases in all; groups are the
+        DuplicateGroups of the people reported more than once.
+        """
+        rng = self.rng
+        cases, groups = [], []
+        while len(cases) < count:
+            original = self.person()
+            cases.append(original)
+            if rng.random() < DUPLICATED_SHARE:
+                duplicates, perturbations = [], []
+                for _ in range(rng.choice([1, 1, 1, 2])):
+                    duplicate, noise = self.duplicate(original)
+                    duplicates.append(duplicate)
+                    perturbations.append(noise)
+                cases.extend(duplicates)
+                groups.append(DuplicateGroup(original, duplicates, perturbations))
+            if rng.random() < RELATIVE_SHARE:
+                cases.append(self.relative(original))
+        return cases, groups
@@ -8,6 +8,7 @@
 import json
 from datetime import datetime
 from models import db, Disparu, Contribution, ModerationReport
+from services.image_hashes import hash_upload
 
 
 def generate_backup_stream(country=None):
@@ -51,6 +52,7 @@ def generate_backup_stream(country=None):
             'objects': d.objects,
             'contacts': d.contacts,
             'photo_url': d.photo_url,
+            'photo_hash': d.photo_hash,
             'status': d.status,
             'is_flagged': d.is_flagged,
             'view_count': d.view_count,
@@ -219,6 +221,10 @@ def restore_from_json(file_content):
         d.objects = d_data.get('objects')
         d.contacts = d_data.get('contacts')
         d.photo_url = d_data.get('photo_url')
+        # Older backups carry no hash: read it from the restored upload
+        d.photo_hash = d_data.get('photo_hash')
+        if d.photo_hash is None and d.photo_url:
+            d.photo_hash = hash_upload(d.photo_url)
         d.status = d_data.get('status', 'missing')
         d.is_flagged = d_data.get('is_flagged', False)
 
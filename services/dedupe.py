@@ -0,0 +1,377 @@
+"""
+ * Nom de l'application : DISPARUS.ORG
+ * Description : Detection des doublons sur toute la base (flask dedupe)
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+import heapq
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from flask import current_app, has_app_context
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import aliased
+
+from models import db, Disparu, MatchCandidate, DedupeRun, on_disparu_change
+from algorithms.matching import (
+    MAX_MATCHES, MIN_MATCH_SCORE, _blocked_candidate_ids, best_candidates, blocked_candidate_ids,
+    score_candidates, score_pair
+)
+from services.job_queue import enqueue_job, job_handler
+from algorithms.name_index import NameIndex
+from algorithms.photo_index import PhotoHashIndex
+from algorithms.description_index import DescriptionIndex
+
+# Query ids blocked by a worker per task
+DEFAULT_BLOCK_SIZE = 500
+# Candidates per scanned case and source: the closest lookalikes only,
+# find_potential_matches() digs deeper for a single case
+NAME_CANDIDATES = 40
+PHOTO_CANDIDATES = 20
+DESCRIPTION_CANDIDATES = 20
+# Pairs stored per case, best first
+PAIRS_PER_RECORD = 20
+# Rows per INSERT and ids per IN clause
+WRITE_BATCH_SIZE = 1000
+
+# The columns score_pair() reads, loaded once instead of full ORM objects
+MatchRecord = namedtuple('MatchRecord', [
+    'id', 'person_type', 'first_name', 'last_name', 'age', 'sex', 'country', 'city',
+    'physical_description', 'description_minhash', 'photo_url', 'photo_hash', 'updated_at',
+])
+
+# A run still 'running' after this many seconds died with its process
+STALE_RUN_AFTER = 6 * 3600
+
+# (records, name_index, photo_index, description_index) of the running job,
+# inherited by forked workers
+_state = None
+# The `flask dedupe` process started from the admin by this worker
+_process = None
+_job_lock = threading.Lock()
+
+
+def _load_records():
+    columns = [getattr(Disparu, field) for field in MatchRecord._fields]
+    rows = db.session.query(*columns).order_by(Disparu.id).yield_per(10000)
+    return {row.id: MatchRecord(*row) for row in rows}
+
+
+def _build_state(records):
+    """In-memory blocking indexes over records, private to the job."""
+    name_index = NameIndex()
+    name_index.load((r.id, r.first_name, r.last_name) for r in records.values())
+    photo_index = PhotoHashIndex()
+    photo_index.load((r.id, r.photo_hash) for r in records.values())
+    description_index = DescriptionIndex()
+    description_index.load((r.id, r.description_minhash) for r in records.values())
+    return records, name_index, photo_index, description_index
+
+
+def _init_worker(records):
+    global _state
+    # Forked workers inherit the parent's indexes; spawned ones rebuild them
+    if _state is None:
+        _state = _build_state(records)
+
+
+def _block(query_ids):
+    """Candidate pairs of the query ids, as (smallest id, largest id)."""
+    records, name_index, photo_index, description_index = _state
+    pairs = set()
+    for query_id in query_ids:
+        record = records[query_id]
+        for other_id in blocked_candidate_ids(record, name_index, photo_index, description_index,
+                                              NAME_CANDIDATES, PHOTO_CANDIDATES, DESCRIPTION_CANDIDATES):
+            other = records.get(other_id)
+            if other is not None and other.person_type == record.person_type:
+                pairs.add((min(query_id, other_id), max(query_id, other_id)))
+    return pairs
+
+
+def _score_pairs(pairs):
+    records = _state[0]
+    candidates = defaultdict(list)
+    for disparu_id, candidate_id in pairs:
+        candidates[disparu_id].append(candidate_id)
+    scored = []
+    # Each case against all of its candidates at once; reasons for the matches only
+    for disparu_id, candidate_ids in candidates.items():
+        record = records[disparu_id]
+        others = [records[candidate_id] for candidate_id in candidate_ids]
+        scores = score_candidates(record, others)
+        for i in np.flatnonzero(scores >= MIN_MATCH_SCORE).tolist():
+            scored.append((disparu_id, candidate_ids[i], int(scores[i]), score_pair(record, others[i])[1]))
+    return scored
+
+
+def _best_pairs(scored):
+    """The pairs among the PAIRS_PER_RECORD best of either of their cases."""
+    by_record = defaultdict(list)
+    for pair in scored:
+        by_record[pair[0]].append(pair)
+        by_record[pair[1]].append(pair)
+    kept = {}
+    for pairs in by_record.values():
+        for disparu_id, candidate_id, score, reasons in heapq.nsmallest(
+                PAIRS_PER_RECORD, pairs, key=lambda pair: (-pair[2], pair[0], pair[1])):
+            kept[(disparu_id, candidate_id)] = (score, reasons)
+    return kept
+
+
+def _mp_context():
+    # fork shares the indexes copy-on-write instead of pickling them
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return None
+
+
+def _score(records, query_ids, workers, block_size):
+    """
+    Blocks the query ids, then scores each candidate pair once, however
+    many of its cases found it.
+    """
+    global _state
+    blocks = [query_ids[i:i + block_size] for i in range(0, len(query_ids), block_size)]
+    workers = min(workers or os.cpu_count() or 1, len(blocks))
+
+    _state = _build_state(records)
+    pool = None
+    try:
+        if workers <= 1:
+            mapper = map
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=_mp_context(),
+                                       initializer=_init_worker, initargs=(records,))
+            mapper = pool.map
+
+        pairs = sorted(set().union(*mapper(_block, blocks)))
+        chunk_size = block_size * PAIRS_PER_RECORD
+        chunks = [pairs[i:i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+        scored = [pair for chunk in mapper(_score_pairs, chunks) for pair in chunk]
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        _state = None
+
+    return _best_pairs(scored)
+
+
+def _chunks(items, size=WRITE_BATCH_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _upsert_pairs(rows):
+    """
+    Inserts pair rows, rescoring in place those another job or run stored
+    meanwhile instead of failing on uq_match_candidates_pair.
+    """
+    insert = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}[db.session.get_bind().dialect.name]
+    statement = insert(MatchCandidate)
+    statement = statement.on_conflict_do_update(
+        index_elements=['disparu_id', 'candidate_id'],
+        set_={'score': statement.excluded.score, 'reasons': statement.excluded.reasons, 'computed_at': db.func.now()},
+    )
+    for chunk in _chunks(rows):
+        db.session.execute(statement, chunk)
+
+
+def _stored_partners(ids, records):
+    """The cases still in records that share a stored pair with one of ids."""
+    partners = set()
+    for chunk in _chunks(ids):
+        rows = db.session.query(MatchCandidate.disparu_id, MatchCandidate.candidate_id).filter(db.or_(
+            MatchCandidate.disparu_id.in_(chunk), MatchCandidate.candidate_id.in_(chunk)
+        ))
+        for disparu_id, candidate_id in rows:
+            partners.update((disparu_id, candidate_id))
+    return {partner_id for partner_id in partners if partner_id in records}
+
+
+def _store(pairs, rescored_ids, full):
+    if full:
+        MatchCandidate.query.delete(synchronize_session=False)
+    else:
+        for chunk in _chunks(rescored_ids):
+            MatchCandidate.query.filter(db.or_(
+                MatchCandidate.disparu_id.in_(chunk), MatchCandidate.candidate_id.in_(chunk)
+            )).delete(synchronize_session=False)
+        # Pairs of cases deleted since the last run
+        existing = db.select(Disparu.id)
+        MatchCandidate.query.filter(db.or_(
+            MatchCandidate.disparu_id.not_in(existing), MatchCandidate.candidate_id.not_in(existing)
+        )).delete(synchronize_session=False)
+
+    rows = [
+        {'disparu_id': disparu_id, 'candidate_id': candidate_id, 'score': score, 'reasons': reasons}
+        for (disparu_id, candidate_id), (score, reasons) in sorted(pairs.items())
+    ]
+    _upsert_pairs(rows)
+
+
+def last_dedupe_run(status=None):
+    query = DedupeRun.query
+    if status:
+        query = query.filter_by(status=status)
+    return query.order_by(DedupeRun.id.desc()).first()
+
+
+def run_dedupe(full=False, workers=None, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Scores every case against its blocking candidates and stores the pairs
+    reaching MIN_MATCH_SCORE in match_candidates. Unless full, only the cases
+    created or updated since the last finished run are rescored. Returns the
+    DedupeRun.
+    """
+    previous = last_dedupe_run('finished')
+    full = full or previous is None
+    run = DedupeRun(mode='full' if full else 'incremental', status='running')
+    db.session.add(run)
+    db.session.commit()
+
+    try:
+        records = _load_records()
+        if full:
+            query_ids = list(records)
+        else:
+            # Timestamps both come from the database clock
+            since = previous.started_at
+            query_ids = [r.id for r in records.values() if r.updated_at is None or r.updated_at >= since]
+
+        changed_ids = query_ids
+        if not full and query_ids:
+            # Blocking is not symmetric: the stored pairs of a changed case
+            # may have been found by the other case only, so those are
+            # blocked again too before the pairs of the changed ones go
+            query_ids = sorted(set(query_ids) | _stored_partners(query_ids, records))
+
+        pairs = _score(records, query_ids, workers, block_size) if query_ids else {}
+        _store(pairs, changed_ids, full)
+
+        run.status = 'finished'
+        run.records_scanned = len(query_ids)
+        run.pairs_found = len(pairs)
+        run.finished_at = db.func.now()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        run.status = 'failed'
+        run.error = str(e)
+        run.finished_at = db.func.now()
+        db.session.commit()
+        raise
+    return run
+
+
+def dedupe_running():
+    """Whether a run, from this process or another, is still going."""
+    run = last_dedupe_run('running')
+    if run is None or run.started_at is None:
+        return False
+    # Both from the database clock, like the incremental cutoff
+    now = db.session.scalar(db.select(db.func.now())).replace(tzinfo=None)
+    return (now - run.started_at).total_seconds() < STALE_RUN_AFTER
+
+
+def start_dedupe_job(app, full=False):
+    """
+    Runs `flask dedupe` for the admin in a child process of its own, so the
+    web worker never forks its threads into the scoring pool. Returns the
+    process, or None when a run is still going.
+    """
+    global _process
+    with _job_lock:
+        if _process is not None and _process.poll() is None:
+            return None
+        if dedupe_running():
+            return None
+
+        command = [sys.executable, '-m', 'flask', '--app', 'app:create_app', 'dedupe']
+        if full:
+            command.append('--full')
+        # Same database as this app; the job threads stay with the web workers
+        env = dict(os.environ, DATABASE_URL=str(app.config['SQLALCHEMY_DATABASE_URI']), JOB_WORKERS='0')
+        _process = subprocess.Popen(command, cwd=app.root_path, env=env,
+                                    stdin=subprocess.DEVNULL, start_new_session=True)
+        return _process
+
+
+@job_handler('match_case')
+def refresh_case_candidates(disparu_id):
+    """
+    Brings the stored pairs of one case up to date, or drops them if it was
+    deleted. Its MAX_MATCHES best matches are stored, and the pairs a dedupe
+    run kept for the other case are rescored rather than dropped, as long
+    as they still block each other. Skipped while a run is going: the next
+    incremental one rescores the case.
+    """
+    if dedupe_running():
+        return
+
+    involving = db.or_(MatchCandidate.disparu_id == disparu_id, MatchCandidate.candidate_id == disparu_id)
+    disparu = db.session.get(Disparu, disparu_id)
+    if disparu is None:
+        MatchCandidate.query.filter(involving).delete(synchronize_session=False)
+        db.session.commit()
+        return
+
+    stored = {
+        pair.candidate_id if pair.disparu_id == disparu_id else pair.disparu_id: pair.id
+        for pair in MatchCandidate.query.filter(involving)
+    }
+    # Not find_potential_matches(): a failed lookup must fail the job, for a retry
+    blocked_ids = set(_blocked_candidate_ids(disparu))
+    candidate_ids = blocked_ids | set(stored)
+    others = Disparu.query.filter(
+        Disparu.id.in_(candidate_ids), Disparu.id != disparu_id, Disparu.person_type == disparu.person_type
+    ).all() if candidate_ids else []
+    # Stored pairs stay while either case still blocks the other
+    linked = {
+        other.id for other in others
+        if other.id in stored and (other.id in blocked_ids or disparu_id in _blocked_candidate_ids(other))
+    }
+    others = [other for other in others if other.id in blocked_ids or other.id in linked]
+
+    kept = {}
+    for rank, (other, score, reasons) in enumerate(best_candidates(disparu, others, limit=len(others))):
+        if rank < MAX_MATCHES or other.id in linked:
+            kept[other.id] = (score, reasons)
+
+    dropped = [pair_id for other_id, pair_id in stored.items() if other_id not in kept]
+    if dropped:
+        MatchCandidate.query.filter(MatchCandidate.id.in_(dropped)).delete(synchronize_session=False)
+    _upsert_pairs([
+        {'disparu_id': min(disparu_id, other_id), 'candidate_id': max(disparu_id, other_id),
+         'score': score, 'reasons': reasons}
+        for other_id, (score, reasons) in sorted(kept.items())
+    ])
+    db.session.commit()
+
+
+def possible_duplicates(disparu_id, limit=5):
+    """(MatchCandidate, other Disparu) pairs stored for a case, best first."""
+    other = aliased(Disparu)
+    return db.session.query(MatchCandidate, other).join(other, db.or_(
+        db.and_(MatchCandidate.disparu_id == disparu_id, other.id == MatchCandidate.candidate_id),
+        db.and_(MatchCandidate.candidate_id == disparu_id, other.id == MatchCandidate.disparu_id),
+    )).order_by(MatchCandidate.score.desc(), other.id).limit(limit).all()
+
+
+@on_disparu_change
+def _queue_match_jobs(engine, changes):
+    # Matches of new and edited cases are computed after commit, off the
+    # request; pairs of deleted ones are dropped
+    if not has_app_context():
+        return
+    app = current_app._get_current_object()
+    for action, disparu_id in changes:
+        if action in ('insert', 'update', 'delete'):
+            enqueue_job(app, 'match_case', {'disparu_id': disparu_id})
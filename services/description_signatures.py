@@ -0,0 +1,35 @@
+"""
+ * Nom de l'application : DISPARUS.ORG
+ * Description : Signatures MinHash des descriptions enregistrees
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+from models import db, Disparu
+from algorithms.minhash import minhash_signature
+
+
+def backfill_description_signatures(batch_size=500):
+    """
+    Signs cases saved before description_minhash existed. Returns
+    (signed, empty) counts, empty being descriptions without a word to hash.
+    """
+    signed = empty = 0
+    last_id = 0
+    while True:
+        batch = Disparu.query.filter(Disparu.description_minhash.is_(None), Disparu.id > last_id) \
+            .order_by(Disparu.id).limit(batch_size).all()
+        if not batch:
+            break
+
+        for disparu in batch:
+            signature = minhash_signature(disparu.physical_description, disparu.clothing)
+            if signature is None:
+                empty += 1
+                continue
+            disparu.description_minhash = signature
+            signed += 1
+
+        db.session.commit()
+        last_id = batch[-1].id
+    return signed, empty
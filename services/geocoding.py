@@ -0,0 +1,67 @@
+"""
+ * Nom de l'application : DISPARUS.ORG
+ * Description : Geocodage hors ligne des signalements sans coordonnees
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+from models import db, Disparu, Contribution
+from utils.geo import get_coordinates_from_city
+
+
+def _missing_coordinates(model):
+    return db.or_(model.latitude.is_(None), model.longitude.is_(None))
+
+
+def backfill_disparu_coordinates(batch_size=500):
+    """
+    Places cases without coordinates at their city. Returns
+    (geocoded, unresolved) counts.
+    """
+    geocoded = unresolved = 0
+    last_id = 0
+    while True:
+        batch = Disparu.query.filter(_missing_coordinates(Disparu), Disparu.id > last_id) \
+            .order_by(Disparu.id).limit(batch_size).all()
+        if not batch:
+            break
+
+        for disparu in batch:
+            coords = get_coordinates_from_city(disparu.city, disparu.country)
+            if coords is None:
+                unresolved += 1
+                continue
+            disparu.latitude, disparu.longitude = coords
+            geocoded += 1
+
+        db.session.commit()
+        last_id = batch[-1].id
+    return geocoded, unresolved
+
+
+def backfill_contribution_coordinates(batch_size=500):
+    """
+    Places contributions without coordinates at their location name, looked
+    up in the case's country. Returns (geocoded, unresolved) counts.
+    """
+    geocoded = unresolved = 0
+    last_id = 0
+    while True:
+        batch = db.session.query(Contribution, Disparu.country) \
+            .join(Disparu, Contribution.disparu_id == Disparu.id) \
+            .filter(_missing_coordinates(Contribution), Contribution.id > last_id) \
+            .order_by(Contribution.id).limit(batch_size).all()
+        if not batch:
+            break
+
+        for contribution, country in batch:
+            coords = get_coordinates_from_city(contribution.location_name or contribution.location, country)
+            if coords is None:
+                unresolved += 1
+                continue
+            contribution.latitude, contribution.longitude = coords
+            geocoded += 1
+
+        db.session.commit()
+        last_id = batch[-1][0].id
+    return geocoded, unresolved
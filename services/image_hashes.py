@@ -0,0 +1,69 @@
+"""
+ * Nom de l'application : DISPARUS.ORG
+ * Description : Empreintes perceptuelles des photos et preuves enregistrees
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+import os
+
+from flask import current_app
+
+from models import db, Disparu, Contribution
+from algorithms.matching import compute_photo_hash
+
+
+def upload_path(url):
+    """
+    Local file behind an uploaded image URL: '/static/uploads/<name>' from
+    the public forms or a bare file name from the admin edit form.
+    None for external URLs.
+    """
+    if not url:
+        return None
+    if url.startswith('/static/'):
+        return os.path.join(current_app.root_path, url.lstrip('/'))
+    if '/' not in url:
+        return os.path.join(current_app.config['UPLOAD_FOLDER'], url)
+    return None
+
+
+def hash_upload(url):
+    path = upload_path(url)
+    return compute_photo_hash(path) if path else None
+
+
+def _backfill(model, url_column, hash_column, batch_size):
+    hashed = unreadable = 0
+    last_id = 0
+    while True:
+        batch = model.query.filter(
+            url_column.isnot(None),
+            url_column != '',
+            hash_column.is_(None),
+            model.id > last_id
+        ).order_by(model.id).limit(batch_size).all()
+        if not batch:
+            break
+
+        for record in batch:
+            value = hash_upload(getattr(record, url_column.key))
+            if value is None:
+                unreadable += 1
+                continue
+            setattr(record, hash_column.key, value)
+            hashed += 1
+
+        db.session.commit()
+        last_id = batch[-1].id
+    return hashed, unreadable
+
+
+def backfill_photo_hashes(batch_size=200):
+    """Hashes case photos uploaded before photo_hash existed. Returns (hashed, unreadable)."""
+    return _backfill(Disparu, Disparu.photo_url, Disparu.photo_hash, batch_size)
+
+
+def backfill_proof_hashes(batch_size=200):
+    """Hashes contribution proofs uploaded before proof_hash existed. Returns (hashed, unreadable)."""
+    return _backfill(Contribution, Contribution.proof_url, Contribution.proof_hash, batch_size)
@@ -0,0 +1,182 @@
+"""
+ * Nom de l'application : DISPARUS.ORG
+ * Description : File de taches en arriere-plan (table SQLite locale)
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+# Runs before a failing job is left as failed
+MAX_ATTEMPTS = 3
+# Seconds between two looks at the table, for jobs queued by other processes
+POLL_INTERVAL = 5
+# A job still running after this long was lost with its process
+STALE_AFTER = 600
+
+_HANDLERS = {}
+
+logger = logging.getLogger(__name__)
+
+
+def job_handler(kind):
+    """Registers fn(**payload) as the handler of the jobs of that kind."""
+    def decorator(fn):
+        _HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+class JobQueue:
+    """
+    Background jobs for work that must not hold up a request. Jobs are rows
+    of a small SQLite table, a file that every worker process shares (or
+    memory), run in the app context by daemon threads of each process.
+
+    A job is claimed in a write transaction, so each runs once; jobs left
+    running by a dead process are queued again after STALE_AFTER seconds,
+    failing ones are retried up to MAX_ATTEMPTS times. Finished jobs are
+    deleted.
+    """
+
+    def __init__(self, app, path=None, workers=1):
+        self.app = app
+        self.path = path or ':memory:'
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        if self.path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, payload TEXT NOT NULL, '
+            "status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, error TEXT, "
+            'created_at REAL NOT NULL, started_at REAL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_waiting ON jobs (kind, payload) WHERE status = 'pending'")
+
+    def enqueue(self, kind, payload):
+        """Queues a job, unless the same one is already waiting."""
+        payload = json.dumps(payload, sort_keys=True)
+        with self._lock:
+            waiting = self._conn.execute(
+                "SELECT 1 FROM jobs WHERE kind = ? AND payload = ? AND status = 'pending'", (kind, payload)
+            ).fetchone()
+            if not waiting:
+                self._conn.execute('INSERT INTO jobs (kind, payload, created_at) VALUES (?, ?, ?)',
+                                   (kind, payload, time.time()))
+        self._wakeup.set()
+
+    def _claim(self):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute(
+                    "SELECT id, kind, payload, attempts FROM jobs WHERE status = 'pending' ORDER BY id LIMIT 1"
+                ).fetchone()
+                if row:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ? WHERE id = ?",
+                        (time.time(), row[0])
+                    )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return row
+
+    def _finish(self, job_id, attempts, error=None):
+        with self._lock:
+            if error is None:
+                self._conn.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+            else:
+                status = 'pending' if attempts < MAX_ATTEMPTS else 'failed'
+                self._conn.execute('UPDATE jobs SET status = ?, error = ? WHERE id = ?', (status, error, job_id))
+
+    def requeue_stale(self):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'pending' WHERE status = 'running' AND started_at < ?",
+                (time.time() - STALE_AFTER,)
+            )
+
+    def run_pending(self):
+        """Runs queued jobs until none is left. Returns how many ran."""
+        count = 0
+        while True:
+            row = self._claim()
+            if row is None:
+                return count
+            job_id, kind, payload, attempts = row
+            error = None
+            try:
+                handler = _HANDLERS[kind]
+                with self.app.app_context():
+                    handler(**json.loads(payload))
+            except Exception as e:
+                logger.exception('Job %s (%s) failed', job_id, kind)
+                error = repr(e)
+            self._finish(job_id, attempts + 1, error)
+            count += 1
+
+    def _work(self):
+        while True:
+            self._wakeup.wait(POLL_INTERVAL)
+            self._wakeup.clear()
+            try:
+                self.requeue_stale()
+                self.run_pending()
+            except sqlite3.Error:
+                logger.exception('Job queue unavailable')
+
+    def start(self):
+        """Starts the worker threads, once."""
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'jobs-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self._wakeup.set()
+
+    def stats(self):
+        with self._lock:
+            rows = self._conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        return dict(rows)
+
+
+def _memory_database(app):
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI') or ''
+    return uri.startswith('sqlite') and (':memory:' in uri or uri.rstrip('/') == 'sqlite:')
+
+
+def init_job_queue(app):
+    """Creates the app's job queue; its threads start unless JOB_WORKERS is 0."""
+    path = app.config.get('JOB_QUEUE_PATH')
+    workers = app.config.get('JOB_WORKERS', 1)
+    if _memory_database(app):
+        # One connection shared by every thread: jobs only run when asked
+        path, workers = ':memory:', 0
+    elif not path:
+        os.makedirs(app.instance_path, exist_ok=True)
+        path = os.path.join(app.instance_path, 'jobs.db')
+    queue = JobQueue(app, path, workers)
+    app.extensions['job_queue'] = queue
+    if queue.workers:
+        queue.start()
+    return queue
+
+
+def enqueue_job(app, kind, payload):
+    """Queues a job on the app's queue, a no-op for apps without one."""
+    queue = app.extensions.get('job_queue')
+    if queue is not None:
+        queue.enqueue(kind, payload)
@@ -13,6 +13,8 @@ from werkzeug.utils import secure_filename
 from flask import current_app
 
 from models import db, Disparu
+from utils.geo import get_coordinates_from_city
+from algorithms.matching import compute_photo_hash
 
 
 def generate_public_id():
@@ -21,12 +23,14 @@ def generate_public_id():
 
 def create_signalement(form_data, photo_file=None):
     photo_url = None
+    photo_hash = None
     if photo_file and photo_file.filename:
         filename = secure_filename(photo_file.filename)
         unique_name = f"{generate_public_id()}_{filename}"
         filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_name)
         photo_file.save(filepath)
         photo_url = f"/static/uploads/{unique_name}"
+        photo_hash = compute_photo_hash(filepath)
     
     contacts = []
     for i in range(3):
@@ -42,6 +46,9 @@ def create_signalement(form_data, photo_file=None):
     
     lat = form_data.get('latitude')
     lng = form_data.get('longitude')
+    if not (lat and lng):
+        # No map pin: place the report at its city, from the offline gazetteer
+        lat, lng = get_coordinates_from_city(form_data.get('city'), form_data.get('country')) or (None, None)
     
     disparu = Disparu(
         public_id=generate_public_id(),
@@ -54,6 +61,7 @@ def create_signalement(form_data, photo_file=None):
         city=form_data['city'],
         physical_description=form_data['physical_description'],
         photo_url=photo_url,
+        photo_hash=photo_hash,
         disappearance_date=datetime.fromisoformat(form_data['disappearance_date']),
         circumstances=form_data['circumstances'],
         latitude=float(lat) if lat else None,
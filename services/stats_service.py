@@ -7,6 +7,7 @@
 """
 from datetime import datetime, timedelta
 from models import db, Disparu, Contribution, Download
+from utils.geo import get_countries
 
 
 def get_dashboard_stats():
@@ -65,45 +66,18 @@ def get_dashboard_stats():
 def get_map_data():
     """
     Retrieves data for the dedicated map view.
+    Markers are fetched per viewport from /api/map-clusters; the page only
+    needs the country filter options and the report count. Countries are
+    those with reports among the ones /api/map-clusters filters on.
     """
-    # Optimized query: select only needed fields
-    results = db.session.query(
-        Disparu.id,
-        Disparu.public_id,
-        Disparu.first_name,
-        Disparu.last_name,
-        Disparu.latitude,
-        Disparu.longitude,
-        Disparu.country,
-        Disparu.city,
-        Disparu.status,
-        Disparu.is_flagged,
-        Disparu.photo_url,
-        Disparu.disappearance_date,
-        Disparu.person_type
-    ).all()
-
-    disparus_list = []
-    for row in results:
-        disparus_list.append({
-            'id': row.id,
-            'public_id': row.public_id,
-            'first_name': row.first_name,
-            'last_name': row.last_name,
-            'latitude': row.latitude,
-            'longitude': row.longitude,
-            'country': row.country,
-            'city': row.city,
-            'status': row.status,
-            'is_flagged': row.is_flagged,
-            'photo_url': row.photo_url,
-            'disappearance_date': row.disappearance_date.isoformat() if row.disappearance_date else None,
-            'person_type': row.person_type
-        })
+    countries = [row.country for row in db.session.query(Disparu.country)
+                 .filter(Disparu.country.in_(get_countries()))
+                 .distinct()
+                 .order_by(Disparu.country)]
 
     return {
-        'results': results,
-        'disparus_list': disparus_list
+        'countries': countries,
+        'total': db.session.query(db.func.count(Disparu.id)).scalar() or 0
     }
 
 
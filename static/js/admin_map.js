@@ -26,24 +26,43 @@ document.addEventListener('DOMContentLoaded', function() {
     function fetchAdminMapData() {
         const bounds = map.getBounds();
         const params = new URLSearchParams({
-            min_lat: bounds.getSouth(),
-            max_lat: bounds.getNorth(),
-            min_lng: bounds.getWest(),
-            max_lng: bounds.getEast(),
+            bbox: [bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()].join(','),
+            zoom: map.getZoom(),
             type: adminTypeFilter ? adminTypeFilter.value : '',
             country: adminCountryFilter ? adminCountryFilter.value : ''
         });
 
-        fetch(`/api/map-data?${params.toString()}`)
-            .then(r => r.json())
+        fetch(`/api/map-clusters?${params.toString()}`)
+            .then(r => {
+                // Errors keep the markers already shown
+                if (!r.ok) throw new Error('map-clusters: HTTP ' + r.status);
+                return r.json();
+            })
             .then(data => {
                 markersLayer.clearLayers();
+                const features = data.features;
 
                 if (adminCount) {
-                    adminCount.textContent = data.length + ' ' + reportLabel;
+                    adminCount.textContent = data.total + ' ' + reportLabel;
                 }
 
-                data.forEach(d => {
+                features.forEach(d => {
+                    if (d.type === 'cluster') {
+                        const size = d.count < 100 ? 36 : (d.count < 1000 ? 44 : 52);
+                        const clusterMarker = L.marker([d.latitude, d.longitude], {
+                            icon: L.divIcon({
+                                html: '<div class="map-cluster">' + d.count + '</div>',
+                                className: '',
+                                iconSize: [size, size]
+                            })
+                        });
+                        clusterMarker.on('click', function() {
+                            map.setView([d.latitude, d.longitude], d.expansion_zoom);
+                        });
+                        markersLayer.addLayer(clusterMarker);
+                        return;
+                    }
+
                     let color = '#ef4444'; // missing (red)
                     if (['found', 'found_alive'].includes(d.status)) {
                         color = '#22c55e'; // green
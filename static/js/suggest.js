@@ -0,0 +1,40 @@
+// Typeahead for inputs marked data-suggest: completions from /api/suggest in a datalist
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('input[data-suggest]').forEach(function(input, n) {
+        const list = document.createElement('datalist');
+        list.id = 'suggestions-' + n;
+        input.setAttribute('list', list.id);
+        input.setAttribute('autocomplete', 'off');
+        input.after(list);
+
+        let timer = null;
+        let controller = null;
+
+        input.addEventListener('input', function() {
+            clearTimeout(timer);
+            const query = input.value.trim();
+            if (query.length < 2) {
+                list.replaceChildren();
+                return;
+            }
+            // Waits for a pause in typing, and drops the answer to an older keystroke
+            timer = setTimeout(function() {
+                if (controller) controller.abort();
+                controller = new AbortController();
+                const params = new URLSearchParams({ q: query });
+                if (input.dataset.suggest) params.set('types', input.dataset.suggest);
+
+                fetch('/api/suggest?' + params, { signal: controller.signal })
+                    .then(function(response) { return response.ok ? response.json() : []; })
+                    .then(function(suggestions) {
+                        list.replaceChildren(...suggestions.map(function(suggestion) {
+                            const option = document.createElement('option');
+                            option.value = suggestion.value;
+                            return option;
+                        }));
+                    })
+                    .catch(function() {});
+            }, 150);
+        });
+    });
+});
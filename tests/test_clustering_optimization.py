@@ -1,7 +1,7 @@
 import unittest
 from app import create_app
 from models import db, Disparu
-from algorithms.clustering import get_nearby_cases
+from algorithms.clustering import get_nearby_cases, haversine_distance, haversine_distances
 from datetime import datetime
 
 class TestClusteringOptimization(unittest.TestCase):
@@ -78,5 +78,16 @@ class TestClusteringOptimization(unittest.TestCase):
         ids = sorted([r['disparu']['public_id'] for r in results])
         self.assertEqual(ids, ['west1', 'wrap1'])
 
+    def test_haversine_distances_matches_scalar(self):
+        points = [(0, 0), (48.8566, 2.3522), (-1.28, 36.82), (0, -179.9), (89.9, 10), (-33.9, 18.4)]
+        lats = [p[0] for p in points]
+        lngs = [p[1] for p in points]
+
+        distances = haversine_distances(0, 179.9, lats, lngs)
+
+        self.assertEqual(len(distances), len(points))
+        for (lat, lng), distance in zip(points, distances):
+            self.assertAlmostEqual(distance, haversine_distance(0, 179.9, lat, lng), places=6)
+
 if __name__ == '__main__':
     unittest.main()
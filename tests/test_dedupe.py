@@ -0,0 +1,169 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+from app import create_app
+from algorithms.matching import blocked_candidate_ids
+from models import db, Disparu, MatchCandidate, DedupeRun
+from services.dedupe import run_dedupe, start_dedupe_job
+from commands import dedupe_command
+
+
+class TestDedupe(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def disparu(self, public_id, first_name, last_name, city='Kinshasa', age=30, description='Grand, chemise rouge'):
+        d = Disparu(
+            public_id=public_id, person_type='adult', first_name=first_name, last_name=last_name,
+            age=age, sex='M', country='Congo', city=city, physical_description=description,
+            disappearance_date=datetime.now(), circumstances='.'
+        )
+        db.session.add(d)
+        db.session.commit()
+        return d
+
+    def seed(self):
+        jean = self.disparu('DUP001', 'Jean', 'Dupont')
+        variant = self.disparu('DUP002', 'Jéan', 'Dupond', city='Goma', age=31)
+        other = self.disparu('DUP003', 'Awa', 'Ndiaye', city='Dakar', age=60, description='Petite, robe jaune')
+        return jean, variant, other
+
+    def pairs(self):
+        return {(c.disparu_id, c.candidate_id): c for c in MatchCandidate.query.all()}
+
+    def age_everything(self):
+        """Moves the last run and every case in the past, as if time had passed."""
+        Disparu.query.update({Disparu.updated_at: datetime(2020, 1, 1)}, synchronize_session=False)
+        DedupeRun.query.update({DedupeRun.started_at: datetime(2021, 1, 1)}, synchronize_session=False)
+        db.session.commit()
+
+    def test_full_run(self):
+        jean, variant, other = self.seed()
+        run = run_dedupe(workers=1)
+
+        self.assertEqual((run.mode, run.status, run.records_scanned, run.pairs_found), ('full', 'finished', 3, 1))
+        pairs = self.pairs()
+        self.assertEqual(list(pairs), [(jean.id, variant.id)])
+        candidate = pairs[(jean.id, variant.id)]
+        self.assertGreaterEqual(candidate.score, 30)
+        self.assertTrue(any(reason.startswith('Nom très similaire') for reason in candidate.reasons))
+        self.assertIsNotNone(candidate.computed_at)
+
+    def test_process_pool_gives_the_same_pairs(self):
+        self.seed()
+        for i in range(20):
+            self.disparu(f'FIL{i:03d}', 'Paul', f'Kabila{i}', age=20 + i)
+        run_dedupe(workers=1, block_size=4)
+        inline = {pair: (c.score, c.reasons) for pair, c in self.pairs().items()}
+
+        run_dedupe(full=True, workers=2, block_size=4)
+        self.assertEqual({pair: (c.score, c.reasons) for pair, c in self.pairs().items()}, inline)
+
+    def test_incremental_run_rescores_changed_cases_only(self):
+        jean, variant, other = self.seed()
+        run_dedupe(workers=1)
+        self.age_everything()
+
+        run = run_dedupe(workers=1)
+        self.assertEqual((run.mode, run.records_scanned), ('incremental', 0))
+        self.assertEqual(list(self.pairs()), [(jean.id, variant.id)])
+
+        # A new report of Awa, and Jean's duplicate deleted
+        late = self.disparu('DUP004', 'Awa', 'Ndiaye', city='Dakar', age=60, description='Petite, robe jaune')
+        db.session.delete(variant)
+        db.session.commit()
+
+        run = run_dedupe(workers=1)
+        self.assertEqual((run.mode, run.records_scanned), ('incremental', 1))
+        self.assertEqual(list(self.pairs()), [(other.id, late.id)])
+
+        run = run_dedupe(full=True, workers=1)
+        self.assertEqual((run.mode, run.records_scanned), ('full', 3))
+        self.assertEqual(list(self.pairs()), [(other.id, late.id)])
+
+    def test_incremental_run_keeps_pairs_found_from_the_other_side(self):
+        jean, variant, other = self.seed()
+        run_dedupe(workers=1)
+        self.age_everything()
+
+        # Only the variant's blocking finds Jean, not the other way round
+        def one_way(record, *args):
+            return [] if record.id == jean.id else blocked_candidate_ids(record, *args)
+
+        jean.city = 'Matadi'
+        db.session.commit()
+        with patch('services.dedupe.blocked_candidate_ids', side_effect=one_way):
+            run = run_dedupe(workers=1)
+        self.assertEqual((run.mode, run.records_scanned), ('incremental', 2))
+        self.assertEqual(list(self.pairs()), [(jean.id, variant.id)])
+
+    def test_command(self):
+        self.seed()
+        result = self.app.test_cli_runner().invoke(dedupe_command, ['--workers', '1'])
+        self.assertIn('Dedupe (full): 3 cases scanned, 1 pairs', result.output)
+        result = self.app.test_cli_runner().invoke(dedupe_command, ['--workers', '1'])
+        self.assertIn('Dedupe (incremental)', result.output)
+
+    def test_background_job(self):
+        # The run happens in another process, which needs a database file
+        with tempfile.TemporaryDirectory() as tmp:
+            with patch.dict(os.environ, {'DATABASE_URL': 'sqlite:///' + os.path.join(tmp, 'dedupe.db')}):
+                app = create_app('testing')
+            with app.app_context():
+                db.create_all()
+                self.seed()
+                process = start_dedupe_job(app)
+                self.assertEqual(process.wait(120), 0)
+                self.assertEqual(DedupeRun.query.one().status, 'finished')
+                self.assertEqual(len(self.pairs()), 1)
+                db.session.remove()
+                db.engine.dispose()
+
+    def test_one_background_job_at_a_time(self):
+        db.session.add(DedupeRun(mode='full', status='running'))
+        db.session.commit()
+        self.assertIsNone(start_dedupe_job(self.app))
+
+        # Unless the running one died long ago
+        DedupeRun.query.update({DedupeRun.started_at: datetime(2021, 1, 1)}, synchronize_session=False)
+        db.session.commit()
+        with patch('services.dedupe.subprocess.Popen') as popen:
+            self.assertIs(start_dedupe_job(self.app, full=True), popen.return_value)
+        command = popen.call_args.args[0]
+        self.assertEqual(command[-2:], ['dedupe', '--full'])
+
+    def test_admin_pages(self):
+        jean, variant, other = self.seed()
+        run_dedupe(workers=1)
+
+        self.assertNotEqual(self.client.get('/admin/duplicates').status_code, 200)
+        with self.client.session_transaction() as sess:
+            sess['admin_logged_in'] = True
+
+        response = self.client.get('/admin/duplicates')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('DUP002', response.get_data(as_text=True))
+        self.assertNotIn('DUP002', self.client.get('/admin/duplicates?min_score=999').get_data(as_text=True))
+
+        with patch('routes.admin.duplicates.start_dedupe_job') as start:
+            response = self.client.post('/admin/duplicates/run', data={'full': '1'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(start.call_args.kwargs['full'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import os
+import random
+import unittest
+from unittest import mock
+from datetime import datetime
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+from app import create_app
+from models import db, Disparu
+from algorithms.clustering import dbscan, find_density_hotspots, haversine_distance, spherical_centroid
+
+
+class TestDbscan(unittest.TestCase):
+    def brute_force(self, lats, lons, eps_km, min_samples):
+        n = len(lats)
+        neighbours = [
+            [j for j in range(n) if j != i and haversine_distance(lats[i], lons[i], lats[j], lons[j]) <= eps_km]
+            for i in range(n)
+        ]
+        core = [len(nb) + 1 >= min_samples for nb in neighbours]
+
+        labels = [-1] * n
+        for i in range(n):
+            if core[i] and labels[i] < 0:
+                members, stack = {i}, [i]
+                while stack:
+                    for j in neighbours[stack.pop()]:
+                        if core[j] and j not in members:
+                            members.add(j)
+                            stack.append(j)
+                for j in members:
+                    labels[j] = min(members)
+        for i in range(n):
+            if not core[i]:
+                anchors = [(haversine_distance(lats[i], lons[i], lats[j], lons[j]), j) for j in neighbours[i] if core[j]]
+                if anchors:
+                    labels[i] = labels[min(anchors)[1]]
+        return labels
+
+    def test_matches_brute_force(self):
+        rng = random.Random(3)
+        for _ in range(10):
+            lats = [rng.gauss(0, 1) if rng.random() < 0.8 else rng.uniform(85, 90) for _ in range(250)]
+            lons = [(rng.gauss(179.5, 1) + 180) % 360 - 180 for _ in range(250)]
+            eps_km, min_samples = rng.choice([10, 40]), rng.choice([2, 5])
+            self.assertEqual(dbscan(lats, lons, eps_km, min_samples).tolist(),
+                             self.brute_force(lats, lons, eps_km, min_samples))
+
+    def test_pairs_streamed_in_chunks(self):
+        rng = random.Random(11)
+        lats = [rng.gauss(-4.3, 0.05) for _ in range(400)]
+        lons = [rng.gauss(15.3, 0.05) for _ in range(400)]
+        expected = self.brute_force(lats, lons, 2, 5)
+        # Pairs spread over many chunks merge into the same clusters
+        with mock.patch('algorithms.clustering.PAIR_CHUNK', 50):
+            self.assertEqual(dbscan(lats, lons, 2, 5).tolist(), expected)
+
+    def test_labels_do_not_depend_on_order(self):
+        rng = random.Random(5)
+        points = [(i, rng.gauss(0, 0.3), rng.gauss(10, 0.3)) for i in range(200)]
+        labels = dict(zip([p[0] for p in points], dbscan([p[1] for p in points], [p[2] for p in points], 10, 4,
+                                                         ids=[p[0] for p in points]).tolist()))
+        rng.shuffle(points)
+        shuffled = dict(zip([p[0] for p in points], dbscan([p[1] for p in points], [p[2] for p in points], 10, 4,
+                                                           ids=[p[0] for p in points]).tolist()))
+        self.assertEqual(labels, shuffled)
+
+    def test_spherical_centroid_across_antimeridian(self):
+        lat, lng = spherical_centroid([0, 0], [179.9, -179.9])
+        self.assertAlmostEqual(lat, 0)
+        self.assertAlmostEqual(abs(lng), 180)
+
+
+class TestDensityHotspots(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def create_disparu(self, public_id, lat, lng, status='missing'):
+        d = Disparu(
+            public_id=public_id, person_type='adult', first_name='Test', last_name='Density',
+            age=30, sex='M', country='Fiji', city='Suva', physical_description='.',
+            disappearance_date=datetime.now(), circumstances='.',
+            latitude=lat, longitude=lng, status=status
+        )
+        db.session.add(d)
+        return d
+
+    def test_find_density_hotspots(self):
+        first = self.create_disparu('east01', 0.0, 179.95)
+        self.create_disparu('east02', 0.01, 179.97)
+        self.create_disparu('west01', 0.0, -179.95)
+        self.create_disparu('west02', -0.01, -179.97)
+        self.create_disparu('found1', 0.0, 179.99, status='found')
+        self.create_disparu('alone1', 10.0, 10.0)
+        db.session.commit()
+
+        hotspots = find_density_hotspots(eps_km=10, min_samples=3)
+
+        self.assertEqual(len(hotspots), 1)
+        hotspot = hotspots[0]
+        self.assertEqual(hotspot['cluster_id'], first.id)
+        self.assertCountEqual(hotspot['disparus'], ['east01', 'east02', 'west01', 'west02'])
+        self.assertAlmostEqual(abs(hotspot['longitude']), 180, places=1)
+        self.assertLess(hotspot['radius_km'], 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
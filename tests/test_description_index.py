@@ -0,0 +1,142 @@
+import os
+import random
+import unittest
+from datetime import datetime
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+from app import create_app
+from models import db, Disparu
+from algorithms import description_index
+from algorithms.description_index import DescriptionIndex
+from algorithms.minhash import SIGNATURE_BYTES, description_tokens, minhash_signature, minhash_similarity
+from algorithms.matching import find_potential_matches
+from commands import minhash_backfill_command
+
+VOCABULARY = [f'mot{i:04d}' for i in range(3000)]
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b)
+
+
+class TestMinHash(unittest.TestCase):
+    def test_signature(self):
+        signature = minhash_signature('Grand homme, chemise rouge', 'pantalon noir')
+        self.assertEqual(len(signature), SIGNATURE_BYTES)
+        self.assertEqual(signature, minhash_signature('pantalon noir rouge', 'chemise grand homme'))
+        self.assertIsNone(minhash_signature('', None, 'et de la'))
+        self.assertEqual(minhash_similarity(signature, signature), 1.0)
+        self.assertEqual(minhash_similarity(signature, None), 0.0)
+
+    def test_estimates_jaccard(self):
+        rng = random.Random(3)
+        errors = []
+        for _ in range(200):
+            a = set(rng.sample(VOCABULARY, 20))
+            b = set(rng.sample(sorted(a), rng.randint(0, 20))) | set(rng.sample(VOCABULARY, rng.randint(0, 20)))
+            if not b:
+                continue
+            estimate = minhash_similarity(minhash_signature(' '.join(a)), minhash_signature(' '.join(b)))
+            errors.append(abs(estimate - jaccard(a, b)))
+        self.assertLess(sum(errors) / len(errors), 0.06)
+
+
+class TestDescriptionIndex(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(5)
+        self.texts = {point_id: set(rng.sample(VOCABULARY, 12)) for point_id in range(1, 3001)}
+        # Rewordings of existing descriptions: Jaccard 0.5 and more
+        for point_id in range(3001, 3101):
+            base = sorted(self.texts[point_id - 3000])
+            self.texts[point_id] = set(base[:9]) | set(rng.sample(VOCABULARY, 3))
+        self.signatures = {point_id: minhash_signature(' '.join(words)) for point_id, words in self.texts.items()}
+        self.index = DescriptionIndex()
+        self.index.load(self.signatures.items())
+
+    def test_finds_similar_without_pairwise_scan(self):
+        found = 0
+        for point_id in range(1, 101):
+            hits = self.index.search(self.signatures[point_id], exclude={point_id})
+            found += (point_id + 3000) in [hit_id for _, hit_id in hits]
+            for similarity, hit_id in hits:
+                self.assertGreaterEqual(similarity, description_index.DEFAULT_THRESHOLD)
+                self.assertEqual(similarity, minhash_similarity(self.signatures[point_id], self.signatures[hit_id]))
+        self.assertGreaterEqual(found, 97)
+
+    def test_incremental_updates(self):
+        query = self.signatures[1]
+        self.index.upsert(9000, query)
+        self.index.upsert(3001, minhash_signature('robe jaune'))
+        self.index.remove(1)
+        self.index.upsert(2, None)
+
+        ids = [point_id for _, point_id in self.index.search(query)]
+        self.assertEqual(ids[0], 9000)
+        self.assertNotIn(1, ids)
+        self.assertNotIn(3001, ids)
+        self.assertEqual(len(self.index), len(self.signatures) - 1)
+
+        for point_id in range(10000, 10000 + description_index.MIN_REBUILD_THRESHOLD + 10):
+            self.index.upsert(point_id, query)
+        self.assertLess(len(self.index.pending), 20)
+        self.assertEqual(len(self.index.search(query, limit=5000)), description_index.MIN_REBUILD_THRESHOLD + 11)
+
+
+class TestDescriptionSignatures(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        description_index.invalidate_description_index()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def disparu(self, public_id, first_name, last_name, description, clothing=None, city='Kinshasa'):
+        d = Disparu(
+            public_id=public_id, person_type='adult', first_name=first_name, last_name=last_name,
+            age=30, sex='F', country='Congo', city=city, physical_description=description, clothing=clothing,
+            disappearance_date=datetime.now(), circumstances='.'
+        )
+        db.session.add(d)
+        db.session.commit()
+        return d
+
+    def test_kept_in_step_with_text(self):
+        d = self.disparu('DESC01', 'Awa', 'Diop', 'Petite, tresses longues', 'robe jaune')
+        self.assertEqual(d.description_minhash, minhash_signature('Petite, tresses longues', 'robe jaune'))
+        d.clothing = 'pantalon bleu'
+        db.session.commit()
+        self.assertEqual(db.session.get(Disparu, d.id).description_minhash,
+                         minhash_signature('Petite, tresses longues', 'pantalon bleu'))
+
+    def test_description_lookalikes_are_candidates(self):
+        target = self.disparu('DESC01', 'Awa', 'Diop', 'Petite, cicatrice joue gauche, tresses longues', 'robe jaune sandales')
+        self.disparu('DESC02', 'Marie', 'Kabongo', 'Grande, lunettes', 'pantalon bleu')
+        lookalike = self.disparu('DESC03', 'Grace', 'Mukendi', 'Tresses longues, cicatrice joue gauche, petite',
+                                 'sandales, robe jaune', city='Goma')
+
+        matches = find_potential_matches(target)
+        self.assertEqual([m['disparu']['id'] for m in matches], [lookalike.id])
+        self.assertIn('Description similaire (100%)', matches[0]['match_reasons'])
+
+    def test_backfill_command(self):
+        d = self.disparu('DESC01', 'Awa', 'Diop', 'Petite, tresses longues', 'robe jaune')
+        self.disparu('DESC02', 'Marie', 'Kabongo', 'et de la', None)
+        Disparu.query.update({Disparu.description_minhash: None}, synchronize_session=False)
+        db.session.commit()
+
+        result = self.app.test_cli_runner().invoke(minhash_backfill_command)
+        self.assertIn('1 signed, 1 without words', result.output)
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Disparu, d.id).description_minhash,
+                         minhash_signature('Petite, tresses longues', 'robe jaune'))
+        self.assertEqual(description_tokens('et de la'), set())
+
+
+if __name__ == '__main__':
+    unittest.main()
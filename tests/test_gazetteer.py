@@ -0,0 +1,82 @@
+import os
+import unittest
+from datetime import datetime
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+from app import create_app
+from models import db, Disparu, Contribution
+from commands import geocode_backfill_command
+from utils.geo import COUNTRIES_CITIES, get_coordinates_from_city, get_gazetteer, reverse_geocode
+
+
+class TestGazetteer(unittest.TestCase):
+    def test_covers_every_city(self):
+        for country, cities in COUNTRIES_CITIES.items():
+            for city in cities:
+                coords = get_coordinates_from_city(city, country)
+                self.assertIsNotNone(coords, f"{city}, {country}")
+                # Every city maps back to itself
+                self.assertEqual(reverse_geocode(*coords)['city'], city)
+
+    def test_lookup_is_forgiving(self):
+        self.assertEqual(get_coordinates_from_city('saint louis', 'Sénégal'), get_coordinates_from_city('Saint-Louis', 'Senegal'))
+        self.assertEqual(get_coordinates_from_city('Yaoundé'), get_coordinates_from_city('Yaounde', 'Cameroun'))
+        # Same name in two countries: the country decides
+        self.assertNotEqual(get_coordinates_from_city('Porto Novo', 'Cap-Vert'), get_coordinates_from_city('Porto-Novo', 'Benin'))
+        self.assertIsNone(get_coordinates_from_city('Atlantis', 'Senegal'))
+        # A city of another country is not a match
+        self.assertIsNone(get_coordinates_from_city('Dakar', 'Kenya'))
+        self.assertIsNone(get_coordinates_from_city('', None))
+
+    def test_reverse_geocode(self):
+        place = reverse_geocode(14.70, -17.45)
+        self.assertEqual((place['city'], place['country']), ('Dakar', 'Senegal'))
+        self.assertLess(place['distance_km'], 5)
+        self.assertIsNone(reverse_geocode(48.85, 2.35, max_distance_km=100))
+        self.assertIs(get_gazetteer(), get_gazetteer())
+
+
+class TestGeocodeBackfill(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def create_disparu(self, public_id, city, lat=None, lng=None):
+        d = Disparu(
+            public_id=public_id, person_type='adult', first_name='Test', last_name='Geo',
+            age=30, sex='M', country='Kenya', city=city, physical_description='.',
+            disappearance_date=datetime.now(), circumstances='.',
+            latitude=lat, longitude=lng, status='missing'
+        )
+        db.session.add(d)
+        db.session.commit()
+        return d
+
+    def test_backfill_command(self):
+        nairobi = self.create_disparu('nairob', 'Nairobi')
+        pinned = self.create_disparu('pinned', 'Nairobi', -1.0, 36.0)
+        unknown = self.create_disparu('unknow', 'Nowhere')
+        db.session.add(Contribution(disparu_id=nairobi.id, contribution_type='sighting', details='.', location_name='Mombasa'))
+        db.session.commit()
+
+        result = self.app.test_cli_runner().invoke(geocode_backfill_command)
+        self.assertIn('Disparus: 1 geocoded, 1 unresolved', result.output)
+        self.assertIn('Contributions: 1 geocoded, 0 unresolved', result.output)
+
+        self.assertEqual((nairobi.latitude, nairobi.longitude), get_coordinates_from_city('Nairobi', 'Kenya'))
+        self.assertIsNotNone(nairobi.geohash)
+        self.assertEqual((pinned.latitude, pinned.longitude), (-1.0, 36.0))
+        self.assertIsNone(unknown.latitude)
+        self.assertEqual(Contribution.query.one().latitude, get_coordinates_from_city('Mombasa', 'Kenya')[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
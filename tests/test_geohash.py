@@ -0,0 +1,111 @@
+import os
+import random
+import unittest
+from datetime import datetime
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+from sqlalchemy import text
+from app import create_app
+from models import db, Disparu, Contribution
+from algorithms.clustering import get_nearby_cases
+from init_db import sync_indexes
+from utils.geohash import bbox_prefixes, encode_geohash
+from utils.spatial import filter_bbox, is_geohash_indexed
+
+
+class TestGeohash(unittest.TestCase):
+    def test_encode(self):
+        self.assertEqual(encode_geohash(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(encode_geohash(14.69, -17.44), 'edeee4hx6')
+        self.assertIsNone(encode_geohash(None, 10))
+
+    def test_prefixes_cover_the_box(self):
+        rng = random.Random(7)
+        for _ in range(5000):
+            size = rng.choice([1e-4, 0.01, 1, 10, 100])
+            min_lat = rng.uniform(-90, 90 - min(size, 179))
+            max_lat = min(90, min_lat + rng.random() * size)
+            width = rng.random() * size
+            min_lng = rng.uniform(-180, 180)
+            max_lng = (min_lng + width + 180) % 360 - 180
+
+            prefixes = bbox_prefixes(min_lat, max_lat, min_lng, max_lng)
+            if prefixes is None:
+                continue
+            for _ in range(5):
+                lat = rng.uniform(min_lat, max_lat)
+                lng = (min_lng + rng.random() * width + 180) % 360 - 180
+                cell = encode_geohash(lat, lng)
+                self.assertTrue(any(cell.startswith(p) for p in prefixes))
+
+        self.assertIsNone(bbox_prefixes(-90, 90, -180, 180))
+
+
+class TestGeohashColumn(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def create_disparu(self, public_id, lat, lng):
+        d = Disparu(
+            public_id=public_id, person_type='adult', first_name='Test', last_name='Geohash',
+            age=30, sex='M', country='Senegal', city='Dakar', physical_description='.',
+            disappearance_date=datetime.now(), circumstances='.',
+            latitude=lat, longitude=lng, status='missing'
+        )
+        db.session.add(d)
+        db.session.commit()
+        return d
+
+    def test_validators_keep_geohash_in_step(self):
+        d = self.create_disparu('dakar1', 14.69, -17.44)
+        self.assertEqual(d.geohash, encode_geohash(14.69, -17.44))
+        d.longitude = None
+        self.assertIsNone(d.geohash)
+        d.longitude = -17.5
+        self.assertEqual(d.geohash, encode_geohash(14.69, -17.5))
+
+        c = Contribution(disparu_id=d.id, contribution_type='sighting', details='.', latitude=14.7, longitude=-17.4)
+        self.assertEqual(c.geohash, encode_geohash(14.7, -17.4))
+
+    def test_sync_indexes_backfills_and_bbox_uses_prefixes(self):
+        self.create_disparu('dakar1', 14.69, -17.44)
+        self.create_disparu('east01', 0, 179.5)
+        self.create_disparu('west01', 0, -179.5)
+        self.create_disparu('nogeo1', None, None)
+        db.session.execute(text("UPDATE disparus_flask SET geohash = NULL"))
+        db.session.commit()
+
+        self.assertFalse(is_geohash_indexed())
+        sync_indexes()
+        self.assertTrue(is_geohash_indexed())
+        hashes = dict(db.session.execute(text("SELECT public_id, geohash FROM disparus_flask")).all())
+        self.assertEqual(hashes['dakar1'], encode_geohash(14.69, -17.44))
+        self.assertIsNone(hashes['nogeo1'])
+
+        query = filter_bbox(db.session.query(Disparu.id), 14, 15, -18, -17)
+        sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+        plan = ' '.join(row[-1] for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql)))
+        self.assertIn('ix_disparus_flask_geohash', plan)
+
+        resp = self.client.get('/api/map-data?min_lat=14&max_lat=15&min_lng=-18&max_lng=-17')
+        self.assertEqual([d['public_id'] for d in resp.get_json()], ['dakar1'])
+
+        resp = self.client.get('/api/map-data?min_lat=-1&max_lat=1&min_lng=179&max_lng=-179')
+        self.assertCountEqual([d['public_id'] for d in resp.get_json()], ['east01', 'west01'])
+
+        results = get_nearby_cases(0, 179.9, radius_km=100)
+        self.assertCountEqual([r['disparu']['public_id'] for r in results], ['east01', 'west01'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+from PIL import Image
+
+import algorithms.matching
+from algorithms.hash_cache import ImageHashCache
+from algorithms.matching import compute_image_hash, configure_hash_cache, hash_cache_stats
+
+
+def gradient_png(path, reverse=False):
+    img = Image.new('L', (64, 64))
+    img.putdata([(255 - x * 4) if reverse else x * 4 for y in range(64) for x in range(64)])
+    img.save(path)
+
+
+class TestImageHashCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_lru_eviction(self):
+        cache = ImageHashCache(maxsize=2)
+        cache.put(('a', 1, 1), 'aa')
+        cache.put(('b', 1, 1), 'bb')
+        self.assertEqual(cache.get(('a', 1, 1)), 'aa')
+        cache.put(('c', 1, 1), 'cc')
+
+        self.assertIn(('a', 1, 1), cache)
+        self.assertNotIn(('b', 1, 1), cache)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(('b', 1, 1)))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        cache.configure(maxsize=1)
+        self.assertEqual(len(cache), 1)
+
+    def test_shared_store(self):
+        store = os.path.join(self.tmp_dir, 'hashes.db')
+        first = ImageHashCache(path=store)
+        second = ImageHashCache(path=store)
+
+        first.put(('photo.png', 10, 20), 'abcd')
+        self.assertEqual(second.get(('photo.png', 10, 20)), 'abcd')
+        self.assertEqual(second.stats()['disk_hits'], 1)
+        # Now served from memory
+        self.assertEqual(second.get(('photo.png', 10, 20)), 'abcd')
+        self.assertEqual(second.stats()['disk_hits'], 1)
+        self.assertEqual(second.stats()['hits'], 2)
+
+        # A different mtime or size is a different file
+        self.assertIsNone(second.get(('photo.png', 11, 20)))
+        self.assertIsNone(second.get(('photo.png', 10, 21)))
+
+    def test_broken_store_is_ignored(self):
+        cache = ImageHashCache(path=os.path.join(self.tmp_dir, 'missing', 'hashes.db'))
+        cache.put(('a', 1, 1), 'aa')
+        self.assertEqual(cache.get(('a', 1, 1)), 'aa')
+        self.assertIsNone(cache.get(('b', 1, 1)))
+
+
+class TestComputeImageHashCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        configure_hash_cache(16)
+        algorithms.matching._HASH_CACHE.clear()
+
+    def tearDown(self):
+        configure_hash_cache(16)
+        algorithms.matching._HASH_CACHE.clear()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_overwritten_photo_is_rehashed(self):
+        path = os.path.join(self.tmp_dir, 'photo.png')
+        gradient_png(path)
+        original = compute_image_hash(path)
+        self.assertEqual(compute_image_hash(path), original)
+        self.assertEqual(hash_cache_stats()['hits'], 1)
+
+        gradient_png(path, reverse=True)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertNotEqual(compute_image_hash(path), original)
+        self.assertEqual(hash_cache_stats()['misses'], 2)
+
+        self.assertIsNone(compute_image_hash(os.path.join(self.tmp_dir, 'missing.png')))
+
+    def test_workers_share_hashes(self):
+        path = os.path.join(self.tmp_dir, 'photo.png')
+        gradient_png(path)
+        configure_hash_cache(16, os.path.join(self.tmp_dir, 'hashes.db'))
+        value = compute_image_hash(path)
+
+        # Another worker: empty memory, same store
+        algorithms.matching._HASH_CACHE.clear()
+        self.assertEqual(compute_image_hash(path), value)
+        self.assertEqual(hash_cache_stats()['disk_hits'], 1)
+        self.assertEqual(hash_cache_stats()['misses'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
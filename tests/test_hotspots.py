@@ -1,7 +1,10 @@
 import unittest
 from app import create_app
 from models import db, Disparu
-from algorithms.clustering import find_hotspots
+import random
+import time
+from algorithms.clustering import find_hotspots, compute_hotspots
+from algorithms.hotspot_index import HotspotIndex, get_hotspot_index
 from datetime import datetime
 
 class TestHotspots(unittest.TestCase):
@@ -94,5 +97,106 @@ class TestHotspots(unittest.TestCase):
         self.assertEqual(len(hotspots), 1)
         self.assertEqual(hotspots[0]['count'], 3)
 
+    def test_hotspots_follow_writes(self):
+        d1 = self.create_disparu(0.1, 0.1, 'p1')
+        d2 = self.create_disparu(0.12, 0.12, 'p2')
+        d3 = self.create_disparu(None, None, 'p3')
+        db.session.add_all([d1, d2, d3])
+        db.session.commit()
+
+        self.assertEqual(find_hotspots(), [])
+
+        # Geolocating the third case forms the hotspot
+        d3.latitude, d3.longitude = 0.08, 0.08
+        db.session.commit()
+        hotspots = find_hotspots()
+        self.assertEqual(len(hotspots), 1)
+        self.assertCountEqual(hotspots[0]['disparus'], ['p1', 'p2', 'p3'])
+
+        # A new report joins it
+        d4 = self.create_disparu(0.11, 0.09, 'p4')
+        db.session.add(d4)
+        db.session.commit()
+        self.assertEqual(find_hotspots()[0]['count'], 4)
+
+        # Found cases leave it
+        d1.status = 'found'
+        d2.status = 'found'
+        db.session.commit()
+        self.assertEqual(find_hotspots(), [])
+
+        d2.status = 'missing'
+        db.session.commit()
+        self.assertEqual(find_hotspots()[0]['count'], 3)
+
+        db.session.delete(d4)
+        db.session.commit()
+        self.assertEqual(find_hotspots(), [])
+
+        # Bulk deletes reset the index
+        d4 = self.create_disparu(0.1, 0.11, 'p5')
+        db.session.add(d4)
+        db.session.commit()
+        self.assertEqual(find_hotspots()[0]['count'], 3)
+        Disparu.query.filter_by(public_id='p5').delete()
+        db.session.commit()
+        self.assertEqual(find_hotspots(), [])
+
+    def test_stale_index_reloads_in_background(self):
+        db.session.add_all([self.create_disparu(0.1, 0.1, 'p1'), self.create_disparu(0.12, 0.12, 'p2'),
+                            self.create_disparu(0.08, 0.08, 'p3')])
+        db.session.commit()
+        index = get_hotspot_index()
+        self.assertEqual(len(index.hotspots()), 1)
+
+        # Found by another worker: only the reload sees it
+        db.session.execute(db.text("UPDATE disparus_flask SET status = 'found' WHERE public_id = 'p1'"))
+        db.session.commit()
+        index.built_at -= index.ttl + 1
+
+        self.assertIs(get_hotspot_index(), index)
+        deadline = time.time() + 10
+        while get_hotspot_index() is index and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(find_hotspots(), [])
+
+    def test_incremental_matches_full_recompute(self):
+        rng = random.Random(7)
+
+        def random_row(point_id):
+            status = 'missing' if rng.random() < 0.85 else 'found'
+            return (point_id, f'p{point_id}', rng.gauss(0, 0.6), rng.gauss(20, 0.6), status)
+
+        rows = {i: random_row(i) for i in range(400)}
+        index = HotspotIndex(min_cases=3, radius_km=50)
+        index.load(sorted(rows.values()))
+
+        for _ in range(100):
+            updated, removed = [], []
+            for point_id in rng.sample(range(500), 3):
+                if point_id in rows and rng.random() < 0.3:
+                    del rows[point_id]
+                    removed.append(point_id)
+                else:
+                    rows[point_id] = random_row(point_id)
+                    updated.append(rows[point_id])
+            index.apply(updated, removed)
+
+            full = HotspotIndex(min_cases=3, radius_km=50)
+            full.load(sorted(rows.values()))
+            self.assertEqual(
+                [h['disparus'] for h in index.hotspots()],
+                [h['disparus'] for h in full.hotspots()]
+            )
+
+    def test_index_matches_compute_hotspots(self):
+        rng = random.Random(11)
+        db.session.add_all([
+            self.create_disparu(rng.gauss(5, 1), rng.gauss(10, 1), f'r{i}') for i in range(300)
+        ])
+        db.session.commit()
+
+        self.assertEqual(find_hotspots(), compute_hotspots())
+
 if __name__ == '__main__':
     unittest.main()
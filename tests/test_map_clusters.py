@@ -0,0 +1,167 @@
+import os
+import random
+import unittest
+from unittest import mock
+from datetime import datetime
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+from app import create_app
+from models import db, Disparu
+from algorithms.map_clusters import ClusterHierarchy, MAX_ZOOM, get_cluster_hierarchy
+from services.stats_service import get_map_data
+
+
+class TestClusterHierarchy(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(1)
+        self.rows = [(i, rng.uniform(-35, 37), rng.uniform(-20, 52)) for i in range(1, 5001)]
+        self.hierarchy = ClusterHierarchy(self.rows)
+
+    def test_counts_are_conserved_at_every_zoom(self):
+        for zoom in range(MAX_ZOOM + 2):
+            clusters = self.hierarchy.get_clusters(-85, 85, -180, 180, zoom)
+            self.assertEqual(sum(c['count'] for c in clusters), len(self.rows))
+
+    def test_low_zoom_aggregates_high_zoom_expands(self):
+        world = self.hierarchy.get_clusters(-85, 85, -180, 180, 2)
+        self.assertLess(len(world), 100)
+        self.assertTrue(all(c['expansion_zoom'] > 2 for c in world if c['count'] > 1))
+
+        # Single cases carry their id; a small viewport returns only what it covers
+        clusters = self.hierarchy.get_clusters(0, 1, 10, 11, MAX_ZOOM + 1)
+        expected = sorted(r[0] for r in self.rows if 0 <= r[1] <= 1 and 10 <= r[2] <= 11)
+        self.assertEqual(sorted(c['disparu_id'] for c in clusters), expected)
+
+    def test_antimeridian_box(self):
+        hierarchy = ClusterHierarchy([(1, 0, 179.9), (2, 0, -179.9), (3, 0, 170)])
+        clusters = hierarchy.get_clusters(-1, 1, 179, -179, MAX_ZOOM + 1)
+        self.assertCountEqual([c['disparu_id'] for c in clusters], [1, 2])
+
+
+class TestMapClustersEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def create_disparu(self, public_id, lat, lng, person_type='adult'):
+        d = Disparu(
+            public_id=public_id, person_type=person_type, first_name='Test', last_name='Map',
+            age=30, sex='M', country='Senegal', city='Dakar', physical_description='.',
+            disappearance_date=datetime.now(), circumstances='.',
+            latitude=lat, longitude=lng, status='missing'
+        )
+        db.session.add(d)
+        db.session.commit()
+        return d
+
+    def test_clusters_then_points(self):
+        self.create_disparu('dakar1', 14.69, -17.44)
+        self.create_disparu('dakar2', 14.70, -17.45)
+        self.create_disparu('dog001', 14.71, -17.46, person_type='animal')
+
+        resp = self.client.get('/api/map-clusters?bbox=-30,0,0,30&zoom=4')
+        data = resp.get_json()
+        self.assertEqual(data['total'], 3)
+        self.assertEqual(len(data['features']), 1)
+        self.assertEqual(data['features'][0]['type'], 'cluster')
+        self.assertEqual(data['features'][0]['count'], 3)
+
+        resp = self.client.get('/api/map-clusters?bbox=-17.5,14.6,-17.4,14.8&zoom=18')
+        data = resp.get_json()
+        self.assertCountEqual([f['public_id'] for f in data['features']], ['dakar1', 'dakar2', 'dog001'])
+
+        resp = self.client.get('/api/map-clusters?bbox=-17.5,14.6,-17.4,14.8&zoom=18&type=animal')
+        self.assertEqual([f['public_id'] for f in resp.get_json()['features']], ['dog001'])
+
+        # New reports show up without waiting for the cache to expire
+        self.create_disparu('dakar3', 14.72, -17.47)
+        resp = self.client.get('/api/map-clusters?bbox=-30,0,0,30&zoom=4')
+        self.assertEqual(resp.get_json()['total'], 4)
+
+        # Longitudes past the date line, as sent by a panned map
+        resp = self.client.get('/api/map-clusters?bbox=-390,0,-360,30&zoom=4')
+        self.assertEqual(resp.get_json()['total'], 4)
+
+    def test_writes_only_drop_matching_filter_sets(self):
+        dog = self.create_disparu('dog001', 14.71, -17.46, person_type='animal')
+        self.create_disparu('dakar1', 14.69, -17.44)
+        animals = get_cluster_hierarchy('animal')
+        gabon = get_cluster_hierarchy('all', 'Gabon')
+        everyone = get_cluster_hierarchy('all')
+
+        # A person in Senegal: neither the animals nor Gabon change
+        self.create_disparu('dakar2', 14.70, -17.45)
+        self.assertIs(get_cluster_hierarchy('animal'), animals)
+        self.assertIs(get_cluster_hierarchy('all', 'Gabon'), gabon)
+        self.assertIsNot(get_cluster_hierarchy('all'), everyone)
+        self.assertEqual(get_cluster_hierarchy('all').total, 3)
+
+        # Moving the dog to Gabon changes both the set it leaves and the one it joins
+        self.assertEqual(get_cluster_hierarchy('animal', 'Senegal').total, 1)
+        dog.country = 'Gabon'
+        db.session.commit()
+        self.assertEqual(get_cluster_hierarchy('animal', 'Senegal').total, 0)
+        self.assertEqual(get_cluster_hierarchy('all', 'Gabon').total, 1)
+        self.assertIsNot(get_cluster_hierarchy('animal'), animals)
+
+    def test_points_past_the_limit_stay_counted(self):
+        for n in range(3):
+            self.create_disparu(f'dakar{n}', 14.69 + n * 0.01, -17.44)
+        with mock.patch('routes.api.MAX_MAP_POINTS', 2):
+            data = self.client.get('/api/map-clusters?bbox=-17.5,14.6,-17.4,14.8&zoom=18').get_json()
+        self.assertEqual(data['total'], 3)
+        self.assertEqual(sorted(f['type'] for f in data['features']), ['cluster', 'point', 'point'])
+        self.assertEqual(sum(f['count'] for f in data['features']), 3)
+
+    def test_wide_boxes_fall_back_to_coarser_zooms(self):
+        for n in range(3):
+            self.create_disparu(f'case{n}', 14.69 + n, -17.44 + n)
+        world = '/api/map-clusters?bbox=-180,-85,180,85&zoom=17'
+        self.assertEqual(len(self.client.get(world).get_json()['features']), 3)
+        with mock.patch('routes.api.MAX_MAP_FEATURES', 2):
+            data = self.client.get(world).get_json()
+        self.assertLessEqual(len(data['features']), 2)
+        self.assertEqual(data['total'], 3)
+
+    def test_bbox_required(self):
+        resp = self.client.get('/api/map-clusters?zoom=3')
+        self.assertEqual(resp.status_code, 400)
+        for bbox in ('nan,0,10,10', '0,0,inf,10', '-inf,0,10,10'):
+            self.assertEqual(self.client.get(f'/api/map-clusters?bbox={bbox}&zoom=3').status_code, 400)
+
+    def test_zoom_is_a_number(self):
+        self.create_disparu('dakar1', 14.69, -17.44)
+        self.create_disparu('dakar2', 14.70, -17.45)
+        fractional = self.client.get('/api/map-clusters?bbox=-30,0,0,30&zoom=4.7').get_json()
+        self.assertEqual(fractional, self.client.get('/api/map-clusters?bbox=-30,0,0,30&zoom=4').get_json())
+        for zoom in ('abc', 'nan', 'inf'):
+            self.assertEqual(self.client.get(f'/api/map-clusters?bbox=-30,0,0,30&zoom={zoom}').status_code, 400)
+
+    def test_filters_outside_the_map_choices(self):
+        # Each accepted filter set keeps a hierarchy per worker: arbitrary values would pile up
+        for query in ('type=robot', 'country=Atlantis', 'type=animal&country=senegal'):
+            resp = self.client.get(f'/api/map-clusters?bbox=-30,0,0,30&zoom=4&{query}')
+            self.assertEqual(resp.status_code, 400)
+            self.assertEqual(self.client.get(f'/api/tiles/4/7/7?{query}').status_code, 400)
+        self.assertEqual(self.client.get('/api/map-clusters?bbox=-30,0,0,30&zoom=4&type=&country=Senegal').status_code,
+                         200)
+
+    def test_admin_map_offers_only_accepted_countries(self):
+        self.create_disparu('dakar1', 14.69, -17.44)
+        france = self.create_disparu('paris1', 48.85, 2.35)
+        france.country = 'France'
+        db.session.commit()
+        self.assertEqual(get_map_data()['countries'], ['Senegal'])
+
+
+if __name__ == '__main__':
+    unittest.main()
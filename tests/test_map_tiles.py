@@ -0,0 +1,131 @@
+import gzip
+import os
+import unittest
+from datetime import datetime
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+from app import create_app
+from models import db, Disparu
+from algorithms.map_clusters import invalidate_cluster_hierarchies
+from utils.tiles import TILE_EXTENT, decode_tile, encode_tile, tile_bounds
+
+
+class TestTileEncoding(unittest.TestCase):
+    def test_roundtrip(self):
+        z, x, y = 10, 462, 469  # Dakar
+        min_lat, max_lat, min_lng, max_lng = tile_bounds(z, x, y)
+        self.assertTrue(min_lat < 14.69 < max_lat and min_lng < -17.44 < max_lng)
+
+        features = [
+            {'latitude': 14.69, 'longitude': -17.44, 'count': 1, 'expansion_zoom': 17,
+             'public_id': 'ABC123', 'status': 'missing', 'person_type': 'adult', 'country': 'Sénégal'},
+            {'latitude': 14.70, 'longitude': -17.45, 'count': 12, 'expansion_zoom': 12},
+            {'latitude': 48.85, 'longitude': 2.35, 'count': 1, 'public_id': 'OUT001'},
+        ]
+        tile = decode_tile(encode_tile(z, x, y, features))
+
+        self.assertEqual((tile['z'], tile['x'], tile['y']), (z, x, y))
+        self.assertEqual(len(tile['features']), 2)
+        point, cluster = tile['features']
+        self.assertEqual(point['public_id'], 'ABC123')
+        self.assertEqual(point['country'], 'Sénégal')
+        self.assertEqual(point['status'], 'missing')
+        self.assertIsNone(cluster['public_id'])
+        self.assertEqual((cluster['count'], cluster['expansion_zoom']), (12, 12))
+
+        # Quantization error stays below one step of the tile
+        step = (max_lng - min_lng) / TILE_EXTENT
+        self.assertAlmostEqual(point['longitude'], -17.44, delta=step)
+        self.assertAlmostEqual(point['latitude'], 14.69, delta=step)
+
+
+class TestTileEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def create_disparu(self, public_id, lat, lng, person_type='adult'):
+        d = Disparu(
+            public_id=public_id, person_type=person_type, first_name='Test', last_name='Tile',
+            age=30, sex='M', country='Senegal', city='Dakar', physical_description='.',
+            disappearance_date=datetime.now(), circumstances='.',
+            latitude=lat, longitude=lng, status='missing'
+        )
+        db.session.add(d)
+        db.session.commit()
+        return d
+
+    def test_tile_content_and_revalidation(self):
+        self.create_disparu('dak001', 14.6905, -17.4405)
+        self.create_disparu('dak002', 14.6908, -17.4402, person_type='animal')
+
+        resp = self.client.get('/api/tiles/2/1/1', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertIn('max-age', resp.headers['Cache-Control'])
+        tile = decode_tile(gzip.decompress(resp.data))
+        self.assertEqual([f['count'] for f in tile['features']], [2])
+
+        resp = self.client.get('/api/tiles/17/59186/60127')
+        tile = decode_tile(resp.data)
+        self.assertCountEqual([f['public_id'] for f in tile['features']], ['dak001', 'dak002'])
+        self.assertCountEqual([f['person_type'] for f in tile['features']], ['adult', 'animal'])
+
+        resp = self.client.get('/api/tiles/17/59186/60127?type=animal')
+        self.assertEqual([f['public_id'] for f in decode_tile(resp.data)['features']], ['dak002'])
+
+        etag = self.client.get('/api/tiles/2/1/1').headers['ETag']
+        resp = self.client.get('/api/tiles/2/1/1', headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 304)
+
+        # The gzip and identity bodies carry distinct tags, both revalidate
+        gz_etag = self.client.get('/api/tiles/2/1/1', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+        self.assertNotEqual(gz_etag, etag)
+        resp = self.client.get('/api/tiles/2/1/1', headers={'If-None-Match': gz_etag, 'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.headers['ETag'], gz_etag)
+
+        # A new case in the tile changes its version
+        self.create_disparu('dak003', 14.70, -17.45)
+        resp = self.client.get('/api/tiles/2/1/1', headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(decode_tile(resp.data)['features'][0]['count'], 3)
+
+    def test_etag_follows_the_served_clusters(self):
+        self.create_disparu('dak001', 14.6905, -17.4405)
+        etag = self.client.get('/api/tiles/2/1/1').headers['ETag']
+
+        # Written through another worker: this one's hierarchy has not seen it yet,
+        # so the tile and its ETag stay those of the clusters it serves
+        db.session.execute(db.text(
+            "INSERT INTO disparus_flask (public_id, person_type, first_name, last_name, age, sex, country, city, "
+            "physical_description, disappearance_date, circumstances, latitude, longitude, status) VALUES "
+            "('dak002', 'adult', 'Test', 'Tile', 30, 'M', 'Senegal', 'Dakar', '.', '2026-01-01', '.', "
+            "14.69, -17.44, 'missing')"
+        ))
+        db.session.commit()
+        self.assertEqual(self.client.get('/api/tiles/2/1/1', headers={'If-None-Match': etag}).status_code, 304)
+
+        # Once the hierarchy is rebuilt, the new tile gets a new ETag
+        invalidate_cluster_hierarchies()
+        resp = self.client.get('/api/tiles/2/1/1', headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp.headers['ETag'], etag)
+        self.assertEqual(decode_tile(resp.data)['features'][0]['count'], 2)
+
+    def test_out_of_range(self):
+        resp = self.client.get('/api/tiles/3/8/0')
+        self.assertEqual(resp.status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
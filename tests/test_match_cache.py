@@ -0,0 +1,135 @@
+import os
+import time
+import unittest
+from datetime import datetime
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+from app import create_app
+from models import db, Disparu
+from algorithms import match_cache
+from algorithms.match_cache import MatchCache, configure_match_cache, get_match_cache
+from algorithms.matching import find_potential_matches
+
+
+class TestMatchCache(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        match_cache.invalidate_match_cache()
+
+    def tearDown(self):
+        configure_match_cache(self.app.config['MATCH_CACHE_SIZE'], self.app.config['MATCH_CACHE_TTL'])
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def disparu(self, public_id, first_name, last_name, city='Kinshasa', age=30, description='Grand, chemise rouge'):
+        d = Disparu(
+            public_id=public_id, person_type='adult', first_name=first_name, last_name=last_name,
+            age=age, sex='M', country='Congo', city=city, physical_description=description,
+            disappearance_date=datetime.now(), circumstances='.'
+        )
+        db.session.add(d)
+        db.session.commit()
+        return d
+
+    def ids(self, disparu):
+        return [m['disparu']['id'] for m in find_potential_matches(disparu)]
+
+    def assertCached(self, disparu, expected):
+        cache = get_match_cache()
+        hits = cache.hits
+        self.assertEqual(self.ids(disparu), expected)
+        self.assertEqual(cache.hits, hits + 1)
+
+    def assertRecomputed(self, disparu, expected):
+        cache = get_match_cache()
+        misses = cache.misses
+        self.assertEqual(self.ids(disparu), expected)
+        self.assertEqual(cache.misses, misses + 1)
+
+    def test_served_until_a_candidate_changes(self):
+        jean = self.disparu('CACHE1', 'Jean', 'Dupont')
+        variant = self.disparu('CACHE2', 'Jéan', 'Dupond', city='Goma', age=31)
+
+        self.assertRecomputed(jean, [variant.id])
+        self.assertCached(jean, [variant.id])
+
+        # Callers get their own copies
+        matches = find_potential_matches(jean)
+        matches[0]['disparu']['first_name'] = 'X'
+        matches[0]['match_reasons'].clear()
+        cached = find_potential_matches(jean)
+        self.assertEqual(cached[0]['disparu']['first_name'], 'Jéan')
+        self.assertTrue(cached[0]['match_reasons'])
+
+        # A case blocking with nothing of Jean's leaves the list alone
+        self.disparu('CACHE3', 'Awa', 'Ndiaye', city='Dakar', age=60, description='Petite, robe jaune')
+        self.assertCached(jean, [variant.id])
+
+        # A new lookalike, an edited candidate, a deleted one
+        swapped = self.disparu('CACHE4', 'Dupont', 'Jean')
+        self.assertRecomputed(jean, [swapped.id, variant.id])
+        variant.first_name = 'Paul'
+        variant.last_name = 'Kabila'
+        variant.physical_description = 'Petite, robe jaune'
+        db.session.commit()
+        self.assertRecomputed(jean, [swapped.id])
+        db.session.delete(swapped)
+        db.session.commit()
+        self.assertRecomputed(jean, [])
+        self.assertCached(jean, [])
+
+    def test_own_edits_and_bulk_writes(self):
+        jean = self.disparu('CACHE1', 'Jean', 'Dupont')
+        variant = self.disparu('CACHE2', 'Jéan', 'Dupond', city='Goma', age=31)
+        self.ids(jean)
+
+        # Not served while the case has uncommitted changes
+        jean.first_name = 'Pierre'
+        jean.physical_description = 'Petite, robe jaune'
+        hits = get_match_cache().hits
+        self.assertEqual(self.ids(jean), [])
+        self.assertEqual(get_match_cache().hits, hits)
+        db.session.rollback()
+        self.assertCached(jean, [variant.id])
+
+        jean.first_name, jean.physical_description = 'Pierre', 'Petite, robe jaune'
+        db.session.commit()
+        self.assertRecomputed(jean, [])
+        jean.first_name, jean.physical_description = 'Jean', 'Grand, chemise rouge'
+        db.session.commit()
+        self.assertRecomputed(jean, [variant.id])
+
+        version = get_match_cache().version
+        Disparu.query.filter_by(id=variant.id).update({Disparu.age: 70}, synchronize_session=False)
+        db.session.commit()
+        self.assertEqual(get_match_cache().version, version + 1)
+        self.assertRecomputed(jean, [variant.id])
+
+    def test_size_and_ttl(self):
+        cases = [self.disparu(f'CACHE{i}', 'Jean', f'Dupont{i}') for i in range(4)]
+        configure_match_cache(maxsize=2, ttl=300)
+        for case in cases:
+            self.ids(case)
+        self.assertEqual(list(get_match_cache().entries), [cases[2].id, cases[3].id])
+
+        configure_match_cache(maxsize=2, ttl=0)
+        self.ids(cases[3])
+        time.sleep(0.01)
+        self.assertRecomputed(cases[3], [case.id for case in cases[:3]])
+
+    def test_stale_results_are_not_stored(self):
+        cache = MatchCache()
+        jean = self.disparu('CACHE1', 'Jean', 'Dupont')
+        version = cache.version
+        cache.clear()
+        cache.put(jean, [], [], version, 0)
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+from app import create_app
+from models import db, Disparu, MatchCandidate, DedupeRun
+from services import dedupe, job_queue
+from services.job_queue import JobQueue, job_handler
+from commands import jobs_run_command
+
+
+class TestMatchJobs(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        self.queue = self.app.extensions['job_queue']
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def disparu(self, public_id, first_name, last_name, city='Kinshasa', age=30, description='Grand, chemise rouge'):
+        d = Disparu(
+            public_id=public_id, person_type='adult', first_name=first_name, last_name=last_name,
+            age=age, sex='M', country='Congo', city=city, physical_description=description,
+            disappearance_date=datetime.now(), circumstances='.'
+        )
+        db.session.add(d)
+        db.session.commit()
+        return d
+
+    def pairs(self):
+        return sorted((c.disparu_id, c.candidate_id) for c in MatchCandidate.query.all())
+
+    def test_writes_queue_jobs_that_store_matches(self):
+        jean = self.disparu('JOB001', 'Jean', 'Dupont')
+        variant = self.disparu('JOB002', 'Jéan', 'Dupond', city='Goma', age=31)
+        self.assertEqual(self.queue.stats(), {'pending': 2})
+        self.assertEqual(self.pairs(), [])
+
+        self.assertEqual(self.queue.run_pending(), 2)
+        self.assertEqual(self.queue.stats(), {})
+        self.assertEqual(self.pairs(), [(jean.id, variant.id)])
+
+        # Edited away from Jean, then deleted
+        variant.first_name, variant.last_name = 'Paul', 'Kabila'
+        variant.physical_description = 'Petite, robe jaune'
+        db.session.commit()
+        self.queue.run_pending()
+        self.assertEqual(self.pairs(), [])
+
+        variant.first_name, variant.last_name = 'Jéan', 'Dupond'
+        variant.physical_description = 'Grand, chemise rouge'
+        db.session.commit()
+        self.queue.run_pending()
+        self.assertEqual(self.pairs(), [(jean.id, variant.id)])
+
+        db.session.delete(variant)
+        db.session.commit()
+        self.assertEqual(self.queue.run_pending(), 1)
+        self.assertEqual(self.pairs(), [])
+
+    def test_jobs_keep_the_pairs_of_dedupe_runs(self):
+        jean = self.disparu('JOB001', 'Jean', 'Dupont')
+        variant = self.disparu('JOB002', 'Jéan', 'Dupond', city='Goma', age=31)
+        self.queue.run_pending()
+        score = MatchCandidate.query.one().score
+
+        # A pair the batch found from the other case outlives an edit
+        with patch('services.dedupe.MAX_MATCHES', 0):
+            variant.city = 'Kinshasa'
+            db.session.commit()
+            self.queue.run_pending()
+        self.assertEqual(self.pairs(), [(jean.id, variant.id)])
+        self.assertGreater(MatchCandidate.query.one().score, score)
+
+        # Stored meanwhile by another job: rescored, not a duplicate row
+        dedupe._upsert_pairs([{'disparu_id': jean.id, 'candidate_id': variant.id, 'score': 1, 'reasons': []}])
+        db.session.commit()
+        db.session.expire_all()
+        self.assertEqual(MatchCandidate.query.one().score, 1)
+
+    def test_failed_lookups_keep_the_pairs_and_retry(self):
+        jean = self.disparu('JOB001', 'Jean', 'Dupont')
+        variant = self.disparu('JOB002', 'Jéan', 'Dupond', city='Goma', age=31)
+        self.queue.run_pending()
+
+        variant.age = 32
+        db.session.commit()
+        with patch('services.dedupe._blocked_candidate_ids', side_effect=RuntimeError('index unavailable')) as lookup:
+            self.queue.run_pending()
+        self.assertEqual(lookup.call_count, job_queue.MAX_ATTEMPTS)
+        self.assertEqual(self.queue.stats(), {'failed': 1})
+        self.assertEqual(self.pairs(), [(jean.id, variant.id)])
+
+    def test_jobs_wait_for_running_dedupe(self):
+        self.disparu('JOB001', 'Jean', 'Dupont')
+        db.session.add(DedupeRun(mode='full', status='running'))
+        db.session.commit()
+        self.disparu('JOB002', 'Jéan', 'Dupond', city='Goma', age=31)
+        self.assertEqual(self.queue.run_pending(), 2)
+        # Left to the run, which stores its own pairs
+        self.assertEqual(self.pairs(), [])
+
+    def test_waiting_jobs_are_not_queued_twice(self):
+        jean = self.disparu('JOB001', 'Jean', 'Dupont')
+        for age in (31, 32, 33):
+            jean.age = age
+            db.session.commit()
+        self.assertEqual(self.queue.stats(), {'pending': 1})
+
+    def test_failing_jobs_are_retried_then_kept(self):
+        calls = []
+
+        @job_handler('test_failing')
+        def failing(value):
+            calls.append(value)
+            raise RuntimeError('boom')
+
+        try:
+            self.queue.enqueue('test_failing', {'value': 1})
+            for _ in range(job_queue.MAX_ATTEMPTS):
+                self.queue.run_pending()
+            self.assertEqual(calls, [1] * job_queue.MAX_ATTEMPTS)
+            self.assertEqual(self.queue.stats(), {'failed': 1})
+            self.assertEqual(self.queue.run_pending(), 0)
+        finally:
+            job_queue._HANDLERS.pop('test_failing')
+
+    def test_queue_file_outlives_the_process(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'jobs.db')
+            JobQueue(self.app, path, workers=0).enqueue('match_case', {'disparu_id': 1})
+            queue = JobQueue(self.app, path, workers=0)
+            self.assertEqual(queue.stats(), {'pending': 1})
+            self.assertEqual(queue.run_pending(), 1)
+            self.assertEqual(queue.stats(), {})
+
+    def test_worker_threads(self):
+        jean = self.disparu('JOB001', 'Jean', 'Dupont')
+        variant = self.disparu('JOB002', 'Jéan', 'Dupond', city='Goma', age=31)
+        queue = JobQueue(self.app, workers=1)
+        self.app.extensions['job_queue'] = queue
+        try:
+            queue.enqueue('match_case', {'disparu_id': jean.id})
+            queue.start()
+            deadline = time.time() + 30
+            while queue.stats() and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(queue.stats(), {})
+            db.session.expire_all()
+            self.assertEqual(self.pairs(), [(jean.id, variant.id)])
+        finally:
+            self.app.extensions['job_queue'] = self.queue
+
+    def test_duplicates_shown_to_moderators_only(self):
+        self.disparu('JOB001', 'Jean', 'Dupont')
+        variant = self.disparu('JOB002', 'Jéan', 'Dupond', city='Goma', age=31)
+        self.queue.run_pending()
+
+        page = self.client.get('/disparu/JOB001').get_data(as_text=True)
+        self.assertNotIn('section-possible-duplicates', page)
+
+        with self.client.session_transaction() as sess:
+            sess['admin_logged_in'] = True
+        page = self.client.get('/disparu/JOB001').get_data(as_text=True)
+        self.assertIn('section-possible-duplicates', page)
+        self.assertIn('/disparu/JOB002', page)
+
+        page = self.client.get(f'/admin/disparu/{variant.id}/edit').get_data(as_text=True)
+        self.assertIn('JOB001', page)
+
+    def test_command(self):
+        self.disparu('JOB001', 'Jean', 'Dupont')
+        result = self.app.test_cli_runner().invoke(jobs_run_command)
+        self.assertIn('Jobs: 1 run, 0 failed', result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -14,6 +14,7 @@ from algorithms.matching import (
     compare_hashes,
     find_potential_matches
 )
+from algorithms.minhash import minhash_signature
 
 class TestMatching(unittest.TestCase):
 
@@ -66,10 +67,10 @@ class TestMatching(unittest.TestCase):
         h3 = "0000000000000000"
         self.assertLess(compare_hashes(h1, h3), 0.8)
 
-    @patch('algorithms.matching.or_')
+    @patch('algorithms.matching._blocked_candidate_ids')
     @patch('algorithms.matching.Disparu')
     @patch('algorithms.matching.compute_image_hash')
-    def test_find_potential_matches(self, mock_hash, MockDisparu, mock_or):
+    def test_find_potential_matches(self, mock_hash, MockDisparu, mock_blocked):
         mock_query = MagicMock()
         MockDisparu.query.filter.return_value = mock_query
 
@@ -85,6 +86,8 @@ class TestMatching(unittest.TestCase):
         d1.city = "Kinshasa"
         d1.physical_description = "Grand noir"
         d1.photo_url = "photo1.jpg"
+        d1.photo_hash = -1
+        d1.description_minhash = minhash_signature(d1.physical_description)
         d1.sex = "M"
 
         c1 = MagicMock()
@@ -96,20 +99,22 @@ class TestMatching(unittest.TestCase):
         c1.city = "Kinshasa"
         c1.physical_description = "Grand homme noir"
         c1.photo_url = "photo2.jpg"
+        c1.photo_hash = -1
+        c1.description_minhash = minhash_signature(c1.physical_description)
         c1.sex = "M"
         c1.to_dict.return_value = {'id': 2, 'score': 0}
 
-        mock_query.limit.return_value.all.return_value = [c1]
-
-        def side_effect(path):
-            if path == "photo1.jpg": return "ffffffffffffffff"
-            if path == "photo2.jpg": return "ffffffffffffffff"
-            return None
-        mock_hash.side_effect = side_effect
+        # Found by the name blocking index
+        mock_blocked.return_value = [2]
+        mock_query.all.return_value = [c1]
 
         matches = find_potential_matches(d1)
         self.assertEqual(len(matches), 1)
         self.assertGreater(matches[0]['score'], 80)
+        self.assertIn("Photo très similaire (100%)", matches[0]['match_reasons'])
+
+        # Stored hashes only: image files are never read on the request path
+        mock_hash.assert_not_called()
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,92 @@
+import os
+import random
+import tempfile
+import unittest
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+from app import create_app
+from models import db
+from algorithms.matching import hamming_similarity
+from scripts.matching_dataset import PERTURBATIONS, CaseGenerator, misspell, public_id
+from scripts.benchmark_matching import compare, run_benchmark
+
+
+class TestMatchingDataset(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.photo_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.photo_dir.cleanup()
+        self.app_context.pop()
+
+    def test_ground_truth(self):
+        cases, groups = CaseGenerator(self.photo_dir.name, seed=1).generate(500)
+        self.assertGreaterEqual(len(cases), 500)
+        self.assertEqual(len({case.public_id for case in cases}), len(cases))
+        self.assertTrue(all(len(case.public_id) == 6 for case in cases))
+        self.assertTrue(groups)
+
+        seen = set()
+        for group in groups:
+            self.assertIn(group.original, cases)
+            for duplicate, noise in zip(group.duplicates, group.perturbations):
+                self.assertIn(duplicate, cases)
+                self.assertTrue(noise)
+                self.assertTrue(set(noise) <= set(PERTURBATIONS))
+                seen.update(noise)
+                if 'photo' in noise:
+                    # Re-encoded, not copied: close but own file
+                    self.assertNotEqual(duplicate.photo_url, group.original.photo_url)
+                    self.assertGreater(hamming_similarity(duplicate.photo_hash, group.original.photo_hash), 0.8)
+                if 'age_drift' in noise:
+                    self.assertLessEqual(abs(duplicate.age - group.original.age), 3)
+                    self.assertNotEqual(duplicate.age, group.original.age)
+        self.assertEqual(seen, set(PERTURBATIONS))
+
+        # Same seed, same dataset
+        again, _ = CaseGenerator(self.photo_dir.name, seed=1).generate(500)
+        self.assertEqual([(c.first_name, c.last_name, c.age) for c in again],
+                         [(c.first_name, c.last_name, c.age) for c in cases])
+
+    def test_misspell_changes_the_name(self):
+        rng = random.Random(3)
+        for name in ['Jean', 'Tshisekedi', 'Ba', 'Philippe']:
+            self.assertNotEqual(misspell(rng, name), name)
+        self.assertEqual(public_id('S', 36), 'S00010')
+
+
+class TestMatchingBenchmark(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_report(self):
+        result = run_benchmark(300, queries=10, seed=5)
+        self.assertEqual(result['queries'], 10)
+        for metric in ('precision', 'recall', 'top1_accuracy'):
+            self.assertGreaterEqual(result[metric], 0)
+            self.assertLessEqual(result[metric], 1)
+        self.assertGreater(result['recall'], 0.5)
+        self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+        self.assertTrue(set(result['recall_by_perturbation']) <= set(PERTURBATIONS))
+
+        worse = dict(result, recall=result['recall'] - 0.1, p95_ms=result['p95_ms'] * 2)
+        lines = compare({'results': [worse]}, {'results': [result]})
+        self.assertIn(f"{result['records']} records, recall: {worse['recall']} -> {result['recall']} (better)", lines)
+        self.assertTrue(any(line.startswith(f"{result['records']} records, p95_ms") and line.endswith('(better)')
+                            for line in lines))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import os
+import unittest
+from datetime import datetime
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+from app import create_app
+from models import db, Disparu
+from algorithms import name_index
+from algorithms.name_index import NameIndex
+from algorithms.phonetics import fold_name, jaro_winkler, name_keys, name_similarity, phonetic_key
+from algorithms.matching import find_potential_matches
+
+
+class TestPhonetics(unittest.TestCase):
+    def test_transcription_variants_share_a_key(self):
+        groups = [
+            ('Mamadou', 'Mamadu'),
+            ('Ousmane', 'Usman', 'Osman'),
+            ('Philippe', 'Filipe'),
+            ('Tshisekedi', 'Chisekedi'),
+            ('Mohamed', 'Mouhamed', 'Mohammed', 'Muhammad'),
+            ('Kouassi', 'Kwasi'),
+            ('Djibril', 'Jibril'),
+            ('Dupont', 'Dupond'),
+            ('Ouattara', 'Watara'),
+            ('François', 'Fransois'),
+            ('Nkurunziza', 'Nkurunzisa'),
+        ]
+        for group in groups:
+            self.assertEqual(len({phonetic_key(name) for name in group}), 1, group)
+        self.assertNotEqual(phonetic_key('Kabila'), phonetic_key('Kabongo'))
+        self.assertEqual(phonetic_key(''), '')
+
+    def test_fold_and_keys(self):
+        self.assertEqual(fold_name("  Jean-Éric N'Diaye "), 'jean eric n diaye')
+        keys = name_keys('Jean', 'Dupont')
+        self.assertIn('pDPN', keys)
+        self.assertIn('t  j', keys)
+        self.assertEqual(name_keys('Jean', 'Dupont'), name_keys('DUPONT', 'jean'))
+
+    def test_jaro_winkler(self):
+        self.assertAlmostEqual(jaro_winkler('martha', 'marhta'), 0.9611, places=4)
+        self.assertAlmostEqual(jaro_winkler('dixon', 'dicksonx'), 0.8133, places=4)
+        self.assertAlmostEqual(jaro_winkler('dwayne', 'duane'), 0.84, places=4)
+        self.assertEqual(jaro_winkler('abc', 'abc'), 1.0)
+        self.assertEqual(jaro_winkler('', 'abc'), 0.0)
+
+        self.assertEqual(name_similarity('Jean', 'Dupont', 'Dupont', 'Jean'), 1.0)
+        self.assertEqual(name_similarity('Jean', 'Dupont', 'Jéan', 'DUPONT'), 1.0)
+        self.assertGreater(name_similarity('Jean', 'Dupont', 'Jean', 'Dupond'), 0.92)
+        self.assertLess(name_similarity('Jean', 'Dupont', 'Paul', 'Kabila'), 0.6)
+
+
+class TestNameIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = NameIndex()
+        self.index.load([
+            (1, 'Jean', 'Dupont'),
+            (2, 'Mamadou', 'Diallo'),
+            (3, 'Ousmane', 'Traoré'),
+            (4, 'Paul', 'Kabila'),
+            (5, 'Marie', 'Kabongo'),
+            (6, None, None),
+        ])
+
+    def ids(self, *name, **kwargs):
+        return [point_id for _, point_id in self.index.search(*name, **kwargs)]
+
+    def test_ranked_candidates(self):
+        self.assertEqual(self.ids('Jean', 'Dupond')[0], 1)
+        self.assertEqual(self.ids('Mamadu', 'Dialo')[0], 2)
+        self.assertEqual(self.ids('Traore', 'Usman')[0], 3)
+        self.assertNotIn(4, self.ids('Jean', 'Dupont'))
+        self.assertEqual(self.ids('', ''), [])
+        self.assertEqual(self.ids('Jean', 'Dupont', exclude={1}), [])
+        self.assertEqual(len(self.index), 5)
+
+        scores = self.index.search('Jean', 'Dupont')
+        self.assertAlmostEqual(scores[0][0], 1.0)
+
+    def test_incremental_updates(self):
+        self.index.upsert(7, 'Jean', 'Dupond')
+        self.index.upsert(1, 'Pierre', 'Martin')
+        self.index.remove(2)
+
+        self.assertEqual(set(self.ids('Jean', 'Dupont')), {7})
+        self.assertEqual(self.ids('Pierre', 'Martin'), [1])
+        self.assertEqual(self.ids('Mamadou', 'Diallo'), [])
+
+        for point_id in range(100, 100 + name_index.MIN_REBUILD_THRESHOLD + 10):
+            self.index.upsert(point_id, 'Awa', 'Ndiaye')
+        # Folded into the postings past the threshold
+        self.assertLess(len(self.index.pending), 20)
+        self.assertEqual(len(self.ids('Awa', 'Ndiaye', limit=1000)), name_index.MIN_REBUILD_THRESHOLD + 10)
+        self.assertEqual(self.ids('Pierre', 'Martin'), [1])
+        self.assertIn(7, self.ids('Jean', 'Dupont'))
+
+
+class TestBlockedMatching(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        name_index.invalidate_name_index()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def disparu(self, public_id, first_name, last_name, city='Kinshasa', country='Congo', age=30,
+                description='Grand homme noir'):
+        return Disparu(
+            public_id=public_id, person_type='adult', first_name=first_name, last_name=last_name,
+            age=age, sex='M', country=country, city=city, physical_description=description,
+            disappearance_date=datetime.now(), circumstances='.'
+        )
+
+    def test_misspelled_name_in_another_city(self):
+        target = self.disparu('NAME01', 'Jean', 'Dupont')
+        db.session.add(target)
+        # More same-country records than the old 500 candidate cap
+        db.session.add_all(
+            self.disparu(f'FILL{i:03d}', 'Paul', f'Kabila{i}', city='Lubumbashi', age=60, description='Petite robe jaune')
+            for i in range(600)
+        )
+        db.session.commit()
+
+        # Added after the index is built: picked up through the change feed
+        self.assertEqual(find_potential_matches(target), [])
+        variant = self.disparu('NAME02', 'Jéan', 'Dupond', city='Goma', age=31)
+        swapped = self.disparu('NAME03', 'Dupont', 'Jean', city='Kisangani', country='Rwanda', age=29)
+        db.session.add_all([variant, swapped])
+        db.session.commit()
+
+        matches = find_potential_matches(target)
+        self.assertEqual({m['disparu']['id'] for m in matches}, {variant.id, swapped.id})
+        for match in matches:
+            self.assertTrue(any(reason.startswith('Nom très similaire') for reason in match['match_reasons']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import os
+import unittest
+from datetime import datetime, timedelta
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+from app import create_app
+from models import db, Disparu
+from utils.pagination import MAX_PAGE_SIZE, InvalidCursor, decode_cursor, encode_cursor, page_size
+from utils.search import build_search_index, ranked_search
+
+
+class TestCursors(unittest.TestCase):
+    def test_round_trip(self):
+        created_at = datetime(2026, 3, 1, 12, 30, 15, 250)
+        cursor = encode_cursor(created_at, 42)
+        self.assertNotIn('=', cursor)
+        self.assertEqual(decode_cursor(cursor, datetime, int), (created_at, 42))
+        self.assertEqual(decode_cursor(encode_cursor(0.1 + 0.2, 7), float, int), (0.1 + 0.2, 7))
+
+    def test_invalid(self):
+        for cursor in ['', 'not a cursor', encode_cursor(1, 2, 3), encode_cursor('yesterday', 1)]:
+            with self.assertRaises(InvalidCursor):
+                decode_cursor(cursor, datetime, int)
+
+    def test_page_size(self):
+        self.assertEqual(page_size(None), 20)
+        self.assertEqual(page_size(None, default=MAX_PAGE_SIZE), MAX_PAGE_SIZE)
+        self.assertEqual(page_size(10 ** 6), MAX_PAGE_SIZE)
+        self.assertEqual(page_size(-5), 1)
+
+
+class PaginationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.session.execute(db.text("DROP TABLE IF EXISTS disparus_fts_vocab"))
+        db.session.execute(db.text("DROP TABLE IF EXISTS disparus_fts"))
+        db.session.commit()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_cases(self, count):
+        # Two cases per second: created_at ties, broken by id
+        start = datetime(2026, 1, 1)
+        for n in range(count):
+            db.session.add(Disparu(
+                public_id=f'PAG{n:03d}', person_type='adult', first_name='Jean', last_name='Dupont',
+                age=30, sex='M', country='Congo', city='Kinshasa', physical_description='.',
+                disappearance_date=start, circumstances='.', created_at=start + timedelta(seconds=n // 2)
+            ))
+        db.session.commit()
+
+    def pages(self, url, size):
+        """Public ids of every page of url, following X-Next-Cursor"""
+        pages, cursor = [], None
+        while True:
+            resp = self.client.get(url + f'&limit={size}' + (f'&cursor={cursor}' if cursor else ''))
+            self.assertEqual(resp.status_code, 200)
+            pages.append([d['public_id'] for d in resp.get_json()])
+            cursor = resp.headers.get('X-Next-Cursor')
+            if cursor is None:
+                self.assertNotIn('Link', resp.headers)
+                return pages
+            self.assertIn(f'cursor={cursor}', resp.headers['Link'])
+            self.assertTrue(resp.headers['Link'].endswith('rel="next"'))
+
+    def check_ranked_pages(self):
+        self.add_cases(6)
+        for n, name in enumerate(['Dupond', 'Dupontel', 'Dupond']):
+            db.session.add(Disparu(
+                public_id=f'TYP{n:03d}', person_type='adult', first_name='Jean', last_name=name, age=30,
+                sex='M', country='Congo', city='Goma', physical_description='.',
+                disappearance_date=datetime(2026, 1, 1), circumstances='.'
+            ))
+        db.session.commit()
+
+        ranked = [d.public_id for d, _ in ranked_search('jean dupont', limit=MAX_PAGE_SIZE)]
+        # Exact matches, then the longer word, then the typos
+        self.assertEqual(len(ranked), 9)
+        self.assertEqual(ranked[6:], ['TYP001', 'TYP002', 'TYP000'])
+        for size in (1, 2, 4):
+            pages = self.pages('/api/search?q=jean%20dupont', size)
+            self.assertEqual(sum(pages, []), ranked)
+        self.assertEqual(self.pages('/api/search?q=jean%20dupont&fuzzy=0', 4), [ranked[:4], ranked[4:7]])
+
+        # Filtered searches resume after the cursor too
+        first = ranked_search('jean dupont', {'city': 'Goma'}, limit=2)
+        last, score = first[-1]
+        rest = ranked_search('jean dupont', {'city': 'Goma'}, after=(score, last.id))
+        self.assertEqual([d.public_id for d, _ in first + rest], ['TYP001', 'TYP002', 'TYP000'])
+
+
+class TestListPagination(PaginationTestCase):
+    def test_newest_first(self):
+        self.add_cases(7)
+        newest = [d.public_id for d in Disparu.query.order_by(Disparu.created_at.desc(), Disparu.id.desc())]
+        pages = self.pages('/api/disparus?status=missing', 3)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), newest)
+
+        # An exact multiple of the page size ends without an empty page
+        self.assertEqual([len(page) for page in self.pages('/api/disparus?status=missing', 7)], [7])
+
+    def test_max_page_size(self):
+        self.add_cases(MAX_PAGE_SIZE + 1)
+        resp = self.client.get('/api/disparus?limit=100000')
+        self.assertEqual(len(resp.get_json()), MAX_PAGE_SIZE)
+        self.assertIn('X-Next-Cursor', resp.headers)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/disparus?cursor=abc').status_code, 400)
+        self.assertEqual(self.client.get('/api/search?q=jean&cursor=abc').status_code, 400)
+
+    def test_nearest_first(self):
+        self.add_cases(5)
+        for n, d in enumerate(Disparu.query.order_by(Disparu.id)):
+            # Two cases at each distance
+            d.latitude, d.longitude = -4.3 + (n // 2) * 0.1, 15.3
+        db.session.commit()
+        pages = self.pages('/api/disparus?lat=-4.3&lng=15.3', 2)
+        self.assertEqual(sum(pages, []), ['PAG000', 'PAG001', 'PAG002', 'PAG003', 'PAG004'])
+
+    def test_composite_index(self):
+        indexes = {idx['name']: idx['column_names'] for idx in db.inspect(db.engine).get_indexes('disparus_flask')}
+        self.assertEqual(indexes['ix_disparus_flask_created_at_id'], ['created_at', 'id'])
+        plan = db.session.execute(db.text(
+            "EXPLAIN QUERY PLAN SELECT id FROM disparus_flask WHERE (created_at, id) < (:created_at, :id) "
+            "ORDER BY created_at DESC, id DESC LIMIT 20"
+        ), {'created_at': '2026-01-01 00:00:00', 'id': 10}).all()
+        self.assertIn('ix_disparus_flask_created_at_id', ' '.join(row[-1] for row in plan))
+
+    def test_search_page(self):
+        self.add_cases(5)
+        page = self.client.get('/recherche?limit=2').get_data(as_text=True)
+        self.assertIn('data-testid="link-next-page"', page)
+        self.assertIn('PAG004', page)
+        self.assertNotIn('PAG002', page)
+
+        next_url = page.split('data-testid="link-next-page"')[0].rsplit('href="', 1)[1].split('"')[0]
+        page = self.client.get(next_url.replace('&amp;', '&')).get_data(as_text=True)
+        self.assertIn('PAG002', page)
+        self.assertNotIn('PAG004', page)
+
+        # A broken cursor starts over
+        resp = self.client.get('/recherche?q=jean&cursor=abc')
+        self.assertEqual(resp.status_code, 302)
+        self.assertNotIn('cursor', resp.headers['Location'])
+
+
+class TestMemoryRankedPagination(PaginationTestCase):
+    def test_ranked_pages(self):
+        self.check_ranked_pages()
+
+
+class TestSqliteFtsRankedPagination(PaginationTestCase):
+    def test_ranked_pages(self):
+        build_search_index()
+        self.check_ranked_pages()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+from PIL import Image
+
+from app import create_app
+from models import db, Disparu
+from algorithms.matching import compute_image_hash, hamming_similarity, hash_to_int
+from commands import hash_backfill_command
+from services.data_manager import restore_from_json
+
+
+def gradient_png(path, reverse=False):
+    img = Image.new('L', (64, 64))
+    img.putdata([(255 - x * 4) if reverse else x * 4 for y in range(64) for x in range(64)])
+    img.save(path)
+
+
+class TestPhotoHash(unittest.TestCase):
+    def test_signed_64_bit(self):
+        self.assertEqual(hash_to_int('ffffffffffffffff'), -1)
+        self.assertEqual(hash_to_int('7fffffffffffffff'), 2 ** 63 - 1)
+        self.assertEqual(hash_to_int('0000000000000001'), 1)
+        self.assertIsNone(hash_to_int(None))
+
+        self.assertEqual(hamming_similarity(-1, -1), 1.0)
+        self.assertEqual(hamming_similarity(-1, 0), 0.0)
+        self.assertEqual(hamming_similarity(-1, hash_to_int('7fffffffffffffff')), 1 - 1 / 64)
+        self.assertEqual(hamming_similarity(None, 0), 0.0)
+
+
+class TestPhotoHashColumns(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.upload_dir = tempfile.mkdtemp()
+        self.app.config['UPLOAD_FOLDER'] = self.upload_dir
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.upload_dir)
+
+    def create_disparu(self, public_id, photo_url=None):
+        d = Disparu(
+            public_id=public_id, person_type='adult', first_name='Test', last_name='Hash',
+            age=30, sex='M', country='Senegal', city='Dakar', physical_description='.',
+            disappearance_date=datetime.now(), circumstances='.', photo_url=photo_url
+        )
+        db.session.add(d)
+        db.session.commit()
+        return d
+
+    def test_backfill_command(self):
+        gradient_png(os.path.join(self.upload_dir, 'a.png'))
+        hashed = self.create_disparu('hash01', 'a.png')
+        missing = self.create_disparu('hash02', 'gone.png')
+        self.create_disparu('hash03')
+
+        result = self.app.test_cli_runner().invoke(hash_backfill_command)
+        self.assertIn('Photos: 1 hashed, 1 unreadable', result.output)
+        self.assertEqual(hashed.photo_hash, hash_to_int(compute_image_hash(os.path.join(self.upload_dir, 'a.png'))))
+        self.assertIsNone(missing.photo_hash)
+
+    def test_restore_keeps_or_recomputes_hash(self):
+        gradient_png(os.path.join(self.upload_dir, 'b.png'), reverse=True)
+        record = {
+            'first_name': 'A', 'last_name': 'B', 'age': 20, 'sex': 'M', 'person_type': 'adult',
+            'country': 'Senegal', 'city': 'Dakar', 'disappearance_date': '2024-01-01T00:00:00',
+            'physical_description': '.', 'status': 'missing'
+        }
+        backup = {'disparus': [
+            dict(record, public_id='REST01', photo_url='x.png', photo_hash=42),
+            dict(record, public_id='REST02', photo_url='b.png'),
+        ]}
+        restore_from_json(json.dumps(backup))
+
+        self.assertEqual(Disparu.query.filter_by(public_id='REST01').one().photo_hash, 42)
+        self.assertEqual(
+            Disparu.query.filter_by(public_id='REST02').one().photo_hash,
+            hash_to_int(compute_image_hash(os.path.join(self.upload_dir, 'b.png')))
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
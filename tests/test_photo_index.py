@@ -0,0 +1,185 @@
+import io
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+import numpy as np
+from PIL import Image
+
+from app import create_app
+from models import db, Disparu
+from algorithms import photo_index
+from algorithms.photo_index import PhotoHashIndex, max_distance_for
+from algorithms.matching import compute_photo_hash, find_similar_photos, hash_cache_stats
+
+
+def gradient_png(path, reverse=False):
+    img = Image.new('L', (64, 64))
+    img.putdata([(255 - x * 4) if reverse else x * 4 for y in range(64) for x in range(64)])
+    img.save(path)
+
+
+def signed(value):
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def flip_bits(value, count, rng):
+    value &= (1 << 64) - 1
+    for bit in rng.sample(range(64), count):
+        value ^= 1 << bit
+    return signed(value)
+
+
+def brute_force(pairs, query, max_distance, exclude=()):
+    return sorted(
+        (((h ^ query) & ((1 << 64) - 1)).bit_count(), point_id)
+        for point_id, h in pairs.items()
+        if point_id not in exclude and ((h ^ query) & ((1 << 64) - 1)).bit_count() <= max_distance
+    )
+
+
+class TestPhotoHashIndex(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(7)
+        np.random.seed(7)
+        count = 50000
+        self.pairs = dict(zip(
+            range(1, count + 1),
+            np.random.randint(-2 ** 63, 2 ** 63 - 1, size=count, dtype=np.int64).tolist()
+        ))
+        # Near duplicates so that searches have something to find
+        for point_id in range(count + 1, count + 200):
+            self.pairs[point_id] = flip_bits(self.pairs[self.rng.randrange(1, count)], self.rng.randint(0, 10), self.rng)
+        self.index = PhotoHashIndex()
+        self.index.load(self.pairs.items())
+
+    def test_threshold_to_distance(self):
+        self.assertEqual(max_distance_for(1.0), 0)
+        self.assertEqual(max_distance_for(0.9), 6)
+        self.assertEqual(max_distance_for(0.8), 12)
+        self.assertEqual(max_distance_for(0.0), 64)
+
+    def test_matches_brute_force(self):
+        for max_distance in (0, 3, 6, 8, 12):
+            for _ in range(10):
+                base = self.pairs[self.rng.randrange(1, len(self.pairs))]
+                query = flip_bits(base, self.rng.randint(0, max_distance), self.rng)
+                self.assertEqual(
+                    self.index.search(query, max_distance),
+                    brute_force(self.pairs, query, max_distance)
+                )
+
+    def test_incremental_updates(self):
+        query = self.pairs[10]
+        moved = flip_bits(query, 2, self.rng)
+
+        self.index.upsert(20, moved)
+        self.pairs[20] = moved
+        self.index.remove(10)
+        del self.pairs[10]
+        self.index.upsert(10 ** 6, query)
+        self.pairs[10 ** 6] = query
+        self.index.upsert(30, None)
+        del self.pairs[30]
+
+        self.assertEqual(len(self.index), len(self.pairs))
+        self.assertIn(20, self.index.tombstones)
+        self.assertEqual(self.index.search(query, 6), brute_force(self.pairs, query, 6))
+        self.assertEqual(self.index.search(query, 6, exclude={20}), brute_force(self.pairs, query, 6, exclude={20}))
+
+    def test_rebuild_folds_pending_writes(self):
+        updated = {}
+        for point_id in range(1, photo_index.MIN_REBUILD_THRESHOLD * 4, 2):
+            updated[point_id] = flip_bits(self.pairs[point_id], 1, self.rng)
+            self.index.upsert(point_id, updated[point_id])
+        self.pairs.update(updated)
+
+        # The buffer never grows past the threshold
+        self.assertLessEqual(len(self.index.pending), max(photo_index.MIN_REBUILD_THRESHOLD, len(self.pairs) // 16) + 1)
+        for point_id in (1, 101, 2001):
+            query = self.pairs[point_id]
+            self.assertEqual(self.index.search(query, 8), brute_force(self.pairs, query, 8))
+
+
+class TestFindSimilarPhotos(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.tmp_dir = tempfile.mkdtemp()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        photo_index.invalidate_photo_index()
+        self.client = self.app.test_client()
+
+        self.photo = os.path.join(self.tmp_dir, 'photo.png')
+        gradient_png(self.photo)
+        self.other = os.path.join(self.tmp_dir, 'other.png')
+        gradient_png(self.other, reverse=True)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.tmp_dir)
+
+    def create_disparu(self, public_id, photo_hash):
+        d = Disparu(
+            public_id=public_id, person_type='adult', first_name='Test', last_name='Photo',
+            age=30, sex='M', country='Senegal', city='Dakar', physical_description='.',
+            disappearance_date=datetime.now(), circumstances='.', photo_hash=photo_hash
+        )
+        db.session.add(d)
+        db.session.commit()
+        return d
+
+    def test_finds_duplicates_and_follows_writes(self):
+        same = self.create_disparu('SIM001', compute_photo_hash(self.photo))
+        self.create_disparu('SIM002', compute_photo_hash(self.other))
+        self.create_disparu('SIM003', None)
+
+        matches = find_similar_photos(self.photo)
+        self.assertEqual([m['disparu']['id'] for m in matches], [same.id])
+        self.assertEqual(matches[0]['distance'], 0)
+        self.assertEqual(matches[0]['similarity'], 1.0)
+
+        # Writes after the index is built are picked up through the change feed
+        late = self.create_disparu('SIM004', compute_photo_hash(self.photo))
+        self.assertEqual({m['disparu']['id'] for m in find_similar_photos(self.photo)}, {same.id, late.id})
+
+        db.session.delete(same)
+        db.session.commit()
+        self.assertEqual([m['disparu']['id'] for m in find_similar_photos(self.photo)], [late.id])
+
+    def test_admin_endpoints(self):
+        first = self.create_disparu('SIM001', compute_photo_hash(self.photo))
+        second = self.create_disparu('SIM002', compute_photo_hash(self.photo))
+
+        url = f'/admin/disparu/{first.id}/similar-photos'
+        self.assertNotEqual(self.client.get(url).status_code, 200)
+
+        with self.client.session_transaction() as sess:
+            sess['admin_logged_in'] = True
+
+        data = self.client.get(url).get_json()
+        self.assertEqual([m['disparu']['id'] for m in data['matches']], [second.id])
+
+        cached = hash_cache_stats()['size']
+        with open(self.photo, 'rb') as f:
+            response = self.client.post('/admin/similar-photos', data={'photo': (io.BytesIO(f.read()), 'query.png')},
+                                        content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({m['disparu']['id'] for m in response.get_json()['matches']}, {first.id, second.id})
+        # The temporary upload leaves nothing in the hash cache
+        self.assertEqual(hash_cache_stats()['size'], cached)
+
+        self.assertEqual(self.client.post('/admin/similar-photos', data={}).status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import unittest
+from datetime import datetime
+
+# Runs against a disposable local PostgreSQL, e.g.
+# TEST_POSTGRES_URL=postgresql://postgres@localhost/disparus_test
+POSTGRES_URL = os.environ.get('TEST_POSTGRES_URL')
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+from sqlalchemy import text
+from app import create_app
+from models import db, Disparu
+from init_db import setup_postgres_geo
+from utils.spatial import get_postgres_geo_backend
+
+
+@unittest.skipUnless(POSTGRES_URL, 'TEST_POSTGRES_URL not set')
+class TestPostgresGeo(unittest.TestCase):
+    def setUp(self):
+        # Config.init_app reads DATABASE_URL at app creation
+        previous_url = os.environ['DATABASE_URL']
+        os.environ['DATABASE_URL'] = POSTGRES_URL
+        try:
+            self.app = create_app('testing')
+        finally:
+            os.environ['DATABASE_URL'] = previous_url
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        setup_postgres_geo()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def create_disparu(self, public_id, lat, lng, status='missing'):
+        d = Disparu(
+            public_id=public_id, person_type='adult', first_name='Test', last_name='Geo',
+            age=30, sex='M', country='Kenya', city='Nairobi', physical_description='.',
+            disappearance_date=datetime.now(), circumstances='.',
+            latitude=lat, longitude=lng, status=status
+        )
+        db.session.add(d)
+        db.session.commit()
+        return d
+
+    def test_backend_detected(self):
+        self.assertIn(get_postgres_geo_backend(), ('postgis', 'earthdistance'))
+
+    def test_geog_follows_coordinates(self):
+        if get_postgres_geo_backend() != 'postgis':
+            self.skipTest('PostGIS not installed')
+        d = self.create_disparu('geog01', -1.28, 36.82)
+        geog = lambda: db.session.execute(text("SELECT ST_Y(geog::geometry) FROM disparus_flask WHERE id = :id"), {'id': d.id}).scalar()
+        self.assertAlmostEqual(geog(), -1.28)
+
+        d.latitude = -4.04
+        db.session.commit()
+        self.assertAlmostEqual(geog(), -4.04)
+
+        d.latitude = None
+        db.session.commit()
+        self.assertIsNone(geog())
+
+    def test_knn_and_bbox(self):
+        self.create_disparu('nairob', -1.28, 36.82)
+        self.create_disparu('mombas', -4.04, 39.67)
+        self.create_disparu('kisumu', -0.09, 34.77, status='found')
+        self.create_disparu('east01', 0, 179.5)
+        self.create_disparu('west01', 0, -179.5)
+
+        resp = self.client.get('/api/disparus/nearby?lat=-1.3&lng=36.8&limit=2')
+        data = resp.get_json()
+        self.assertEqual([d['public_id'] for d in data], ['nairob', 'mombas'])
+        self.assertLess(data[0]['distance'], 5)
+
+        resp = self.client.get('/api/disparus/nearby?lat=-1.3&lng=36.8&limit=5&status=found')
+        self.assertEqual([d['public_id'] for d in resp.get_json()], ['kisumu'])
+
+        resp = self.client.get('/api/disparus?lat=-4&lng=39.6&limit=3')
+        self.assertEqual([d['public_id'] for d in resp.get_json()], ['mombas', 'nairob', 'kisumu'])
+
+        resp = self.client.get('/api/map-data?min_lat=-2&max_lat=0&min_lng=36&max_lng=37')
+        self.assertEqual([d['public_id'] for d in resp.get_json()], ['nairob'])
+
+        resp = self.client.get('/api/map-data?min_lat=-1&max_lat=1&min_lng=179&max_lng=-179')
+        self.assertCountEqual([d['public_id'] for d in resp.get_json()], ['east01', 'west01'])
+
+
+if __name__ == '__main__':
+    unittest.main()
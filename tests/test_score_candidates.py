@@ -0,0 +1,79 @@
+import os
+import random
+import unittest
+from collections import namedtuple
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+from algorithms.matching import best_candidates, score_candidates, score_pair
+from algorithms.minhash import minhash_signature
+from algorithms.phonetics import jaro_winkler, jaro_winkler_many
+
+Record = namedtuple('Record', [
+    'id', 'first_name', 'last_name', 'age', 'sex', 'country', 'city',
+    'physical_description', 'description_minhash', 'photo_url', 'photo_hash',
+])
+
+FIRST_NAMES = ['Jean', 'Jéan', 'Jan', 'Marie', 'Mari', 'Dupont', '', None]
+LAST_NAMES = ['Dupont', 'Dupond', 'Jean', 'Kabila', 'Kabilla', '', None]
+CITIES = ['Kinshasa', 'kinshasa', 'Kinshassa', 'Goma', '', None]
+COUNTRIES = ['Congo', 'congo', 'Senegal', '', None]
+WORDS = ['grand', 'mince', 'chemise', 'rouge', 'bleu', 'pantalon', 'noir', 'lunettes']
+
+
+def variant(rng, names):
+    name = rng.choice(names)
+    if name and rng.random() < 0.5:
+        # Spelled some other way
+        i = rng.randrange(len(name))
+        name = name[:i] + rng.choice('aeiouklmnt') + name[i + 1:]
+    return name
+
+
+def random_record(rng, record_id):
+    description = ' '.join(rng.sample(WORDS, rng.randint(0, 5)))
+    photo = rng.random() < 0.6
+    base = -0x0123456789ABCDEF
+    return Record(
+        record_id, variant(rng, FIRST_NAMES), variant(rng, LAST_NAMES), rng.choice([None, 0, 20, 21, 23, 25, 30, 60]),
+        rng.choice(['M', 'F', '', None]), rng.choice(COUNTRIES), variant(rng, CITIES), description,
+        # Some rows predate the stored signatures
+        minhash_signature(description) if rng.random() < 0.8 else None,
+        'photo.jpg' if photo else None,
+        (base ^ rng.getrandbits(rng.choice([3, 12, 20]))) if photo and rng.random() < 0.9 else None,
+    )
+
+
+class TestScoreCandidates(unittest.TestCase):
+    def test_batched_jaro_winkler(self):
+        rng = random.Random(3)
+        alphabet = 'abcdeou '
+        for _ in range(300):
+            query = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 10)))
+            strings = [''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 14))) for _ in range(40)] + [query]
+            self.assertEqual(jaro_winkler_many(query, strings).tolist(), [jaro_winkler(query, s) for s in strings])
+        self.assertEqual(jaro_winkler_many('jean', []).tolist(), [])
+
+    def test_same_scores_as_score_pair(self):
+        rng = random.Random(7)
+        for trial in range(50):
+            query = random_record(rng, 0)
+            # Both sides of BATCH_SIMILARITY_MIN
+            others = [random_record(rng, i) for i in range(1, rng.choice([20, 300]))]
+            expected = [score_pair(query, other)[0] for other in others]
+            self.assertEqual(score_candidates(query, others).tolist(), expected)
+
+    def test_best_candidates(self):
+        rng = random.Random(11)
+        query = random_record(rng, 0)._replace(first_name='Jean', last_name='Dupont', city='Kinshasa', country='Congo')
+        others = [random_record(rng, i) for i in range(1, 200)]
+        best = best_candidates(query, others, limit=5)
+
+        ranked = sorted(((score_pair(query, o)[0], i) for i, o in enumerate(others)), key=lambda pair: -pair[0])
+        ranked = [(others[i], score, score_pair(query, others[i])[1]) for score, i in ranked if score >= 30][:5]
+        self.assertEqual(best, ranked)
+        self.assertEqual(score_candidates(query, []).tolist(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
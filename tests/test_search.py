@@ -0,0 +1,287 @@
+import os
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+from app import create_app
+from models import db, Disparu
+from algorithms.phonetics import edit_distance
+from utils.search import (WordIndex, backfill_search_columns, build_search_index, get_fts_vocabulary,
+                          get_inverted_index, get_search_backend, query_terms, ranked_search, search_disparus,
+                          search_words, update_search_index)
+
+
+class SearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.session.execute(db.text("DROP TABLE IF EXISTS disparus_fts_vocab"))
+        db.session.execute(db.text("DROP TABLE IF EXISTS disparus_fts"))
+        db.session.commit()
+        db.drop_all()
+        self.app_context.pop()
+
+    def disparu(self, public_id, first_name, last_name, city='Kinshasa', status='missing', photo_url=None,
+                country='Congo'):
+        d = Disparu(
+            public_id=public_id, person_type='adult', first_name=first_name, last_name=last_name,
+            age=30, sex='M', country=country, city=city, physical_description='Grand',
+            disappearance_date=datetime.now(), circumstances='.', status=status, photo_url=photo_url
+        )
+        db.session.add(d)
+        db.session.commit()
+        return d
+
+    def found(self, query, filters=None):
+        return sorted(d.public_id for d in search_disparus(query, filters).all())
+
+    def check_search(self):
+        self.disparu('SRC001', 'Jean', 'Dupont')
+        self.disparu('SRC002', 'Jeanne', 'Kabila', city='Goma', status='found', photo_url='/a.jpg')
+        self.disparu('SRC003', 'Paul', 'Dupont', city='Goma')
+
+        self.assertEqual(self.found('jean'), ['SRC001', 'SRC002'])
+        self.assertEqual(self.found('DUP'), ['SRC001', 'SRC003'])
+        self.assertEqual(self.found('dupont goma'), ['SRC003'])
+        self.assertEqual(self.found('src002'), ['SRC002'])
+        self.assertEqual(self.found('jean "kab*'), ['SRC002'])
+        self.assertEqual(self.found('marie'), [])
+        self.assertEqual(self.found('jean', {'status': 'missing'}), ['SRC001'])
+        self.assertEqual(self.found('', {'has_photo': True, 'person_type': 'person'}), ['SRC002'])
+
+        # Accents, case and punctuation fold the same way in rows and queries
+        self.disparu('SRC004', 'Hélène', "N'Guessan", city='Yaoundé', country='Cameroun')
+        self.disparu('SRC005', 'Koffi', 'Yao', city="N'Djamena", country='Tchad')
+        self.disparu('SRC006', 'Awa', 'Kone', city='Abidjan', country="Côte d'Ivoire")
+        self.assertEqual(self.found('yaounde'), ['SRC004'])
+        self.assertEqual(self.found('YAOUNDÉ helene'), ['SRC004'])
+        self.assertEqual(self.found('nguessan'), ['SRC004'])
+        self.assertEqual(self.found('Ndjamena'), ['SRC005'])
+        self.assertEqual(self.found("n'djamena"), ['SRC005'])
+        self.assertEqual(self.found('djamena'), ['SRC005'])
+        self.assertEqual(self.found("Cote d'Ivoire"), ['SRC006'])
+        self.assertEqual(self.found('côte divoire'), ['SRC006'])
+        self.assertEqual(self.found('ivoire'), ['SRC006'])
+
+    def ranked(self, query, **kwargs):
+        return [d.public_id for d, _ in ranked_search(query, **kwargs)]
+
+    def check_ranked_search(self):
+        self.disparu('SRC001', 'Jean', 'Dupont')
+        self.disparu('SRC002', 'Jaen', 'Dupond', city='Goma')
+        self.disparu('SRC003', 'Jeanne', 'Dupont', status='found')
+        self.disparu('SRC004', 'Paul', 'Kabila')
+        self.disparu('SRC005', 'Jaen', 'Dupont')
+
+        # Exact words, then prefixes, then one typo, then two
+
+        self.assertEqual(self.ranked('jean dupont'), ['SRC001', 'SRC003', 'SRC005', 'SRC002'])
+        self.assertEqual(self.ranked('jean dupont', fuzzy=False), ['SRC001', 'SRC003'])
+        self.assertEqual(self.ranked('dupnot'), ['SRC005', 'SRC003', 'SRC001'])
+        self.assertEqual(self.ranked('kabilla goma'), [])
+        self.assertEqual(self.ranked('kabilla'), ['SRC004'])
+        # Short words get no typo allowance
+        self.assertNotIn('SRC005', self.ranked('jea dupont'))
+        self.assertEqual(self.ranked('jeane dupont', filters={'status': 'found'}), ['SRC003'])
+        self.assertEqual(self.ranked('jean dupont', limit=1), ['SRC001'])
+
+        scores = [score for _, score in ranked_search('jean dupont')]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertGreater(scores[0], scores[-1])
+
+        results = self.client.get('/api/search?q=jean%20dupont').get_json()
+        self.assertEqual([d['public_id'] for d in results], ['SRC001', 'SRC003', 'SRC005', 'SRC002'])
+        self.assertEqual([d['score'] for d in results], [round(score, 4) for score in scores])
+        results = self.client.get('/api/search?q=jean%20dupont&fuzzy=0').get_json()
+        self.assertEqual([d['public_id'] for d in results], ['SRC001', 'SRC003'])
+
+
+class TestMemorySearch(SearchTestCase):
+    def test_search(self):
+        self.assertEqual(get_search_backend(), 'memory')
+        self.check_search()
+
+    def test_follows_writes(self):
+        jean = self.disparu('SRC001', 'Jean', 'Dupont')
+        self.assertEqual(self.found('jean'), ['SRC001'])
+
+        jean.first_name = 'Pierre'
+        db.session.commit()
+        self.assertEqual(self.found('jean'), [])
+        self.assertEqual(self.found('pierre'), ['SRC001'])
+
+        db.session.delete(jean)
+        db.session.commit()
+        self.assertEqual(self.found('pierre'), [])
+        self.assertEqual(len(get_inverted_index()), 0)
+
+        # Bulk writes bypass the validators, and reload the whole index
+        self.disparu('SRC002', 'Paul', 'Kabila')
+        Disparu.query.update({'city': 'Bukavu', 'city_search': 'bukavu'})
+        db.session.commit()
+        self.assertEqual(self.found('bukavu'), ['SRC002'])
+
+    def test_ranked_search(self):
+        self.check_ranked_search()
+
+    def test_ranked_search_follows_writes(self):
+        paul = self.disparu('SRC001', 'Paul', 'Kabila')
+        self.assertEqual(self.ranked('kabilla'), ['SRC001'])
+        paul.last_name = 'Mutombo'
+        db.session.commit()
+        self.assertEqual(self.ranked('kabilla'), [])
+        self.assertEqual(self.ranked('mutonbo'), ['SRC001'])
+
+    def test_update_search_index(self):
+        paul = self.disparu('SRC001', 'Paul', 'Kabila')
+        self.assertEqual(self.found('paul'), ['SRC001'])
+        db.session.execute(db.text("UPDATE disparus_flask SET first_name = 'Marc' WHERE id = :id"), {'id': paul.id})
+        db.session.commit()
+        db.session.expire_all()
+        update_search_index(paul)
+        db.session.commit()
+        self.assertEqual(self.found('marc'), ['SRC001'])
+
+    def test_query_terms(self):
+        self.assertEqual(query_terms('  Jean-Paul "KAB*'), ['jean', 'paul', 'kab'])
+        self.assertEqual(query_terms("N’Djaména"), ['ndjamena'])
+        self.assertEqual(query_terms(None), [])
+        self.assertEqual(search_words("Côte d'Ivoire"), 'cote divoire d ivoire')
+        self.assertEqual(search_words('Yaoundé'), 'yaounde')
+        self.assertIsNone(search_words(None))
+
+    def test_word_index(self):
+        index = WordIndex()
+        for word in ['dupont', 'dupond', 'dumont', 'kabila', 'jean', 'jeanne', 'tshisekedi']:
+            index.add(word)
+        self.assertEqual(index.similar('dupont'), {'dupond': 1, 'dumont': 1})
+        self.assertEqual(index.similar('jaen'), {'jean': 1})
+        self.assertEqual(index.similar('chisekedi'), {'tshisekedi': 2})
+        self.assertEqual(index.similar('ban'), {})
+        index.discard('dupond')
+        self.assertEqual(index.similar('dupont'), {'dumont': 1})
+
+        self.assertEqual(edit_distance('jean', 'jaen', 2), 1)
+        self.assertEqual(edit_distance('kitten', 'sitting', 5), 3)
+        self.assertEqual(edit_distance('kitten', 'sitting', 1), 2)
+
+    def test_folded_columns(self):
+        d = self.disparu('SRC001', 'Éloïse', 'Mbappé', city='Yaoundé')
+        self.assertEqual((d.first_name_search, d.last_name_search, d.city_search, d.country_search),
+                         ('eloise', 'mbappe', 'yaounde', 'congo'))
+        d.city = 'Douala'
+        self.assertEqual(d.city_search, 'douala')
+
+        # Rows written before the columns existed
+        db.session.execute(db.text("UPDATE disparus_flask SET city_search = NULL, first_name_search = NULL"))
+        db.session.commit()
+        self.assertEqual(backfill_search_columns(), 1)
+        db.session.expire_all()
+        self.assertEqual((d.first_name_search, d.city_search), ('eloise', 'douala'))
+        self.assertEqual(backfill_search_columns(), 0)
+
+
+class TestSqliteFtsSearch(SearchTestCase):
+    def test_search(self):
+        self.disparu('SRC000', 'Esther', 'Mutombo')
+        self.assertEqual(build_search_index(), 'fts5')
+        self.assertEqual(get_search_backend(), 'fts5')
+        # Rows written before the build are indexed too
+        self.assertEqual(self.found('esther'), ['SRC000'])
+        self.check_search()
+
+    def test_ranked_search(self):
+        build_search_index()
+        self.check_ranked_search()
+
+    def test_ranked_search_follows_writes(self):
+        build_search_index()
+        paul = self.disparu('SRC001', 'Paul', 'Kabila')
+        self.assertEqual(self.ranked('kabilla'), ['SRC001'])
+        paul.last_name = 'Mutombo'
+        db.session.commit()
+        self.assertEqual(self.ranked('kabilla'), [])
+        self.assertEqual(self.ranked('mutonbo'), ['SRC001'])
+
+    @patch('utils.search.COMMON_WORD_CASES', 2)
+    def test_common_long_words_are_spelled_out(self):
+        build_search_index()
+        self.disparu('SRC001', 'Jean', 'Mwanangongo')
+        self.disparu('SRC002', 'Paul', 'Mwanangongo')
+        self.disparu('SRC003', 'Awa', 'Tshimangamba')
+        self.disparu('SRC005', 'Awa', 'Kabila')
+        self.disparu('SRC006', 'Jean', 'Kabila')
+        self.assertEqual(get_fts_vocabulary().spelled_out('mwanangongo'), 'mwanangongo')
+        self.assertEqual(get_fts_vocabulary().spelled_out('mwanangon'), 'mwanangongo')
+        self.assertIsNone(get_fts_vocabulary().spelled_out('tshimangamba'))
+        self.assertEqual(self.ranked('mwanangon jean', fuzzy=False), ['SRC001'])
+        # Shorter terms only when they are the word
+        self.assertEqual(get_fts_vocabulary().spelled_out('kabil'), 'kabila')
+        self.assertEqual(self.ranked('kabila jean'), ['SRC006'])
+        self.assertEqual(self.ranked('kabil awa', fuzzy=False), ['SRC005'])
+
+        # Not once it prefixes another word, written here or by the next reload
+        self.disparu('SRC004', 'Marie', 'Mwanangongoma')
+        self.assertIsNone(get_fts_vocabulary().spelled_out('mwanangongo'))
+        self.assertEqual(self.ranked('mwanangongo', fuzzy=False), ['SRC002', 'SRC001', 'SRC004'])
+
+    @patch('utils.search.RANKED_WINDOW', 2)
+    def test_broad_queries_rank_the_newest_matches(self):
+        build_search_index()
+        self.disparu('SRC001', 'Jean', 'Dupont')
+        self.disparu('SRC002', 'Jean', 'Kabila')
+        self.disparu('SRC003', 'Jeanne', 'Mutombo')
+        self.disparu('SRC004', 'Paul', 'Kabila')
+        get_fts_vocabulary()
+
+        self.assertEqual(sorted(self.ranked('jean', fuzzy=False)), ['SRC002', 'SRC003'])
+        # A rarer term keeps every match ranked
+        self.assertEqual(self.ranked('jean dupont', fuzzy=False), ['SRC001'])
+        first = ranked_search('jean', limit=1, fuzzy=False)
+        after = (first[0][1], first[0][0].id)
+        self.assertEqual(len(ranked_search('jean', fuzzy=False, after=after)), 1)
+
+    def test_follows_writes(self):
+        build_search_index()
+        jean = self.disparu('SRC001', 'Jean', 'Dupont')
+        jean.first_name = 'Pierre'
+        db.session.commit()
+        self.assertEqual(self.found('jean'), [])
+        self.assertEqual(self.found('pierre'), ['SRC001'])
+        db.session.delete(jean)
+        db.session.commit()
+        self.assertEqual(self.found('pierre'), [])
+
+    def test_outdated_table_is_recreated(self):
+        self.disparu('SRC001', 'Jean', 'Dupont')
+        db.session.execute(db.text(
+            "CREATE VIRTUAL TABLE disparus_fts USING fts5(first_name, content='disparus_flask', content_rowid='id')"
+        ))
+        db.session.commit()
+        build_search_index()
+        self.assertEqual(self.found('dupont'), ['SRC001'])
+
+    def test_routes(self):
+        build_search_index()
+        self.disparu('SRC001', 'Jean', 'Dupont')
+        self.disparu('SRC002', 'Paul', 'Kabila')
+
+        page = self.client.get('/recherche?q=dupo').get_data(as_text=True)
+        self.assertIn('SRC001', page)
+        self.assertNotIn('SRC002', page)
+
+        results = self.client.get('/api/search?q=kabila').get_json()
+        self.assertEqual([d['public_id'] for d in results], ['SRC002'])
+        self.assertEqual(self.client.get('/api/search?q=k').get_json(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
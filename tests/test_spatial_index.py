@@ -0,0 +1,160 @@
+import unittest
+import random
+import time
+from datetime import datetime
+from app import create_app
+from models import db, Disparu
+from algorithms.clustering import haversine_distance
+from algorithms.spatial_index import SpatialIndex, get_spatial_index
+
+
+class TestSpatialIndex(unittest.TestCase):
+    def test_nearest_matches_brute_force(self):
+        rng = random.Random(42)
+        rows = [(i, rng.uniform(-35, 37), rng.uniform(-20, 52), 'missing') for i in range(3000)]
+        index = SpatialIndex()
+        index.load(rows)
+
+        for _ in range(20):
+            lat, lng = rng.uniform(-35, 37), rng.uniform(-20, 52)
+            expected = sorted((haversine_distance(lat, lng, r[1], r[2]), r[0]) for r in rows)[:10]
+            got = index.nearest(lat, lng, 10)
+            self.assertEqual([i for _, i in got], [i for _, i in expected])
+            for (d_got, _), (d_exp, _) in zip(got, expected):
+                self.assertAlmostEqual(d_got, d_exp, places=3)
+
+    def test_antimeridian(self):
+        index = SpatialIndex()
+        index.load([(1, 0, 179.9, 'missing'), (2, 0, -179.9, 'missing'), (3, 0, 170, 'missing')])
+        got = index.nearest(0, 180, 2)
+        self.assertCountEqual([i for _, i in got], [1, 2])
+        self.assertLess(got[1][0], 20)
+
+    def test_updates_and_status_partitions(self):
+        index = SpatialIndex()
+        index.load([(i, i * 0.01, 0, 'missing') for i in range(200)])
+
+        index.upsert(500, 10, 10, 'missing')
+        self.assertEqual(index.nearest(10, 10, 1)[0][1], 500)
+
+        # Relocation
+        index.upsert(500, -10, -10, 'missing')
+        self.assertEqual(index.nearest(-10, -10, 1)[0][1], 500)
+        self.assertNotEqual(index.nearest(10, 10, 1)[0][1], 500)
+
+        # Status change moves the point between partitions
+        index.upsert(0, 0, 0, 'found')
+        self.assertNotEqual(index.nearest(0, 0, 1, status='missing')[0][1], 0)
+        self.assertEqual(index.nearest(0, 0, 1, status='found')[0][1], 0)
+        self.assertEqual(index.nearest(0, 0, 1)[0][1], 0)
+
+        # Removal, enough of them to force a rebuild
+        for i in range(1, 150):
+            index.remove(i)
+        ids = [i for _, i in index.nearest(0, 0, 100, status='missing')]
+        self.assertTrue(all(i >= 150 for i in ids))
+        self.assertEqual(len(index), 52)
+
+
+class TestNearbyEndpointIndex(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def create_disparu(self, public_id, lat, lng, status='missing'):
+        d = Disparu(
+            public_id=public_id, person_type='adult', first_name='Test', last_name='Index',
+            age=30, sex='M', country='Gabon', city='Libreville', physical_description='.',
+            disappearance_date=datetime.now(), circumstances='.',
+            latitude=lat, longitude=lng, status=status
+        )
+        db.session.add(d)
+        db.session.commit()
+        return d
+
+    def nearby_ids(self, lat, lng, **params):
+        query = '&'.join(f'{k}={v}' for k, v in params.items())
+        resp = self.client.get(f'/api/disparus/nearby?lat={lat}&lng={lng}&{query}')
+        self.assertEqual(resp.status_code, 200)
+        return [d['public_id'] for d in resp.get_json()]
+
+    def test_index_follows_writes(self):
+        self.create_disparu('near01', 0.40, 9.45)
+        far = self.create_disparu('far001', 5.0, 20.0)
+
+        self.assertEqual(self.nearby_ids(0.39, 9.45, limit=5), ['near01', 'far001'])
+
+        # Insert after the index was built
+        self.create_disparu('near02', 0.391, 9.451)
+        self.assertEqual(self.nearby_ids(0.39, 9.45, limit=1), ['near02'])
+
+        # Relocation
+        far.latitude = 0.3905
+        far.longitude = 9.4502
+        db.session.commit()
+        self.assertEqual(self.nearby_ids(0.39, 9.45, limit=1), ['far001'])
+
+        # Status change
+        far.status = 'found'
+        db.session.commit()
+        self.assertNotIn('far001', self.nearby_ids(0.39, 9.45, limit=5))
+        self.assertEqual(self.nearby_ids(0.39, 9.45, limit=5, status='found'), ['far001'])
+
+        # Delete
+        db.session.delete(far)
+        db.session.commit()
+        self.assertEqual(self.nearby_ids(0.39, 9.45, limit=5, status='found'), [])
+
+        # Bulk delete bypasses the mapper hooks
+        Disparu.query.filter_by(public_id='near02').delete(synchronize_session=False)
+        db.session.commit()
+        self.assertEqual(self.nearby_ids(0.39, 9.45, limit=5), ['near01'])
+
+    def test_rollback_discards_changes(self):
+        self.create_disparu('keep01', 1.0, 1.0)
+        index = get_spatial_index()
+        self.assertEqual(len(index), 1)
+
+        d = Disparu.query.filter_by(public_id='keep01').first()
+        d.latitude = 40.0
+        db.session.flush()
+        db.session.rollback()
+
+        self.assertEqual(self.nearby_ids(1.0, 1.0, limit=1), ['keep01'])
+
+    def test_stale_index_reloads_in_background(self):
+        self.create_disparu('move01', 1.0, 1.0)
+        index = get_spatial_index()
+
+        # Written by another worker: no change event here, only the reload sees it
+        db.session.execute(db.text("UPDATE disparus_flask SET latitude = 40.0 WHERE public_id = 'move01'"))
+        db.session.commit()
+        index.built_at -= index.ttl + 1
+
+        # The stale index answers at once while its replacement is built
+        self.assertIs(get_spatial_index(), index)
+        self.create_disparu('new001', 2.0, 2.0)
+        deadline = time.time() + 10
+        while get_spatial_index() is index and time.time() < deadline:
+            time.sleep(0.01)
+
+        fresh = get_spatial_index()
+        self.assertIsNot(fresh, index)
+        self.assertFalse(fresh.is_stale())
+        self.assertEqual(self.nearby_ids(40.0, 1.0, limit=1), ['move01'])
+        # Writes made during the reload are not lost
+        self.assertEqual(self.nearby_ids(2.0, 2.0, limit=1), ['new001'])
+
+
+if __name__ == '__main__':
+    unittest.main()
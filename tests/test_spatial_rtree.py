@@ -0,0 +1,87 @@
+import os
+import unittest
+from datetime import datetime
+
+# Set environment variables before importing app
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+
+from sqlalchemy import text
+from app import create_app
+from models import db, Disparu
+from algorithms.clustering import get_nearby_cases
+from init_db import setup_sqlite_rtree
+from utils.spatial import is_sqlite_rtree_available
+
+
+class TestSqliteRtree(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def create_disparu(self, public_id, lat, lng):
+        d = Disparu(
+            public_id=public_id, person_type='adult', first_name='Test', last_name='Rtree',
+            age=30, sex='M', country='Kenya', city='Nairobi', physical_description='.',
+            disappearance_date=datetime.now(), circumstances='.',
+            latitude=lat, longitude=lng, status='missing'
+        )
+        db.session.add(d)
+        db.session.commit()
+        return d
+
+    def rtree_ids(self):
+        return sorted(r[0] for r in db.session.execute(text("SELECT id FROM disparus_rtree")))
+
+    def test_triggers_keep_rtree_in_sync(self):
+        existing = self.create_disparu('exist1', -1.28, 36.82)
+        self.create_disparu('nogeo1', None, None)
+
+        self.assertFalse(is_sqlite_rtree_available())
+        setup_sqlite_rtree()
+        self.assertTrue(is_sqlite_rtree_available())
+
+        # Backfill skips records without coordinates
+        self.assertEqual(self.rtree_ids(), [existing.id])
+
+        inserted = self.create_disparu('new001', -4.04, 39.67)
+        self.assertEqual(self.rtree_ids(), sorted([existing.id, inserted.id]))
+
+        inserted.latitude = None
+        db.session.commit()
+        self.assertEqual(self.rtree_ids(), [existing.id])
+
+        db.session.delete(existing)
+        db.session.commit()
+        self.assertEqual(self.rtree_ids(), [])
+
+    def test_bbox_queries_use_rtree(self):
+        setup_sqlite_rtree()
+        self.create_disparu('nairob', -1.28, 36.82)
+        self.create_disparu('mombas', -4.04, 39.67)
+        self.create_disparu('east01', 0, 179.5)
+        self.create_disparu('west01', 0, -179.5)
+
+        resp = self.client.get('/api/map-data?min_lat=-2&max_lat=0&min_lng=36&max_lng=37')
+        self.assertEqual([d['public_id'] for d in resp.get_json()], ['nairob'])
+
+        # Box crossing the antimeridian
+        resp = self.client.get('/api/map-data?min_lat=-1&max_lat=1&min_lng=179&max_lng=-179')
+        self.assertCountEqual([d['public_id'] for d in resp.get_json()], ['east01', 'west01'])
+
+        results = get_nearby_cases(-1.3, 36.8, radius_km=50)
+        self.assertEqual([r['disparu']['public_id'] for r in results], ['nairob'])
+
+        results = get_nearby_cases(0, 179.9, radius_km=100)
+        self.assertCountEqual([r['disparu']['public_id'] for r in results], ['east01', 'west01'])
+
+
+if __name__ == '__main__':
+    unittest.main()
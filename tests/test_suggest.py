@@ -0,0 +1,142 @@
+import os
+import time
+import unittest
+from datetime import datetime
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+from app import create_app
+from models import db, Disparu
+from utils.suggest import SuggestIndex, get_suggest_index
+
+
+def values(suggestions):
+    return [(s['type'], s['value']) for s in suggestions]
+
+
+class TestSuggestIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = SuggestIndex()
+        self.index.load([
+            (1, 'KIN001', 'adult', 'Jean', 'Dupont', 'Kinshasa', 10),
+            (2, 'KIN002', 'adult', 'Jeanne', 'Kabila', 'Kinshasa', 50),
+            (3, 'GOM001', 'child', 'Paul', 'Dupond', 'Goma', 5),
+            (4, 'YAO001', 'adult', 'Hélène', "N'Guessan", 'Yaoundé', None),
+            (5, 'KIN003', 'animal', 'Rex', 'Chien', 'Kinshasa', 1),
+        ])
+
+    def test_prefixes(self):
+        self.assertEqual(values(self.index.suggest('jea')), [('name', 'Jeanne Kabila'), ('name', 'Jean Dupont')])
+        # Any word of a name, folded like searches
+        self.assertEqual(values(self.index.suggest('DUP')), [('name', 'Jean Dupont'), ('name', 'Paul Dupond')])
+        self.assertEqual(values(self.index.suggest('nguess')), [('name', "Hélène N'Guessan")])
+        self.assertEqual(values(self.index.suggest('jean dup')), [('name', 'Jean Dupont')])
+        self.assertEqual(self.index.suggest('gom001'), [{'type': 'public_id', 'value': 'GOM001', 'public_id': 'GOM001'}])
+        self.assertEqual(self.index.suggest('jea')[0]['public_id'], 'KIN002')
+        # Animals go by their name alone
+        self.assertEqual(values(self.index.suggest('rex')), [('name', 'Rex')])
+        self.assertEqual(self.index.suggest('chien'), [])
+        self.assertEqual(self.index.suggest('  '), [])
+
+    def test_cities_by_views_of_their_cases(self):
+        self.assertEqual(values(self.index.suggest('yaounde')), [('city', 'Yaoundé')])
+        # Ties in views go by value
+        self.assertEqual(values(self.index.suggest('g')), [('public_id', 'GOM001'), ('city', 'Goma')])
+        kinshasa = self.index.suggest('kin', kinds=('city',))
+        self.assertEqual(kinshasa, [{'type': 'city', 'value': 'Kinshasa'}])
+        self.assertEqual(values(self.index.suggest('k', k=3)),
+                         [('city', 'Kinshasa'), ('name', 'Jeanne Kabila'), ('public_id', 'KIN002')])
+
+    def test_writes(self):
+        self.index.upsert(6, 'KIN004', 'adult', 'Jeannot', 'Mutombo', 'Kinshasa', 100)
+        self.assertEqual(values(self.index.suggest('jea', k=1)), [('name', 'Jeannot Mutombo')])
+        self.index.upsert(2, 'KIN002', 'adult', 'Marie', 'Kabila', 'Goma', 50)
+        self.assertNotIn(('name', 'Jeanne Kabila'), values(self.index.suggest('jea')))
+        self.assertEqual(values(self.index.suggest('goma', kinds=('city',))), [('city', 'Goma')])
+        self.index.remove(6)
+        self.index.remove(1)
+        self.assertEqual(self.index.suggest('jea'), [])
+        self.assertEqual(len(self.index), 4)
+
+        # Rebuilt arrays answer the same as the buffer and tombstones did
+        before = [self.index.suggest(prefix) for prefix in ('m', 'k', 'g', 'p', 'r')]
+        self.index._build()
+        self.assertEqual([self.index.suggest(prefix) for prefix in ('m', 'k', 'g', 'p', 'r')], before)
+
+
+class TestSuggestApi(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def disparu(self, public_id, first_name, last_name, city='Kinshasa', view_count=0):
+        d = Disparu(
+            public_id=public_id, person_type='adult', first_name=first_name, last_name=last_name,
+            age=30, sex='M', country='Congo', city=city, physical_description='.',
+            disappearance_date=datetime.now(), circumstances='.', view_count=view_count
+        )
+        db.session.add(d)
+        db.session.commit()
+        return d
+
+    def test_follows_writes(self):
+        jean = self.disparu('SUG001', 'Jean', 'Dupont', view_count=3)
+        self.assertEqual(values(get_suggest_index().suggest('dup')), [('name', 'Jean Dupont')])
+
+        self.disparu('SUG002', 'Paul', 'Dupuis', view_count=7)
+        jean.last_name = 'Mutombo'
+        db.session.commit()
+        self.assertEqual(values(get_suggest_index().suggest('dup')), [('name', 'Paul Dupuis')])
+        self.assertEqual(values(get_suggest_index().suggest('mut')), [('name', 'Jean Mutombo')])
+
+        db.session.delete(jean)
+        db.session.commit()
+        self.assertEqual(get_suggest_index().suggest('mut'), [])
+
+        # Bulk writes bypass the mapper events, and reload the whole index
+        Disparu.query.update({'city': 'Bukavu'})
+        db.session.commit()
+        self.assertEqual(values(get_suggest_index().suggest('buk')), [('city', 'Bukavu')])
+
+    def test_view_counts_reload_in_background(self):
+        self.disparu('SUG001', 'Jean', 'Dupont', view_count=3)
+        self.disparu('SUG002', 'Jeanne', 'Kabila', view_count=9)
+        index = get_suggest_index()
+        self.assertEqual(index.suggest('jea')[0]['value'], 'Jeanne Kabila')
+
+        # Views are counted in raw SQL, without change events
+        db.session.execute(db.text("UPDATE disparus_flask SET view_count = 20 WHERE public_id = 'SUG001'"))
+        db.session.commit()
+        index.built_at -= index.ttl + 1
+
+        # Typeahead keeps answering from the stale index while it reloads
+        self.assertIs(get_suggest_index(), index)
+        deadline = time.time() + 10
+        while get_suggest_index() is index and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(get_suggest_index().suggest('jea')[0]['value'], 'Jean Dupont')
+
+    def test_endpoint(self):
+        self.disparu('SUG001', 'Jean', 'Dupont', view_count=3)
+        self.disparu('SUG002', 'Jeanne', 'Kabila', city='Goma', view_count=9)
+
+        results = self.client.get('/api/suggest?q=Jea').get_json()
+        self.assertEqual(results, [
+            {'type': 'name', 'value': 'Jeanne Kabila', 'public_id': 'SUG002'},
+            {'type': 'name', 'value': 'Jean Dupont', 'public_id': 'SUG001'},
+        ])
+        self.assertEqual(values(self.client.get('/api/suggest?q=g&types=city').get_json()), [('city', 'Goma')])
+        self.assertEqual(len(self.client.get('/api/suggest?q=s&limit=1').get_json()), 1)
+        self.assertEqual(self.client.get('/api/suggest?q=').get_json(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
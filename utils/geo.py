@@ -5,6 +5,14 @@
  * Fait par : Aisance KALONJI, www.aisancekalonji.com
  * Auditer par : La CyberConfiance, www.cyberconfiance.com
 """
+import csv
+import os
+import re
+import threading
+import unicodedata
+
+import numpy as np
+
 COUNTRIES_CITIES = {
     "Afrique du Sud": ["Johannesbourg", "Le Cap", "Durban", "Pretoria", "Port Elizabeth", "Bloemfontein", "Nelspruit", "Kimberley", "Polokwane", "Pietermaritzburg"],
     "Algerie": ["Alger", "Oran", "Constantine", "Annaba", "Blida", "Batna", "Setif", "Djelfa", "Biskra", "Tebessa"],
@@ -79,9 +87,112 @@ def get_countries_count():
     return len(COUNTRIES_CITIES)
 
 
-def get_coordinates_from_city(city, country):
-    pass
+# Bundled offline gazetteer: one row per city of COUNTRIES_CITIES
+GAZETTEER_PATH = os.path.join(os.path.dirname(__file__), 'gazetteer.csv')
+
+
+def normalize_place_name(name):
+    """Lowercase, accent-free, with hyphens and apostrophes as spaces"""
+    name = unicodedata.normalize('NFKD', name or '')
+    name = ''.join(ch for ch in name if not unicodedata.combining(ch)).lower()
+    return ' '.join(re.sub(r"[-'’_.,]", ' ', name).split())
+
+
+class Gazetteer:
+    """
+    Cities with coordinates in parallel arrays. Forward lookups go through
+    dicts keyed by normalized names, reverse lookups through a KD-tree over
+    unit-sphere vectors.
+    """
+
+    def __init__(self, rows):
+        # rows: iterable of (country, city, latitude, longitude)
+        rows = list(rows)
+        self.countries = [row[0] for row in rows]
+        self.cities = [row[1] for row in rows]
+        self.latitudes = np.array([row[2] for row in rows], dtype=np.float64)
+        self.longitudes = np.array([row[3] for row in rows], dtype=np.float64)
+
+        self.by_name = {}
+        self.by_city = {}
+        for i, (country, city, _, _) in enumerate(rows):
+            self.by_name[(normalize_place_name(country), normalize_place_name(city))] = i
+            # City alone, for callers without a reliable country (first one wins)
+            self.by_city.setdefault(normalize_place_name(city), i)
+
+        # Imported late: the algorithms package imports utils
+        from algorithms.spatial_index import KDTree, to_unit_vector
+        self.tree = KDTree((i, to_unit_vector(lat, lng)) for i, (_, _, lat, lng) in enumerate(rows))
+
+    @classmethod
+    def from_csv(cls, path=GAZETTEER_PATH):
+        with open(path, encoding='utf-8', newline='') as f:
+            return cls(
+                (row['country'], row['city'], float(row['latitude']), float(row['longitude']))
+                for row in csv.DictReader(f)
+            )
+
+    def __len__(self):
+        return len(self.cities)
+
+    def lookup(self, city, country=None):
+        """Index of the city, within the given country when there is one"""
+        key = normalize_place_name(city)
+        if not key:
+            return None
+        if country:
+            return self.by_name.get((normalize_place_name(country), key))
+        return self.by_city.get(key)
+
+    def nearest(self, lat, lng):
+        """(index, distance_km) of the closest city"""
+        from algorithms.spatial_index import chord_to_km, to_unit_vector
+        heap = []
+        self.tree.search(to_unit_vector(lat, lng), 1, heap, ())
+        if not heap:
+            return None
+        chord_sq, i = heap[0]
+        return i, chord_to_km(-chord_sq)
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    """Loads the gazetteer once per process"""
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                _gazetteer = Gazetteer.from_csv()
+    return _gazetteer
+
+
+def get_coordinates_from_city(city, country=None):
+    """(latitude, longitude) of a known city, None otherwise"""
+    gazetteer = get_gazetteer()
+    i = gazetteer.lookup(city, country)
+    if i is None:
+        return None
+    return float(gazetteer.latitudes[i]), float(gazetteer.longitudes[i])
 
 
-def reverse_geocode(lat, lng):
-    pass
+def reverse_geocode(lat, lng, max_distance_km=None):
+    """Closest known city as a dict, None when farther than max_distance_km"""
+    if lat is None or lng is None:
+        return None
+    gazetteer = get_gazetteer()
+    found = gazetteer.nearest(float(lat), float(lng))
+    if found is None:
+        return None
+    i, distance_km = found
+    if max_distance_km is not None and distance_km > max_distance_km:
+        return None
+    return {
+        'city': gazetteer.cities[i],
+        'country': gazetteer.countries[i],
+        'latitude': float(gazetteer.latitudes[i]),
+        'longitude': float(gazetteer.longitudes[i]),
+        'distance_km': distance_km,
+    }
@@ -0,0 +1,83 @@
+"""
+ * Nom de l'application : DISPARUS.ORG
+ * Description : Geohash des coordonnees et prefixes de proximite
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# Stored precision: cells of about 4.8 m x 4.8 m
+GEOHASH_PRECISION = 9
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Geohash of a coordinate, None when either part is missing."""
+    if latitude is None or longitude is None:
+        return None
+    lat, lng = float(latitude), float(longitude)
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+
+    chars = []
+    bits = 0
+    value = 0
+    even = True  # Bits alternate, longitude first
+    while len(chars) < precision:
+        target, bounds = (lng, lng_range) if even else (lat, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        if target >= mid:
+            value = (value << 1) | 1
+            bounds[0] = mid
+        else:
+            value <<= 1
+            bounds[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(height, width) in degrees of the cells of a precision."""
+    lng_bits = math.ceil(5 * precision / 2)
+    lat_bits = 5 * precision // 2
+    return 180 / 2 ** lat_bits, 360 / 2 ** lng_bits
+
+
+def neighbour_cells(latitude, longitude, precision):
+    """Geohashes of the cell holding the point and of its 8 neighbours (fewer next to a pole)."""
+    height, width = cell_size(precision)
+    cells = []
+    for d_lat in (-1, 0, 1):
+        # Past a pole the row is the polar one again
+        lat = min(max(latitude + d_lat * height, -90), 90 - 1e-9)
+        for d_lng in (-1, 0, 1):
+            lng = (longitude + d_lng * width + 180) % 360 - 180
+            cell = encode_geohash(lat, lng, precision)
+            if cell not in cells:
+                cells.append(cell)
+    return cells
+
+
+def bbox_prefixes(min_lat, max_lat, min_lng, max_lng, max_precision=GEOHASH_PRECISION):
+    """
+    Geohash prefixes covering the box: the cell around its centre plus the
+    8 neighbours, at the finest precision whose cells are at least half the
+    box wide and high. None when the box is too large for a useful
+    prefilter. min_lng > max_lng means the box crosses the antimeridian.
+    """
+    width = max_lng - min_lng if min_lng <= max_lng else max_lng - min_lng + 360
+    height = max_lat - min_lat
+    center_lat = (min_lat + max_lat) / 2
+    center_lng = (min_lng + width / 2 + 180) % 360 - 180
+
+    # The 3x3 block reaches at least one cell past the centre cell on each side
+    for precision in range(max_precision, 1, -1):
+        cell_height, cell_width = cell_size(precision)
+        if cell_height >= height / 2 and cell_width >= width / 2:
+            return neighbour_cells(center_lat, center_lng, precision)
+    return None
@@ -0,0 +1,86 @@
+"""
+ * Nom de l'application : DISPARUS.ORG
+ * Description : Pagination par curseur (keyset)
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+import base64
+import json
+from datetime import datetime
+
+from flask import request, url_for
+
+from models import db
+
+# Largest page any listing returns, whatever limit is asked for
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def page_size(requested, default=20):
+    """requested (None when absent) clamped to 1..MAX_PAGE_SIZE"""
+    if requested is None:
+        requested = default
+    return max(1, min(requested, MAX_PAGE_SIZE))
+
+
+def encode_cursor(*values):
+    """
+    Opaque token of the sort key of the last row of a page: the values
+    as JSON (datetimes in ISO format), in URL-safe base64.
+    """
+    data = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, *types):
+    """
+    The values of an encode_cursor() token, converted with types
+    (datetime, float, int); raises InvalidCursor when it isn't one.
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(data, list) or len(data) != len(types):
+            raise ValueError(cursor)
+        return tuple(datetime.fromisoformat(value) if kind is datetime else kind(value)
+                     for kind, value in zip(types, data))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f'invalid cursor: {cursor!r}') from e
+
+
+def keyset_condition(columns, values, descending=True):
+    """
+    Condition selecting the rows that sort after values on columns, all
+    in the same direction: a row-value comparison, so that an index on
+    the columns seeks straight to the next page however deep it is.
+    """
+    key = db.tuple_(*columns)
+    return key < db.tuple_(*values) if descending else key > db.tuple_(*values)
+
+
+def paginate(items, size, key):
+    """
+    (page, next_cursor) out of up to size + 1 items, the extra one only
+    telling that there is a next page; key gives the sort key of an item.
+    """
+    if len(items) <= size:
+        return items, None
+    items = items[:size]
+    return items, encode_cursor(*key(items[-1]))
+
+
+def with_next_cursor(response, cursor):
+    """
+    Adds the next page to response as metadata, leaving the body as it
+    is: X-Next-Cursor and a Link header (rel="next") to the same URL with
+    that cursor.
+    """
+    if cursor:
+        args = dict(request.args, cursor=cursor)
+        response.headers['X-Next-Cursor'] = cursor
+        response.headers['Link'] = f'<{url_for(request.endpoint, **request.view_args, **args)}>; rel="next"'
+    return response
@@ -5,42 +5,872 @@
  * Fait par : Aisance KALONJI, www.aisancekalonji.com
  * Auditer par : La CyberConfiance, www.cyberconfiance.com
 """
+import logging
+import math
+import re
+import unicodedata
+import weakref
+from bisect import bisect_left, insort
+from functools import lru_cache
+from operator import itemgetter
+
+import numpy as np
+
 from models import db, Disparu
+from algorithms.index_reload import DEFAULT_TTL, IndexRegistry, ReloadableIndex
+from algorithms.phonetics import edit_distance_codes, trigrams
+from utils.pagination import keyset_condition
+
+logger = logging.getLogger(__name__)
+
+# Columns folded into a <column>_search shadow column by the Disparu validators
+FOLDED_FIELDS = ('first_name', 'last_name', 'city', 'country')
+# Columns every backend indexes
+SEARCH_COLUMNS = ('public_id',) + tuple(f'{field}_search' for field in FOLDED_FIELDS)
+# Columns scanned when a search has no word to match
+SUBSTRING_FIELDS = ('first_name', 'last_name', 'public_id', 'city')
+# Typo matches reranked per query on FTS5: the best of them by bm25
+TYPO_WINDOW = 100
+# Ranked ids turned into rows per query on the in-memory backend
+FETCH_BATCH = 200
+# Longest prefix served by the prefix index of disparus_fts. Public ids
+# are shorter: longer terms only prefix words of the folded columns
+FTS_PREFIX_LENGTH = 8
+# A longer term prefixing a single word of this many cases, or a term that
+# is that word, is matched as the word: FTS5 copies the whole doclists of a
+# prefix it has no index for, but seeks into those of words, and bm25 reads
+# the doclist of every phrase, a term and the word it is counting twice
+COMMON_WORD_CASES = 1000
+# bm25 is computed for every case a MATCH finds: when each term of a query
+# prefixes the words of more cases than this, only the newest are ranked
+RANKED_WINDOW = 2000
+
+_APOSTROPHES = re.compile(r"['\u2019\u02bc`]")
+_WORDS = re.compile(r'[^\W_]+')
+
+# External content table over the folded columns of disparus_flask, kept
+# in step by the triggers below
+_FTS_TABLE = f"""
+    CREATE VIRTUAL TABLE disparus_fts USING fts5(
+        {', '.join(SEARCH_COLUMNS)},
+        content='disparus_flask',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3 4 5 6 7 8'
+    )
+"""
+_FTS_COLUMNS = ', '.join(SEARCH_COLUMNS)
+_FTS_NEW = ', '.join(f'new.{column}' for column in SEARCH_COLUMNS)
+_FTS_OLD = ', '.join(f'old.{column}' for column in SEARCH_COLUMNS)
+_FTS_TRIGGERS = {
+    'disparus_ai': f"""
+        CREATE TRIGGER disparus_ai AFTER INSERT ON disparus_flask BEGIN
+            INSERT INTO disparus_fts(rowid, {_FTS_COLUMNS}) VALUES (new.id, {_FTS_NEW});
+        END
+    """,
+    'disparus_ad': f"""
+        CREATE TRIGGER disparus_ad AFTER DELETE ON disparus_flask BEGIN
+            INSERT INTO disparus_fts(disparus_fts, rowid, {_FTS_COLUMNS}) VALUES ('delete', old.id, {_FTS_OLD});
+        END
+    """,
+    'disparus_au': f"""
+        CREATE TRIGGER disparus_au AFTER UPDATE OF {_FTS_COLUMNS} ON disparus_flask BEGIN
+            INSERT INTO disparus_fts(disparus_fts, rowid, {_FTS_COLUMNS}) VALUES ('delete', old.id, {_FTS_OLD});
+            INSERT INTO disparus_fts(rowid, {_FTS_COLUMNS}) VALUES (new.id, {_FTS_NEW});
+        END
+    """,
+}
+
+# 'simple' configuration: the columns are folded, stemming would only blur names
+_PG_TSVECTOR = "to_tsvector('simple', " + " || ' ' || ".join(
+    f"coalesce({column},'')" for column in SEARCH_COLUMNS) + ")"
+_PG_TRGM_INDEXES = {column: f'ix_disparus_flask_{column}_trgm' for column in SEARCH_COLUMNS}
+# Indexes of the raw columns, replaced by those of the folded ones
+_PG_OBSOLETE_INDEXES = ['idx_disparu_fulltext'] + [
+    f'ix_disparus_flask_{field}_trgm' for field in ('first_name', 'last_name', 'city')]
+
+# Backend per engine so that test databases never share it
+_backend_status = weakref.WeakKeyDictionary()
+
+
+@lru_cache(maxsize=65536)
+def fold_text(text):
+    """
+    Lowercase, accent-free words separated by single spaces; apostrophes
+    are dropped so that "N'Djamena" folds like "Ndjamena".
+    """
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return ' '.join(_WORDS.findall(_APOSTROPHES.sub('', text)))
+
+
+def search_words(text):
+    """
+    Value of a <column>_search shadow column: the folded words, then the
+    parts of elided words ("Côte d'Ivoire": 'cote divoire d ivoire'), so
+    that both spellings find it.
+    """
+    if text is None:
+        return None
+    words = fold_text(text).split()
+    for word in fold_text(_APOSTROPHES.sub(' ', text)).split():
+        if word not in words:
+            words.append(word)
+    return ' '.join(words)
+
+
+def query_terms(text):
+    """Folded words of a search, the unit every backend matches by prefix."""
+    return fold_text(text).split()
+
+
+def max_edits(term):
+    """Typos tolerated in a search term: none under 4 letters, 2 from 8."""
+    if len(term) < 4:
+        return 0
+    return 1 if len(term) < 8 else 2
+
+
+def _match_quality(term, word, edits=0):
+    # 1 for the word itself, above 0.5 for a prefix, below for a typo
+    if edits:
+        return 0.4 / edits
+    return 0.5 + 0.5 * len(term) / len(word)
+
+
+def _term_edits(term, words, similar):
+    # Edits between term and the closest of words: 0 for the term or a
+    # longer word it prefixes, else those of the similar word found for it
+    best = max_edits(term) + 1
+    for word in words:
+        if word.startswith(term):
+            return 0
+        if word in similar:
+            best = min(best, similar[word])
+    return best
+
+
+def _normalized_sql(sql):
+    return ' '.join((sql or '').split())
+
+
+def get_search_backend(session=None):
+    """
+    'fts5' (SQLite with disparus_fts), 'postgres' (tsvector and, when
+    pg_trgm is installed, trigram indexes) or 'memory' (Python inverted
+    index), cached per engine.
+    """
+    session = session or db.session
+    bind = session.get_bind()
+    if bind in _backend_status:
+        return _backend_status[bind][0]
+
+    backend, has_trgm = 'memory', False
+    try:
+        if bind.dialect.name == 'sqlite':
+            if session.execute(db.text(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name='disparus_fts'"
+            )).scalar() is not None:
+                backend = 'fts5'
+        elif bind.dialect.name == 'postgresql':
+            backend = 'postgres'
+            has_trgm = bool(session.execute(db.text(
+                "SELECT count(*) FROM pg_extension WHERE extname = 'pg_trgm'"
+            )).scalar())
+    except Exception:
+        session.rollback()
+    _backend_status[bind] = (backend, has_trgm)
+    return backend
+
+
+def reset_search_backend(session=None):
+    """Forget the cached backend, e.g. after build_search_index()"""
+    session = session or db.session
+    _backend_status.pop(session.get_bind(), None)
+
+
+def _letter_counts(word):
+    # Letters counted in 32 buckets (by code point), capped to fit int8
+    counts = np.bincount([ord(ch) % 32 for ch in word], minlength=32)
+    return np.minimum(counts, 63).astype(np.int8)
+
+
+class WordIndex:
+    """
+    Trigrams of the indexed words, to find those a misspelled term is close
+    to. An edit changes at most 3 trigrams, a swap 4, so only the words of
+    about the term's length sharing all but 3*d + 1 of the term's trigrams
+    are measured, all at once (edit_distance_codes): d edits with at most
+    one swap among them. An edit also changes the letter counts of a word
+    by 2 at most, which rules out most of the rest before measuring.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.rows = {}         # word -> row
+        self.words = []        # row -> word, None once discarded
+        self.by_trigram = {}   # trigram -> rows
+        self.arrays = {}       # trigram -> rows as an array, rebuilt on use after a write
+        self.codes = np.zeros((1024, 16), dtype=np.int32)
+        self.lengths = np.zeros(1024, dtype=np.int64)
+        self.letters = np.zeros((1024, 32), dtype=np.int8)
+
+    def __contains__(self, word):
+        return word in self.rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, word):
+        if word in self.rows:
+            return
+        row = len(self.words)
+        self.rows[word] = row
+        self.words.append(word)
+        if row >= len(self.lengths):
+            self.codes = np.concatenate([self.codes, np.zeros_like(self.codes)])
+            self.lengths = np.concatenate([self.lengths, np.zeros_like(self.lengths)])
+            self.letters = np.concatenate([self.letters, np.zeros_like(self.letters)])
+        if len(word) > self.codes.shape[1]:
+            self.codes = np.pad(self.codes, ((0, 0), (0, len(word) - self.codes.shape[1])))
+        self.codes[row, :len(word)] = [ord(ch) for ch in word]
+        self.lengths[row] = len(word)
+        self.letters[row] = _letter_counts(word)
+        for gram in trigrams(word):
+            rows = self.by_trigram.get(gram)
+            if rows is None:
+                rows = self.by_trigram[gram] = set()
+            rows.add(row)
+            self.arrays.pop(gram, None)
+
+    def discard(self, word):
+        row = self.rows.pop(word, None)
+        if row is None:
+            return
+        # The row is not reused: a reload reclaims it
+        self.words[row] = None
+        for gram in trigrams(word):
+            rows = self.by_trigram[gram]
+            rows.discard(row)
+            self.arrays.pop(gram, None)
+            if not rows:
+                del self.by_trigram[gram]
+
+    def _gram_rows(self, gram):
+        rows = self.arrays.get(gram)
+        if rows is None:
+            rows = self.arrays[gram] = np.fromiter(self.by_trigram[gram], dtype=np.int64)
+        return rows
+
+    def similar(self, term, limit=None):
+        """{word: edits} of the other words within limit (default max_edits(term)) edits of term."""
+        limit = max_edits(term) if limit is None else limit
+        grams = trigrams(term)
+        known = [gram for gram in grams if gram in self.by_trigram]
+        if not limit or not known:
+            return {}
+
+        shared = np.bincount(np.concatenate([self._gram_rows(gram) for gram in known]))
+        rows = np.flatnonzero(shared >= max(len(grams) - 3 * limit - 1, 1))
+        rows = rows[np.abs(self.lengths[rows] - len(term)) <= limit]
+        letters = np.abs(self.letters[rows] - _letter_counts(term)).sum(axis=1)
+        rows = rows[letters <= 2 * limit]
+        if not len(rows):
+            return {}
+        lengths = self.lengths[rows]
+        edits = edit_distance_codes(term, self.codes[rows, :int(lengths.max())], lengths, limit)
+        close = edits <= limit
+
+        found = {}
+        for row, distance in zip(rows[close].tolist(), edits[close].tolist()):
+            word = self.words[row]
+            if word != term:
+                found[word] = distance
+        return found
+
+
+class InvertedIndex(ReloadableIndex):
+    """
+    Words of the searched columns to case ids, for databases without a
+    full-text index. A term matches every word it prefixes, found by
+    bisection in the sorted vocabulary, and, for typos, the words of the
+    folded columns in word_index (public ids are codes, not words).
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        super().__init__(ttl)
+        self.postings = {}
+        self.words_by_id = {}
+        self.vocabulary = None
+        self.word_index = WordIndex()
+        self.word_counts = {}      # folded column word -> cases having it
+        self.typo_words_by_id = {}
+
+    def load(self, rows):
+        """Replaces the whole index with rows of (id, *SEARCH_COLUMNS)."""
+        with self.lock:
+            self.postings = {}
+            self.words_by_id = {}
+            self.vocabulary = None
+            self.word_index = WordIndex()
+            self.word_counts = {}
+            self.typo_words_by_id = {}
+            for row in rows:
+                self.upsert(row[0], *row[1:])
+            self._built()
+
+    def upsert(self, disparu_id, public_id, *values):
+        with self.lock:
+            self.remove(disparu_id)
+            typo_words = set(query_terms(' '.join(value or '' for value in values)))
+            words = typo_words | set(query_terms(public_id))
+            self.words_by_id[disparu_id] = words
+            for word in words:
+                ids = self.postings.get(word)
+                if ids is None:
+                    ids = self.postings[word] = set()
+                    if self.vocabulary is not None:
+                        insort(self.vocabulary, word)
+                ids.add(disparu_id)
+            self.typo_words_by_id[disparu_id] = typo_words
+            for word in typo_words:
+                count = self.word_counts.get(word, 0)
+                if not count:
+                    self.word_index.add(word)
+                self.word_counts[word] = count + 1
+
+    def remove(self, disparu_id):
+        with self.lock:
+            for word in self.words_by_id.pop(disparu_id, ()):
+                ids = self.postings[word]
+                ids.discard(disparu_id)
+                if not ids:
+                    del self.postings[word]
+                    if self.vocabulary is not None:
+                        del self.vocabulary[bisect_left(self.vocabulary, word)]
+            for word in self.typo_words_by_id.pop(disparu_id, ()):
+                self.word_counts[word] -= 1
+                if not self.word_counts[word]:
+                    del self.word_counts[word]
+                    self.word_index.discard(word)
+
+    def __len__(self):
+        return len(self.words_by_id)
+
+    def _prefixed(self, term):
+        if self.vocabulary is None:
+            self.vocabulary = sorted(self.postings)
+        vocabulary = self.vocabulary
+        i = bisect_left(vocabulary, term)
+        while i < len(vocabulary) and vocabulary[i].startswith(term):
+            yield vocabulary[i]
+            i += 1
+
+    def search(self, terms):
+        """Ids of the cases having, for every term, a word it prefixes."""
+        with self.lock:
+            found = None
+            # Longest terms first: they prefix fewer words
+            for term in sorted(terms, key=len, reverse=True):
+                ids = set()
+                for word in self._prefixed(term):
+                    ids |= self.postings[word]
+                found = ids if found is None else found & ids
+                if not found:
+                    return set()
+            return found or set()
+
+    def ranked(self, terms, fuzzy=True):
+        """
+        (id, score) of the cases matching every term, best first. A term
+        matches a word as a prefix or, when fuzzy, within max_edits(term)
+        edits; the score adds up the IDF of each term, discounted by how
+        loosely the case's closest word matches it. Past RANKED_WINDOW
+        matches, only the newest are ranked, as on FTS5.
+        """
+        with self.lock:
+            total = len(self.words_by_id)
+            matched = []
+            for term in terms:
+                qualities = {word: _match_quality(term, word) for word in self._prefixed(term)}
+                if fuzzy:
+                    for word, edits in self.word_index.similar(term).items():
+                        qualities.setdefault(word, _match_quality(term, word, edits))
+                if not qualities:
+                    return []
+                # Cases of each word, like the document frequency of each FTS5 phrase
+                cases = sum(len(self.postings[word]) for word in qualities)
+                matched.append([cases, qualities])
+
+            # Rarest term first: the others are only looked up among its cases
+            matched.sort(key=lambda item: item[0])
+            ids = None
+            for item in matched:
+                cases, qualities = item
+                words_by_quality = {}
+                for word, quality in qualities.items():
+                    words_by_quality.setdefault(quality, []).append(self.postings[word])
+                # Cases of the words of each quality, kept for the scores
+                cases_by_quality = {
+                    quality: set().union(*(postings if ids is None else [ids & p for p in postings]))
+                    for quality, postings in words_by_quality.items()
+                }
+                ids = set().union(*cases_by_quality.values())
+                if not ids:
+                    return []
+                item[1] = cases_by_quality
+            if len(ids) > RANKED_WINDOW:
+                newest = np.fromiter(ids, dtype=np.int64, count=len(ids))
+                ids = set(np.partition(newest, -RANKED_WINDOW)[-RANKED_WINDOW:].tolist())
+
+            scores = dict.fromkeys(ids, 0.0)
+            for cases, cases_by_quality in matched:
+                idf = math.log(1 + total / cases)
+                best = {}
+                # Loosest first, so that a case keeps its closest word
+                for quality in sorted(cases_by_quality):
+                    best.update(dict.fromkeys(ids & cases_by_quality[quality], quality))
+                for disparu_id, quality in best.items():
+                    scores[disparu_id] += quality * idf
+            return sorted(scores.items(), key=itemgetter(1, 0), reverse=True)
+
+
+class FtsVocabulary(WordIndex, ReloadableIndex):
+    """
+    Words of the folded columns of disparus_fts, read from its
+    disparus_fts_vocab table, for the typos and the long prefixes of the
+    FTS5 backend. Words of edited or deleted cases linger until the next
+    reload: they only widen the MATCH. Words first written by other workers
+    are not spelled out until then.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        WordIndex.__init__(self)
+        ReloadableIndex.__init__(self, ttl)
+
+    def clear(self):
+        super().clear()
+        self.cases = {}           # word -> cases having it, as of the last load
+        self.sorted_words = []
+
+    def load(self, rows):
+        # rows: (word, cases having it)
+        with self.lock:
+            self.clear()
+            for word, cases in rows:
+                super().add(word)
+                self.cases[word] = cases
+            self.sorted_words = sorted(self.rows)
+            self._built()
+
+    def add(self, word):
+        if word not in self.rows:
+            insort(self.sorted_words, word)
+        super().add(word)
+
+    def spelled_out(self, term):
+        """
+        The one word term prefixes, when COMMON_WORD_CASES cases or more
+        have it, None otherwise. As a phrase it matches and ranks the same
+        cases as "term"*.
+        """
+        i = bisect_left(self.sorted_words, term)
+        words = self.sorted_words[i:i + 2]
+        if not words or not words[0].startswith(term) or (len(words) > 1 and words[1].startswith(term)):
+            return None
+        if self.cases.get(words[0], 0) < COMMON_WORD_CASES:
+            return None
+        return words[0]
+
+    def prefixed_cases(self, term, limit):
+        """Cases having a word term prefixes, as of the last load, counted until past limit."""
+        total = 0
+        i = bisect_left(self.sorted_words, term)
+        while total <= limit and i < len(self.sorted_words) and self.sorted_words[i].startswith(term):
+            total += self.cases.get(self.sorted_words[i], 0)
+            i += 1
+        return total
+
+    def refresh(self, rows, ids):
+        # Adds the words of the written cases: removed ones linger until the next reload
+        with self.lock:
+            for row in rows:
+                for word in query_terms(' '.join(value or '' for value in row[2:])):
+                    self.add(word)
+
+
+_INDEXES = IndexRegistry()
+_VOCABULARIES = IndexRegistry()
+
+
+def _fetch_rows(session, ids=None):
+    query = session.query(Disparu.id, *[getattr(Disparu, column) for column in SEARCH_COLUMNS])
+    if ids is None:
+        return query.yield_per(10000)
+    return query.filter(Disparu.id.in_(ids)).all()
+
+
+def get_inverted_index(session=None):
+    """Returns the up-to-date in-memory search index of the session's database."""
+    return _INDEXES.get(session or db.session, InvertedIndex, _fetch_rows)
+
+
+def _fetch_vocabulary(session, ids=None):
+    # (word, cases having it) of the whole vocabulary, the rows of the cases written otherwise
+    if ids is not None:
+        return _fetch_rows(session, ids)
+    try:
+        return session.execute(db.text(
+            "SELECT term, SUM(doc) FROM disparus_fts_vocab WHERE col != 'public_id' GROUP BY term"
+        )).all()
+    except Exception as e:
+        # Built before the vocabulary table: no typo tolerance until build_search_index()
+        session.rollback()
+        logger.warning(f"FTS5 vocabulary unavailable: {e}")
+        return []
+
+
+def get_fts_vocabulary(session=None):
+    """Returns the up-to-date vocabulary of the session's FTS5 index."""
+    return _VOCABULARIES.get(session or db.session, FtsVocabulary, _fetch_vocabulary)
+
+
+def _substring_condition(text):
+    # Leading-wildcard scan, for searches without a word to match
+    search_term = f"%{text}%"
+    return db.or_(*[getattr(Disparu, field).ilike(search_term) for field in SUBSTRING_FIELDS])
+
+
+def search_condition(text, session=None):
+    """
+    Filter on Disparu matching every folded word of text by prefix in one
+    of SEARCH_COLUMNS, evaluated by the database's search backend.
+    """
+    session = session or db.session
+    terms = query_terms(text)
+    if not terms:
+        return _substring_condition(text)
+
+    backend = get_search_backend(session)
+    if backend == 'fts5':
+        fts_query = ' '.join(f'"{term}"*' for term in terms)
+        return db.text(
+            "disparus_flask.id IN (SELECT rowid FROM disparus_fts WHERE disparus_fts MATCH :fts_query)"
+        ).bindparams(fts_query=fts_query)
+
+    if backend == 'postgres':
+        if _backend_status[session.get_bind()][1]:
+            # Substrings, served by the gin_trgm_ops indexes
+            return db.and_(*[
+                db.or_(*[getattr(Disparu, column).ilike(f'%{term}%') for column in SEARCH_COLUMNS])
+                for term in terms
+            ])
+        ts_query = ' & '.join(f'{term}:*' for term in terms)
+        return db.text(f"{_PG_TSVECTOR} @@ to_tsquery('simple', :ts_query)").bindparams(ts_query=ts_query)
+
+    ids = get_inverted_index(session).search(terms)
+    return Disparu.id.in_(sorted(ids)) if ids else db.false()
+
+
+def _apply_filters(q, filters):
+    if not filters:
+        return q
+    if filters.get('status'):
+        q = q.filter(Disparu.status == filters['status'])
+    if filters.get('person_type'):
+        if filters['person_type'] == 'person':
+            q = q.filter(Disparu.person_type.in_(['child', 'adult', 'elderly']))
+        else:
+            q = q.filter(Disparu.person_type == filters['person_type'])
+    if filters.get('country'):
+        q = q.filter(Disparu.country == filters['country'])
+    if filters.get('city'):
+        q = q.filter(Disparu.city == filters['city'])
+    if filters.get('has_photo'):
+        q = q.filter(Disparu.photo_url.isnot(None))
+    return q
 
 
 def search_disparus(query, filters=None):
+    """Cases matching every word of query exactly (by prefix), newest first."""
     q = Disparu.query
-    
+
     if query:
-        search_term = f"%{query}%"
-        q = q.filter(
-            db.or_(
-                Disparu.first_name.ilike(search_term),
-                Disparu.last_name.ilike(search_term),
-                Disparu.public_id.ilike(search_term),
-                Disparu.city.ilike(search_term),
-                Disparu.physical_description.ilike(search_term),
-            )
+        q = q.filter(search_condition(query))
+
+    return _apply_filters(q, filters).order_by(Disparu.created_at.desc(), Disparu.id.desc())
+
+
+def _fts5_match(terms, expansions, spelled):
+    # Every term as a prefix (or the one word it prefixes, when spelled
+    # out) or, when it has expansions, one of the words a typo away from
+    # it. Without them the term also counts as a whole word, so that bm25
+    # puts it before the longer words it prefixes (once, when spelled out
+    # as itself)
+    groups = []
+    for term, similar, spelled_word in zip(terms, expansions, spelled):
+        prefixed = f'"{spelled_word}"' if spelled_word else f'"{term}"*'
+        phrases = [f'"{word}"' for word in similar] or [f'"{term}"']
+        groups.append('(' + ' OR '.join(dict.fromkeys([prefixed] + phrases)) + ')')
+    return ' AND '.join(groups)
+
+
+def _fts5_exact(session, terms, spelled, filters, limit, after, broad=False):
+    # Score 1 + b / (1 + b), b = -bm25, computed by SQLite: monotonic in
+    # bm25, so the next page is a keyset on (score, id) like any column
+    fts = db.table('disparus_fts', db.column('rowid'), db.column('rank'))
+    score = 1 + fts.c.rank / (fts.c.rank - 1)
+    match = db.text("disparus_fts MATCH :fts_query").bindparams(fts_query=_fts5_match(terms, [{}] * len(terms), spelled))
+
+    if not filters or not any(filters.values()):
+        # Ranked and cut by FTS5 alone, before the rows are read
+        if broad:
+            # Over the newest RANKED_WINDOW matches, which FTS5 reads by rowid without ranking them
+            ranked = session.query(fts.c.rowid, fts.c.rank).filter(match) \
+                .order_by(fts.c.rowid.desc()).limit(RANKED_WINDOW).subquery()
+            score = 1 + ranked.c.rank / (ranked.c.rank - 1)
+            q = session.query(ranked.c.rowid, score.label('score'))
+        else:
+            ranked = fts
+            q = session.query(fts.c.rowid, score.label('score')).filter(match)
+        if after:
+            q = q.filter(keyset_condition([score, ranked.c.rowid], after))
+        page = q.order_by(db.desc('score'), ranked.c.rowid.desc()).limit(limit).subquery()
+        q = session.query(Disparu, page.c.score).join(page, page.c.rowid == Disparu.id) \
+            .order_by(page.c.score.desc(), Disparu.id.desc())
+    else:
+        q = _apply_filters(session.query(Disparu, score.label('score'))
+                           .join(fts, fts.c.rowid == Disparu.id).filter(match), filters)
+        if after:
+            q = q.filter(keyset_condition([score, Disparu.id], after))
+        q = q.order_by(db.desc('score'), Disparu.id.desc()).limit(limit)
+    return [(disparu, float(score)) for disparu, score in q.all()]
+
+
+def _fts5_typos(session, terms, spelled, expansions, filters, limit, after):
+    # The TYPO_WINDOW best cases by bm25 among those matching with typos
+    # (exact ones are left to _fts5_exact), reranked so that every edit
+    # halves the score, (1 + b / (1 + b)) / 2 ** edits: fewer typos first,
+    # then bm25. Always the same window, so every page of it costs the same
+    fts = db.table('disparus_fts', db.column('rowid'), db.column('rank'))
+    q = session.query(Disparu, fts.c.rank).join(fts, fts.c.rowid == Disparu.id) \
+        .filter(db.text("disparus_fts MATCH :fts_query").bindparams(fts_query=_fts5_match(terms, expansions, spelled)))
+    rows = _apply_filters(q, filters).order_by(fts.c.rank).limit(TYPO_WINDOW).all()
+
+    results = []
+    for disparu, rank in rows:
+        words = query_terms(' '.join(getattr(disparu, column) or '' for column in SEARCH_COLUMNS))
+        edits = sum(_term_edits(term, words, similar) for term, similar in zip(terms, expansions))
+        score = (1 + rank / (rank - 1)) / 2 ** edits
+        if edits and (after is None or (score, disparu.id) < after):
+            results.append((disparu, score))
+    results.sort(key=lambda item: (-item[1], -item[0].id))
+    return results[:limit]
+
+
+def _fts5_ranked(session, terms, filters, limit, fuzzy, after):
+    # Exact matches score from 1 up and typos below, so typos are only
+    # searched for once the exact matches run out (rare misspelt words
+    # would otherwise crowd them out of the bm25 window)
+    vocabulary = get_fts_vocabulary(session)
+    with vocabulary.lock:
+        spelled = [vocabulary.spelled_out(term) for term in terms]
+        spelled = [word if word == term or len(term) > FTS_PREFIX_LENGTH else None
+                   for term, word in zip(terms, spelled)]
+        broad = all(vocabulary.prefixed_cases(term, RANKED_WINDOW) > RANKED_WINDOW for term in terms)
+
+    results = []
+    if after is None or after[0] >= 1:
+        results = _fts5_exact(session, terms, spelled, filters, limit, after, broad)
+    if fuzzy and len(results) < limit:
+        with vocabulary.lock:
+            expansions = [vocabulary.similar(term) for term in terms]
+        if any(expansions):
+            results += _fts5_typos(session, terms, spelled, expansions, filters, limit - len(results), after)
+    return results
+
+
+def _postgres_ranked(session, terms, filters, limit, fuzzy, after):
+    columns = [getattr(Disparu, column) for column in SEARCH_COLUMNS]
+    if _backend_status[session.get_bind()][1]:
+        # Substrings and, for typos, word similarity: both served by the gin_trgm_ops indexes
+        conditions, scores = [], []
+        for term in terms:
+            matches = [column.ilike(f'%{term}%') for column in columns]
+            if fuzzy and max_edits(term):
+                matches += [db.literal(term).op('<%')(column) for column in columns]
+            conditions.append(db.or_(*matches))
+            scores.append(db.func.greatest(*[db.func.word_similarity(term, column) for column in columns]))
+        condition = db.and_(*conditions)
+        score = sum(scores[1:], scores[0])
+    else:
+        ts_query = db.func.to_tsquery('simple', ' & '.join(f'{term}:*' for term in terms))
+        condition = db.literal_column(_PG_TSVECTOR).op('@@')(ts_query)
+        score = db.func.ts_rank(db.literal_column(_PG_TSVECTOR), ts_query)
+
+    q = _apply_filters(session.query(Disparu, score.label('score')).filter(condition), filters)
+    if after:
+        q = q.filter(keyset_condition([score, Disparu.id], after))
+    rows = q.order_by(db.desc('score'), Disparu.id.desc()).limit(limit).all()
+    return [(disparu, float(score)) for disparu, score in rows]
+
+
+def _memory_ranked(session, terms, filters, limit, fuzzy, after):
+    ranked = get_inverted_index(session).ranked(terms, fuzzy)
+    if after:
+        ranked = [(disparu_id, score) for disparu_id, score in ranked if (score, disparu_id) < after]
+    results = []
+    # Best first until enough of them pass the filters
+    for start in range(0, len(ranked), FETCH_BATCH):
+        batch = ranked[start:start + FETCH_BATCH]
+        q = session.query(Disparu).filter(Disparu.id.in_([disparu_id for disparu_id, _ in batch]))
+        rows = {disparu.id: disparu for disparu in _apply_filters(q, filters)}
+        results.extend((rows[disparu_id], score) for disparu_id, score in batch if disparu_id in rows)
+        if len(results) >= limit:
+            break
+    return results[:limit]
+
+
+def ranked_search(query, filters=None, limit=20, fuzzy=True, session=None, after=None):
+    """
+    [(disparu, score)] of the cases matching query, most relevant first
+    (then newest id first): bm25 on FTS5, trigram word similarity (or
+    ts_rank) on Postgres, IDF of the matched words in memory. When fuzzy,
+    words within max_edits() of a term match too, ranked below exact ones.
+    after, the (score, id) of the last case of a page, starts the next one.
+    """
+    session = session or db.session
+    terms = query_terms(query)
+    if not terms:
+        q = search_disparus(query, filters).order_by(None).order_by(Disparu.id.desc())
+        if after:
+            q = q.filter(Disparu.id < after[1])
+        return [(disparu, 0.0) for disparu in q.limit(limit)]
+
+    backend = get_search_backend(session)
+    if backend == 'fts5':
+        return _fts5_ranked(session, terms, filters, limit, fuzzy, after)
+    if backend == 'postgres':
+        return _postgres_ranked(session, terms, filters, limit, fuzzy, after)
+    return _memory_ranked(session, terms, filters, limit, fuzzy, after)
+
+
+def _build_sqlite_fts(session, rebuild):
+    existing = session.execute(db.text(
+        "SELECT sql FROM sqlite_master WHERE type='table' AND name='disparus_fts'"
+    )).scalar()
+    if existing is not None and _normalized_sql(existing) != _normalized_sql(_FTS_TABLE):
+        # Created with other columns or options: start over
+        session.execute(db.text("DROP TABLE disparus_fts"))
+        existing = None
+    for name in _FTS_TRIGGERS:
+        session.execute(db.text(f"DROP TRIGGER IF EXISTS {name}"))
+
+    if existing is None:
+        session.execute(db.text(_FTS_TABLE))
+    session.execute(db.text("CREATE VIRTUAL TABLE IF NOT EXISTS disparus_fts_vocab USING fts5vocab(disparus_fts, 'col')"))
+    for sql in _FTS_TRIGGERS.values():
+        session.execute(db.text(sql))
+    if existing is None or rebuild:
+        # Reindexes every row of the content table
+        session.execute(db.text("INSERT INTO disparus_fts(disparus_fts) VALUES ('rebuild')"))
+    session.commit()
+
+
+def _build_postgres(session):
+    for idx_name in _PG_OBSOLETE_INDEXES:
+        session.execute(db.text(f"DROP INDEX IF EXISTS {idx_name}"))
+    session.commit()
+    try:
+        session.execute(db.text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for column, idx_name in _PG_TRGM_INDEXES.items():
+            session.execute(db.text(
+                f"CREATE INDEX IF NOT EXISTS {idx_name} ON disparus_flask USING gin ({column} gin_trgm_ops)"
+            ))
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.warning(f"  - Postgres pg_trgm indexes skipped/failed: {e}")
+    session.execute(db.text(
+        f"CREATE INDEX IF NOT EXISTS idx_disparu_search_fulltext ON disparus_flask USING gin({_PG_TSVECTOR})"
+    ))
+    session.commit()
+
+
+def backfill_search_columns(session=None, batch_size=1000):
+    """
+    Fills the folded columns of rows written before they existed or by raw
+    SQL. Returns the number of rows updated.
+    """
+    session = session or db.session
+    total = 0
+    last_id = 0
+    while True:
+        rows = session.execute(db.text(
+            f"SELECT id, {', '.join(FOLDED_FIELDS)} FROM disparus_flask "
+            f"WHERE ({' OR '.join(f'{field}_search IS NULL' for field in FOLDED_FIELDS)}) AND id > :last_id "
+            "ORDER BY id LIMIT :limit"
+        ), {'last_id': last_id, 'limit': batch_size}).fetchall()
+        if not rows:
+            break
+
+        session.execute(
+            db.text(f"UPDATE disparus_flask SET {', '.join(f'{field}_search = :{field}' for field in FOLDED_FIELDS)} "
+                    "WHERE id = :id"),
+            [dict({field: search_words(getattr(row, field)) for field in FOLDED_FIELDS}, id=row.id) for row in rows]
         )
-    
-    if filters:
-        if filters.get('status'):
-            q = q.filter_by(status=filters['status'])
-        if filters.get('person_type'):
-            q = q.filter_by(person_type=filters['person_type'])
-        if filters.get('country'):
-            q = q.filter_by(country=filters['country'])
-        if filters.get('city'):
-            q = q.filter_by(city=filters['city'])
-        if filters.get('has_photo'):
-            q = q.filter(Disparu.photo_url.isnot(None))
-    
-    return q.order_by(Disparu.created_at.desc())
-
-
-def build_search_index():
-    pass
-
-
-def update_search_index(disparu):
-    pass
+        session.commit()
+        total += len(rows)
+        last_id = rows[-1].id
+    return total
+
+
+def build_search_index(session=None, rebuild=False):
+    """
+    Creates the search index of the database, or brings an outdated one to
+    the current definition: the FTS5 table and its triggers on SQLite, the
+    tsvector and trigram indexes on Postgres, the in-memory index elsewhere
+    or when SQLite was built without FTS5. rebuild reindexes every case.
+    Returns the backend now in use.
+    """
+    session = session or db.session
+    dialect = session.get_bind().dialect.name
+    filled = backfill_search_columns(session)
+    if filled:
+        logger.info(f"  + Folded the searched columns of {filled} cases")
+    try:
+        if dialect == 'sqlite':
+            _build_sqlite_fts(session, rebuild)
+        elif dialect == 'postgresql':
+            _build_postgres(session)
+    except Exception as e:
+        session.rollback()
+        logger.warning(f"  - Search index setup skipped/failed, in-memory index used: {e}")
+
+    reset_search_backend(session)
+    backend = get_search_backend(session)
+    if backend == 'memory':
+        get_inverted_index(session).load(_fetch_rows(session))
+    else:
+        _VOCABULARIES.invalidate(session.get_bind())
+    return backend
+
+
+def update_search_index(disparu, session=None):
+    """
+    Brings the folded columns and the search index in step with one case
+    right away. ORM writes keep both up to date by themselves (validators,
+    then triggers, expression indexes or the change feed); this is for
+    writes made outside the ORM. Only flushes: the caller's commit hands
+    the change to the feed, which refreshes the in-memory index.
+    """
+    session = session or db.session
+    if session.get(Disparu, disparu.id) is None:
+        if get_search_backend(session) == 'memory':
+            get_inverted_index(session).remove(disparu.id)
+        return
+    for field in FOLDED_FIELDS:
+        setattr(disparu, f'{field}_search', search_words(getattr(disparu, field)))
+    session.flush()
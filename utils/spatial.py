@@ -0,0 +1,230 @@
+"""
+ * Nom de l'application : DISPARUS.ORG
+ * Description : Filtres geographiques assistes par index spatial
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+import weakref
+
+from models import db, Disparu
+from utils.geohash import bbox_prefixes
+
+# Capability caches, per engine so test databases never share them
+_sqlite_rtree_status = weakref.WeakKeyDictionary()
+_postgres_geo_status = weakref.WeakKeyDictionary()
+_geohash_index_status = weakref.WeakKeyDictionary()
+
+# Beyond this radius an earth_box prefilter selects most of the continent
+MAX_EARTH_BOX_KM = 3000
+
+_rtree = db.table(
+    'disparus_rtree',
+    db.column('id'),
+    db.column('min_lat'),
+    db.column('max_lat'),
+    db.column('min_lng'),
+    db.column('max_lng'),
+)
+
+
+def is_sqlite_rtree_available(session=None):
+    """Check if the SQLite R*Tree table exists, with caching"""
+    session = session or db.session
+    try:
+        bind = session.get_bind()
+        if bind.dialect.name != 'sqlite':
+            return False
+
+        if bind in _sqlite_rtree_status:
+            return _sqlite_rtree_status[bind]
+
+        result = session.execute(db.text("SELECT name FROM sqlite_master WHERE type='table' AND name='disparus_rtree'")).scalar()
+        available = (result is not None)
+        _sqlite_rtree_status[bind] = available
+        return available
+    except Exception:
+        return False
+
+
+def get_postgres_geo_backend(session=None):
+    """
+    Returns 'postgis' when the geog column exists, 'earthdistance' when only
+    cube/earthdistance are installed, None otherwise. Cached per engine.
+    """
+    session = session or db.session
+    try:
+        bind = session.get_bind()
+        if bind.dialect.name != 'postgresql':
+            return None
+
+        if bind in _postgres_geo_status:
+            return _postgres_geo_status[bind]
+
+        backend = None
+        has_geog = session.execute(db.text(
+            "SELECT count(*) FROM information_schema.columns "
+            "WHERE table_name = 'disparus_flask' AND column_name = 'geog'"
+        )).scalar()
+        if has_geog:
+            backend = 'postgis'
+        elif session.execute(db.text("SELECT count(*) FROM pg_extension WHERE extname = 'earthdistance'")).scalar():
+            backend = 'earthdistance'
+
+        _postgres_geo_status[bind] = backend
+        return backend
+    except Exception:
+        return None
+
+
+def is_geohash_indexed(session=None):
+    """Check if init_db.sync_indexes created the geohash prefix index, with caching"""
+    session = session or db.session
+    try:
+        bind = session.get_bind()
+        if bind in _geohash_index_status:
+            return _geohash_index_status[bind]
+
+        indexes = db.inspect(bind).get_indexes('disparus_flask')
+        available = any(idx['name'] == 'ix_disparus_flask_geohash' for idx in indexes)
+        _geohash_index_status[bind] = available
+        return available
+    except Exception:
+        return False
+
+
+def reset_spatial_capabilities(session=None):
+    """Forget cached availability, e.g. after creating the spatial indexes"""
+    session = session or db.session
+    bind = session.get_bind()
+    _sqlite_rtree_status.pop(bind, None)
+    _postgres_geo_status.pop(bind, None)
+    _geohash_index_status.pop(bind, None)
+
+
+def geohash_prefilter(column, min_lat, max_lat, min_lng, max_lng):
+    """
+    LIKE 'prefix%' conditions on the 9 geohash cells around the box, or None
+    when the box is too large for them to narrow anything. Rows whose
+    geohash was never filled are kept.
+    """
+    prefixes = bbox_prefixes(min_lat, max_lat, min_lng, max_lng)
+    if not prefixes:
+        return None
+    return db.or_(column.is_(None), *[column.like(f'{prefix}%') for prefix in prefixes])
+
+
+_geog = db.literal_column('disparus_flask.geog')
+# Planar view of geog, backed by its own GiST expression index for bbox tests
+_geom = db.literal_column('(disparus_flask.geog::geometry)')
+
+
+def _geog_point(lat, lng):
+    return db.func.ST_GeogFromText(db.literal(f'SRID=4326;POINT({float(lng)} {float(lat)})'))
+
+
+def knn_distance(lat, lng, session=None):
+    """
+    Returns (order_by, distance_km) expressions for an index-assisted
+    nearest-first ordering (<-> on a GiST index) on PostgreSQL, or None
+    when no geo backend is installed.
+    """
+    backend = get_postgres_geo_backend(session)
+
+    if backend == 'postgis':
+        point = _geog_point(lat, lng)
+        return _geog.op('<->')(point), db.func.ST_Distance(_geog, point) / 1000
+
+    if backend == 'earthdistance':
+        point = db.func.ll_to_earth(lat, lng)
+        case_point = db.func.ll_to_earth(Disparu.latitude, Disparu.longitude)
+        # cube <-> is the chord length: same order as the great-circle distance
+        return case_point.op('<->')(point), db.func.earth_distance(point, case_point) / 1000
+
+    return None
+
+
+def _postgres_bbox_filter(query, backend, min_lat, max_lat, min_lng, max_lng):
+    crosses = min_lng > max_lng
+
+    if backend == 'postgis':
+        def envelope(west, east):
+            return db.func.ST_MakeEnvelope(west, min_lat, east, max_lat, 4326)
+
+        if crosses:
+            return query.filter(db.or_(
+                _geom.op('&&')(envelope(min_lng, 180)),
+                _geom.op('&&')(envelope(-180, max_lng)),
+            ))
+        return query.filter(_geom.op('&&')(envelope(min_lng, max_lng)))
+
+    # earthdistance: earth_box around the circle circumscribing the viewport
+    from algorithms.clustering import haversine_distance
+
+    width = (max_lng + 360 - min_lng) if crosses else (max_lng - min_lng)
+    if width >= 180:
+        return query
+    center_lat = (min_lat + max_lat) / 2
+    center_lng = min_lng + width / 2
+    if center_lng > 180:
+        center_lng -= 360
+
+    radius_km = max(
+        haversine_distance(center_lat, center_lng, lat, lng)
+        for lat in (min_lat, center_lat, max_lat)
+        for lng in (min_lng, max_lng)
+    )
+    if radius_km > MAX_EARTH_BOX_KM:
+        return query
+
+    earth_box = db.func.earth_box(db.func.ll_to_earth(center_lat, center_lng), radius_km * 1000 * 1.01)
+    return query.filter(earth_box.op('@>')(db.func.ll_to_earth(Disparu.latitude, Disparu.longitude)))
+
+
+def _rtree_ids(min_lat, max_lat, min_lng, max_lng):
+    return db.select(_rtree.c.id).where(
+        _rtree.c.max_lat >= min_lat,
+        _rtree.c.min_lat <= max_lat,
+        _rtree.c.max_lng >= min_lng,
+        _rtree.c.min_lng <= max_lng,
+    )
+
+
+def filter_bbox(query, min_lat, max_lat, min_lng, max_lng, session=None):
+    """
+    Restricts query to cases inside the box. min_lng > max_lng means the box
+    crosses the antimeridian. Uses the R*Tree or the PostgreSQL GiST indexes
+    when present, else the portable geohash prefix index; the exact column
+    predicates are always kept since those indexes only prefilter (32-bit
+    R*Tree floats, circular earth_box, geohash cells).
+    """
+    crosses = min_lng > max_lng
+
+    if crosses:
+        query = query.filter(
+            Disparu.latitude.between(min_lat, max_lat),
+            db.or_(Disparu.longitude >= min_lng, Disparu.longitude <= max_lng)
+        )
+    else:
+        query = query.filter(
+            Disparu.latitude.between(min_lat, max_lat),
+            Disparu.longitude.between(min_lng, max_lng)
+        )
+
+    backend = get_postgres_geo_backend(session)
+    if backend:
+        query = _postgres_bbox_filter(query, backend, min_lat, max_lat, min_lng, max_lng)
+    elif is_sqlite_rtree_available(session):
+        if crosses:
+            query = query.filter(db.or_(
+                Disparu.id.in_(_rtree_ids(min_lat, max_lat, min_lng, 180)),
+                Disparu.id.in_(_rtree_ids(min_lat, max_lat, -180, max_lng)),
+            ))
+        else:
+            query = query.filter(Disparu.id.in_(_rtree_ids(min_lat, max_lat, min_lng, max_lng)))
+    elif is_geohash_indexed(session):
+        prefilter = geohash_prefilter(Disparu.geohash, min_lat, max_lat, min_lng, max_lng)
+        if prefilter is not None:
+            query = query.filter(prefilter)
+
+    return query
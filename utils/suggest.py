@@ -0,0 +1,226 @@
+"""
+ * Nom de l'application : DISPARUS.ORG
+ * Description : Suggestions de saisie (noms, identifiants, villes)
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+from bisect import bisect_left, insort
+
+import numpy as np
+
+from models import db, Disparu
+from algorithms.index_reload import DEFAULT_TTL, IndexRegistry, ReloadableIndex
+from utils.search import fold_text
+
+KINDS = ('name', 'public_id', 'city')
+_KIND_CODES = {'name': 0, 'public_id': 1}
+# Above every character a folded key can hold: prefix + _KEY_END bounds the keys starting with prefix
+_KEY_END = '\U0010ffff'
+# Candidates taken from the top of a range per suggestion asked, before duplicate labels are dropped
+SPREAD = 4
+# Pending writes tolerated before the sorted arrays are rebuilt
+MIN_REBUILD_THRESHOLD = 256
+
+
+def _word_suffixes(text):
+    # 'jean paul dupont' -> 'jean paul dupont', 'paul dupont', 'dupont':
+    # a completion is found from the start of any of its words
+    words = fold_text(text).split()
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+class SuggestIndex(ReloadableIndex):
+    """
+    Completions of case names, public ids and cities, most viewed first.
+
+    Keys (the folded words of a label from each of its words on) are kept
+    sorted, so the keys a typed prefix starts are a contiguous range found
+    by bisection, whose most viewed rows numpy picks (argpartition). Cities
+    are grouped, weighted by the views of all their cases. Writes go to a
+    small sorted buffer until the arrays are rebuilt, the outdated rows
+    they replace being skipped meanwhile. View counts change without
+    change events: only the reload every ttl picks them up.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        super().__init__(ttl)
+        self.cases = {}          # id -> (public_id, name, city, view_count), the source of every rebuild
+        self.keys = []           # sorted keys of the frozen rows
+        self.ids = np.empty(0, dtype=np.int64)
+        self.kinds = np.empty(0, dtype=np.int8)
+        self.weights = np.empty(0, dtype=np.int64)
+        self.pending = []        # sorted (key, id, kind) written since last rebuild
+        self.pending_ids = set()
+        self.tombstones = set()  # ids whose frozen rows are outdated
+        self.cities = {}         # folded city -> [label, views, cases]
+        self.city_keys = None    # sorted (key, folded city), rebuilt on use after a new city
+
+    def load(self, rows):
+        """Replaces the whole index with rows of (id, public_id, person_type, first_name, last_name, city, view_count)."""
+        with self.lock:
+            self.cases = {}
+            self.cities = {}
+            for row in rows:
+                self._add_case(row[0], *row[1:])
+            self._build()
+            self._built()
+
+    @staticmethod
+    def _case_keys(disparu_id, case):
+        public_id, name = case[0], case[1]
+        keys = [(key, disparu_id, _KIND_CODES['name']) for key in _word_suffixes(name)]
+        if public_id:
+            keys.append((fold_text(public_id), disparu_id, _KIND_CODES['public_id']))
+        return keys
+
+    def _build(self):
+        rows = sorted(row for disparu_id, case in self.cases.items() for row in self._case_keys(disparu_id, case))
+        self.keys = [key for key, _, _ in rows]
+        self.ids = np.fromiter((disparu_id for _, disparu_id, _ in rows), dtype=np.int64, count=len(rows))
+        self.kinds = np.fromiter((kind for _, _, kind in rows), dtype=np.int8, count=len(rows))
+        self.weights = np.fromiter((self.cases[disparu_id][3] for _, disparu_id, _ in rows), dtype=np.int64,
+                                   count=len(rows))
+        self.pending = []
+        self.pending_ids = set()
+        self.tombstones = set()
+
+    def _add_case(self, disparu_id, public_id, person_type, first_name, last_name, city, view_count):
+        # Animals go by their name alone, as on their cards
+        name = first_name if person_type == 'animal' else ' '.join(filter(None, [first_name, last_name]))
+        case = (public_id, name or '', city, view_count or 0)
+        self.cases[disparu_id] = case
+        self._count_city(city, case[3], 1)
+        return case
+
+    def _count_city(self, city, views, cases):
+        city_key = fold_text(city)
+        if not city_key:
+            return
+        entry = self.cities.get(city_key)
+        if entry is None:
+            entry = self.cities[city_key] = [city, 0, 0]
+            self.city_keys = None
+        entry[1] += views
+        entry[2] += cases
+        if entry[2] <= 0:
+            del self.cities[city_key]
+            self.city_keys = None
+
+    def upsert(self, disparu_id, public_id, person_type, first_name, last_name, city, view_count):
+        with self.lock:
+            self.remove(disparu_id)
+            case = self._add_case(disparu_id, public_id, person_type, first_name, last_name, city, view_count)
+            for row in self._case_keys(disparu_id, case):
+                insort(self.pending, row)
+            self.pending_ids.add(disparu_id)
+            self._maybe_rebuild()
+
+    def remove(self, disparu_id):
+        with self.lock:
+            case = self.cases.pop(disparu_id, None)
+            if case is None:
+                return
+            self._count_city(case[2], -case[3], -1)
+            self.tombstones.add(disparu_id)
+            if disparu_id in self.pending_ids:
+                self.pending = [row for row in self.pending if row[1] != disparu_id]
+                self.pending_ids.discard(disparu_id)
+            self._maybe_rebuild()
+
+    def __len__(self):
+        return len(self.cases)
+
+    def _maybe_rebuild(self):
+        if len(self.pending) + len(self.tombstones) > max(MIN_REBUILD_THRESHOLD, len(self.keys) // 16):
+            self._build()
+
+    def _frozen(self, prefix, k, kinds, out):
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + _KEY_END, lo)
+        if lo == hi:
+            return
+        weights = self.weights[lo:hi]
+        if len(kinds) < len(_KIND_CODES):
+            weights = np.where(np.isin(self.kinds[lo:hi], [_KIND_CODES[kind] for kind in kinds]), weights, -1)
+        wanted = k * SPREAD + len(self.tombstones)
+        if len(weights) > wanted:
+            rows = np.argpartition(-weights, wanted)[:wanted]
+        else:
+            rows = np.arange(len(weights))
+        rows = rows[np.argsort(-weights[rows], kind='stable')]
+        for row in rows.tolist():
+            if weights[row] < 0:
+                break
+            disparu_id = int(self.ids[lo + row])
+            if disparu_id not in self.tombstones:
+                out.append((int(weights[row]), disparu_id, int(self.kinds[lo + row])))
+
+    def _buffered(self, prefix, kinds, out):
+        codes = {_KIND_CODES[kind] for kind in kinds}
+        start = bisect_left(self.pending, (prefix,))
+        end = bisect_left(self.pending, (prefix + _KEY_END,), start)
+        for _, disparu_id, kind in self.pending[start:end]:
+            if kind in codes:
+                out.append((self.cases[disparu_id][3], disparu_id, kind))
+
+    def _city_suggestions(self, prefix):
+        if self.city_keys is None:
+            self.city_keys = sorted((key, city_key) for city_key in self.cities for key in _word_suffixes(city_key))
+        start = bisect_left(self.city_keys, (prefix,))
+        end = bisect_left(self.city_keys, (prefix + _KEY_END,), start)
+        return {city_key for _, city_key in self.city_keys[start:end]}
+
+    def suggest(self, text, k=8, kinds=KINDS):
+        """
+        Up to k completions of text, most viewed first: dicts of type
+        ('name', 'public_id' or 'city'), value and, but for cities, the
+        public_id of the most viewed case behind it.
+        """
+        prefix = fold_text(text)
+        if not prefix or k <= 0:
+            return []
+
+        with self.lock:
+            case_kinds = [kind for kind in kinds if kind in _KIND_CODES]
+            found = []
+            if case_kinds:
+                self._frozen(prefix, k, case_kinds, found)
+                self._buffered(prefix, case_kinds, found)
+            # (views, type, value, public_id)
+            candidates = []
+            for views, disparu_id, kind in found:
+                public_id, name = self.cases[disparu_id][:2]
+                candidates.append((views, KINDS[kind], name if KINDS[kind] == 'name' else public_id, public_id))
+            if 'city' in kinds:
+                candidates += [(self.cities[city_key][1], 'city', self.cities[city_key][0], None)
+                               for city_key in self._city_suggestions(prefix)]
+
+        results, seen = [], set()
+        for views, kind, value, public_id in sorted(candidates, key=lambda item: (-item[0], item[2], item[3] or '')):
+            if (kind, value) in seen:
+                continue
+            seen.add((kind, value))
+            result = {'type': kind, 'value': value}
+            if public_id is not None:
+                result['public_id'] = public_id
+            results.append(result)
+            if len(results) == k:
+                break
+        return results
+
+
+_INDEXES = IndexRegistry()
+
+
+def _fetch_rows(session, ids=None):
+    query = session.query(Disparu.id, Disparu.public_id, Disparu.person_type, Disparu.first_name,
+                          Disparu.last_name, Disparu.city, Disparu.view_count)
+    if ids is None:
+        return query.yield_per(5000)
+    return query.filter(Disparu.id.in_(ids)).all()
+
+
+def get_suggest_index(session=None):
+    """Returns the up-to-date suggestion index for the session's database."""
+    return _INDEXES.get(session or db.session, SuggestIndex, _fetch_rows)
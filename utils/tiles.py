@@ -0,0 +1,158 @@
+"""
+ * Nom de l'application : DISPARUS.ORG
+ * Description : Encodage binaire compact des tuiles de la carte
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+import struct
+
+import numpy as np
+
+from algorithms.map_clusters import inverse_mercator, mercator
+
+TILE_MAGIC = b'DTIL'
+TILE_VERSION = 1
+# Coordinates are quantized to TILE_EXTENT steps per tile side (16 bits)
+TILE_EXTENT = 4096
+MAX_TILE_ZOOM = 22
+TILE_MIMETYPE = 'application/vnd.disparus.tile'
+
+# Layout, little-endian, columns of `count` entries each:
+#   header   magic(4) version(u8) z(u8) x(u32) y(u32) extent(u16) count(u32)
+#   tables   status, person_type, country: n(u16) then n x [len(u16) utf-8];
+#            entry 0 is always '' (clusters carry no attributes)
+#   columns  x(u16) y(u16) count(u32) expansion_zoom(u8)
+#            status(u8) person_type(u8) country(u16)
+#            public_id: len(u8) ascii each, empty for clusters
+_HEADER = struct.Struct('<4sBBIIHI')
+
+
+def tile_bounds(z, x, y):
+    """(min_lat, max_lat, min_lng, max_lng) of a Web Mercator tile."""
+    n = 2 ** z
+    (north, south), (west, east) = inverse_mercator([x / n, (x + 1) / n], [y / n, (y + 1) / n])
+    return float(south), float(north), float(west), float(east)
+
+
+def quantize(z, x, y, lats, lons):
+    """Tile-local integer coordinates, and the mask of those falling inside the tile."""
+    n = 2 ** z
+    mx, my = mercator(lats, lons)
+    qx = np.floor((mx * n - x) * TILE_EXTENT).astype(np.int64)
+    qy = np.floor((my * n - y) * TILE_EXTENT).astype(np.int64)
+    inside = (qx >= 0) & (qx < TILE_EXTENT) & (qy >= 0) & (qy < TILE_EXTENT)
+    return qx, qy, inside
+
+
+class _Dictionary:
+    """String table assigning a small integer to each distinct value."""
+
+    def __init__(self):
+        self.values = ['']
+        self.codes = {'': 0}
+
+    def code(self, value):
+        value = value or ''
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def encode(self):
+        parts = [struct.pack('<H', len(self.values))]
+        for value in self.values:
+            data = value.encode('utf-8')
+            parts.append(struct.pack('<H', len(data)))
+            parts.append(data)
+        return b''.join(parts)
+
+
+def encode_tile(z, x, y, features):
+    """
+    Encodes features (dicts with latitude, longitude, count, expansion_zoom
+    and, for single cases, public_id, status, person_type, country) as a
+    columnar binary tile. Features outside the tile are dropped.
+    """
+    lats = [f['latitude'] for f in features]
+    lons = [f['longitude'] for f in features]
+    qx, qy, inside = quantize(z, x, y, lats, lons)
+    keep = np.flatnonzero(inside).tolist()
+
+    statuses, person_types, countries = _Dictionary(), _Dictionary(), _Dictionary()
+    status_codes, type_codes, country_codes, public_ids = [], [], [], []
+    for i in keep:
+        f = features[i]
+        status_codes.append(statuses.code(f.get('status')))
+        type_codes.append(person_types.code(f.get('person_type')))
+        country_codes.append(countries.code(f.get('country')))
+        public_id = (f.get('public_id') or '').encode('ascii')
+        public_ids.append(bytes([len(public_id)]) + public_id)
+
+    counts = [features[i]['count'] for i in keep]
+    expansion = [min(features[i].get('expansion_zoom') or 0, 255) for i in keep]
+
+    return b''.join([
+        _HEADER.pack(TILE_MAGIC, TILE_VERSION, z, x, y, TILE_EXTENT, len(keep)),
+        statuses.encode(),
+        person_types.encode(),
+        countries.encode(),
+        qx[keep].astype('<u2').tobytes(),
+        qy[keep].astype('<u2').tobytes(),
+        np.asarray(counts, dtype='<u4').tobytes(),
+        np.asarray(expansion, dtype=np.uint8).tobytes(),
+        np.asarray(status_codes, dtype=np.uint8).tobytes(),
+        np.asarray(type_codes, dtype=np.uint8).tobytes(),
+        np.asarray(country_codes, dtype='<u2').tobytes(),
+        b''.join(public_ids),
+    ])
+
+
+def decode_tile(data):
+    """Inverse of encode_tile, with tile-local coordinates turned back into lat/lng."""
+    magic, version, z, x, y, extent, count = _HEADER.unpack_from(data, 0)
+    if magic != TILE_MAGIC or version != TILE_VERSION:
+        raise ValueError('Not a disparus tile')
+    offset = _HEADER.size
+
+    tables = []
+    for _ in range(3):
+        (size,), offset = struct.unpack_from('<H', data, offset), offset + 2
+        values = []
+        for _ in range(size):
+            (length,), offset = struct.unpack_from('<H', data, offset), offset + 2
+            values.append(data[offset:offset + length].decode('utf-8'))
+            offset += length
+        tables.append(values)
+
+    columns = []
+    for dtype in ('<u2', '<u2', '<u4', 'u1', 'u1', 'u1', '<u2'):
+        column = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+        columns.append(column.tolist())
+        offset += column.nbytes
+    qx, qy, counts, expansion, status_codes, type_codes, country_codes = columns
+
+    n = 2 ** z
+    # Centre of the quantization step
+    lats, lons = inverse_mercator(
+        (x + (np.asarray(qx) + 0.5) / extent) / n,
+        (y + (np.asarray(qy) + 0.5) / extent) / n
+    )
+
+    features = []
+    for i in range(count):
+        length = data[offset]
+        public_id = data[offset + 1:offset + 1 + length].decode('ascii')
+        offset += 1 + length
+        features.append({
+            'latitude': float(lats[i]),
+            'longitude': float(lons[i]),
+            'count': counts[i],
+            'expansion_zoom': expansion[i],
+            'public_id': public_id or None,
+            'status': tables[0][status_codes[i]] or None,
+            'person_type': tables[1][type_codes[i]] or None,
+            'country': tables[2][country_codes[i]] or None,
+        })
+    return {'z': z, 'x': x, 'y': y, 'features': features}